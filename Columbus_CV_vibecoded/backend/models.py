@@ -8,28 +8,54 @@ class UploadedFile(BaseModel):
     size: int
     stored: bool
     path: Optional[str] = None
-    content: Optional[bytes] = None
+    content_id: str  # SHA-256 of the file content
+    deduplicated: bool = False  # Content was already in the blob store
 
 class UploadResponse(BaseModel):
     session_id: str
     files: List[UploadedFile]
     stored: bool
 
+class KnownFile(BaseModel):
+    filename: str
+    content_type: str
+    sha256: str
+
+class BlobCheckRequest(BaseModel):
+    hashes: List[str]
+
+class BlobCheckResponse(BaseModel):
+    present: List[str]
+    missing: List[str]
+
 class ImageData(BaseModel):
     filename: str
     content: str  # base64 encoded
     content_type: str
 
+class ImageRef(BaseModel):
+    session_id: str
+    filename: str
+
 class ChatRequest(BaseModel):
     prompt: str
     images: Optional[List[ImageData]] = []
+    image_refs: Optional[List[ImageRef]] = []
     template: Optional[str] = None
     session_id: Optional[str] = None
+    use_cache: bool = True
+    preprocess: Optional[bool] = None  # None = server default (PREPROCESS_ENABLED)
+    tiling: Optional[bool] = None  # None = server default (TILING_ENABLED)
 
 class ChatResponse(BaseModel):
     response: str
     session_id: Optional[str]
     timestamp: str
+    cached: bool = False
+    preprocessing: Optional[Dict[str, Any]] = None
+    plan: Optional[Dict[str, Any]] = None  # Detail, resolution and output limit chosen per request; None on a cache hit
+    usage: Optional[Dict[str, Any]] = None  # Upstream token usage; None on a cache hit
+    tiling: Optional[Dict[str, Any]] = None  # Tile counts and merged dimensions of tiled drawings; None on a cache hit
 
 class PromptTemplate(BaseModel):
     name: str
@@ -39,4 +65,13 @@ class PromptTemplate(BaseModel):
 class ErrorResponse(BaseModel):
     error: str
     detail: Optional[str] = None
-    timestamp: str
\ No newline at end of file
+    timestamp: str
+
+class JobProgress(BaseModel):
+    job_id: str
+    status: str
+    created: str
+    updated: str
+    total: int
+    counts: Dict[str, int]
+    progress: float
\ No newline at end of file
@@ -0,0 +1,292 @@
+import os
+import io
+import json
+import math
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from services.image_payload import ImagePayload
+from services.image_preprocessor import SHORT_EDGE, model_view_size
+from services.worker_pool import WorkerPool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it nothing is tiled
+    Image = None
+
+load_dotenv()
+
+Box = Tuple[int, int, int, int]  # left, top, right, bottom in page pixels
+
+# Tiles whose darkest pixel is lighter than this carry no linework or text
+BLANK_THRESHOLD = 200
+TILE_GROWTH = 1.25
+
+TILE_PROMPT = (
+    "This image is one tile cut from a larger engineering drawing. List every dimension "
+    "callout that is fully visible in it, exactly as written: the nominal value, the "
+    "tolerance if one is given, what kind of callout it is and what feature it dimensions. "
+    "Give the position of each callout's text as x and y fractions (0-1) of this tile's "
+    "width and height. Skip callouts cut by the tile edge."
+)
+
+TILE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "dimensions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "value": {"type": "string"},
+                    "tolerance": {"type": ["string", "null"]},
+                    "kind": {"type": "string", "enum": ["linear", "diameter", "radius", "angle", "thread", "other"]},
+                    "feature": {"type": "string"},
+                    "x": {"type": "number"},
+                    "y": {"type": "number"}
+                },
+                "required": ["value", "tolerance", "kind", "feature", "x", "y"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["dimensions"],
+    "additionalProperties": False
+}
+
+
+def _spans(length: int, tile: int, overlap: int) -> List[Tuple[int, int]]:
+    """Evenly spaced [start, end) spans of size tile covering length, overlapping by at least overlap"""
+    if length <= tile:
+        return [(0, length)]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    step = (length - tile) / (count - 1)
+    return [(round(index * step), round(index * step) + tile) for index in range(count)]
+
+
+def plan_tiles(width: int, height: int, tile_size: int, overlap: float, max_tiles: int) -> List[Box]:
+    """Tile boxes covering the page row by row; tiles grow until there are at most max_tiles"""
+    while True:
+        overlap_px = min(tile_size - 1, round(tile_size * overlap))
+        boxes = [
+            (left, top, right, bottom)
+            for top, bottom in _spans(height, tile_size, overlap_px)
+            for left, right in _spans(width, tile_size, overlap_px)
+        ]
+        if len(boxes) <= max_tiles or tile_size >= max(width, height):
+            return boxes
+        tile_size = math.ceil(tile_size * TILE_GROWTH)
+
+
+def _png(image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def split_drawing(
+    data: bytes,
+    tile_size: int,
+    overlap: float,
+    max_tiles: int,
+    overview_edge: int
+) -> Tuple[Tuple[int, int], bytes, List[Tuple[Box, bytes]]]:
+    """
+    The upright page size, a downscaled overview PNG and (box, PNG) for every
+    tile with ink on it; runs in a pool worker
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        page = ImageOps.exif_transpose(source)
+        if page.mode in ("RGBA", "LA", "P"):
+            # Transparent areas of exported drawings are paper
+            rgba = page.convert("RGBA")
+            page = Image.new("RGB", rgba.size, "white")
+            page.paste(rgba, mask=rgba.getchannel("A"))
+        elif page.mode not in ("L", "RGB"):
+            page = page.convert("L" if page.mode == "1" else "RGB")
+        page.load()
+
+    tiles = []
+    for box in plan_tiles(page.width, page.height, tile_size, overlap, max_tiles):
+        tile = page.crop(box)
+        darkest, _ = tile.convert("L").getextrema()
+        if darkest < BLANK_THRESHOLD:
+            tiles.append((box, _png(tile)))
+
+    overview = page.copy()
+    overview.thumbnail((overview_edge, overview_edge), Image.LANCZOS)
+    return page.size, _png(overview), tiles
+
+
+def _number(value: Optional[str]) -> Optional[str]:
+    """2.490, 2.49 and ±.0020 compare equal; anything else (1/4, 3/4-16 UNF) as written"""
+    if value is None:
+        return None
+    text = value.strip().lstrip("Ø⌀R±+").strip()
+    try:
+        return f"{float(text):g}"
+    except ValueError:
+        return value.strip().lower()
+
+
+def _tolerance(text: Optional[str]) -> str:
+    """' ±0.002' for a bare (symmetric) tolerance; '+0.002/-0.001', 'H7' and the like as written"""
+    if not text:
+        return ""
+    bare = text.strip().lstrip("±").strip()
+    try:
+        float(bare)
+    except ValueError:
+        return f" {text.strip()}"
+    return f" ±{bare}"
+
+
+class DrawingTiler:
+    """
+    Splits large drawings into overlapping tiles so small tolerance callouts
+    survive: a high-detail image is fitted into 2048x2048 with its short side
+    at 768px, so on a large sheet they shrink below legibility. A drawing is
+    tiled when that fit would keep less than TILE_MIN_SCALE of it. Every tile
+    is read in its own upstream call with a structured (JSON schema) answer,
+    the calls run in parallel under the UpstreamScheduler, and the request's
+    own prompt is answered from a downscaled overview. Callouts read twice
+    in the overlap of neighbouring tiles are merged by value and position.
+    """
+
+    def __init__(self):
+        self.available = Image is not None
+        self.enabled = os.getenv("TILING_ENABLED", "false").lower() == "true"
+        self.tile_size = int(os.getenv("TILE_SIZE", str(SHORT_EDGE)))
+        self.overlap = float(os.getenv("TILE_OVERLAP", "0.15"))
+        self.max_tiles = int(os.getenv("TILE_MAX", "16"))
+        self.min_scale = float(os.getenv("TILE_MIN_SCALE", "0.75"))
+        self.overview_edge = int(os.getenv("TILE_OVERVIEW_EDGE", "1024"))
+        self.output_tokens = int(os.getenv("TILE_OUTPUT_TOKENS", "1000"))
+        # Readings closer than this fraction of a tile are the same callout
+        self.merge_distance = float(os.getenv("TILE_MERGE_DISTANCE", "0.1"))
+
+    @property
+    def settings_key(self) -> str:
+        """Identifies the current settings, so cached responses follow config changes"""
+        settings = {
+            "tile_size": self.tile_size,
+            "overlap": self.overlap,
+            "max_tiles": self.max_tiles,
+            "overview_edge": self.overview_edge,
+            "output_tokens": self.output_tokens,
+            "merge_distance": self.merge_distance
+        }
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    @property
+    def response_format(self) -> Dict[str, Any]:
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "drawing_tile_dimensions", "strict": True, "schema": TILE_SCHEMA}
+        }
+
+    def needs_tiling(self, size: Optional[Tuple[int, int]]) -> bool:
+        """Whether the model's own fit would shrink the drawing below min_scale"""
+        if size is None:
+            return False
+        width, height = size
+        return model_view_size(width, height)[0] / width < self.min_scale
+
+    async def split(
+        self,
+        image: ImagePayload,
+        pool: WorkerPool
+    ) -> Tuple[Tuple[int, int], ImagePayload, List[Tuple[Box, ImagePayload]]]:
+        """The page size, the overview payload and a payload per non-blank tile"""
+        data = await asyncio.to_thread(image.read_bytes)
+        size, overview, tiles = await pool.run(
+            split_drawing, data, self.tile_size, self.overlap, self.max_tiles, self.overview_edge,
+            input_bytes=len(data)
+        )
+        stem = os.path.splitext(image.filename)[0]
+        return size, ImagePayload(image.filename, "image/png", data=overview), [
+            (box, ImagePayload(f"{stem}_tile_{box[0]}_{box[1]}.png", "image/png", data=tile, detail="high"))
+            for box, tile in tiles
+        ]
+
+    @staticmethod
+    def messages(tile: ImagePayload) -> List[Dict[str, Any]]:
+        # Base64-encodes the tile; called in a thread
+        return [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": TILE_PROMPT},
+                {"type": "image_url", "image_url": {"url": tile.data_url(), "detail": tile.detail}}
+            ]
+        }]
+
+    @staticmethod
+    def read_tile(content: Optional[str], box: Box) -> Optional[List[Dict[str, Any]]]:
+        """
+        The tile's dimensions with x/y in page pixels, or None if the answer is
+        not the expected JSON; one malformed dimension makes the whole tile unreadable
+        """
+        try:
+            dimensions = json.loads(content or "")["dimensions"]
+            left, top, right, bottom = box
+            readings = []
+            for dim in dimensions:
+                if not all(isinstance(dim.get(field), str) for field in ("value", "kind", "feature")):
+                    return None
+                if dim.get("tolerance") is not None and not isinstance(dim["tolerance"], str):
+                    return None
+                readings.append(dict(
+                    value=dim["value"],
+                    tolerance=dim.get("tolerance"),
+                    kind=dim["kind"],
+                    feature=dim["feature"],
+                    x=round(left + min(1.0, max(0.0, float(dim["x"]))) * (right - left)),
+                    y=round(top + min(1.0, max(0.0, float(dim["y"]))) * (bottom - top))
+                ))
+            return readings
+        except (ValueError, TypeError, KeyError, AttributeError):
+            return None
+
+    def merge(self, readings: List[Tuple[int, Box, List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        """
+        One list of dimensions from (tile index, box, dimensions) readings of one drawing.
+        A reading is the same callout as an earlier one with the same kind, value
+        and tolerance when it comes from another tile and lies within the merge
+        distance, a fraction of the larger of the two tiles (plan_tiles grows
+        tiles on big drawings); repeats within one tile are separate callouts.
+        The reading nearest its own tile's centre is kept (edges cut text),
+        with 'tiles' listing every tile that saw it.
+        """
+        merged: List[Dict[str, Any]] = []
+        for index, box, dims in readings:
+            centre = ((box[0] + box[2]) / 2, (box[1] + box[3]) / 2)
+            edge = max(box[2] - box[0], box[3] - box[1])
+            for dim in dims:
+                key = (dim["kind"], _number(dim["value"]), _number(dim["tolerance"]))
+                offset = math.dist((dim["x"], dim["y"]), centre)
+                match = next((
+                    entry for entry in merged
+                    if entry["key"] == key and index not in entry["tiles"]
+                    and math.dist((dim["x"], dim["y"]), (entry["dim"]["x"], entry["dim"]["y"]))
+                    <= self.merge_distance * max(edge, entry["edge"])
+                ), None)
+                if match is None:
+                    merged.append({"key": key, "dim": dim, "offset": offset, "edge": edge, "tiles": [index]})
+                    continue
+                match["tiles"].append(index)
+                if offset < match["offset"]:
+                    match["dim"], match["offset"], match["edge"] = dim, offset, edge
+        return [dict(entry["dim"], tiles=entry["tiles"]) for entry in merged]
+
+    @staticmethod
+    def format_dimensions(dimensions: List[Dict[str, Any]]) -> str:
+        """The merged dimensions as a section appended to the response"""
+        lines = ["", "", "Dimensions (read from full-resolution tiles):"]
+        for dim in dimensions:
+            where = f"{dim['drawing']} @ {dim['x']},{dim['y']}"
+            lines.append(f"- {dim['value']}{_tolerance(dim['tolerance'])} ({dim['kind']}) - {dim['feature']} [{where}]")
+        if not dimensions:
+            lines.append("- none found")
+        return "\n".join(lines)
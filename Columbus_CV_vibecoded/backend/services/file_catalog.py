@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import hashlib
+import mimetypes
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    content_type TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_session ON files (session_id, created);
+CREATE INDEX IF NOT EXISTS files_sha256 ON files (sha256);
+CREATE INDEX IF NOT EXISTS files_filename ON files (filename);
+CREATE INDEX IF NOT EXISTS files_session_filename ON files (session_id, filename, created);
+CREATE INDEX IF NOT EXISTS files_created ON files (created);
+"""
+
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+
+class FileCatalog:
+    """
+    SQLite index of stored session files, so listings and lookups by
+    session, hash, filename or age never scan the upload tree.
+    The files on disk stay the source of truth: rebuild() recreates the
+    index from them, and it runs automatically when the database is
+    missing or damaged.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.needs_rebuild = not os.path.exists(db_path)
+        # Calls arrive from worker threads; one connection guarded by a lock is plenty for SQLite
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            if conn.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+                raise sqlite3.DatabaseError("integrity check failed")
+        except sqlite3.DatabaseError:
+            # Unreadable index: start over, the files themselves are intact
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.db_path + suffix):
+                    os.remove(self.db_path + suffix)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.needs_rebuild = True
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def add(self, path: str, session_id: str, filename: str, sha256: str, size: int,
+            content_type: Optional[str] = None, created: Optional[float] = None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, session_id, filename, sha256, size, content_type, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, session_id, filename, sha256, size, content_type, created or datetime.now().timestamp())
+            )
+
+    def list_session(self, session_id: str) -> List[Dict[str, Any]]:
+        return self._query("SELECT * FROM files WHERE session_id = ? ORDER BY created", (session_id,))
+
+    def find_latest(self, session_id: str, filename: str) -> Optional[str]:
+        rows = self._query(
+            "SELECT path FROM files WHERE session_id = ? AND filename = ? ORDER BY created DESC LIMIT 1",
+            (session_id, filename)
+        )
+        return rows[0]["path"] if rows else None
+
+    def find_by_hash(self, sha256: str) -> List[Dict[str, Any]]:
+        return self._query("SELECT * FROM files WHERE sha256 = ?", (sha256,))
+
+    def find_by_filename(self, filename: str) -> List[Dict[str, Any]]:
+        return self._query("SELECT * FROM files WHERE filename = ? ORDER BY created", (filename,))
+
+    def older_than(self, cutoff: float) -> List[Dict[str, Any]]:
+        return self._query("SELECT * FROM files WHERE created < ? ORDER BY created", (cutoff,))
+
+    def remove_paths(self, paths: List[str]):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in paths])
+
+    def remove_session(self, session_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE session_id = ?", (session_id,))
+
+    def rebuild(self, upload_dir: str, blob_dir: str) -> int:
+        """Re-create the index from the upload tree; returns the number of files indexed"""
+        # Session files are hard links into the blob store, so the inode gives the hash without reading
+        blob_hashes: Dict[int, str] = {}
+        for root, _, names in os.walk(blob_dir):
+            if os.path.basename(root) == "tmp":
+                continue
+            for name in names:
+                blob_hashes[os.stat(os.path.join(root, name)).st_ino] = name
+
+        rows = []
+        for session_id in os.listdir(upload_dir):
+            session_dir = os.path.join(upload_dir, session_id)
+            if not os.path.isdir(session_dir):
+                continue
+            for name in os.listdir(session_dir):
+                path = os.path.join(session_dir, name)
+                stat = os.stat(path)
+                filename = name
+                try:
+                    created = datetime.strptime(name[:15], TIMESTAMP_FORMAT).timestamp()
+                    filename = name[16:]
+                except ValueError:
+                    created = stat.st_mtime
+                sha256 = blob_hashes.get(stat.st_ino) or self._hash_file(path)
+                rows.append((path, session_id, filename, sha256, stat.st_size,
+                             mimetypes.guess_type(filename)[0], created))
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, session_id, filename, sha256, size, content_type, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        self.needs_rebuild = False
+        return len(rows)
+
+    def _query(self, sql: str, params: tuple) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,74 +1,481 @@
 import os
-import base64
-from typing import List, Optional
-from openai import OpenAI
+import time
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
-from models import ImageData
+from services.image_payload import ImagePayload
+from services.cache_service import ResponseCache
+from services.image_preprocessor import ImagePreprocessor
+from services.request_planner import RequestPlanner
+from services.drawing_tiler import TILE_PROMPT, DrawingTiler
+from services.worker_pool import WorkerPool
+from services.rate_limiter import UpstreamError, UpstreamScheduler
+from services.metrics import METRICS, count_error, observe_stage, observe_template, record_usage, span
 
 load_dotenv()
 
+TEMPLATE_NAMES = ("analyze", "describe", "technical", "default")
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (pip install httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
 class GPTService:
-    def __init__(self):
-        self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY")
+    def __init__(self, worker_pool: Optional[WorkerPool] = None):
+        # Shared connection pool - one keep-alive pool for every request in this process
+        self.http_client = httpx.AsyncClient(
+            http2=os.getenv("OPENAI_HTTP2", "true").lower() == "true" and _http2_available(),
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+            ),
+            timeout=httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT", "300")), connect=10.0)
+        )
+        self.client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
+            http_client=self.http_client,
+            max_retries=0  # Retries are scheduled by UpstreamScheduler
         )
         self.model = os.getenv("OPENAI_MODEL", "gpt-4o")
+        self.max_tokens = 4000
+        self.temperature = 0.7
+        self.cache = ResponseCache()
+        self.preprocessor = ImagePreprocessor()
+        # CPU-bound image work (preprocessing, planned resizes) runs in worker processes
+        self.worker_pool = worker_pool or WorkerPool()
+        # Detail, resolution, output limit and temperature per call; max_tokens/temperature apply when it is off
+        self.planner = RequestPlanner(self.max_tokens, self.temperature)
+        # Large drawings are read tile by tile in parallel calls, next to an overview answering the prompt
+        self.tiler = DrawingTiler()
+
+        # Rate limits, adaptive concurrency cap and retries for every upstream call
+        self.scheduler = UpstreamScheduler()
+
+        METRICS.gauge("columbus_upstream_in_flight", "Upstream calls in flight", function=lambda: self.scheduler.in_flight)
+        METRICS.gauge("columbus_upstream_concurrency_limit", "Current adaptive upstream concurrency limit",
+                      function=lambda: self.scheduler.concurrency.limit)
+        METRICS.counter("columbus_upstream_retries_total", "Upstream calls retried", function=lambda: self.scheduler.retries)
+        METRICS.counter("columbus_upstream_throttled_total", "Upstream calls answered with 429",
+                        function=lambda: self.scheduler.throttled)
+
+    @property
+    def in_flight(self) -> int:
+        return self.scheduler.in_flight
+
+    async def close(self):
+        """Close the shared HTTP connection pool"""
+        await self.client.close()
 
     async def process_chat(
         self,
         prompt: str,
-        images: Optional[List[ImageData]] = None,
-        template: Optional[str] = None
-    ) -> str:
+        images: Optional[List[ImagePayload]] = None,
+        template: Optional[str] = None,
+        use_cache: bool = True,
+        preprocess: Optional[bool] = None,
+        tiling: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """
+        Returns {"response": str, "cached": bool, "preprocessing": stats or None,
+        "plan": the RequestPlanner plan, "usage": upstream usage, "tiling": tile stats and
+        merged dimensions or None}; plan, usage and tiling are None on a cache hit
+        """
+        start_time = time.perf_counter()
         try:
             # Apply template if provided
             final_prompt = self._apply_template(prompt, template)
+            preprocess = self._should_preprocess(preprocess, images)
+            tiling = self._should_tile(tiling, images)
+            preprocessing = None
+            plan = None
+            usage = None
+            tiling_stats = None
 
-            # Prepare messages
-            messages = [
-                {
-                    "role": "user",
-                    "content": self._build_message_content(final_prompt, images)
-                }
-            ]
+            async def compute() -> str:
+                nonlocal preprocessing, plan, usage, tiling_stats
+                upstream_images, tile_reads = await self._start_tiles(images, tiling)
+                try:
+                    upstream_images, preprocessing = await self._preprocess(upstream_images, preprocess)
+                    plan, upstream_images = await self._plan(final_prompt, upstream_images, template)
+                    messages = await asyncio.to_thread(self._build_messages, final_prompt, upstream_images)
+                    content, usage = await self._complete(messages, plan)
+                    if tile_reads is None:
+                        return content
+                    section, tiling_stats, tile_usage = await tile_reads
+                finally:
+                    if tile_reads is not None:
+                        tile_reads.cancel()
+                usage = self._add_usage(usage, tile_usage)
+                return content + section
 
-            # Make API call
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=4000,
-                temperature=0.7
+            if not use_cache:
+                response = await compute()
+                return {"response": response, "cached": False, "preprocessing": preprocessing, "plan": plan,
+                        "usage": usage, "tiling": tiling_stats}
+
+            response, cached = await self.cache.get_or_compute(
+                await asyncio.to_thread(self._cache_key, final_prompt, images, preprocess, tiling),
+                compute
             )
+            return {"response": response, "cached": cached, "preprocessing": preprocessing, "plan": plan,
+                    "usage": usage, "tiling": tiling_stats}
+
+        except UpstreamError:
+            raise
+        except Exception as e:
+            raise Exception(f"GPT API error: {str(e)}")
+        finally:
+            observe_template(self._template_label(template), time.perf_counter() - start_time)
+
+    def _should_preprocess(self, requested: Optional[bool], images: Optional[List[ImagePayload]]) -> bool:
+        if not images or not self.preprocessor.available:
+            return False
+        return self.preprocessor.enabled if requested is None else requested
+
+    def _should_tile(self, requested: Optional[bool], images: Optional[List[ImagePayload]]) -> bool:
+        if not images or not self.tiler.available:
+            return False
+        return self.tiler.enabled if requested is None else requested
+
+    async def _start_tiles(
+        self,
+        images: Optional[List[ImagePayload]],
+        tiling: bool
+    ) -> Tuple[Optional[List[ImagePayload]], Optional[asyncio.Task]]:
+        """
+        Split every drawing that needs tiling and start reading its tiles in the
+        background. Returns the images for the main call, with each tiled drawing
+        replaced by its overview, and the task, which resolves to _read_tiles()
+        """
+        if not tiling:
+            return images, None
+        with span("tile"):
+            sizes = await asyncio.to_thread(lambda: [self.planner.image_size(image) for image in images])
+            splits = await asyncio.gather(*(
+                self.tiler.split(image, self.worker_pool) if self.tiler.needs_tiling(size) else asyncio.sleep(0, None)
+                for image, size in zip(images, sizes)
+            ))
+        upstream_images, tiles = [], []
+        for image, split in zip(images, splits):
+            if split is None:
+                upstream_images.append(image)
+                continue
+            _, overview, image_tiles = split
+            upstream_images.append(overview)
+            tiles.append((image.filename, image_tiles))
+        return upstream_images, asyncio.ensure_future(self._read_tiles(tiles))
+
+    async def _read_tiles(
+        self,
+        drawings: List[Tuple[str, List[Tuple[Tuple[int, int, int, int], ImagePayload]]]]
+    ) -> Tuple[str, Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        Read every tile of every drawing in parallel upstream calls and merge each
+        drawing's readings. Returns the dimensions section for the response, the
+        tiling stats and the summed usage of the tile calls
+        """
+        calls = [
+            asyncio.ensure_future(self._read_tile(tile, box))
+            for _, tiles in drawings for box, tile in tiles
+        ]
+        try:
+            results = iter(await asyncio.gather(*calls))
+        except BaseException:
+            # One tile failed for good: the request fails, so stop paying for the others
+            for call in calls:
+                call.cancel()
+            raise
 
-            return response.choices[0].message.content
+        dimensions, usage, unreadable = [], None, 0
+        for filename, tiles in drawings:
+            readings = []
+            for index, (box, _) in enumerate(tiles):
+                content, tile_usage = next(results)
+                usage = self._add_usage(usage, tile_usage)
+                dims = self.tiler.read_tile(content, box)
+                if dims is None:
+                    unreadable += 1
+                    continue
+                readings.append((index, box, dims))
+            dimensions += [dict(dim, drawing=filename) for dim in self.tiler.merge(readings)]
 
+        stats = {
+            "drawings": len(drawings),
+            "tiles": len(calls),
+            "unreadable_tiles": unreadable,
+            "dimensions": dimensions
+        }
+        section = self.tiler.format_dimensions(dimensions) if drawings else ""
+        return section, stats, usage
+
+    async def _read_tile(self, tile: ImagePayload, box: Tuple[int, int, int, int]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """One tile's structured answer; planned like any image, with its own output limit and no sampling"""
+        size = (box[2] - box[0], box[3] - box[1])
+        plan = dict(
+            self.planner.plan(TILE_PROMPT, [tile.filename], [size], None),
+            max_tokens=self.tiler.output_tokens,
+            temperature=0
+        )
+        messages = await asyncio.to_thread(self.tiler.messages, tile)
+        return await self._complete(messages, plan, response_format=self.tiler.response_format)
+
+    @staticmethod
+    def _add_usage(total: Optional[Dict[str, Any]], usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if total is None or usage is None:
+            return total or usage
+        return {
+            key: total[key] + usage[key]
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens")
+        }
+
+    async def _preprocess(
+        self,
+        images: Optional[List[ImagePayload]],
+        preprocess: bool
+    ) -> Tuple[Optional[List[ImagePayload]], Optional[Dict[str, Any]]]:
+        if not preprocess:
+            return images, None
+        with span("preprocess"):
+            return await self.preprocessor.process_all(images, self.worker_pool)
+
+    async def _plan(
+        self,
+        final_prompt: str,
+        images: Optional[List[ImagePayload]],
+        template: Optional[str]
+    ) -> Tuple[Dict[str, Any], Optional[List[ImagePayload]]]:
+        with span("plan"):
+            return await self.planner.prepare(final_prompt, images, template, self.worker_pool)
+
+    async def _execute(self, plan: Dict[str, Any], **params) -> Tuple[Any, float]:
+        """scheduler.execute() for one planned completion; time waiting for admission (and retries) counts as upstream_queue"""
+        queued = time.perf_counter()
+        try:
+            raw, started = await self.scheduler.execute(
+                lambda: self.client.chat.completions.with_raw_response.create(
+                    model=self.model,
+                    max_tokens=plan["max_tokens"],
+                    temperature=plan["temperature"],
+                    **params
+                ),
+                self._estimate_tokens(plan)
+            )
+        except BaseException as e:
+            count_error("upstream", e)
+            raise
+        observe_stage("upstream_queue", started - queued)
+        return raw, started
+
+    async def _complete(
+        self,
+        messages: List[Dict[str, Any]],
+        plan: Dict[str, Any],
+        **params
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """The response text and upstream usage; params (e.g. response_format) go to the API as they are"""
+        raw, started = await self._execute(plan, messages=messages, **params)
+        try:
+            response = raw.parse()
+        except BaseException as e:
+            count_error("upstream", e)
+            await self.scheduler.finish(started, None)
+            raise
+        observe_stage("upstream", time.perf_counter() - started)
+        usage = response.usage
+        await self.scheduler.finish(started, usage.completion_tokens if usage else None)
+        self.scheduler.settle_tokens(self._estimate_tokens(plan), usage.total_tokens if usage else None)
+        if usage:
+            record_usage(usage.prompt_tokens, usage.completion_tokens)
+
+        return response.choices[0].message.content, usage.model_dump() if usage else None
+
+    def _estimate_tokens(self, plan: Dict[str, Any]) -> int:
+        """Token reservation for the rate limiter; settled against the reported usage afterwards"""
+        return self.scheduler.reservation(plan["estimated_input_tokens"], plan["max_tokens"])
+
+    async def stream_chat(
+        self,
+        prompt: str,
+        images: Optional[List[ImagePayload]] = None,
+        template: Optional[str] = None,
+        use_cache: bool = True,
+        preprocess: Optional[bool] = None,
+        tiling: Optional[bool] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the model response as it is generated.
+        Yields {"type": "delta", "content": ...} events followed by one
+        {"type": "done", "usage": ..., "plan": ..., "timing": ..., "cached": ..., "tiling": ...} event.
+        A cache hit is replayed as a single delta. With tiling, the overview's
+        answer streams first and the merged dimensions follow as one delta.
+        """
+        start_time = time.perf_counter()
+        try:
+            final_prompt = self._apply_template(prompt, template)
+            preprocess = self._should_preprocess(preprocess, images)
+            tiling = self._should_tile(tiling, images)
+
+            cache_key = None
+            if use_cache and self.cache.enabled:
+                cache_key = await asyncio.to_thread(self._cache_key, final_prompt, images, preprocess, tiling)
+            if cache_key:
+                cached_response = await self.cache.get(cache_key)
+                if cached_response is not None:
+                    self.cache.count_lookup(hit=True)
+                    yield {"type": "delta", "content": cached_response}
+                    yield {
+                        "type": "done",
+                        "usage": None,
+                        "plan": None,
+                        "cached": True,
+                        "preprocessing": None,
+                        "tiling": None,
+                        "timing": {
+                            "time_to_first_token": time.perf_counter() - start_time,
+                            "total_time": time.perf_counter() - start_time
+                        }
+                    }
+                    return
+                self.cache.count_lookup(hit=False)
+
+            upstream_images, tile_reads = await self._start_tiles(images, tiling)
+            tiling_stats = None
+            try:
+                upstream_images, preprocessing = await self._preprocess(upstream_images, preprocess)
+                plan, upstream_images = await self._plan(final_prompt, upstream_images, template)
+                messages = await asyncio.to_thread(self._build_messages, final_prompt, upstream_images)
+
+                raw, started = await self._execute(
+                    plan,
+                    messages=messages,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                first_token_time = None
+                usage = None
+                parts = []
+                try:
+                    async for chunk in raw.parse():
+                        # The final chunk carries usage and no choices
+                        if chunk.usage is not None:
+                            usage = chunk.usage.model_dump()
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            if first_token_time is None:
+                                first_token_time = time.perf_counter() - start_time
+                            parts.append(delta)
+                            yield {"type": "delta", "content": delta}
+                except BaseException as e:
+                    count_error("upstream", e)
+                    raise
+                finally:
+                    await self.scheduler.finish(started, usage["completion_tokens"] if usage else None)
+                observe_stage("upstream", time.perf_counter() - started)
+                self.scheduler.settle_tokens(self._estimate_tokens(plan), usage["total_tokens"] if usage else None)
+                if usage:
+                    record_usage(usage["prompt_tokens"], usage["completion_tokens"])
+
+                if tile_reads is not None:
+                    section, tiling_stats, tile_usage = await tile_reads
+                    usage = self._add_usage(usage, tile_usage)
+                    if section:
+                        parts.append(section)
+                        yield {"type": "delta", "content": section}
+            finally:
+                if tile_reads is not None:
+                    tile_reads.cancel()
+
+            if cache_key:
+                await self.cache.set(cache_key, "".join(parts))
+
+            yield {
+                "type": "done",
+                "usage": usage,
+                "plan": plan,
+                "cached": False,
+                "preprocessing": preprocessing,
+                "tiling": tiling_stats,
+                "timing": {
+                    "time_to_first_token": first_token_time,
+                    "total_time": time.perf_counter() - start_time
+                }
+            }
+
+        except UpstreamError:
+            raise
         except Exception as e:
             raise Exception(f"GPT API error: {str(e)}")
+        finally:
+            observe_template(self._template_label(template), time.perf_counter() - start_time)
+
+    def _cache_key(self, final_prompt: str, images: Optional[List[ImagePayload]], preprocess: bool, tiling: bool) -> str:
+        # Hashes every image's bytes; called in a thread
+        with span("cache_key"):
+            return self.cache.make_key(
+                model=self.model,
+                prompt=final_prompt,
+                plan=self.planner.settings_key,
+                images=[image.sha256 for image in images or []],
+                preprocess=self.preprocessor.settings_key if preprocess else None,
+                tiling=self.tiler.settings_key if tiling else None
+            )
+
+    def _build_messages(self, final_prompt: str, images: Optional[List[ImagePayload]]) -> List[Dict[str, Any]]:
+        # Base64-encodes every image into its data URL; called in a thread
+        with span("encode"):
+            return [
+                {
+                    "role": "user",
+                    "content": self._build_message_content(final_prompt, images)
+                }
+            ]
+
+    @staticmethod
+    def _template_label(template: Optional[str]) -> str:
+        """Metrics label for a template; unknown names share one label so clients cannot grow the series"""
+        if not template:
+            return "none"
+        return template if template in TEMPLATE_NAMES else "unknown"
 
     def _apply_template(self, prompt: str, template: Optional[str]) -> str:
         if not template:
             return prompt
 
         # Basic template system - can be expanded
-        templates = {
-            "analyze": f"Please analyze the following images and provide detailed insights: {prompt}",
-            "describe": f"Please describe what you see in the images: {prompt}",
-            "technical": f"Provide a technical analysis of the images with focus on: {prompt}",
-            "default": prompt
-        }
+        with span("template"):
+            templates = {
+                "analyze": f"Please analyze the following images and provide detailed insights: {prompt}",
+                "describe": f"Please describe what you see in the images: {prompt}",
+                "technical": f"Provide a technical analysis of the images with focus on: {prompt}",
+                "default": prompt
+            }
 
-        return templates.get(template, templates["default"])
+            return templates.get(template, templates["default"])
 
-    def _build_message_content(self, prompt: str, images: Optional[List[ImageData]]):
+    def _build_message_content(self, prompt: str, images: Optional[List[ImagePayload]]):
         content = [{"type": "text", "text": prompt}]
 
         if images:
             for image in images:
+                image_url = {"url": image.data_url()}
+                if image.detail:
+                    image_url["detail"] = image.detail
                 content.append({
                     "type": "image_url",
-                    "image_url": {
-                        "url": f"data:{image.content_type};base64,{image.content}"
-                    }
+                    "image_url": image_url
                 })
 
-        return content
\ No newline at end of file
+        return content
@@ -0,0 +1,110 @@
+import io
+import copy
+import base64
+import hashlib
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional
+
+from models import ImageData
+
+# Multiple of 3 so chunked base64 output concatenates without padding in between
+ENCODE_CHUNK_SIZE = 3 * 256 * 1024
+
+
+class ImagePayload:
+    """
+    An image on its way to the upstream model.
+    The bytes stay where they arrived - a multipart upload's spooled file, a
+    stored upload on disk, raw bytes, or the base64 string a JSON client
+    already sent - and base64 encoding happens at most once, when the data
+    URL is first built.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        content_type: str,
+        data: Optional[bytes] = None,
+        file: Optional[BinaryIO] = None,
+        path: Optional[str] = None,
+        b64: Optional[str] = None,
+        detail: Optional[str] = None
+    ):
+        self.filename = filename
+        self.content_type = content_type
+        self._data = data
+        self._file = file
+        self._path = path
+        self._b64 = b64
+        self.detail = detail  # "low" | "high" | None (no hint), chosen by RequestPlanner
+        self._sha256: Optional[str] = None
+        self._data_url: Optional[str] = None
+
+    @classmethod
+    def from_image_data(cls, image: ImageData) -> "ImagePayload":
+        return cls(image.filename, image.content_type, b64=image.content)
+
+    def with_detail(self, detail: Optional[str]) -> "ImagePayload":
+        """The same image with another detail hint; bytes, hash and data URL are shared"""
+        payload = copy.copy(self)
+        payload.detail = detail
+        return payload
+
+    def _open(self) -> BinaryIO:
+        if self._data is not None:
+            return io.BytesIO(self._data)
+        if self._file is not None:
+            self._file.seek(0)
+            return self._file
+        if self._path is not None:
+            return open(self._path, "rb")
+        return io.BytesIO(base64.b64decode(self._b64))
+
+    @contextmanager
+    def open(self) -> Iterator[BinaryIO]:
+        """
+        The image as a readable file, for reading part of it (e.g. the header)
+        without copying it; a stored upload is closed and a spooled upload
+        rewound afterwards. JSON base64 is still decoded in full.
+        """
+        f = self._open()
+        try:
+            yield f
+        finally:
+            if self._path is not None:
+                f.close()
+            elif self._file is not None:
+                self._file.seek(0)
+
+    def _iter_chunks(self, chunk_size: int):
+        with self.open() as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                yield chunk
+
+    def read_bytes(self) -> bytes:
+        if self._data is not None:
+            return self._data
+        return b"".join(self._iter_chunks(ENCODE_CHUNK_SIZE))
+
+    @property
+    def sha256(self) -> str:
+        """SHA-256 of the decoded image bytes, so every transport yields the same cache key"""
+        if self._sha256 is None:
+            digest = hashlib.sha256()
+            for chunk in self._iter_chunks(ENCODE_CHUNK_SIZE):
+                digest.update(chunk)
+            self._sha256 = digest.hexdigest()
+        return self._sha256
+
+    def data_url(self) -> str:
+        if self._data_url is None:
+            prefix = f"data:{self.content_type};base64,"
+            if self._b64 is not None:
+                self._data_url = prefix + self._b64
+            else:
+                # Encode chunk by chunk so the raw bytes are never held in full alongside the output
+                encoded = bytearray(prefix.encode("ascii"))
+                for chunk in self._iter_chunks(ENCODE_CHUNK_SIZE):
+                    encoded += base64.b64encode(chunk)
+                self._data_url = encoded.decode("ascii")
+        return self._data_url
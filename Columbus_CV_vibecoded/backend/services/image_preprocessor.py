@@ -0,0 +1,196 @@
+import os
+import io
+import math
+import json
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from services.cache_service import MemoryCache
+from services.image_payload import ImagePayload
+from services.worker_pool import WorkerPool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it preprocessing is a no-op
+    Image = None
+
+load_dotenv()
+
+# OpenAI high-detail image tiling: fit within 2048x2048, shortest side to 768, 512px tiles
+MAX_FIT_EDGE = 2048
+SHORT_EDGE = 768
+TILE_SIZE = 512
+BASE_TOKENS = 85
+TOKENS_PER_TILE = 170
+
+
+def model_view_size(width: int, height: int) -> Tuple[int, int]:
+    """The size the model actually sees a high-detail image at; anything larger is wasted upload"""
+    scale = min(1.0, MAX_FIT_EDGE / max(width, height))
+    scale *= min(1.0, SHORT_EDGE / (min(width, height) * scale))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """Estimate input tokens for a high-detail image of the given size"""
+    width, height = model_view_size(width, height)
+    tiles = math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+    return BASE_TOKENS + TOKENS_PER_TILE * tiles
+
+
+class ImagePreprocessor:
+    """
+    Shrinks engineering drawings before they are sent upstream:
+    crop white margins, downscale to the model's tiling, reduce to
+    grayscale or black/white, and keep the smaller of PNG and WebP.
+    Results are cached by content hash and settings. The pixel work runs
+    in the WorkerPool.
+    """
+
+    def __init__(self):
+        self.available = Image is not None
+        self.enabled = os.getenv("PREPROCESS_ENABLED", "false").lower() == "true"
+        self.autocrop = os.getenv("PREPROCESS_AUTOCROP", "true").lower() == "true"
+        self.target_long_edge = int(os.getenv("PREPROCESS_TARGET_LONG_EDGE", str(MAX_FIT_EDGE)))
+        self.color_mode = os.getenv("PREPROCESS_COLOR_MODE", "grayscale")  # grayscale | binary | color
+        self.binary_threshold = int(os.getenv("PREPROCESS_BINARY_THRESHOLD", "200"))
+        self.formats = os.getenv("PREPROCESS_FORMATS", "png,webp").split(",")
+        self.cache = MemoryCache(int(os.getenv("PREPROCESS_CACHE_ENTRIES", "128")))
+
+    @property
+    def settings_key(self) -> str:
+        """Identifies the current settings, so cached variants and responses follow config changes"""
+        settings = {
+            "autocrop": self.autocrop,
+            "target_long_edge": self.target_long_edge,
+            "color_mode": self.color_mode,
+            "binary_threshold": self.binary_threshold,
+            "formats": self.formats
+        }
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Sent to pool workers with every task: settings only, not the cache
+        return dict(self.__dict__, cache=None)
+
+    async def process_all(self, images: List[ImagePayload], pool: WorkerPool) -> Tuple[List[ImagePayload], Dict[str, Any]]:
+        """Preprocess every image, returning the new payloads and aggregate stats for the request"""
+        stats = {
+            "images": len(images),
+            "cache_hits": 0,
+            "original_bytes": 0,
+            "processed_bytes": 0,
+            "bytes_saved": 0,
+            "estimated_tokens_before": 0,
+            "estimated_tokens_after": 0,
+            "estimated_tokens_saved": 0
+        }
+        processed = []
+        for result, image_stats in await asyncio.gather(*(self.process(image, pool) for image in images)):
+            processed.append(result)
+            for key in image_stats:
+                stats[key] += image_stats[key]
+
+        stats["bytes_saved"] = stats["original_bytes"] - stats["processed_bytes"]
+        stats["estimated_tokens_saved"] = stats["estimated_tokens_before"] - stats["estimated_tokens_after"]
+        return processed, stats
+
+    async def process(self, image: ImagePayload, pool: WorkerPool) -> Tuple[ImagePayload, Dict[str, int]]:
+        # Hashing and reading (base64 decoding for JSON uploads) in a thread, the pixel work in the pool
+        key = f"{await asyncio.to_thread(lambda: image.sha256)}:{self.settings_key}"
+        cached = self.cache.get(key)
+        if cached is not None:
+            data, content_type, stats = cached
+            return ImagePayload(image.filename, content_type, data=data), dict(stats, cache_hits=1)
+
+        original = await asyncio.to_thread(image.read_bytes)
+        data, content_type, stats = await pool.run(self.transform_bytes, original, input_bytes=len(original))
+        if data is None:
+            # Not something Pillow can read - send it as is
+            return image, stats
+        if content_type is None:
+            # Nothing gained - send the original
+            data, content_type = original, image.content_type
+        self.cache.set(key, (data, content_type, stats))
+        return ImagePayload(image.filename, content_type, data=data), dict(stats, cache_hits=0)
+
+    def transform_bytes(self, original: bytes) -> Tuple[Optional[bytes], Optional[str], Dict[str, int]]:
+        """
+        Decode, transform and re-encode one image; runs in a pool worker.
+        Returns (None, None, stats) for data Pillow cannot read and
+        (b"", None, stats) when the original should be sent unchanged.
+        """
+        try:
+            with Image.open(io.BytesIO(original)) as source:
+                source.load()
+                before_tokens = estimate_image_tokens(*source.size)
+                result = self._transform(source)
+                after_tokens = estimate_image_tokens(*result.size)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return None, None, {"original_bytes": len(original), "processed_bytes": len(original)}
+
+        data, content_type = self._encode(result)
+        if len(data) >= len(original) and after_tokens >= before_tokens:
+            return b"", None, {
+                "original_bytes": len(original),
+                "processed_bytes": len(original),
+                "estimated_tokens_before": before_tokens,
+                "estimated_tokens_after": before_tokens
+            }
+
+        return data, content_type, {
+            "original_bytes": len(original),
+            "processed_bytes": len(data),
+            "estimated_tokens_before": before_tokens,
+            "estimated_tokens_after": after_tokens
+        }
+
+    def _transform(self, image: "Image.Image") -> "Image.Image":
+        image = ImageOps.exif_transpose(image)
+        gray = image.convert("L")
+
+        if self.autocrop:
+            # Bounding box of anything noticeably darker than the paper, with a small margin
+            bbox = gray.point(lambda p: 255 if p < 240 else 0).getbbox()
+            if bbox:
+                pad = max(4, int(0.01 * max(gray.size)))
+                bbox = (
+                    max(0, bbox[0] - pad), max(0, bbox[1] - pad),
+                    min(gray.width, bbox[2] + pad), min(gray.height, bbox[3] + pad)
+                )
+                gray = gray.crop(bbox)
+                if self.color_mode == "color":
+                    image = image.crop(bbox)
+
+        result = gray if self.color_mode != "color" else image.convert("RGB")
+
+        # Downscale to what the model's tiling will keep, capped at the configured long edge
+        width, height = model_view_size(*result.size)
+        long_edge = max(width, height)
+        if long_edge > self.target_long_edge:
+            scale = self.target_long_edge / long_edge
+            width, height = max(1, round(width * scale)), max(1, round(height * scale))
+        if (width, height) != result.size:
+            result = result.resize((width, height), Image.LANCZOS)
+
+        if self.color_mode == "binary":
+            threshold = self.binary_threshold
+            result = result.point(lambda p: 255 if p > threshold else 0, mode="1")
+
+        return result
+
+    def _encode(self, image: "Image.Image") -> Tuple[bytes, str]:
+        candidates = []
+        if "png" in self.formats:
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG", optimize=True)
+            candidates.append((buffer.getvalue(), "image/png"))
+        if "webp" in self.formats:
+            buffer = io.BytesIO()
+            # WebP has no 1-bit mode; lossless keeps thin lines crisp
+            webp_source = image.convert("L") if image.mode == "1" else image
+            webp_source.save(buffer, format="WEBP", lossless=True, method=4)
+            candidates.append((buffer.getvalue(), "image/webp"))
+        return min(candidates, key=lambda candidate: len(candidate[0]))
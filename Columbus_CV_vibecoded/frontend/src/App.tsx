@@ -2,7 +2,7 @@ import { useState, useCallback } from 'react'
 import ImageUpload from './components/ImageUpload'
 import TemplateSelector from './components/TemplateSelector'
 import ChatInterface, { type ChatMessage } from './components/ChatInterface'
-import { apiService, type ImageData } from './services/api'
+import { apiService } from './services/api'
 import './App.css'
 
 function App() {
@@ -25,23 +25,22 @@ function App() {
     setSelectedTemplate(template);
   }, []);
 
-  const convertFilesToImageData = async (files: File[]): Promise<ImageData[]> => {
-    const imageDataPromises = files.map(file => apiService.fileToImageData(file));
-    return Promise.all(imageDataPromises);
-  };
-
   const handleSendMessage = useCallback(async (message: string) => {
     if (selectedFiles.length === 0) {
       alert('Please upload at least one image first.');
       return;
     }
 
+    // The assistant message the response streams into; an error replaces its content
+    const sentAt = Date.now();
+    const aiMessageId = (sentAt + 1).toString();
+
     try {
       setIsChatLoading(true);
 
       // Add user message to chat
       const userMessage: ChatMessage = {
-        id: Date.now().toString(),
+        id: sentAt.toString(),
         type: 'user',
         content: message,
         timestamp: new Date().toISOString(),
@@ -49,41 +48,40 @@ function App() {
       };
       setMessages(prev => [...prev, userMessage]);
 
-      // Convert files to ImageData for API
-      const imageData = await convertFilesToImageData(selectedFiles);
+      // Add an empty AI message and fill it in as the response streams
+      setMessages(prev => [...prev, {
+        id: aiMessageId,
+        type: 'assistant',
+        content: '',
+        timestamp: new Date().toISOString()
+      }]);
 
-      // Send chat request
-      const response = await apiService.chat({
+      const response = await apiService.chatStream({
         prompt: message,
-        images: imageData,
         template: selectedTemplate === 'default' ? undefined : selectedTemplate,
         session_id: sessionId || undefined
-      });
+      }, (delta) => {
+        setMessages(prev => prev.map(m =>
+          m.id === aiMessageId ? { ...m, content: m.content + delta } : m
+        ));
+      }, selectedFiles);
 
       // Update session ID if we got a new one
       if (response.session_id && response.session_id !== sessionId) {
         setSessionId(response.session_id);
       }
 
-      // Add AI response to chat
-      const aiMessage: ChatMessage = {
-        id: (Date.now() + 1).toString(),
-        type: 'assistant',
-        content: response.response,
-        timestamp: response.timestamp
-      };
-      setMessages(prev => [...prev, aiMessage]);
+      setMessages(prev => prev.map(m =>
+        m.id === aiMessageId ? { ...m, timestamp: response.timestamp } : m
+      ));
 
     } catch (error) {
       console.error('Chat error:', error);
 
-      const errorMessage: ChatMessage = {
-        id: (Date.now() + 1).toString(),
-        type: 'assistant',
-        content: `Sorry, I encountered an error: ${error instanceof Error ? error.message : 'Unknown error'}. Please try again.`,
-        timestamp: new Date().toISOString()
-      };
-      setMessages(prev => [...prev, errorMessage]);
+      const content = `Sorry, I encountered an error: ${error instanceof Error ? error.message : 'Unknown error'}. Please try again.`;
+      setMessages(prev => prev.map(m =>
+        m.id === aiMessageId ? { ...m, content, timestamp: new Date().toISOString() } : m
+      ));
     } finally {
       setIsChatLoading(false);
     }
@@ -0,0 +1,113 @@
+# batch_manifest.py - Resumable --batch runs keyed by drawing content and analysis settings
+"""
+Records every drawing a --batch run finishes (or fails) in
+results/batch_manifest.json. An item is keyed by the SHA-256 of the file's
+content, the model name, the prompt hash and the settings that change the
+output, so a rerun:
+
+- skips drawings that are already done (also when re-added under another name)
+- retries drawings that failed
+- reprocesses drawings whose model, prompt or settings changed
+
+Content hashes are remembered per (path, size, mtime), so restarting a
+large run only stats the files instead of reading them all again. The
+manifest is rewritten atomically after each drawing; a crash loses at most
+the drawing in progress.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+MANIFEST_VERSION = 1
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.pdf', '.tiff', '.bmp')
+
+
+def find_images(directory) -> List[Path]:
+    """Drawings in directory (any extension case), in name order"""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    return sorted(path for path in directory.iterdir() if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def run_key(model: str, prompt: str, settings: Dict[str, Any]) -> str:
+    """Hash of everything besides the drawing itself that determines the analysis"""
+    return hashlib.sha256(json.dumps({
+        'model': model,
+        'prompt_sha256': hashlib.sha256(prompt.encode()).hexdigest(),
+        'settings': settings
+    }, sort_keys=True).encode()).hexdigest()
+
+
+class BatchManifest:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()  # Pipeline writers record results from several threads
+        if self.path.exists():
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION:
+                    self.files = data['files']
+                    self.items = data['items']
+            except (ValueError, KeyError) as e:
+                print(f"⚠️ Ignoring unreadable manifest {self.path}: {e}")
+
+    def file_hash(self, path) -> str:
+        """Content hash of a drawing, re-read only when its size or mtime changed"""
+        path = str(Path(path).resolve())
+        stat = os.stat(path)
+        known = self.files.get(path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+        sha256 = file_sha256(path)
+        self.files[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+        return sha256
+
+    @staticmethod
+    def item_key(file_hash: str, key: str) -> str:
+        return f"{file_hash}:{key}"
+
+    def get(self, item_key: str) -> Optional[Dict[str, Any]]:
+        return self.items.get(item_key)
+
+    def is_done(self, item_key: str) -> bool:
+        """Finished earlier and its result file is still there"""
+        item = self.items.get(item_key)
+        return bool(item and item['status'] == 'done' and Path(item['output']).exists())
+
+    def record_done(self, item_key: str, image_path, output_path, seconds: float):
+        self._record(item_key, image_path, {'status': 'done', 'output': str(output_path), 'seconds': seconds})
+
+    def record_failed(self, item_key: str, image_path, error: str):
+        self._record(item_key, image_path, {'status': 'failed', 'error': error})
+
+    def _record(self, item_key: str, image_path, fields: Dict[str, Any]):
+        with self._lock:
+            self.items[item_key] = {'file': str(image_path), 'updated': time.time(), **fields}
+            self.save()
+
+    def save(self):
+        """Write the whole manifest to a temporary file and rename it over the old one"""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({'version': MANIFEST_VERSION, 'files': self.files, 'items': self.items}, f, indent=1)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)  # Readers only ever see a complete manifest
@@ -0,0 +1,58 @@
+# batch_manifest_test.py - Skip, retry and reprocess decisions of the --batch manifest
+import tempfile
+from pathlib import Path
+
+import batch_manifest
+from batch_manifest import BatchManifest, find_images, run_key
+
+
+def test_batch_manifest():
+    with tempfile.TemporaryDirectory() as tmp:
+        images = Path(tmp) / "images"
+        images.mkdir()
+        for name, content in [("a.pdf", b"drawing a"), ("B.PNG", b"drawing b"), ("c.jpg", b"drawing c"), ("notes.txt", b"x")]:
+            (images / name).write_bytes(content)
+        files = find_images(images)
+        assert [f.name for f in files] == ["B.PNG", "a.pdf", "c.jpg"]
+
+        key = run_key("llava", "prompt", {"profile": "gpu", "dpi": 144})
+        manifest_path = Path(tmp) / "results" / "batch_manifest.json"
+        manifest = BatchManifest(manifest_path)
+        keys = {f: manifest.item_key(manifest.file_hash(f), key) for f in files}
+        output = Path(tmp) / "a_columbus_analysis.json"
+        output.write_text("{}")
+        manifest.record_done(keys[files[1]], files[1], output, 1.5)
+        manifest.record_failed(keys[files[2]], files[2], "could not open")
+        assert not list(manifest_path.parent.glob("*.tmp"))
+
+        # A restart reads the manifest back and only stats the files
+        reads = []
+        original = batch_manifest.file_sha256
+        batch_manifest.file_sha256 = lambda path: reads.append(path) or original(path)
+        try:
+            manifest = BatchManifest(manifest_path)
+            assert [manifest.item_key(manifest.file_hash(f), key) for f in files] == [keys[f] for f in files]
+            assert not reads
+        finally:
+            batch_manifest.file_sha256 = original
+
+        assert manifest.is_done(keys[files[1]])
+        assert not manifest.is_done(keys[files[2]]) and manifest.get(keys[files[2]])['status'] == "failed"
+        assert manifest.get(keys[files[0]]) is None
+
+        # Re-added under another name: same content, same item
+        (images / "a_copy.pdf").write_bytes(b"drawing a")
+        assert manifest.is_done(manifest.item_key(manifest.file_hash(images / "a_copy.pdf"), key))
+
+        # Changed settings, changed content or a deleted result file mean reprocessing
+        other = run_key("llava", "prompt", {"profile": "cpu-int8", "dpi": 144})
+        assert not manifest.is_done(manifest.item_key(manifest.file_hash(files[1]), other))
+        files[1].write_bytes(b"drawing a, revision B")
+        assert not manifest.is_done(manifest.item_key(manifest.file_hash(files[1]), key))
+        output.unlink()
+        assert not manifest.is_done(keys[files[1]])
+        print("✅ Manifest skip / retry / reprocess decisions passed")
+
+
+if __name__ == "__main__":
+    test_batch_manifest()
@@ -0,0 +1,204 @@
+# batch_pipeline.py - Staged --batch processing: prepare, inference and writing overlap
+"""
+Runs a --batch job as three stages connected by bounded queues, so the
+model never waits for the CPU work around it:
+
+    prepare (N threads)  text layer, rasterization, processor inputs
+        -> inference (1 thread, the model)  generate, batched with batch_size > 1
+        -> write (M threads)  regex extraction, JSON result, manifest
+
+Drawings their text layer fully resolves go from prepare straight to
+write. Each stage reports its busy, idle (waiting for input) and blocked
+(waiting for room downstream) time; with enough prepare workers the
+inference stage is busy for nearly the whole run.
+
+    pipeline = BatchPipeline(analyzer, on_result, prepare_workers=2, write_workers=1)
+    stats = pipeline.run([(path, tag), ...])
+    print_stage_stats(stats, pipeline.wall)
+"""
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+_DONE = object()  # End-of-stream marker between stages
+
+
+class StageStats:
+    """Counters for one stage, updated by its workers"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.idle = 0.0
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items: int = 0, busy: float = 0.0, idle: float = 0.0, blocked: float = 0.0):
+        with self._lock:
+            self.items += items
+            self.busy += busy
+            self.idle += idle
+            self.blocked += blocked
+
+    def utilization(self, wall: float) -> float:
+        """Share of the run the stage's workers spent working"""
+        return self.busy / (wall * self.workers) if wall > 0 else 0.0
+
+
+class BatchPipeline:
+    """
+    on_result(image_path, tag, analysis, error, seconds) is called from a
+    write worker for every drawing: analysis is None when error is set,
+    seconds runs from the start of preparation to the final analysis.
+    """
+
+    def __init__(self, analyzer, on_result: Callable[[str, Any, Optional[Dict[str, Any]], Optional[str], float], None],
+                 prepare_workers: int = 2, write_workers: int = 1, queue_size: int = 4, batch_size: int = 1):
+        self.analyzer = analyzer
+        self.on_result = on_result
+        self.prepare_workers = max(1, prepare_workers)
+        self.write_workers = max(1, write_workers)
+        self.batch_size = max(1, batch_size)
+        self.inference_queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.write_queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.stats = {
+            'prepare': StageStats('prepare', self.prepare_workers),
+            'inference': StageStats('inference', 1),
+            'write': StageStats('write', self.write_workers),
+        }
+        self.wall = 0.0
+
+    def run(self, items: Iterable[Tuple[str, Any]]) -> Dict[str, StageStats]:
+        """Process every (image_path, tag) and return the per-stage stats once all results are written"""
+        pending: queue.Queue = queue.Queue()
+        for item in items:
+            pending.put(item)
+
+        start = time.perf_counter()
+        preparers = [threading.Thread(target=self._prepare_worker, args=(pending,), name=f"prepare-{i}", daemon=True)
+                     for i in range(self.prepare_workers)]
+        writers = [threading.Thread(target=self._write_worker, name=f"write-{i}", daemon=True)
+                   for i in range(self.write_workers)]
+        inference = threading.Thread(target=self._inference_worker, name="inference", daemon=True)
+        for thread in preparers + writers + [inference]:
+            thread.start()
+
+        for thread in preparers:
+            thread.join()
+        self.inference_queue.put(_DONE)
+        inference.join()
+        for _ in writers:
+            self.write_queue.put(_DONE)
+        for thread in writers:
+            thread.join()
+        self.wall = time.perf_counter() - start
+        return self.stats
+
+    def _put(self, target: queue.Queue, item, stats: StageStats):
+        waited = time.perf_counter()
+        target.put(item)
+        stats.add(blocked=time.perf_counter() - waited)
+
+    def _prepare_worker(self, pending: queue.Queue):
+        stats = self.stats['prepare']
+        while True:
+            try:
+                image_path, tag = pending.get_nowait()
+            except queue.Empty:
+                return
+            started = time.perf_counter()
+            work = {'image_path': image_path, 'tag': tag, 'started': started, 'text_result': None,
+                    'prepared': [], 'llava_results': [], 'error': None}
+            try:
+                work['text_result'], pages = self.analyzer.plan_analysis(image_path)
+                # Batched generate tokenizes all prompts together, so only single drawings are tokenized here
+                work['prepared'] = [
+                    self.analyzer.prepare_drawing(image_path, page=page, tokenize=self.batch_size == 1) for page in pages
+                ]
+            except Exception as e:
+                work['error'] = str(e)
+            stats.add(items=1, busy=time.perf_counter() - started)
+            # Nothing for the model to do: straight to the writers
+            target = self.inference_queue if work['prepared'] and not work['error'] else self.write_queue
+            self._put(target, work, stats)
+
+    def _inference_worker(self):
+        stats = self.stats['inference']
+        while True:
+            waited = time.perf_counter()
+            work = self.inference_queue.get()
+            if work is _DONE:
+                stats.add(idle=time.perf_counter() - waited)
+                return
+            group = [work]
+            finished = False
+            while len(group) < self.batch_size:
+                try:
+                    work = self.inference_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if work is _DONE:
+                    finished = True
+                    break
+                group.append(work)
+            started = time.perf_counter()
+            stats.add(idle=started - waited)
+
+            self._generate(group)
+            stats.add(items=len(group), busy=time.perf_counter() - started)
+            for work in group:
+                self._put(self.write_queue, work, stats)
+            if finished:
+                return
+
+    def _generate(self, group: List[Dict[str, Any]]):
+        """Model results for every prepared page in the group; a failure marks the drawings it covers"""
+        if self.batch_size == 1:
+            for work in group:
+                try:
+                    work['llava_results'] = [self.analyzer.run_prepared(prepared) for prepared in work['prepared']]
+                except Exception as e:
+                    work['error'] = str(e)
+            return
+
+        pages = [(work, prepared) for work in group for prepared in work['prepared']]
+        try:
+            results = self.analyzer.run_prepared_batch([prepared for _, prepared in pages])
+        except Exception as e:
+            for work in group:
+                work['error'] = str(e)
+            return
+        for (work, _), result in zip(pages, results):
+            work['llava_results'].append(result)
+
+    def _write_worker(self):
+        stats = self.stats['write']
+        while True:
+            waited = time.perf_counter()
+            work = self.write_queue.get()
+            started = time.perf_counter()
+            stats.add(idle=started - waited)
+            if work is _DONE:
+                return
+            analysis, error = None, work['error']
+            if error is None:
+                try:
+                    analysis = self.analyzer.compile_results(work['image_path'], work['text_result'], work['llava_results'])
+                except Exception as e:
+                    error = str(e)
+            try:
+                self.on_result(work['image_path'], work['tag'], analysis, error, time.perf_counter() - work['started'])
+            except Exception as e:
+                print(f"   ❌ Could not write result for {work['image_path']}: {e}")
+            stats.add(items=1, busy=time.perf_counter() - started)
+
+
+def print_stage_stats(stats: Dict[str, StageStats], wall: float):
+    print(f"\n⏱️ Pipeline stages over {wall:.1f}s")
+    print(f"   {'stage':10s} {'workers':>7s} {'items':>6s} {'busy':>8s} {'util':>6s} {'idle':>8s} {'blocked':>8s}")
+    for stage in stats.values():
+        print(f"   {stage.name:10s} {stage.workers:7d} {stage.items:6d} {stage.busy:7.1f}s "
+              f"{stage.utilization(wall) * 100:5.0f}% {stage.idle:7.1f}s {stage.blocked:7.1f}s")
@@ -0,0 +1,57 @@
+# batch_pipeline_test.py - Staged --batch pipeline against the sequential analysis, using a tiny random model
+import os
+import tempfile
+
+from PIL import Image
+
+from tiny_model import build_tiny_model
+from main import ColumbusDrawingAnalyzer
+from batch_pipeline import BatchPipeline
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "images")
+
+
+def test_batch_pipeline():
+    with tempfile.TemporaryDirectory() as tmp:
+        analyzer = ColumbusDrawingAnalyzer(
+            model_name=build_tiny_model(os.path.join(tmp, "model")), max_new_tokens=16, profile="cpu-fp32", lazy_load=True
+        )
+        paths = [os.path.join(IMAGES_DIR, "PIS2.500-0120REVB.pdf")]
+        for index, size in enumerate([(800, 600), (300, 900), (640, 640)]):
+            paths.append(os.path.join(tmp, f"scan{index}.png"))
+            Image.new("RGB", size, (60 * index, 120, 200)).save(paths[-1])
+        broken = os.path.join(tmp, "broken.png")
+        with open(broken, "w") as f:
+            f.write("not an image")
+        expected = {path: analyzer.comprehensive_analysis(path)['analysis_results'] for path in paths}
+
+        for batch_size in (1, 2):
+            written = {}
+
+            def on_result(image_path, tag, analysis, error, seconds):
+                written[image_path] = (tag, analysis, error)
+
+            pipeline = BatchPipeline(analyzer, on_result, prepare_workers=2, write_workers=2, queue_size=1,
+                                     batch_size=batch_size)
+            stats = pipeline.run([(path, f"tag-{path}") for path in paths + [broken]])
+
+            assert set(written) == set(paths) | {broken}
+            assert written[broken][1] is None and written[broken][2]
+            for path in paths:
+                tag, analysis, error = written[path]
+                assert tag == f"tag-{path}" and error is None
+                results = analysis['analysis_results']
+                assert results['performance_metrics']['analysis_path'] == expected[path]['performance_metrics']['analysis_path']
+                assert results['extracted_dimensions'] == expected[path]['extracted_dimensions']
+                if batch_size == 1:
+                    assert results['llava_detailed_response'] == expected[path]['llava_detailed_response']
+
+            # The text layer drawing and the broken file never reach the model
+            assert stats['prepare'].items == 5 and stats['inference'].items == 3 and stats['write'].items == 5
+            assert 0 < stats['inference'].utilization(pipeline.wall) <= 1
+            print(f"✅ Pipeline with batch size {batch_size}: inference busy "
+                  f"{stats['inference'].utilization(pipeline.wall) * 100:.0f}% of {pipeline.wall:.2f}s")
+
+
+if __name__ == "__main__":
+    test_batch_pipeline()
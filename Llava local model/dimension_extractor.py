@@ -0,0 +1,204 @@
+# dimension_extractor.py - Single-pass dimension extraction for Columbus drawing text
+"""
+Runs each dimension pattern once over a whole response, instead of
+calling re.finditer for every pattern on every line, and maps match
+offsets back to line numbers. Output is identical to the per-line,
+per-pattern scan: every pattern finds its own non-overlapping matches,
+ordered by line, then pattern, then position.
+
+    extractor = DimensionExtractor()
+    dims = extractor.extract(text)                  # list of DimensionMatch
+    dicts = [d.as_dict() for d in dims]
+
+    stream = extractor.stream()                      # incremental, e.g. fed by a TextIteratorStreamer
+    for chunk in streamer:
+        for dim in stream.feed(chunk):
+            ...
+    stream.close()
+"""
+import re
+from bisect import bisect_right
+from itertools import accumulate
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+
+# Mechanical drawing dimension patterns
+DIMENSION_PATTERNS = {
+    'tolerance_dim': r'(\d+\.?\d*)\s*[±]\s*(\d+\.?\d*)',
+    'diameter_symbol': r'[Ø∅]\s*(\d+\.?\d*)',
+    'radius': r'R\s*(\d+\.?\d*)',
+    'thread_spec': r'(\d+(?:\s*/\s*\d+)?)\s*[-‑]\s*(\d+)\s*(UNC|UNF|UNEF)\s*[-‑]\s*(\dA|\dB)',
+    'chamfer': r'(\d+\.?\d*)\s*[Xx×]\s*(\d+\.?\d*)°?\s*[Cc]hamfer',
+    'decimal_dim': r'\b(\d+\.\d{2,3})\b',
+    'fractional_dim': r'(\d+)\s*(\d+/\d+)',
+    'inspection_feature': r'\*\s*(\d+\.?\d*)\s*[±]?\s*(\d+\.?\d*)?'
+}
+
+BASE_CONFIDENCE = {
+    'tolerance_dim': 0.9,
+    'diameter_symbol': 0.95,
+    'thread_spec': 0.98,
+    'inspection_feature': 0.95,
+    'chamfer': 0.85,
+    'radius': 0.85,
+    'decimal_dim': 0.7,
+    'fractional_dim': 0.6
+}
+
+# Text every match of a pattern contains. Patterns that open with a digit are
+# tried at every digit of the response, so they only run on lines containing it
+PATTERN_ANCHORS = {
+    'tolerance_dim': '±',
+    'thread_spec': 'UN',
+    'chamfer': 'hamfer',
+    'fractional_dim': '/'
+}
+
+# Typical hydraulic dimensions get a confidence boost
+HYDRAULIC_KEYWORDS = ('2.49', '2.47', '1.00', '0.81')
+
+
+def calculate_confidence(pattern_type: str, match_text: str) -> float:
+    """Calculate confidence score for extracted dimensions"""
+    conf = BASE_CONFIDENCE.get(pattern_type, 0.5)
+    if any(keyword in match_text.lower() for keyword in HYDRAULIC_KEYWORDS):
+        conf += 0.1
+    return min(conf, 1.0)
+
+
+class DimensionMatch:
+    """One extracted dimension; as_dict() gives the extract_dimensions_regex() record"""
+
+    __slots__ = ('type', 'value', 'tolerance', 'full_match', 'line_number', 'line_text', 'confidence')
+
+    def __init__(self, type: str, value: Optional[str], tolerance: Optional[str], full_match: str,
+                 line_number: int, line_text: str, confidence: float):
+        self.type = type
+        self.value = value
+        self.tolerance = tolerance
+        self.full_match = full_match
+        self.line_number = line_number
+        self.line_text = line_text
+        self.confidence = confidence
+
+    def as_dict(self) -> Dict:
+        return {
+            'type': self.type,
+            'value': self.value,
+            'tolerance': self.tolerance,
+            'full_match': self.full_match,
+            'line_number': self.line_number,
+            'line_text': self.line_text,
+            'confidence': self.confidence
+        }
+
+    def __repr__(self):
+        return f"DimensionMatch({self.type}, {self.full_match!r}, line {self.line_number})"
+
+
+class DimensionExtractor:
+    """
+    Compiled scanners for the dimension patterns. Patterns can match
+    overlapping text (a tolerance callout is also two decimal dimensions),
+    which one alternation cannot report, so each pattern keeps its own
+    scanner and runs over the whole text in C rather than line by line.
+    """
+
+    def __init__(self, patterns: Dict[str, str] = None):
+        patterns = DIMENSION_PATTERNS if patterns is None else patterns
+        self.types = list(patterns)
+        self._scanners = []
+        for name, pattern in patterns.items():
+            # Lines are scanned together, so whitespace must not run across a newline
+            regex = re.compile(pattern.replace(r'\s', r'[^\S\n]'), re.IGNORECASE)
+            # Anchors only hold for the stock patterns
+            anchor = PATTERN_ANCHORS.get(name) if pattern == DIMENSION_PATTERNS.get(name) else None
+            anchor = re.compile(re.escape(anchor), re.IGNORECASE) if anchor else None
+            self._scanners.append((regex, anchor, 1 if regex.groups else 0, 2 if regex.groups > 1 else None))
+        self._confidence: List[Dict[str, float]] = [{} for _ in self.types]
+
+    def extract(self, text: str, first_line: int = 1) -> List[DimensionMatch]:
+        """Every dimension in text, in the same order as extract_dimensions_regex()"""
+        lines = text.split('\n')
+        line_starts = list(accumulate((len(line) + 1 for line in lines[:-1]), initial=0))
+        line_texts: Dict[int, str] = {}
+        patterns = len(self._scanners)
+        found = []
+        for index, (regex, anchor, value_group, tolerance_group) in enumerate(self._scanners):
+            pattern_type = self.types[index]
+            confidence = self._confidence[index]
+            spans = [(0, len(text))] if anchor is None else self._anchored_spans(anchor, text, line_starts)
+            for span_start, span_end in spans:
+                for match in regex.finditer(text, span_start, span_end):
+                    line = bisect_right(line_starts, match.start()) - 1
+                    line_text = line_texts.get(line)
+                    if line_text is None:
+                        line_text = line_texts[line] = lines[line].strip()
+                    full_match = match.group()
+                    conf = confidence.get(full_match)
+                    if conf is None:
+                        conf = confidence[full_match] = calculate_confidence(pattern_type, full_match)
+                    found.append((line * patterns + index, DimensionMatch(
+                        pattern_type,
+                        match.group(value_group),
+                        match.group(tolerance_group) if tolerance_group else None,
+                        full_match,
+                        first_line + line,
+                        line_text,
+                        conf
+                    )))
+
+        # Scanned pattern by pattern; the original order is line, then pattern, then position
+        found.sort(key=itemgetter(0))
+        return [item[1] for item in found]
+
+    @staticmethod
+    def _anchored_spans(anchor, text: str, line_starts: List[int]) -> List[Tuple[int, int]]:
+        """(start, end) offsets of the runs of consecutive lines that contain anchor"""
+        spans = []
+        for hit in anchor.finditer(text):
+            line = bisect_right(line_starts, hit.start()) - 1
+            start = line_starts[line]
+            end = line_starts[line + 1] - 1 if line + 1 < len(line_starts) else len(text)
+            if spans and start <= spans[-1][1] + 1:
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+        return spans
+
+    def stream(self) -> "DimensionStream":
+        return DimensionStream(self)
+
+
+class DimensionStream:
+    """
+    Incremental extraction over generated text. Matches never span lines,
+    so each completed line is final as soon as its newline arrives.
+    """
+
+    def __init__(self, extractor: DimensionExtractor):
+        self.extractor = extractor
+        self.pending = []
+        self.next_line = 1
+
+    def feed(self, chunk: str) -> List[DimensionMatch]:
+        """Dimensions on the lines chunk completes"""
+        cut = chunk.rfind('\n')
+        if cut < 0:
+            self.pending.append(chunk)
+            return []
+        self.pending.append(chunk[:cut])
+        complete = ''.join(self.pending)
+        self.pending = [chunk[cut + 1:]]
+        return self._extract(complete)
+
+    def close(self) -> List[DimensionMatch]:
+        """Dimensions on the final, unterminated line"""
+        rest = ''.join(self.pending)
+        self.pending = []
+        return self._extract(rest)
+
+    def _extract(self, lines: str) -> List[DimensionMatch]:
+        found = self.extractor.extract(lines, first_line=self.next_line)
+        self.next_line += lines.count('\n') + 1
+        return found
@@ -0,0 +1,64 @@
+# dimension_extractor_test.py - Single-pass extractor against the original per-line, per-pattern scan
+import random
+import re
+
+from dimension_extractor import DIMENSION_PATTERNS, DimensionExtractor, calculate_confidence
+
+SAMPLE_RESPONSE = """PART NUMBER: PIS2.500-0120
+MATERIAL: ALUMINUM 2011-T3, WEIGHT: 0.81 lbs
+* Ø0.878 ±0.002 bore, R0.03 max
+2.490 ±0.002 and 1 1/2 OD, 0.125 X 45° Chamfer
+1/4-20 UNC-2B thread, *2.47 ± 0.01
+"""
+
+
+def per_line_scan(text: str):
+    # The scan extract_dimensions_regex() used to run
+    dimensions = []
+    for line_num, line in enumerate(text.split('\n')):
+        for pattern_name, pattern in DIMENSION_PATTERNS.items():
+            for match in re.finditer(pattern, line, re.IGNORECASE):
+                dimensions.append({
+                    'type': pattern_name,
+                    'value': match.group(1) if match.groups() else match.group(0),
+                    'tolerance': match.group(2) if len(match.groups()) > 1 else None,
+                    'full_match': match.group(0),
+                    'line_number': line_num + 1,
+                    'line_text': line.strip(),
+                    'confidence': calculate_confidence(pattern_name, match.group(0))
+                })
+    return dimensions
+
+
+def test_dimension_extractor():
+    extractor = DimensionExtractor()
+    expected = per_line_scan(SAMPLE_RESPONSE)
+    assert [d.as_dict() for d in extractor.extract(SAMPLE_RESPONSE)] == expected
+    assert {'thread_spec', 'chamfer', 'fractional_dim', 'inspection_feature'} <= {d['type'] for d in expected}
+    print(f"✅ Sample response: {len(expected)} dimensions, identical")
+
+    # Random text built from the characters the patterns care about, including
+    # whitespace next to newlines and overlapping matches of different patterns
+    pieces = list("0123456789.±Ø∅Rr*xX×°/-‑ \t\r\n") + ["UNC", "unf", "-2B", "Chamfer", "2.49", "0.81", "\x1c"]
+    rng = random.Random(0)
+    for _ in range(3000):
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 60)))
+        assert [d.as_dict() for d in extractor.extract(text)] == per_line_scan(text), repr(text)
+    print("✅ 3000 random texts identical")
+
+    # Streaming: any chunking gives the same dimensions as the whole text
+    for _ in range(200):
+        stream = extractor.stream()
+        streamed = []
+        position = 0
+        while position < len(SAMPLE_RESPONSE):
+            size = rng.randint(1, 8)
+            streamed += stream.feed(SAMPLE_RESPONSE[position:position + size])
+            position += size
+        streamed += stream.close()
+        assert [d.as_dict() for d in streamed] == expected
+    print("✅ Streaming extraction identical")
+
+
+if __name__ == "__main__":
+    test_dimension_extractor()
@@ -0,0 +1,311 @@
+# inference_server.py - Resident LLaVA-NeXT inference service for Columbus drawings
+"""
+Loads ColumbusDrawingAnalyzer once and keeps it in memory. Analysis jobs
+arrive over HTTP or a Unix socket, wait in a queue and run on a
+dedicated model thread; generated tokens stream back as NDJSON, with a
+"dimension" event as soon as a generated line contains one. With
+--batch-size, jobs that are queued together (or arrive within
+--max-wait seconds of each other) share one batched generate call.
+
+    python inference_server.py --port 8765
+    python inference_server.py --port 8765 --batch-size 8 --max-wait 0.2
+    python inference_server.py --socket /tmp/columbus_llava.sock
+    python main.py --image images/your_drawing.pdf --server http://127.0.0.1:8765
+    python main.py --batch --server unix:///tmp/columbus_llava.sock
+"""
+import argparse
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import httpx
+
+
+class AnalysisJob:
+    """One queued drawing; the worker fills in the future (and the streamer when streaming)"""
+
+    def __init__(self, image_path: str, prompt: Optional[str] = None, streamer=None):
+        self.image_path = image_path
+        self.prompt = prompt
+        self.streamer = streamer
+        self.future: Future = Future()
+        self.submitted = time.time()
+
+
+class InferenceWorker:
+    """
+    Owns the loaded analyzer and runs queued jobs on its own thread.
+    Up to batch_size queued jobs go through one batched generate call; after
+    the first job arrives the worker waits at most max_wait seconds for more.
+    """
+
+    def __init__(self, analyzer, batch_size: int = 1, max_wait: float = 0.0):
+        self.analyzer = analyzer
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.jobs: "queue.Queue[Optional[AnalysisJob]]" = queue.Queue()
+        self.completed = 0
+        self.thread = threading.Thread(target=self._run, name="llava-worker", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.jobs.put(None)
+        self.thread.join()
+
+    def submit(self, image_path: str, prompt: Optional[str] = None, stream: bool = False) -> AnalysisJob:
+        streamer = None
+        if stream:
+            from transformers import TextIteratorStreamer
+            streamer = TextIteratorStreamer(self.analyzer.processor.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        job = AnalysisJob(image_path, prompt, streamer)
+        self.jobs.put(job)
+        return job
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            job = self.jobs.get()
+            if job is None:
+                break
+            batch = [job]
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    job = self.jobs.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if job is None:
+                    stopping = True  # Finish what was already collected, then exit
+                    break
+                batch.append(job)
+
+            if len(batch) == 1:
+                self._run_single(batch[0])
+            else:
+                self._run_batch(batch)
+
+    def _run_single(self, job: AnalysisJob):
+        queue_wait = time.time() - job.submitted
+        try:
+            analysis = self.analyzer.comprehensive_analysis(job.image_path, custom_prompt=job.prompt, streamer=job.streamer)
+            analysis['analysis_results']['performance_metrics']['queue_wait_seconds'] = queue_wait
+            job.future.set_result(analysis)
+        except Exception as e:
+            job.future.set_exception(e)
+            if job.streamer is not None:
+                job.streamer.end()  # Unblock the reader; generate() may never have started
+        finally:
+            self.completed += 1
+
+    def _run_batch(self, batch: List[AnalysisJob]):
+        queue_waits = [time.time() - job.submitted for job in batch]
+        try:
+            analyses = self.analyzer.comprehensive_analysis_batch(
+                [job.image_path for job in batch], custom_prompts=[job.prompt for job in batch]
+            )
+        except Exception as e:
+            analyses = [e] * len(batch)
+
+        for job, queue_wait, analysis in zip(batch, queue_waits, analyses):
+            if isinstance(analysis, Exception) or 'error' in analysis:
+                job.future.set_exception(analysis if isinstance(analysis, Exception) else Exception(analysis['error']))
+                if job.streamer is not None:
+                    job.streamer.end()
+            else:
+                analysis['analysis_results']['performance_metrics']['queue_wait_seconds'] = queue_wait
+                job.future.set_result(analysis)
+                if job.streamer is not None:
+                    # A batched generate cannot stream per row, so streaming jobs get their text in one piece
+                    job.streamer.on_finalized_text(analysis['analysis_results']['llava_detailed_response'], stream_end=True)
+            self.completed += 1
+
+
+def create_app(worker: InferenceWorker, model_name: str):
+    from fastapi import FastAPI, HTTPException
+    from fastapi.responses import JSONResponse, StreamingResponse
+    from pydantic import BaseModel
+
+    class AnalyzeRequest(BaseModel):
+        image_path: str
+        prompt: Optional[str] = None
+        stream: bool = False
+
+    app = FastAPI(title="Columbus LLaVA inference server")
+
+    @app.get("/health")
+    async def health():
+        return {
+            "status": "healthy",
+            "model": model_name,
+            "device": str(worker.analyzer.model.device),
+            "queued": worker.jobs.qsize(),
+            "batch_size": worker.batch_size,
+            "completed": worker.completed,
+            "settings": worker.analyzer.analysis_settings()
+        }
+
+    @app.post("/analyze")
+    async def analyze(request: AnalyzeRequest):
+        if not os.path.isfile(request.image_path):
+            raise HTTPException(status_code=404, detail=f"Image not found: {request.image_path}")
+
+        job = worker.submit(request.image_path, request.prompt, stream=request.stream)
+        if not request.stream:
+            try:
+                analysis = await asyncio.wrap_future(job.future)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=str(e))
+            return JSONResponse(json.loads(json.dumps(analysis, default=str)))
+
+        def events() -> Iterator[str]:
+            # Runs in the threadpool: the streamer blocks until the model thread produces text
+            # (JSON output is parsed as a whole, so only prose responses stream dimension events)
+            dimensions = worker.analyzer.dimension_extractor.stream() if worker.analyzer.output == 'prose' else None
+            for text in job.streamer:
+                if text:
+                    yield json.dumps({"type": "token", "text": text}) + "\n"
+                    for dimension in dimensions.feed(text) if dimensions else ():
+                        yield json.dumps({"type": "dimension", "dimension": dimension.as_dict()}) + "\n"
+            for dimension in dimensions.close() if dimensions else ():
+                yield json.dumps({"type": "dimension", "dimension": dimension.as_dict()}) + "\n"
+            try:
+                yield json.dumps({"type": "result", "analysis": job.future.result()}, default=str) + "\n"
+            except Exception as e:
+                yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+        return StreamingResponse(events(), media_type="application/x-ndjson")
+
+    return app
+
+
+class InferenceClient:
+    """
+    Submits drawings to a running inference server. Offers the same
+    comprehensive_analysis() as ColumbusDrawingAnalyzer, so main.py can use
+    either. url is http://host:port or unix:///path/to/socket.
+    """
+
+    def __init__(self, url: str, on_token: Optional[Callable[[str], None]] = None, timeout: Optional[float] = None,
+                 on_dimension: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.on_token = on_token
+        self.on_dimension = on_dimension
+        if url.startswith("unix://"):
+            transport = httpx.HTTPTransport(uds=url[len("unix://"):])
+            self.client = httpx.Client(transport=transport, base_url="http://localhost", timeout=timeout)
+        else:
+            self.client = httpx.Client(base_url=url, timeout=timeout)
+
+    def health(self) -> Dict[str, Any]:
+        return self.client.get("/health").json()
+
+    def comprehensive_analysis(self, image_path: str, custom_prompt: str = None) -> Dict[str, Any]:
+        payload = {"image_path": os.path.abspath(image_path), "prompt": custom_prompt, "stream": True}
+        with self.client.stream("POST", "/analyze", json=payload) as response:
+            if response.status_code != 200:
+                response.read()
+                raise Exception(f"Inference server error {response.status_code}: {response.text}")
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "token":
+                    if self.on_token:
+                        self.on_token(event["text"])
+                elif event["type"] == "dimension":
+                    if self.on_dimension:
+                        self.on_dimension(event["dimension"])
+                elif event["type"] == "result":
+                    return event["analysis"]
+                else:
+                    raise Exception(event["detail"])
+        raise Exception("Inference server closed the stream without a result")
+
+    def comprehensive_analysis_batch(self, image_paths: List[str], custom_prompts: List[str] = None) -> List[Dict[str, Any]]:
+        """
+        Submit all drawings at once so the server can batch them; same
+        result shape as ColumbusDrawingAnalyzer.comprehensive_analysis_batch()
+        """
+        prompts = custom_prompts or [None] * len(image_paths)
+
+        def submit(image_path: str, prompt: Optional[str]) -> Dict[str, Any]:
+            payload = {"image_path": os.path.abspath(image_path), "prompt": prompt, "stream": False}
+            response = self.client.post("/analyze", json=payload)
+            if response.status_code != 200:
+                return {"drawing_file": os.path.basename(image_path), "full_path": image_path,
+                        "error": f"Inference server error {response.status_code}: {response.text}"}
+            return response.json()
+
+        with ThreadPoolExecutor(max_workers=max(1, len(image_paths))) as pool:
+            return list(pool.map(submit, image_paths, prompts))
+
+    def close(self):
+        self.client.close()
+
+
+def main():
+    from main import INFERENCE_PROFILES, OUTPUT_MODES, TEXT_LAYER_MODES, ColumbusDrawingAnalyzer
+    from rasterize import DEFAULT_DPI
+    from tiling import DEFAULT_OVERLAP
+
+    parser = argparse.ArgumentParser(description='Resident Columbus LLaVA-NeXT inference server')
+    parser.add_argument('--model', type=str, default='llava-hf/llava-v1.6-mistral-7b-hf')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', type=str, default=None, help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--batch-size', type=int, default=1, help='Most queued jobs to run in one generate call')
+    parser.add_argument('--max-wait', type=float, default=0.0,
+                        help='Seconds to hold the first queued job while waiting for more to fill a batch')
+    parser.add_argument('--profile', type=str, default='gpu', choices=list(INFERENCE_PROFILES))
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads for CPU inference')
+    parser.add_argument('--interop-threads', type=int, default=None, help='Inter-op threads for CPU inference')
+    parser.add_argument('--compile', action='store_true', help='Compile the model forward with torch.compile')
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI, help='Resolution for rendering PDF drawings')
+    parser.add_argument('--raster-cache', type=str, default=None, help='Directory caching rendered PDF pages')
+    parser.add_argument('--text-layer', type=str, default='auto', choices=TEXT_LAYER_MODES,
+                        help='Read PDF text layers first and use the model only for what they miss')
+    parser.add_argument('--no-prefix-cache', action='store_true',
+                        help='Re-encode the whole prompt for every drawing instead of reusing the cached prefix')
+    parser.add_argument('--output', type=str, default='prose', choices=OUTPUT_MODES,
+                        help='prose: free-form answer mined with regexes; json: schema-constrained JSON object')
+    parser.add_argument('--tile-size', type=int, default=0,
+                        help='Analyze drawings larger than this many pixels as overlapping tiles plus an overview (0 = off)')
+    parser.add_argument('--tile-overlap', type=float, default=DEFAULT_OVERLAP, help='Fraction of a tile shared with its neighbours')
+    parser.add_argument('--tile-workers', type=int, default=0,
+                        help='Processes analyzing tiles in parallel, each loading the model (0 = batches in this process)')
+    parser.add_argument('--tile-batch', type=int, default=4, help='Tiles per generate call without --tile-workers')
+    args = parser.parse_args()
+
+    import uvicorn
+
+    analyzer = ColumbusDrawingAnalyzer(
+        model_name=args.model, profile=args.profile, num_threads=args.threads,
+        interop_threads=args.interop_threads, compile=args.compile,
+        dpi=args.dpi, raster_cache_dir=args.raster_cache, text_layer=args.text_layer,
+        prefix_cache=not args.no_prefix_cache, output=args.output, tile_size=args.tile_size,
+        tile_overlap=args.tile_overlap, tile_workers=args.tile_workers, tile_batch=args.tile_batch
+    )
+    worker = InferenceWorker(analyzer, batch_size=args.batch_size, max_wait=args.max_wait)
+    worker.start()
+
+    app = create_app(worker, args.model)
+    where = f"unix://{args.socket}" if args.socket else f"http://{args.host}:{args.port}"
+    print(f"🚀 Inference server ready at {where}")
+    try:
+        if args.socket:
+            uvicorn.run(app, uds=args.socket)
+        else:
+            uvicorn.run(app, host=args.host, port=args.port)
+    finally:
+        worker.stop()
+        analyzer.close()
+
+
+if __name__ == "__main__":
+    main()
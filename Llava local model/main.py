@@ -2,68 +2,36 @@
 import torch
 import requests
 from PIL import Image
-from transformers import LlavaNextProcessor, LlavaNextForConditionalGeneration
+from transformers import LlavaNextProcessor, LlavaNextForConditionalGeneration, LogitsProcessorList, StoppingCriteriaList
+import copy
+import hashlib
 import json
 import re
 import os
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import argparse
-import io
+from batch_manifest import BatchManifest, find_images, run_key
+from batch_pipeline import BatchPipeline, print_stage_stats
+from dimension_extractor import DIMENSION_PATTERNS, DimensionExtractor, calculate_confidence
+from rasterize import DEFAULT_DPI, render_pages, warm_cache
+from structured_output import (STRUCTURED_PROMPT, GrammarStoppingCriteria, StructuredDecoding, parse_structured,
+                               structured_dimensions, structured_metadata)
+from text_layer import extract_rows, has_usable_text, resolve_title_block
+from tiling import DEFAULT_OVERLAP, DEFAULT_TILE_SIZE, merge_dimensions, needs_tiling, split_drawing
 
-class ColumbusDrawingAnalyzer:
-    def __init__(self, model_name="llava-hf/llava-v1.6-mistral-7b-hf"):
-        """Initialize the analyzer with LLaVA-NeXT model"""
-        print(f"🔧 Columbus Drawing Analyzer - Loading {model_name}")
-        print("⏳ Model loading (3-5 minutes on first run)...")
-        
-        # Load model and processor
-        self.processor = LlavaNextProcessor.from_pretrained(model_name)
-        self.model = LlavaNextForConditionalGeneration.from_pretrained(
-            model_name,
-            torch_dtype=torch.float16,
-            low_cpu_mem_usage=True,
-            device_map="auto",
-            cache_dir="/workspace/columbus_drw/models"  # Cache in our directory
-        )
-        
-        print(f"✅ Model loaded on device: {self.model.device}")
-        
-        # Mechanical drawing dimension patterns
-        self.dimension_patterns = {
-            'tolerance_dim': r'(\d+\.?\d*)\s*[±]\s*(\d+\.?\d*)',
-            'diameter_symbol': r'[Ø∅]\s*(\d+\.?\d*)',
-            'radius': r'R\s*(\d+\.?\d*)',
-            'thread_spec': r'(\d+(?:\s*/\s*\d+)?)\s*[-‑]\s*(\d+)\s*(UNC|UNF|UNEF)\s*[-‑]\s*(\dA|\dB)',
-            'chamfer': r'(\d+\.?\d*)\s*[Xx×]\s*(\d+\.?\d*)°?\s*[Cc]hamfer',
-            'decimal_dim': r'\b(\d+\.\d{2,3})\b',
-            'fractional_dim': r'(\d+)\s*(\d+/\d+)',
-            'inspection_feature': r'\*\s*(\d+\.?\d*)\s*[±]?\s*(\d+\.?\d*)?'
-        }
-
-    def analyze_columbus_drawing(self, image_path: str, custom_prompt: str = None) -> Dict[str, Any]:
-        """Analyze mechanical drawing optimized for Columbus hydraulics components"""
-        
-        # Load and prepare image
-        try:
-            if image_path.lower().endswith('.pdf'):
-                # Convert PDF to image if needed
-                print(f"📄 Converting PDF: {image_path}")
-                image = self._convert_pdf_to_image(image_path)
-            else:
-                image = Image.open(image_path).convert('RGB')
-        except Exception as e:
-            raise Exception(f"Could not load image {image_path}: {e}")
-        
-        # Columbus-specific prompt for hydraulic components
-        if custom_prompt is None:
-            prompt = """<|im_start|>system
+# Default prompt for Columbus hydraulics components. The image comes last, so with the prefix
+# cache everything before it is encoded once instead of for every drawing
+COLUMBUS_PROMPT = """<|im_start|>system
 You are an expert mechanical engineer specializing in hydraulic systems and precision machining. You're analyzing technical drawings for Columbus Hydraulics components.
 
 <|im_start|>user
-<image>
-Analyze this Columbus hydraulics mechanical drawing and extract ALL dimensions with their tolerances and geometric significance. This appears to be a piston assembly or hydraulic component.
+Analyze the Columbus hydraulics mechanical drawing below and extract ALL dimensions with their tolerances and geometric significance. This appears to be a piston assembly or hydraulic component.
 
 For each dimension you identify:
 
@@ -99,25 +67,205 @@ Pay special attention to:
 
 Format your response with clear sections for dimensions, threads, inspection features, and manufacturing notes.
 
+<image>
 <|im_start|>assistant"""
-        else:
-            prompt = custom_prompt
 
-        # Process inputs
-        inputs = self.processor(prompt, image, return_tensors="pt").to(self.model.device)
+# Inference profiles for --profile: weight dtype, device placement and int8 dynamic quantization
+INFERENCE_PROFILES = {
+    'gpu': {'dtype': torch.float16, 'device_map': 'auto', 'quantize': False},
+    'cpu-fp32': {'dtype': torch.float32, 'device_map': 'cpu', 'quantize': False},
+    'cpu-bf16': {'dtype': torch.bfloat16, 'device_map': 'cpu', 'quantize': False},
+    'cpu-int8': {'dtype': torch.float32, 'device_map': 'cpu', 'quantize': True},  # qint8 Linear layers, fp32 activations
+}
+
+# How PDFs with a text layer are read: auto = text layer first, model only for pages without
+# usable text or FALLBACK_FIELDS it could not resolve; only = never run the model for them; off = always the model
+TEXT_LAYER_MODES = ('auto', 'only', 'off')
+FALLBACK_FIELDS = ('part_number', 'material', 'weight', 'revision')
+OUTPUT_MODES = ('prose', 'json')
+# Prompts (tokens around <image>) and prompt-prefix KV caches kept by the prefix cache, least recently used dropped first
+PREFIX_CACHE_SIZE = 4
+
+# Analyzer of a tile worker process (see ColumbusDrawingAnalyzer tile_workers)
+_tile_analyzer = None
+
+def _init_tile_worker(settings: Dict[str, Any]):
+    global _tile_analyzer
+    _tile_analyzer = ColumbusDrawingAnalyzer(**settings)
+
+def _tile_task(task: Tuple[str, Image.Image]) -> Tuple[str, int]:
+    prompt, image = task
+    result = _tile_analyzer.run_prepared({'image_path': None, 'page': 0, 'image': image, 'prompt': prompt,
+                                          'inputs': None, 'prefix_kv': None})
+    return result['llava_response'], result['output_tokens']
+
+class ColumbusDrawingAnalyzer:
+    def __init__(self, model_name="llava-hf/llava-v1.6-mistral-7b-hf", max_new_tokens: int = 1500,
+                 profile: str = "gpu", num_threads: int = None, interop_threads: int = None, compile: bool = False,
+                 dpi: int = DEFAULT_DPI, raster_cache_dir: str = None, text_layer: str = "auto", lazy_load: bool = False,
+                 prefix_cache: bool = True, output: str = "prose", tile_size: int = 0,
+                 tile_overlap: float = DEFAULT_OVERLAP, tile_workers: int = 0, tile_batch: int = 4):
+        """Initialize the analyzer with LLaVA-NeXT model
+        
+        profile: one of INFERENCE_PROFILES; the cpu-* profiles are for CPU-only boxes.
+        num_threads / interop_threads: torch intra-op and inter-op thread pools (default: torch's choice).
+        compile: wrap the model forward in torch.compile (slow first call, faster steady state).
+        dpi / raster_cache_dir: PDF rendering resolution and optional on-disk raster cache.
+        text_layer: one of TEXT_LAYER_MODES - read CAD-exported PDFs from their text layer first.
+        lazy_load: defer loading the model until a drawing actually needs it.
+        prefix_cache: reuse the prompt tokenization and the key/value cache of the prompt text
+        before <image> across single-drawing calls.
+        output: one of OUTPUT_MODES - json constrains generation to the STRUCTURED_SCHEMA object
+        and stops as soon as it closes.
+        tile_size: drawings larger than this (pixels) are analyzed as overlapping tiles plus a
+        low-resolution overview, with the tiles' dimensions merged (0 = off; see tiling.py).
+        tile_overlap: fraction of a tile shared with its neighbours.
+        tile_workers: worker processes analyzing tiles, each with its own copy of the model and
+        an equal share of the CPU threads (0 = in this process, tile_batch tiles per generate call).
+        """
+        if profile not in INFERENCE_PROFILES:
+            raise Exception(f"Unknown profile {profile}, expected one of: {', '.join(INFERENCE_PROFILES)}")
+        if text_layer not in TEXT_LAYER_MODES:
+            raise Exception(f"Unknown text layer mode {text_layer}, expected one of: {', '.join(TEXT_LAYER_MODES)}")
+        if output not in OUTPUT_MODES:
+            raise Exception(f"Unknown output mode {output}, expected one of: {', '.join(OUTPUT_MODES)}")
+        self.model_name = model_name
+        self.profile = profile
+        self.compile = compile
+        self.text_layer = text_layer
+        self.prefix_cache = prefix_cache
+        self.output = output
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tile_workers = tile_workers
+        self.tile_batch = tile_batch
+        self.num_threads = num_threads
+        self._tile_pool = None
+        self.processor = None
+        self.model = None
+        self.structured = None  # Grammar and token masks for json output, built with the model
+        self._load_lock = threading.Lock()  # Pipeline workers may all ask for the model at once
+        
+        # sha256 of the prompt -> its tokens around <image>; sha256 of the prefix tokens -> their KV cache.
+        # A KV cache holds every layer's keys and values for the prefix, so only a few are kept
+        self._prompt_prefixes: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._prefix_kv: OrderedDict[str, Any] = OrderedDict()
+        
+        # Thread pools must be sized before torch runs any parallel work
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        if interop_threads:
+            try:
+                torch.set_num_interop_threads(interop_threads)
+            except RuntimeError as e:
+                print(f"⚠️ Could not set inter-op threads: {e}")
+        
+        # Longer for detailed analysis
+        self.max_new_tokens = max_new_tokens
+        self.dpi = dpi
+        self.raster_cache_dir = raster_cache_dir
+        
+        # Mechanical drawing dimension patterns, compiled once for whole-text scanning
+        self.dimension_patterns = dict(DIMENSION_PATTERNS)
+        self.dimension_extractor = DimensionExtractor(self.dimension_patterns)
+        
+        if not lazy_load:
+            self.load_model()
+
+    def close(self):
+        """Stop the tile worker processes, if any were started"""
+        if self._tile_pool is not None:
+            self._tile_pool.shutdown()
+            self._tile_pool = None
+
+    def load_model(self):
+        """Load the LLaVA-NeXT processor and model (once)"""
+        with self._load_lock:
+            if self.model is None:
+                self._load_model()
+
+    def _load_model(self):
+        settings = INFERENCE_PROFILES[self.profile]
+        
+        print(f"🔧 Columbus Drawing Analyzer - Loading {self.model_name} ({self.profile} profile)")
+        print("⏳ Model loading (3-5 minutes on first run)...")
+        
+        # Load model and processor
+        processor = LlavaNextProcessor.from_pretrained(self.model_name)
+        model = LlavaNextForConditionalGeneration.from_pretrained(
+            self.model_name,
+            torch_dtype=settings['dtype'],
+            low_cpu_mem_usage=True,
+            device_map=settings['device_map'],
+            cache_dir="/workspace/columbus_drw/models"  # Cache in our directory
+        )
+        model.eval()
+        
+        if settings['quantize']:
+            from torch.ao.quantization import quantize_dynamic
+            print("🔧 Quantizing linear layers to int8...")
+            quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        
+        if self.compile:
+            print("🔧 Compiling model forward with torch.compile...")
+            model.forward = torch.compile(model.forward, dynamic=True)
+        
+        # Batched generate pads prompts of different lengths on the left, so every row ends where generation starts
+        processor.tokenizer.padding_side = "left"
+        if processor.tokenizer.pad_token is None:
+            processor.tokenizer.pad_token = processor.tokenizer.eos_token
+        
+        self.processor = processor
+        self.model = model
+        if self.output == 'json':
+            self.structured = StructuredDecoding(processor.tokenizer)
+        print(f"✅ Model loaded on device: {self.model.device} ({torch.get_num_threads()} threads)")
+
+    def analyze_columbus_drawing(self, image_path: str, custom_prompt: str = None, streamer=None, page: int = 0) -> Dict[str, Any]:
+        """Analyze mechanical drawing optimized for Columbus hydraulics components
+        
+        streamer: optional transformers streamer (e.g. TextIteratorStreamer) that
+        receives tokens as they are generated
+        page: PDF page to analyze
+        """
+        return self.run_prepared(self.prepare_drawing(image_path, custom_prompt, page), streamer=streamer)
+
+    def prepare_drawing(self, image_path: str, custom_prompt: str = None, page: int = 0, tokenize: bool = True) -> Dict[str, Any]:
+        """Everything before generate: load the image and, with tokenize, build the model inputs
+        
+        Safe to call from worker threads while the model runs another drawing.
+        """
+        # Load and prepare image
+        image = self._load_image(image_path, page)
+        if not (self._tiled(image) and self.tile_workers > 1):
+            self.load_model()  # Tile worker processes load their own copies
+        
+        # Columbus-specific prompt for hydraulic components
+        prompt = self.default_prompt() if custom_prompt is None else custom_prompt
+        
+        # Process inputs; only the image and the prompt after it are prefilled when the prefix is cached
+        inputs, prefix_kv = self._prompt_inputs(prompt, image) if tokenize and not self._tiled(image) else (None, None)
+        return {'image_path': image_path, 'page': page, 'image': image, 'prompt': prompt,
+                'inputs': inputs, 'prefix_kv': prefix_kv}
+
+    def run_prepared(self, prepared: Dict[str, Any], streamer=None) -> Dict[str, Any]:
+        """Generate the response for one prepare_drawing() result"""
+        if self._tiled(prepared['image']):
+            return self._run_tiled(prepared, streamer=streamer)
+        inputs, prefix_kv = prepared['inputs'], prepared['prefix_kv']
+        if inputs is None:
+            inputs, prefix_kv = self._prompt_inputs(prepared['prompt'], prepared['image'])
         
         print("🔍 Running LLaVA-NeXT inference...")
         start_time = time.time()
         
         # Generate response
-        with torch.no_grad():
-            output = self.model.generate(
-                **inputs,
-                max_new_tokens=1500,  # Longer for detailed analysis
-                do_sample=False,
-                temperature=0.1,
-                pad_token_id=self.processor.tokenizer.eos_token_id
-            )
+        inputs = dict(inputs)
+        with torch.inference_mode():
+            if prefix_kv is not None:
+                inputs['past_key_values'] = copy.deepcopy(prefix_kv)  # generate() extends the cache in place
+            output = self.model.generate(**inputs, **self._generation_kwargs(), streamer=streamer)
+        output_tokens = output.shape[1] - inputs['input_ids'].shape[1]
         
         # Decode response
         response = self.processor.decode(output[0], skip_special_tokens=True)
@@ -127,88 +275,427 @@ Format your response with clear sections for dimensions, threads, inspection fea
             response = response.split("<|im_start|>assistant")[-1].strip()
         
         inference_time = time.time() - start_time
-        print(f"✅ Analysis completed in {inference_time:.2f} seconds")
+        print(f"✅ Analysis completed in {inference_time:.2f} seconds ({output_tokens} tokens)")
         
         return {
             'llava_response': response,
-            'image_path': image_path,
+            'structured': self._parse_structured(response),
+            'image_path': prepared['image_path'],
+            'page': prepared['page'],
             'inference_time': inference_time,
+            'output_tokens': output_tokens,
             'model_device': str(self.model.device),
-            'image_size': image.size
+            'profile': self.profile,
+            'image_size': prepared['image'].size
         }
 
-    def _convert_pdf_to_image(self, pdf_path: str) -> Image:
-        """Convert PDF to image for analysis"""
-        try:
-            import fitz  # PyMuPDF
-            doc = fitz.open(pdf_path)
-            page = doc[0]  # First page
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x scale for better quality
-            img_data = pix.tobytes("ppm")
-            image = Image.open(io.BytesIO(img_data))
-            doc.close()
-            return image
-        except ImportError:
-            raise Exception("PyMuPDF not installed. Install with: pip install PyMuPDF")
+    def analyze_batch(self, image_paths: List[str], custom_prompts: List[str] = None, pages: List[int] = None) -> List[Dict[str, Any]]:
+        """Analyze several drawings with one padded generate call
+        
+        Returns one result per image_path, in order. A drawing that cannot be
+        loaded gets {'image_path', 'error'} instead and the rest still run.
+        pages: PDF page per image_path (default: the first page)
+        """
+        prompts = custom_prompts or [None] * len(image_paths)
+        pages = pages or [0] * len(image_paths)
+        results: List[Dict[str, Any]] = [None] * len(image_paths)
+        
+        loaded = []
+        for index, (image_path, prompt) in enumerate(zip(image_paths, prompts)):
+            try:
+                loaded.append((index, self.prepare_drawing(image_path, prompt, pages[index], tokenize=False)))
+            except Exception as e:
+                results[index] = {'image_path': image_path, 'error': str(e)}
+        
+        if loaded:
+            for (index, _), result in zip(loaded, self.run_prepared_batch([prepared for _, prepared in loaded])):
+                results[index] = result
+        
+        return results
 
-    def extract_dimensions_regex(self, text: str) -> List[Dict]:
-        """Extract dimensions using regex patterns optimized for Columbus drawings"""
-        dimensions = []
-        text_lines = text.split('\n')
-        
-        for line_num, line in enumerate(text_lines):
-            for pattern_name, pattern in self.dimension_patterns.items():
-                matches = re.finditer(pattern, line, re.IGNORECASE)
-                for match in matches:
-                    dim_info = {
-                        'type': pattern_name,
-                        'value': match.group(1) if match.groups() else match.group(0),
-                        'tolerance': match.group(2) if len(match.groups()) > 1 else None,
-                        'full_match': match.group(0),
-                        'line_number': line_num + 1,
-                        'line_text': line.strip(),
-                        'confidence': self._calculate_confidence(pattern_name, match.group(0))
-                    }
-                    dimensions.append(dim_info)
+    def run_prepared_batch(self, prepared: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """One padded generate call for several prepare_drawing(tokenize=False) results
         
-        return dimensions
+        Drawings large enough to tile are run on their own, each as a batch of its tiles.
+        """
+        results = [dict(self._run_tiled(p), batch_size=1) if self._tiled(p['image']) else None for p in prepared]
+        untiled = [p for p, result in zip(prepared, results) if result is None]
+        if untiled:
+            batch_results = iter(self._run_batch(untiled))
+            results = [result if result is not None else next(batch_results) for result in results]
+        return results
 
-    def _calculate_confidence(self, pattern_type: str, match_text: str) -> float:
-        """Calculate confidence score for extracted dimensions"""
-        base_confidence = {
-            'tolerance_dim': 0.9,
-            'diameter_symbol': 0.95,
-            'thread_spec': 0.98,
-            'inspection_feature': 0.95,
-            'chamfer': 0.85,
-            'radius': 0.85,
-            'decimal_dim': 0.7,
-            'fractional_dim': 0.6
+    def _run_batch(self, prepared: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        print(f"🔍 Running batched LLaVA-NeXT inference on {len(prepared)} drawings...")
+        start_time = time.time()
+        responses = self._generate_batch([p['image'] for p in prepared], [p['prompt'] for p in prepared])
+        inference_time = time.time() - start_time
+        print(f"✅ Batch of {len(prepared)} completed in {inference_time:.2f} seconds")
+        
+        return [{
+            'llava_response': response,
+            'structured': self._parse_structured(response),
+            'image_path': p['image_path'],
+            'page': p['page'],
+            'inference_time': inference_time,
+            'output_tokens': output_tokens,
+            'batch_size': len(prepared),
+            'model_device': str(self.model.device),
+            'profile': self.profile,
+            'image_size': p['image'].size
+        } for p, (response, output_tokens) in zip(prepared, responses)]
+
+    def analysis_settings(self) -> Dict[str, Any]:
+        """Settings besides model and prompt that change analysis results (keys --batch manifest items)"""
+        return {
+            'profile': self.profile,
+            'max_new_tokens': self.max_new_tokens,
+            'dpi': self.dpi,
+            'text_layer': self.text_layer,
+            'output': self.output,
+            **({'tile_size': self.tile_size, 'tile_overlap': self.tile_overlap} if self.tile_size else {})
+        }
+
+    def default_prompt(self) -> str:
+        """Prompt used when no custom prompt is given"""
+        return STRUCTURED_PROMPT if self.output == 'json' else COLUMBUS_PROMPT
+
+    def _tiled(self, image: Image.Image) -> bool:
+        return bool(self.tile_size) and needs_tiling(image, self.tile_size)
+
+    def _run_tiled(self, prepared: Dict[str, Any], streamer=None) -> Dict[str, Any]:
+        """run_prepared() for a drawing larger than a tile: tiles and overview analyzed together, dimensions merged"""
+        parts = split_drawing(prepared['image'], self.tile_size, self.tile_overlap)
+        where = f"{self.tile_workers} worker processes" if self.tile_workers > 1 else f"batches of {self.tile_batch}"
+        print(f"🧩 Running LLaVA-NeXT inference on {len(parts) - 1} tiles + overview ({where})...")
+        start_time = time.time()
+        
+        images = [part['image'] for part in parts]
+        prompts = [prepared['prompt']] * len(parts)
+        if self.tile_workers > 1:
+            outputs = list(self._tile_executor().map(_tile_task, zip(prompts, images)))
+        else:
+            outputs = []
+            for start in range(0, len(parts), self.tile_batch):
+                outputs.extend(self._generate_batch(images[start:start + self.tile_batch], prompts[start:start + self.tile_batch]))
+        inference_time = time.time() - start_time
+        print(f"✅ {len(parts)} parts completed in {inference_time:.2f} seconds")
+        
+        readings, metadata, sections, tiles = [], {}, [], []
+        for part, (response, output_tokens) in zip(parts, outputs):
+            result = {'llava_response': response, 'structured': self._parse_structured(response), 'page': prepared['page']}
+            dimensions = self._response_dimensions(result)
+            readings.append((part['region'], dimensions))
+            for key, value in self._response_metadata(result).items():
+                metadata.setdefault(key, value)
+            label = 'Overview' if part['kind'] == 'overview' else 'Tile {},{} - {},{}'.format(*part['region'])
+            sections.append(f"[{label}]\n{response}")
+            tiles.append({'kind': part['kind'], 'region': list(part['region']), 'output_tokens': output_tokens,
+                          'dimensions': len(dimensions)})
+        
+        # Overview first for reading, as it describes the whole drawing
+        response = '\n\n'.join(sections[-1:] + sections[:-1])
+        if streamer is not None:
+            streamer.on_finalized_text(response, stream_end=True)  # Tiles do not stream token by token
+        return {
+            'llava_response': response,
+            'structured': None,
+            'dimensions': merge_dimensions(readings),
+            'metadata': metadata,
+            'tiles': tiles,
+            'image_path': prepared['image_path'],
+            'page': prepared['page'],
+            'inference_time': inference_time,
+            'output_tokens': sum(tile['output_tokens'] for tile in tiles),
+            'model_device': str(self.model.device) if self.model is not None else 'cpu',
+            'profile': self.profile,
+            'image_size': prepared['image'].size
         }
+
+    def _tile_executor(self) -> ProcessPoolExecutor:
+        """Worker processes with their own analyzer, started on first use"""
+        if self._tile_pool is None:
+            settings = {
+                'model_name': self.model_name, 'max_new_tokens': self.max_new_tokens, 'profile': self.profile,
+                'num_threads': max(1, (self.num_threads or torch.get_num_threads()) // self.tile_workers),
+                'compile': self.compile, 'text_layer': 'off', 'prefix_cache': self.prefix_cache, 'output': self.output
+            }
+            # spawn: CUDA and torch's thread pools do not survive fork
+            self._tile_pool = ProcessPoolExecutor(self.tile_workers, mp_context=multiprocessing.get_context('spawn'),
+                                                  initializer=_init_tile_worker, initargs=(settings,))
+        return self._tile_pool
+
+    def _parse_structured(self, response: str) -> Dict[str, Any]:
+        """The JSON object of a json-mode response (None in prose mode)"""
+        if self.output != 'json':
+            return None
+        structured = parse_structured(response)
+        if structured is None:
+            print("⚠️ Response is not a complete JSON object, falling back to regex extraction")
+        return structured
+
+    def _prompt_inputs(self, prompt: str, image: Image.Image):
+        """Model inputs for one drawing and the cached KV of the prompt prefix (None when not cached)"""
+        entry = self._prompt_prefix(prompt, image) if self.prefix_cache else None
+        if entry is None:
+            return self.processor(text=prompt, images=image, return_tensors="pt").to(self.model.device), None
         
-        conf = base_confidence.get(pattern_type, 0.5)
+        # The processor only has to expand <image> for this image size; the prompt text is already tokenized
+        image_inputs = self.processor(text=self.processor.image_token, images=image, return_tensors="pt")
+        image_tokens = int((image_inputs['input_ids'] == entry['image_token_id']).sum())
+        input_ids = torch.cat([
+            entry['prefix_ids'], torch.full((1, image_tokens), entry['image_token_id']), entry['suffix_ids']
+        ], dim=1)
+        inputs = {key: value for key, value in image_inputs.items() if key not in ('input_ids', 'attention_mask')}
+        inputs['input_ids'] = input_ids
+        inputs['attention_mask'] = torch.ones_like(input_ids)
+        return {key: value.to(self.model.device) for key, value in inputs.items()}, self._cached_prefix_kv(entry)
+    
+    def _prompt_prefix(self, prompt: str, image: Image.Image) -> Dict[str, Any]:
+        """Tokens before and after <image> for a prompt; None if not cacheable"""
+        key = hashlib.sha256(prompt.encode()).hexdigest()
+        if key in self._prompt_prefixes:
+            self._prompt_prefixes.move_to_end(key)
+            return self._prompt_prefixes[key]
         
-        # Boost confidence for typical hydraulic dimensions
-        if any(keyword in match_text.lower() for keyword in ['2.49', '2.47', '1.00', '0.81']):
-            conf += 0.1
+        entry = None
+        image_token_id = self.processor.tokenizer.convert_tokens_to_ids(self.processor.image_token)
+        input_ids = self.processor.tokenizer(prompt, return_tensors="pt")['input_ids']
+        positions = (input_ids[0] == image_token_id).nonzero().flatten().tolist()
+        if len(positions) == 1 and positions[0] > 0:
+            split = positions[0]
+            prefix_ids, suffix_ids = input_ids[:, :split], input_ids[:, split + 1:]
             
-        return min(conf, 1.0)
+            # Splicing must give exactly the processor's own tokenization, otherwise leave this prompt uncached
+            expected = self.processor(text=prompt, images=image, return_tensors="pt")['input_ids']
+            image_tokens = expected.shape[1] - input_ids.shape[1] + 1
+            spliced = torch.cat([prefix_ids, torch.full((1, image_tokens), image_token_id), suffix_ids], dim=1)
+            if torch.equal(spliced, expected):
+                entry = {'prefix_ids': prefix_ids, 'suffix_ids': suffix_ids, 'image_token_id': image_token_id,
+                         'prefix_key': hashlib.sha256(prefix_ids.numpy().tobytes()).hexdigest()}
+        
+        self._prompt_prefixes[key] = entry
+        if len(self._prompt_prefixes) > PREFIX_CACHE_SIZE:
+            self._prompt_prefixes.popitem(last=False)
+        return entry
+    
+    def _cached_prefix_kv(self, entry: Dict[str, Any]):
+        """The KV cache of a prompt's prefix tokens, computed on first use and again after being evicted"""
+        prefix_key = entry['prefix_key']
+        if prefix_key in self._prefix_kv:
+            self._prefix_kv.move_to_end(prefix_key)
+            return self._prefix_kv[prefix_key]
+        
+        with torch.inference_mode():
+            output = self.model(input_ids=entry['prefix_ids'].to(self.model.device), use_cache=True, logits_to_keep=1)
+        self._prefix_kv[prefix_key] = output.past_key_values
+        if len(self._prefix_kv) > PREFIX_CACHE_SIZE:
+            self._prefix_kv.popitem(last=False)
+        print(f"🔧 Cached KV for a {entry['prefix_ids'].shape[1]}-token prompt prefix")
+        return output.past_key_values
 
-    def comprehensive_analysis(self, image_path: str) -> Dict[str, Any]:
+    def _generate_batch(self, images: List[Image.Image], prompts: List[str]) -> List[Tuple[str, int]]:
+        """(response, output tokens) per image from one generate call; halves the batch and retries when the GPU runs out of memory"""
+        inputs = self.processor(text=prompts, images=images, padding=True, return_tensors="pt").to(self.model.device)
+        try:
+            with torch.inference_mode():
+                output = self.model.generate(**inputs, **self._generation_kwargs())
+        except torch.cuda.OutOfMemoryError:
+            if len(images) == 1:
+                raise
+            del inputs
+            torch.cuda.empty_cache()
+            half = len(images) // 2
+            print(f"⚠️ Out of memory with a batch of {len(images)}, retrying as {half} + {len(images) - half}")
+            return self._generate_batch(images[:half], prompts[:half]) + self._generate_batch(images[half:], prompts[half:])
+        
+        # Left padding: every row's generated tokens start right after the (padded) prompt
+        new_tokens = output[:, inputs['input_ids'].shape[1]:]
+        # Finished rows are padded with eos up to the longest one
+        counts = (new_tokens != self.processor.tokenizer.eos_token_id).sum(dim=1).tolist()
+        texts = self.processor.batch_decode(new_tokens, skip_special_tokens=True)
+        return [(text.strip(), count) for text, count in zip(texts, counts)]
+
+    def _generation_kwargs(self) -> Dict[str, Any]:
+        kwargs = {
+            'max_new_tokens': self.max_new_tokens,
+            'do_sample': False,
+            'temperature': 0.1,
+            'pad_token_id': self.processor.tokenizer.eos_token_id
+        }
+        if self.output == 'json':
+            # Fresh per call: the processor tracks each row's position in the grammar
+            processor = self.structured.logits_processor(self.max_new_tokens)
+            kwargs['logits_processor'] = LogitsProcessorList([processor])
+            kwargs['stopping_criteria'] = StoppingCriteriaList([GrammarStoppingCriteria(processor)])
+        return kwargs
+
+    def _load_image(self, image_path: str, page: int = 0) -> Image.Image:
+        """Open an image file, rasterizing the given page of PDFs"""
+        try:
+            if image_path.lower().endswith('.pdf'):
+                # Convert PDF to image if needed
+                print(f"📄 Converting PDF: {image_path}")
+                return self._convert_pdf_to_image(image_path, page)
+            return Image.open(image_path).convert('RGB')
+        except Exception as e:
+            raise Exception(f"Could not load image {image_path}: {e}")
+
+    def _convert_pdf_to_image(self, pdf_path: str, page: int = 0) -> Image:
+        """Convert a PDF page (the first by default) to an image for analysis"""
+        return render_pages(pdf_path, [page], dpi=self.dpi, cache_dir=self.raster_cache_dir)[0]
+
+    def text_layer_analysis(self, pdf_path: str) -> Dict[str, Any]:
+        """Dimensions and title block fields read from a PDF's text layer, without the model
+        
+        Returns None when no page has usable text. Otherwise the result lists
+        'pages_without_text' and the FALLBACK_FIELDS still 'missing_fields'.
+        """
+        start_time = time.time()
+        try:
+            pages = extract_rows(pdf_path)
+        except Exception as e:
+            print(f"⚠️ Could not read text layer of {pdf_path}: {e}")
+            return None
+        
+        texts, dimensions, metadata, field_sources, pages_without_text = [], [], {}, {}, []
+        for page, rows in enumerate(pages):
+            if not has_usable_text(rows):
+                pages_without_text.append(page)
+                continue
+            fields, used = resolve_title_block(rows)
+            for key, value in fields.items():
+                if key not in metadata:
+                    metadata[key] = value
+                    field_sources[key] = 'title_block'
+            
+            drawing_rows = [row for index, row in enumerate(rows) if index not in used]
+            text = '\n'.join(row['text'] for row in drawing_rows)
+            page_dimensions = self.extract_dimensions_regex(text)
+            if not page_dimensions:
+                pages_without_text.append(page)  # Only a title block: the views themselves are raster
+                continue
+            for dim in page_dimensions:
+                dim.update(source='text_layer', page=page, bbox=drawing_rows[dim['line_number'] - 1]['bbox'])
+            dimensions.extend(page_dimensions)
+            texts.append(text)
+            for key, value in self._extract_drawing_metadata(text).items():
+                if key not in metadata:
+                    metadata[key] = value
+                    field_sources[key] = 'text_layer'
+        
+        if not texts:
+            return None
+        
+        return {
+            'text': '\n\n'.join(texts),
+            'dimensions': dimensions,
+            'metadata': metadata,
+            'field_sources': field_sources,
+            'pages_without_text': pages_without_text,
+            'missing_fields': [field for field in FALLBACK_FIELDS if field not in metadata],
+            'seconds': time.time() - start_time
+        }
+
+    def _read_text_layer(self, image_path: str, custom_prompt: str = None) -> Dict[str, Any]:
+        # A custom prompt asks the model something specific, so it always goes to the model
+        if self.text_layer == 'off' or custom_prompt is not None or not image_path.lower().endswith('.pdf'):
+            return None
+        return self.text_layer_analysis(image_path)
+
+    def _fallback_pages(self, text_result: Dict[str, Any]) -> List[int]:
+        """Pages the model still has to read for a text layer result"""
+        if self.text_layer == 'only':
+            return []
+        pages = list(text_result['pages_without_text'])
+        if text_result['missing_fields'] and 0 not in pages:
+            pages.insert(0, 0)
+        return pages
+
+    def extract_dimensions_regex(self, text: str) -> List[Dict]:
+        """Extract dimensions using regex patterns optimized for Columbus drawings"""
+        return [dim.as_dict() for dim in self.dimension_extractor.extract(text)]
+
+    def _calculate_confidence(self, pattern_type: str, match_text: str) -> float:
+        """Calculate confidence score for extracted dimensions"""
+        return calculate_confidence(pattern_type, match_text)
+
+    def comprehensive_analysis(self, image_path: str, custom_prompt: str = None, streamer=None) -> Dict[str, Any]:
         """Complete Columbus drawing analysis"""
         print(f"\n{'='*80}")
         print(f"🔧 COLUMBUS HYDRAULICS DRAWING ANALYSIS")
         print(f"📁 File: {os.path.basename(image_path)}")
         print(f"{'='*80}")
         
-        # Primary LLaVA-NeXT analysis
-        llava_result = self.analyze_columbus_drawing(image_path)
+        # CAD-exported PDFs: read the text layer, the model only fills in what it could not resolve
+        text_result, pages = self.plan_analysis(image_path, custom_prompt)
+        if text_result is not None:
+            custom_prompt = None
+        llava_results = [
+            self.analyze_columbus_drawing(image_path, custom_prompt, streamer=streamer if index == 0 else None, page=page)
+            for index, page in enumerate(pages)
+        ]
+        if not llava_results and streamer is not None:
+            streamer.end()  # Nothing was generated; let a waiting reader finish
+        return self.compile_results(image_path, text_result, llava_results)
+
+    def plan_analysis(self, image_path: str, custom_prompt: str = None):
+        """(text layer result or None, pages the model has to read) for one drawing"""
+        text_result = self._read_text_layer(image_path, custom_prompt)
+        if text_result is None:
+            return None, [0]  # Primary LLaVA-NeXT analysis
+        return text_result, self._fallback_pages(text_result)
+
+    def compile_results(self, image_path: str, text_result: Dict[str, Any], llava_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Final analysis of one drawing from plan_analysis() and the model results for its pages"""
+        if text_result is None:
+            return self._compile_analysis(image_path, llava_results[0])
+        return self._compile_text_layer_analysis(image_path, text_result, llava_results)
+
+    def comprehensive_analysis_batch(self, image_paths: List[str], custom_prompts: List[str] = None) -> List[Dict[str, Any]]:
+        """Complete analysis of several drawings through one batched generate call
         
-        # Regex backup extraction
-        regex_dimensions = self.extract_dimensions_regex(llava_result['llava_response'])
+        Drawings that failed to load come back as {'drawing_file', 'full_path', 'error'}.
+        """
+        print(f"\n{'='*80}")
+        print(f"🔧 COLUMBUS HYDRAULICS DRAWING ANALYSIS - BATCH OF {len(image_paths)}")
+        for image_path in image_paths:
+            print(f"📁 File: {os.path.basename(image_path)}")
+        print(f"{'='*80}")
+        
+        prompts = custom_prompts or [None] * len(image_paths)
+        plans = [self.plan_analysis(path, prompt) for path, prompt in zip(image_paths, prompts)]
+        text_results = [text_result for text_result, _ in plans]
+        
+        # One model batch for whole drawings and for the pages text layers could not cover
+        work = []
+        for index, (prompt, (text_result, pages)) in enumerate(zip(prompts, plans)):
+            work.extend((index, prompt if text_result is None else None, page) for page in pages)
+        llava_results = self.analyze_batch(
+            [image_paths[index] for index, _, _ in work], [prompt for _, prompt, _ in work], [page for _, _, page in work]
+        ) if work else []
+        per_drawing: Dict[int, List[Dict[str, Any]]] = {}
+        for (index, _, _), llava_result in zip(work, llava_results):
+            per_drawing.setdefault(index, []).append(llava_result)
+        
+        analyses = []
+        for index, (image_path, text_result) in enumerate(zip(image_paths, text_results)):
+            results = per_drawing.get(index, [])
+            errors = [r['error'] for r in results if 'error' in r]
+            if errors and text_result is None:
+                analyses.append({'drawing_file': os.path.basename(image_path), 'full_path': image_path, 'error': errors[0]})
+                continue
+            analysis = self.compile_results(image_path, text_result, [r for r in results if 'error' not in r])
+            if results and not errors:
+                analysis['analysis_results']['performance_metrics']['batch_size'] = results[0]['batch_size']
+            analyses.append(analysis)
+        return analyses
+
+    def _compile_analysis(self, image_path: str, llava_result: Dict[str, Any]) -> Dict[str, Any]:
+        dimensions = self._response_dimensions(llava_result)
         
         # Analyze drawing metadata
-        drawing_metadata = self._extract_drawing_metadata(llava_result['llava_response'])
+        drawing_metadata = self._response_metadata(llava_result)
         
         # Compile complete analysis
         analysis = {
@@ -217,20 +704,83 @@ Format your response with clear sections for dimensions, threads, inspection fea
             'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
             'analysis_results': {
                 'llava_detailed_response': llava_result['llava_response'],
-                'extracted_dimensions': regex_dimensions,
+                'extracted_dimensions': dimensions,
                 'drawing_metadata': drawing_metadata,
+                'field_sources': {key: 'llava' for key in drawing_metadata},
                 'performance_metrics': {
+                    'analysis_path': 'llava',
                     'inference_time_seconds': llava_result['inference_time'],
+                    'output_tokens': llava_result['output_tokens'],
                     'model_device': llava_result['model_device'],
+                    'profile': llava_result['profile'],
                     'image_dimensions': llava_result['image_size'],
-                    'total_dimensions_found': len(regex_dimensions),
-                    'high_confidence_dims': len([d for d in regex_dimensions if d['confidence'] > 0.8])
+                    'total_dimensions_found': len(dimensions),
+                    'high_confidence_dims': len([d for d in dimensions if d['confidence'] > 0.8])
                 }
             }
         }
+        if 'tiles' in llava_result:
+            analysis['analysis_results']['tiles'] = llava_result['tiles']
         
         return analysis
 
+    def _compile_text_layer_analysis(self, image_path: str, text_result: Dict[str, Any],
+                                     llava_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Text layer analysis, completed by model output for uncovered pages and unresolved fields"""
+        dimensions = list(text_result['dimensions'])
+        metadata = dict(text_result['metadata'])
+        field_sources = dict(text_result['field_sources'])
+        for llava_result in llava_results:
+            if llava_result['page'] in text_result['pages_without_text']:
+                dimensions.extend(self._response_dimensions(llava_result))
+            for key, value in self._response_metadata(llava_result).items():
+                if key not in metadata:
+                    metadata[key] = value
+                    field_sources[key] = 'llava'
+        
+        return {
+            'drawing_file': os.path.basename(image_path),
+            'full_path': image_path,
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'analysis_results': {
+                'llava_detailed_response': '\n\n'.join(r['llava_response'] for r in llava_results),
+                'text_layer': text_result['text'],
+                'extracted_dimensions': dimensions,
+                'drawing_metadata': metadata,
+                'field_sources': field_sources,
+                'unresolved_fields': [field for field in FALLBACK_FIELDS if field not in metadata],
+                'performance_metrics': {
+                    'analysis_path': 'text_layer+llava' if llava_results else 'text_layer',
+                    'text_layer_seconds': text_result['seconds'],
+                    'inference_time_seconds': sum(r['inference_time'] for r in llava_results),
+                    'output_tokens': sum(r['output_tokens'] for r in llava_results),
+                    'model_device': str(self.model.device) if self.model is not None else None,
+                    'profile': self.profile,
+                    'image_dimensions': llava_results[0]['image_size'] if llava_results else None,
+                    'total_dimensions_found': len(dimensions),
+                    'high_confidence_dims': len([d for d in dimensions if d['confidence'] > 0.8])
+                }
+            }
+        }
+
+    def _response_dimensions(self, llava_result: Dict[str, Any]) -> List[Dict]:
+        """Dimensions of a model result: merged from its tiles, from its JSON object, else the regex backup extraction"""
+        if 'dimensions' in llava_result:
+            return llava_result['dimensions']
+        if llava_result.get('structured') is not None:
+            return structured_dimensions(llava_result['structured'], llava_result['page'])
+        dimensions = self.extract_dimensions_regex(llava_result['llava_response'])
+        for dim in dimensions:
+            dim.update(source='llava', page=llava_result['page'])
+        return dimensions
+
+    def _response_metadata(self, llava_result: Dict[str, Any]) -> Dict:
+        if 'metadata' in llava_result:
+            return llava_result['metadata']
+        if llava_result.get('structured') is not None:
+            return structured_metadata(llava_result['structured'])
+        return self._extract_drawing_metadata(llava_result['llava_response'])
+
     def _extract_drawing_metadata(self, response: str) -> Dict:
         """Extract drawing metadata like part number, material, etc."""
         metadata = {}
@@ -256,19 +806,68 @@ def setup_columbus_workspace():
     base_dir = Path("/workspace/columbus_drw")
     
     # Create directory structure
-    dirs = ['images', 'results', 'logs', 'models', 'processed']
+    dirs = ['images', 'results', 'logs', 'models', 'raster_cache']
     for dir_name in dirs:
         (base_dir / dir_name).mkdir(parents=True, exist_ok=True)
         print(f"📁 Directory ready: {dir_name}/")
     
     return base_dir
 
+def save_batch_result(analysis: Dict[str, Any], image_file: Path, results_dir: Path) -> Path:
+    """Save one --batch analysis and print its summary"""
+    output_file = results_dir / f"{image_file.stem}_columbus_analysis.json"
+    with open(output_file, 'w') as f:
+        json.dump(analysis, f, indent=2, default=str)
+    
+    # Print summary
+    metrics = analysis['analysis_results']['performance_metrics']
+    print(f"   ✅ Complete - {metrics['total_dimensions_found']} dimensions found ({metrics['analysis_path']})")
+    if 'text_layer_seconds' in metrics:
+        print(f"   📄 Text layer: {metrics['text_layer_seconds'] * 1000:.0f}ms")
+    print(f"   ⏱️  Processing time: {metrics['inference_time_seconds']:.1f}s")
+    print(f"   💾 Saved to: {output_file.name}")
+    return output_file
+
 def main():
     parser = argparse.ArgumentParser(description='Columbus Hydraulics Drawing Analyzer')
     parser.add_argument('--image', type=str, help='Single image file path')
     parser.add_argument('--batch', action='store_true', help='Process all images in images/')
     parser.add_argument('--model', type=str, default='llava-hf/llava-v1.6-mistral-7b-hf')
     parser.add_argument('--output-dir', type=str, default='results', help='Output directory')
+    parser.add_argument('--server', type=str, default=None,
+                        help='Submit to a running inference_server.py (http://host:port or unix:///path.sock) instead of loading the model')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='Drawings per generate call in --batch mode (larger batches use more GPU memory)')
+    parser.add_argument('--profile', type=str, default='gpu', choices=list(INFERENCE_PROFILES),
+                        help='Inference profile: gpu (float16, device_map=auto) or a CPU profile for CPU-only boxes')
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads for CPU inference')
+    parser.add_argument('--interop-threads', type=int, default=None, help='Inter-op threads for CPU inference')
+    parser.add_argument('--compile', action='store_true', help='Compile the model forward with torch.compile')
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI, help='Resolution for rendering PDF drawings')
+    parser.add_argument('--raster-cache', type=str, default='raster_cache',
+                        help='Directory caching rendered PDF pages ("" disables the cache)')
+    parser.add_argument('--raster-workers', type=int, default=None,
+                        help='Processes rendering PDFs ahead of analysis in --batch mode')
+    parser.add_argument('--prepare-workers', type=int, default=2,
+                        help='Threads reading text layers, rasterizing and tokenizing drawings ahead of the model in --batch mode')
+    parser.add_argument('--write-workers', type=int, default=1,
+                        help='Threads extracting dimensions and writing results in --batch mode')
+    parser.add_argument('--queue-size', type=int, default=4,
+                        help='Drawings waiting between --batch pipeline stages')
+    parser.add_argument('--text-layer', type=str, default='auto', choices=TEXT_LAYER_MODES,
+                        help='auto: read PDF text layers and use the model only for what they miss; '
+                             'only: never run the model on PDFs with text; off: always use the model')
+    parser.add_argument('--no-prefix-cache', action='store_true',
+                        help='Re-encode the whole prompt for every drawing instead of reusing the cached prefix')
+    parser.add_argument('--output', type=str, default='prose', choices=OUTPUT_MODES,
+                        help='prose: free-form answer mined with regexes; json: schema-constrained JSON object')
+    parser.add_argument('--tile-size', type=int, default=0,
+                        help='Analyze drawings larger than this many pixels as overlapping tiles plus an overview '
+                             f'(0 = off; {DEFAULT_TILE_SIZE} matches the model\'s largest input)')
+    parser.add_argument('--tile-overlap', type=float, default=DEFAULT_OVERLAP, help='Fraction of a tile shared with its neighbours')
+    parser.add_argument('--tile-workers', type=int, default=0,
+                        help='Processes analyzing tiles in parallel, each loading the model (0 = batches in this process)')
+    parser.add_argument('--tile-batch', type=int, default=4, help='Tiles per generate call without --tile-workers')
     
     args = parser.parse_args()
     
@@ -280,8 +879,22 @@ def main():
     os.chdir(base_dir)
     
     # Initialize analyzer
-    print("\n🔧 Initializing LLaVA-NeXT for Columbus drawings...")
-    analyzer = ColumbusDrawingAnalyzer(model_name=args.model)
+    if args.server:
+        # The resident server already holds the model; tokens are echoed as they stream back
+        from inference_server import InferenceClient
+        print(f"\n🔌 Using inference server at {args.server}")
+        analyzer = InferenceClient(args.server, on_token=lambda text: print(text, end="", flush=True))
+    else:
+        print("\n🔧 Initializing LLaVA-NeXT for Columbus drawings...")
+        analyzer = ColumbusDrawingAnalyzer(
+            model_name=args.model, profile=args.profile, num_threads=args.threads,
+            interop_threads=args.interop_threads, compile=args.compile,
+            dpi=args.dpi, raster_cache_dir=args.raster_cache or None,
+            text_layer=args.text_layer, prefix_cache=not args.no_prefix_cache, output=args.output,
+            tile_size=args.tile_size, tile_overlap=args.tile_overlap, tile_workers=args.tile_workers,
+            tile_batch=args.tile_batch,
+            lazy_load=True  # Drawings with a text layer may never need the model
+        )
     
     results_dir = Path(args.output_dir)
     results_dir.mkdir(exist_ok=True)
@@ -290,48 +903,91 @@ def main():
         print(f"\n📁 Batch processing mode - scanning images/ directory...")
         
         # Find all image files
-        image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.pdf', '*.tiff', '*.bmp']
-        image_files = []
-        for ext in image_extensions:
-            image_files.extend(Path('images').glob(ext))
-            image_files.extend(Path('images').glob(ext.upper()))
-        
+        image_files = find_images('images')
         if not image_files:
             print("❌ No images found in images/ directory")
             print("   Supported formats: JPG, PNG, PDF, TIFF, BMP")
             return
         
-        print(f"📷 Found {len(image_files)} images to process")
+        # Drawings already analyzed with this model, prompt and settings are skipped; failures are retried
+        if args.server:
+            health = analyzer.health()
+            prompt = STRUCTURED_PROMPT if health['settings'].get('output') == 'json' else COLUMBUS_PROMPT
+            key = run_key(health['model'], prompt, health['settings'])
+        else:
+            key = run_key(args.model, analyzer.default_prompt(), analyzer.analysis_settings())
+        manifest = BatchManifest(results_dir / 'batch_manifest.json')
+        item_keys = {image_file: manifest.item_key(manifest.file_hash(image_file), key) for image_file in image_files}
+        retried = sum(1 for f in image_files if (manifest.get(item_keys[f]) or {}).get('status') == 'failed')
+        done = {f for f in image_files if manifest.is_done(item_keys[f])}
+        manifest.save()  # Keep the content hashes even if nothing else gets recorded
+        image_files = [f for f in image_files if f not in done]
         
-        # Process each image
-        for i, image_file in enumerate(image_files, 1):
-            print(f"\n📊 Processing {i}/{len(image_files)}: {image_file.name}")
-            try:
-                analysis = analyzer.comprehensive_analysis(str(image_file))
-                
-                # Save results
-                output_file = results_dir / f"{image_file.stem}_columbus_analysis.json"
-                with open(output_file, 'w') as f:
-                    json.dump(analysis, f, indent=2, default=str)
-                
-                # Print summary
-                metrics = analysis['analysis_results']['performance_metrics']
-                print(f"   ✅ Complete - {metrics['total_dimensions_found']} dimensions found")
-                print(f"   ⏱️  Processing time: {metrics['inference_time_seconds']:.1f}s")
-                print(f"   💾 Saved to: {output_file.name}")
-                
-                # Move processed image
-                processed_dir = Path('processed')
-                processed_file = processed_dir / image_file.name
+        print(f"📷 Found {len(image_files) + len(done)} images: {len(done)} already done, "
+              f"{len(image_files)} to process ({retried} retried after failure)")
+        if not image_files:
+            return
+        
+        # Render all PDFs across a process pool first; analysis then reads them from the raster cache
+        # (with a text layer most PDFs are never rasterized, so they are rendered on demand instead)
+        pdf_files = [str(f) for f in image_files if f.suffix.lower() == '.pdf']
+        if pdf_files and args.raster_cache and not args.server and args.text_layer == 'off':
+            rendered = warm_cache(pdf_files, args.raster_cache, pages=[0], dpi=args.dpi, workers=args.raster_workers)
+            print(f"🖼️ Rasterized {rendered} PDF page(s) ({len(pdf_files) - rendered} already cached)")
+        
+        if not args.server:
+            # Preparation, inference and writing overlap; the model runs whenever a drawing is ready
+            def write_result(image_path: str, item_key: str, analysis: Dict[str, Any], error: str, seconds: float):
+                image_file = Path(image_path)
+                print(f"\n📊 {image_file.name}")
+                if error is not None:
+                    print(f"   ❌ Error: {error}")
+                    manifest.record_failed(item_key, image_file, error)
+                    return
+                output_file = save_batch_result(analysis, image_file, results_dir)
+                manifest.record_done(item_key, image_file, output_file, seconds)
+            
+            pipeline = BatchPipeline(
+                analyzer, write_result, prepare_workers=args.prepare_workers, write_workers=args.write_workers,
+                queue_size=args.queue_size, batch_size=args.batch_size
+            )
+            stats = pipeline.run([(str(f), item_keys[f]) for f in image_files])
+            print_stage_stats(stats, pipeline.wall)
+        elif args.batch_size > 1:
+            # Several drawings per generate call; results come back split per drawing
+            for start in range(0, len(image_files), args.batch_size):
+                chunk = image_files[start:start + args.batch_size]
+                print(f"\n📊 Processing {start + 1}-{start + len(chunk)}/{len(image_files)}: {', '.join(f.name for f in chunk)}")
+                start_time = time.time()
                 try:
-                    image_file.rename(processed_file)
-                    print(f"   📁 Moved to: processed/{image_file.name}")
-                except:
-                    pass  # Keep original if move fails
-                
-            except Exception as e:
-                print(f"   ❌ Error: {e}")
-                continue
+                    analyses = analyzer.comprehensive_analysis_batch([str(f) for f in chunk])
+                except Exception as e:
+                    print(f"   ❌ Error: {e}")
+                    for image_file in chunk:
+                        manifest.record_failed(item_keys[image_file], image_file, str(e))
+                    continue
+                seconds = time.time() - start_time
+                for image_file, analysis in zip(chunk, analyses):
+                    print(f"\n   {image_file.name}")
+                    if 'error' in analysis:
+                        print(f"   ❌ Error: {analysis['error']}")
+                        manifest.record_failed(item_keys[image_file], image_file, analysis['error'])
+                    else:
+                        output_file = save_batch_result(analysis, image_file, results_dir)
+                        manifest.record_done(item_keys[image_file], image_file, output_file, seconds)
+        else:
+            # Process each image
+            for i, image_file in enumerate(image_files, 1):
+                print(f"\n📊 Processing {i}/{len(image_files)}: {image_file.name}")
+                start_time = time.time()
+                try:
+                    analysis = analyzer.comprehensive_analysis(str(image_file))
+                    output_file = save_batch_result(analysis, image_file, results_dir)
+                except Exception as e:
+                    print(f"   ❌ Error: {e}")
+                    manifest.record_failed(item_keys[image_file], image_file, str(e))
+                    continue
+                manifest.record_done(item_keys[image_file], image_file, output_file, time.time() - start_time)
     
     elif args.image:
         print(f"\n🖼️ Single image analysis: {args.image}")
@@ -352,23 +1008,26 @@ def main():
             print(f"\n📋 DETAILED COLUMBUS ANALYSIS RESULTS")
             print("=" * 60)
             
+            print(f"🛣️ Analysis path: {analysis['analysis_results']['performance_metrics']['analysis_path']}")
             llava_response = analysis['analysis_results']['llava_detailed_response']
-            print("🔍 LLaVA-NeXT Analysis:")
-            print("-" * 40)
-            print(llava_response[:1000] + "..." if len(llava_response) > 1000 else llava_response)
+            if llava_response:
+                print("🔍 LLaVA-NeXT Analysis:")
+                print("-" * 40)
+                print(llava_response[:1000] + "..." if len(llava_response) > 1000 else llava_response)
             
             dims = analysis['analysis_results']['extracted_dimensions']
             print(f"\n📏 Extracted Dimensions ({len(dims)} found):")
             print("-" * 40)
             for dim in dims[:10]:  # Show first 10
-                print(f"  {dim['type']}: {dim['full_match']} (confidence: {dim['confidence']:.2f})")
+                print(f"  {dim['type']}: {dim['full_match']} (confidence: {dim['confidence']:.2f}, {dim['source']})")
             
             metadata = analysis['analysis_results']['drawing_metadata']
+            sources = analysis['analysis_results']['field_sources']
             if metadata:
                 print(f"\n📄 Drawing Metadata:")
                 print("-" * 40)
                 for key, value in metadata.items():
-                    print(f"  {key}: {value}")
+                    print(f"  {key}: {value} ({sources.get(key, 'unknown')})")
             
             print(f"\n💾 Results saved to: {output_file}")
             
@@ -380,6 +1039,11 @@ def main():
         print("Usage:")
         print("  python main.py --image images/your_drawing.pdf")
         print("  python main.py --batch")
+        print("  python main.py --batch --batch-size 4")
+        print("  python main.py --batch --output json")
+        print("  python main.py --image images/your_drawing.pdf --dpi 300 --tile-size 672")
+        print("  python main.py --image images/your_drawing.pdf --profile cpu-bf16 --threads 16")
+        print("  python main.py --image images/your_drawing.pdf --server http://127.0.0.1:8765")
         print("\n📁 Upload your Columbus drawings to: images/")
 
 if __name__ == "__main__":
@@ -0,0 +1,47 @@
+# prefix_cache_test.py - Cached prompt prefix gives the same output as re-encoding the prompt, using a tiny random model
+import os
+import tempfile
+
+from PIL import Image
+
+from tiny_model import build_tiny_model
+from main import COLUMBUS_PROMPT, PREFIX_CACHE_SIZE, ColumbusDrawingAnalyzer
+
+# Same text with the image ahead of the instructions, so only the system message is a cacheable prefix
+IMAGE_FIRST = COLUMBUS_PROMPT.replace("<image>\n", "").replace("<|im_start|>user\n", "<|im_start|>user\n<image>\n")
+
+
+def test_prefix_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        model_dir = build_tiny_model(os.path.join(tmp, "model"))
+        cached = ColumbusDrawingAnalyzer(model_name=model_dir, max_new_tokens=24, profile="cpu-fp32")
+        uncached = ColumbusDrawingAnalyzer(model_name=model_dir, max_new_tokens=24, profile="cpu-fp32", prefix_cache=False)
+
+        # Different sizes expand <image> to different token counts after the shared prefix
+        paths = []
+        for index, size in enumerate([(800, 600), (300, 900)]):
+            paths.append(os.path.join(tmp, f"drawing{index}.png"))
+            Image.new("RGB", size, (60 * index, 120, 200)).save(paths[-1])
+
+        for prompt in (None, IMAGE_FIRST):
+            for path in paths:
+                expected = uncached.analyze_columbus_drawing(path, custom_prompt=prompt)['llava_response']
+                assert cached.analyze_columbus_drawing(path, custom_prompt=prompt)['llava_response'] == expected
+        assert len(cached._prompt_prefixes) == 2 and len(cached._prefix_kv) == 2
+        print("✅ Cached prefix output identical for both prompt layouts")
+
+        # A prompt without <image> is not cacheable and still goes through the processor
+        assert cached._prompt_prefix("no image here", Image.new("RGB", (64, 64))) is None
+
+        # Least recently used prompts and prefix KV caches are dropped; an evicted prefix is encoded again
+        for index in range(PREFIX_CACHE_SIZE):
+            cached.analyze_columbus_drawing(paths[0], custom_prompt=f"Drawing {index}\n" + COLUMBUS_PROMPT)
+        assert len(cached._prompt_prefixes) == PREFIX_CACHE_SIZE and len(cached._prefix_kv) == PREFIX_CACHE_SIZE
+        expected = uncached.analyze_columbus_drawing(paths[1])['llava_response']
+        assert cached.analyze_columbus_drawing(paths[1])['llava_response'] == expected
+        assert len(cached._prefix_kv) == PREFIX_CACHE_SIZE
+        print("✅ Prefix cache stays bounded")
+
+
+if __name__ == "__main__":
+    test_prefix_cache()
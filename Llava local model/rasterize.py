@@ -0,0 +1,202 @@
+# rasterize.py - PDF page rasterization for Columbus drawings
+"""
+Renders PDF pages to RGB PIL images for the analyzers.
+
+- Any subset of pages (all by default) at a requested DPI
+- Images are built straight from the pixmap sample buffer: no PPM
+  encode / BytesIO / decode round trip
+- Open documents are reused between calls
+- rasterize_files() fans pages out over a process pool
+- With a cache_dir, rasters are kept on disk as raw RGB keyed by PDF
+  hash, page and DPI, so re-analyzing a drawing skips rendering
+
+    python rasterize.py images/*.pdf --dpi 200 --cache raster_cache
+"""
+import argparse
+import functools
+import hashlib
+import os
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+DEFAULT_DPI = 144  # The old fitz.Matrix(2, 2): twice the PDF's 72 points per inch
+
+# Cache file: magic, width, height, then width * height * 3 bytes of RGB
+CACHE_HEADER = struct.Struct("<4sII")
+CACHE_MAGIC = b"RGB1"
+
+# PyMuPDF documents are not safe to share between threads
+_document_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=8)
+def _open_document(pdf_path: str, mtime: float):
+    """Open documents stay cached per (path, mtime), so an edited PDF is reopened"""
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        raise Exception("PyMuPDF not installed. Install with: pip install PyMuPDF")
+    return fitz.open(pdf_path)
+
+
+def _document(pdf_path: str):
+    pdf_path = os.path.abspath(pdf_path)
+    return _open_document(pdf_path, os.path.getmtime(pdf_path))
+
+
+@functools.lru_cache(maxsize=256)
+def _file_hash(pdf_path: str, mtime: float, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pdf_hash(pdf_path: str) -> str:
+    """SHA-256 of the PDF, memoized per (path, mtime, size)"""
+    pdf_path = os.path.abspath(pdf_path)
+    stat = os.stat(pdf_path)
+    return _file_hash(pdf_path, stat.st_mtime, stat.st_size)
+
+
+def page_count(pdf_path: str) -> int:
+    with _document_lock:
+        return _document(pdf_path).page_count
+
+
+def pixmap_to_image(pix) -> Image.Image:
+    """PIL image read directly from an RGB pixmap's samples (one copy, no re-encoding)"""
+    return Image.frombuffer("RGB", (pix.width, pix.height), pix.samples_mv, "raw", "RGB", pix.stride, 1)
+
+
+def cache_path(cache_dir: str, sha256: str, page: int, dpi: int) -> str:
+    return os.path.join(cache_dir, sha256[:2], f"{sha256}_p{page}_{dpi}dpi.rgb")
+
+
+def _read_cached(path: str) -> Optional[Image.Image]:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    if len(data) < CACHE_HEADER.size:
+        return None
+    magic, width, height = CACHE_HEADER.unpack_from(data)
+    if magic != CACHE_MAGIC or len(data) != CACHE_HEADER.size + width * height * 3:
+        return None  # Truncated or foreign file: render again and overwrite it
+    return Image.frombuffer("RGB", (width, height), memoryview(data)[CACHE_HEADER.size:], "raw", "RGB", 0, 1)
+
+
+def _write_cached(path: str, image: Image.Image):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, image.width, image.height))
+        f.write(image.tobytes())
+    os.replace(tmp_path, path)  # Readers only ever see complete rasters
+
+
+def render_pages(pdf_path: str, pages: Optional[Sequence[int]] = None, dpi: int = DEFAULT_DPI,
+                 cache_dir: Optional[str] = None) -> List[Image.Image]:
+    """Render the given 0-based pages (all pages when None) of pdf_path as RGB images"""
+    sha256 = pdf_hash(pdf_path) if cache_dir else None
+    images = []
+    with _document_lock:
+        doc = _document(pdf_path)
+        for page in (range(doc.page_count) if pages is None else pages):
+            if not 0 <= page < doc.page_count:
+                raise Exception(f"Page {page} out of range: {pdf_path} has {doc.page_count} pages")
+            if cache_dir:
+                image = _read_cached(cache_path(cache_dir, sha256, page, dpi))
+                if image is not None:
+                    images.append(image)
+                    continue
+            image = pixmap_to_image(doc[page].get_pixmap(dpi=dpi, alpha=False))
+            if cache_dir:
+                _write_cached(cache_path(cache_dir, sha256, page, dpi), image)
+            images.append(image)
+    return images
+
+
+def _render_task(task: Tuple[str, int, int, Optional[str]]) -> Tuple[Tuple[int, int], bytes]:
+    pdf_path, page, dpi, cache_dir = task
+    image = render_pages(pdf_path, [page], dpi, cache_dir)[0]
+    return image.size, image.tobytes()
+
+
+def rasterize_files(pdf_paths: Sequence[str], pages: Optional[Sequence[int]] = None, dpi: int = DEFAULT_DPI,
+                    cache_dir: Optional[str] = None, workers: Optional[int] = None) -> Dict[str, List[Image.Image]]:
+    """
+    Render several PDFs, one (file, page) task per pool process.
+    Returns {pdf_path: [images in page order]}. workers=1 renders in-process.
+    """
+    tasks = []
+    for pdf_path in pdf_paths:
+        selected = range(page_count(pdf_path)) if pages is None else pages
+        tasks.extend((pdf_path, page, dpi, cache_dir) for page in selected)
+
+    results: Dict[str, List[Image.Image]] = {pdf_path: [] for pdf_path in pdf_paths}
+    if workers == 1 or len(tasks) <= 1:
+        for pdf_path, page, _, _ in tasks:
+            results[pdf_path].extend(render_pages(pdf_path, [page], dpi, cache_dir))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (pdf_path, _, _, _), (size, data) in zip(tasks, pool.map(_render_task, tasks)):
+            results[pdf_path].append(Image.frombuffer("RGB", size, data, "raw", "RGB", 0, 1))
+    return results
+
+
+def _warm_task(task: Tuple[str, int, int, str]):
+    pdf_path, page, dpi, cache_dir = task
+    render_pages(pdf_path, [page], dpi, cache_dir)
+
+
+def warm_cache(pdf_paths: Sequence[str], cache_dir: str, pages: Optional[Sequence[int]] = None,
+               dpi: int = DEFAULT_DPI, workers: Optional[int] = None) -> int:
+    """Render everything not yet cached across the pool without shipping pixels back; returns pages rendered"""
+    tasks = []
+    for pdf_path in pdf_paths:
+        sha256 = pdf_hash(pdf_path)
+        selected = range(page_count(pdf_path)) if pages is None else [p for p in pages if p < page_count(pdf_path)]
+        tasks.extend(
+            (pdf_path, page, dpi, cache_dir) for page in selected
+            if not os.path.exists(cache_path(cache_dir, sha256, page, dpi))
+        )
+    if workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            _warm_task(task)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_warm_task, tasks))
+    return len(tasks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rasterize Columbus PDF drawings')
+    parser.add_argument('pdfs', nargs='+')
+    parser.add_argument('--dpi', type=int, default=DEFAULT_DPI)
+    parser.add_argument('--pages', type=str, default=None, help='Comma-separated 0-based pages (default: all)')
+    parser.add_argument('--cache', type=str, default=None, help='Raster cache directory')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output-dir', type=str, default=None, help='Also save each page as PNG here')
+    args = parser.parse_args()
+
+    pages = [int(page) for page in args.pages.split(",")] if args.pages else None
+    rasters = rasterize_files(args.pdfs, pages, args.dpi, args.cache, args.workers)
+    for pdf_path, images in rasters.items():
+        print(f"📄 {pdf_path}: {len(images)} page(s) at {args.dpi} dpi")
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            stem = os.path.splitext(os.path.basename(pdf_path))[0]
+            for page, image in zip(pages or range(len(images)), images):
+                image.save(os.path.join(args.output_dir, f"{stem}_p{page}.png"))
+
+
+if __name__ == "__main__":
+    main()
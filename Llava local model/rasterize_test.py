@@ -0,0 +1,75 @@
+# rasterize_test.py - PDF rasterization, process pool and raster cache
+import io
+import os
+import tempfile
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+import rasterize
+from rasterize import cache_path, pdf_hash, rasterize_files, render_pages, warm_cache
+
+
+def _pdf(path, pages=3):
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page(width=792, height=612)
+        page.draw_rect(fitz.Rect(72, 72, 720, 540), width=2)
+        page.insert_text((90, 560), f"Sheet {number + 1}  Ø2.490 ±0.002")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_rasterize():
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = _pdf(os.path.join(tmp, "drawing.pdf"))
+
+        # Same pixels as the old PPM round trip at fitz.Matrix(2, 2)
+        doc = fitz.open(pdf_path)
+        old = Image.open(io.BytesIO(doc[1].get_pixmap(matrix=fitz.Matrix(2, 2)).tobytes("ppm"))).convert("RGB")
+        doc.close()
+        image = render_pages(pdf_path, [1])[0]
+        assert image.mode == "RGB" and image.size == old.size == (1584, 1224)
+        assert image.tobytes() == old.tobytes()
+
+        # All pages by default, size follows the requested DPI
+        pages = render_pages(pdf_path, dpi=72)
+        assert [p.size for p in pages] == [(792, 612)] * 3
+        print("✅ Rendered pages match the PPM path")
+
+        # Second render comes from the cache, byte for byte
+        cache_dir = os.path.join(tmp, "cache")
+        first = render_pages(pdf_path, [0, 2], dpi=100, cache_dir=cache_dir)
+        cached = cache_path(cache_dir, pdf_hash(pdf_path), 2, 100)
+        assert os.path.exists(cached)
+        stamp = os.path.getmtime(cached)
+        again = render_pages(pdf_path, [0, 2], dpi=100, cache_dir=cache_dir)
+        assert [i.tobytes() for i in again] == [i.tobytes() for i in first]
+        assert os.path.getmtime(cached) == stamp
+
+        # A truncated cache file is re-rendered, not trusted
+        with open(cached, "r+b") as f:
+            f.truncate(100)
+        assert render_pages(pdf_path, [2], dpi=100, cache_dir=cache_dir)[0].tobytes() == first[1].tobytes()
+        print("✅ Raster cache hits and recovers from damaged entries")
+
+        # Process pool fan-out gives the same rasters, in page order per file
+        second_pdf = _pdf(os.path.join(tmp, "second.pdf"), pages=2)
+        pooled = rasterize_files([pdf_path, second_pdf], dpi=72, workers=2)
+        assert len(pooled[pdf_path]) == 3 and len(pooled[second_pdf]) == 2
+        assert [i.tobytes() for i in pooled[pdf_path]] == [i.tobytes() for i in pages]
+        assert warm_cache([pdf_path, second_pdf], cache_dir, dpi=72, workers=2) == 5
+        assert warm_cache([pdf_path, second_pdf], cache_dir, dpi=72, workers=2) == 0
+        print("✅ Process pool rasterization passed")
+
+        try:
+            render_pages(pdf_path, [5])
+            raise AssertionError("expected an out of range error")
+        except Exception as e:
+            assert "out of range" in str(e)
+        rasterize._open_document.cache_clear()
+
+
+if __name__ == "__main__":
+    test_rasterize()
@@ -0,0 +1,109 @@
+# server_test.py - Resident inference server end to end, using a tiny random model
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+from PIL import Image, ImageDraw
+
+from tiny_model import build_tiny_model
+from main import ColumbusDrawingAnalyzer
+from inference_server import InferenceClient, InferenceWorker, create_app
+
+
+def _drawing(path):
+    image = Image.new("RGB", (800, 600), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((100, 100, 700, 500), outline="black", width=3)
+    draw.text((120, 520), "Ø2.490 ±0.002", fill="black")
+    image.save(path)
+    return path
+
+
+def test_inference_server():
+    with tempfile.TemporaryDirectory() as tmp:
+        model_dir = build_tiny_model(os.path.join(tmp, "model"))
+        analyzer = ColumbusDrawingAnalyzer(model_name=model_dir)
+        worker = InferenceWorker(analyzer)
+        worker.start()
+
+        socket_path = os.path.join(tmp, "llava.sock")
+        server = uvicorn.Server(uvicorn.Config(create_app(worker, model_dir), uds=socket_path, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.01)
+
+        try:
+            image_path = _drawing(os.path.join(tmp, "drawing.png"))
+
+            # Tokens stream back while generating and add up to the final response
+            # (the streamer flushes at word boundaries, so random output may arrive in few events)
+            tokens = []
+            client = InferenceClient(f"unix://{socket_path}", on_token=tokens.append)
+            analysis = client.comprehensive_analysis(image_path)
+            response = analysis['analysis_results']['llava_detailed_response']
+            assert tokens, "expected token events before the result"
+            assert "".join(tokens).strip() == response
+            print(f"✅ Streamed {len(tokens)} token event(s), {len(response)} characters")
+
+            # Concurrent submissions queue up behind the one loaded model
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                results = list(pool.map(
+                    lambda _: InferenceClient(f"unix://{socket_path}").comprehensive_analysis(image_path), range(3)
+                ))
+            assert all(r['drawing_file'] == "drawing.png" for r in results)
+            waits = sorted(r['analysis_results']['performance_metrics']['queue_wait_seconds'] for r in results)
+            print(f"✅ Queued jobs completed (queue waits: {', '.join(f'{w:.2f}s' for w in waits)})")
+
+            health = client.health()
+            assert health['completed'] == 4 and health['queued'] == 0
+
+            # Missing files are rejected before they reach the queue
+            try:
+                client.comprehensive_analysis(os.path.join(tmp, "missing.png"))
+                raise AssertionError("expected an error for a missing image")
+            except Exception as e:
+                assert "404" in str(e)
+            print("✅ Inference server test passed")
+        finally:
+            server.should_exit = True
+            thread.join()
+            worker.stop()
+
+
+def test_batched_worker():
+    with tempfile.TemporaryDirectory() as tmp:
+        analyzer = ColumbusDrawingAnalyzer(model_name=build_tiny_model(os.path.join(tmp, "model")), max_new_tokens=32)
+        paths = [_drawing(os.path.join(tmp, f"drawing_{i}.png")) for i in range(3)]
+        expected = [analyzer.analyze_columbus_drawing(path)['llava_response'] for path in paths]
+
+        # Jobs queued before the worker starts are picked up as one batch
+        worker = InferenceWorker(analyzer, batch_size=4, max_wait=0.1)
+        jobs = [worker.submit(path, stream=(i == 0)) for i, path in enumerate(paths)]
+        missing = worker.submit(os.path.join(tmp, "missing.png"))
+        worker.start()
+        try:
+            streamed = "".join(jobs[0].streamer)
+            results = [job.future.result(timeout=60) for job in jobs]
+            for analysis, response in zip(results, expected):
+                metrics = analysis['analysis_results']['performance_metrics']
+                assert metrics['batch_size'] == 3
+                assert analysis['analysis_results']['llava_detailed_response'] == response
+            assert streamed == expected[0]
+            try:
+                missing.future.result(timeout=60)
+                raise AssertionError("expected an error for a missing image")
+            except Exception as e:
+                assert "Could not load image" in str(e)
+            assert worker.completed == 4
+            print("✅ Batched worker test passed")
+        finally:
+            worker.stop()
+
+
+if __name__ == "__main__":
+    test_inference_server()
+    test_batched_worker()
@@ -2,30 +2,30 @@
 import torch
 from PIL import Image
 from transformers import LlavaNextProcessor, LlavaNextForConditionalGeneration
-import fitz  # PyMuPDF
-import io
 import sys
+import functools
+from rasterize import render_pages
 
 def convert_pdf_to_image(pdf_path):
     """Convert PDF to PIL Image"""
-    doc = fitz.open(pdf_path)
-    page = doc[0]
-    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-    img_data = pix.tobytes("ppm")
-    image = Image.open(io.BytesIO(img_data))
-    doc.close()
-    return image
+    return render_pages(pdf_path, [0])[0]
 
-def analyze_drawing(image_path):
-    """Analyze mechanical drawing - SIMPLE VERSION"""
-    
+@functools.lru_cache(maxsize=1)
+def load_model(model_name="llava-hf/llava-v1.6-mistral-7b-hf"):
+    """Load processor and model once per process; later calls reuse them"""
     print(f"🔧 Loading model...")
-    processor = LlavaNextProcessor.from_pretrained("llava-hf/llava-v1.6-mistral-7b-hf")
+    processor = LlavaNextProcessor.from_pretrained(model_name)
     model = LlavaNextForConditionalGeneration.from_pretrained(
-        "llava-hf/llava-v1.6-mistral-7b-hf",
+        model_name,
         torch_dtype=torch.float16,
         device_map="auto"
     )
+    return processor, model
+
+def analyze_drawing(image_path):
+    """Analyze mechanical drawing - SIMPLE VERSION"""
+    
+    processor, model = load_model()
     
     print(f"📄 Processing image: {image_path}")
     
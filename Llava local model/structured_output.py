@@ -0,0 +1,433 @@
+# structured_output.py - Schema-constrained JSON generation for Columbus drawings
+"""
+Makes the model answer with one compact JSON object instead of prose:
+
+    {"part_number": "PIS2.500-0120", "revision": "B", "material": "ALUMINUM 2011-T3", "weight": null,
+     "components": ["piston"],
+     "dimensions": [{"feature": "main bore", "kind": "diameter", "value": 2.490, "tolerance": 0.002,
+                     "inspection": true}]}
+
+STRUCTURED_SCHEMA is compiled into a character-level automaton. A logits
+processor masks every token that would leave it, so the output always
+parses, and a stopping criterion ends a row the moment its object
+closes. Token masks are cached per automaton state and computed by
+walking a trie of the vocabulary, so after the first drawing masking
+costs a dictionary lookup per step. Near the end of the token budget only
+the shortest completion is allowed, so the object closes within
+max_new_tokens. Strings close after MAX_STRING_CHARS characters.
+"""
+import json
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+from transformers import LogitsProcessor, StoppingCriteria
+
+from dimension_extractor import calculate_confidence
+
+DIMENSION_KINDS = ('diameter', 'length', 'radius', 'thread', 'chamfer', 'angle', 'other')
+
+# Field order is fixed, so the model only ever chooses values
+STRUCTURED_SCHEMA = {
+    'part_number': 'string?',
+    'revision': 'string?',
+    'material': 'string?',
+    'weight': 'string?',
+    'components': ['string'],
+    'dimensions': [{
+        'feature': 'string',
+        'kind': DIMENSION_KINDS,
+        'value': 'number',
+        'tolerance': 'number?',
+        'inspection': 'boolean'
+    }]
+}
+
+METADATA_FIELDS = ('part_number', 'revision', 'material', 'weight')
+MAX_STRING_CHARS = 48
+
+# Dimension kinds mapped onto the regex extractor's types (and their confidence)
+KIND_TYPES = {'diameter': 'diameter_symbol', 'radius': 'radius', 'thread': 'thread_spec', 'chamfer': 'chamfer'}
+
+STRUCTURED_PROMPT = """<|im_start|>system
+You are an expert mechanical engineer specializing in hydraulic systems and precision machining. You're analyzing technical drawings for Columbus Hydraulics components. You answer with a single JSON object and nothing else.
+
+<|im_start|>user
+Extract the Columbus hydraulics drawing below as JSON with these fields, in this order:
+- part_number, revision, material, weight: title block values as strings, or null
+- components: short names of the parts shown (piston, shaft, seal groove, ...)
+- dimensions: every dimension, each {"feature": what it controls, "kind": one of diameter, length, radius, thread, chamfer, angle, other, "value": number, "tolerance": number or null, "inspection": true when marked with *}
+Put thread callouts (e.g. 1/4-20 UNC-2B) in "feature" with kind "thread".
+
+<image>
+<|im_start|>assistant"""
+
+
+class _CharClass:
+    """A set of characters described by exclusions; sample is used to spell out completions"""
+
+    def __init__(self, excluded: str = '', allowed: str = None, sample: str = 'a'):
+        self.excluded = excluded
+        self.allowed = allowed
+        self.sample = sample
+
+    def matches(self, char: str) -> bool:
+        if self.allowed is not None:
+            return char in self.allowed
+        return char >= ' ' and char not in self.excluded
+
+
+STRING_CHAR = _CharClass(excluded='"\\\x7f', sample='a')
+DIGIT = _CharClass(allowed='0123456789', sample='0')
+SPACE = _CharClass(allowed=' \n', sample=' ')
+
+
+def _lit(text): return ('lit', text)
+def _cls(char_class): return ('cls', char_class)
+def _seq(*parts): return ('seq', parts)
+def _alt(*parts): return ('alt', parts)
+def _opt(part): return ('alt', (part, ('seq', ())))
+def _star(part): return ('star', part)
+
+
+def _repeat(part, least: int, most: int):
+    optional = _seq()
+    for _ in range(most - least):
+        optional = _opt(_seq(part, optional))
+    return _seq(*([part] * least), optional)
+
+
+def schema_pattern(schema) -> tuple:
+    """Grammar of the JSON text for a schema: dict, [item], tuple of enum strings or a type name ('...?' = nullable)"""
+    ws = _opt(_cls(SPACE))
+    if isinstance(schema, dict):
+        parts = [_lit('{'), ws]
+        for index, (key, value) in enumerate(schema.items()):
+            if index:
+                parts += [ws, _lit(','), ws]
+            parts += [_lit(json.dumps(key)), ws, _lit(':'), ws, schema_pattern(value)]
+        return _seq(*parts, ws, _lit('}'))
+    if isinstance(schema, list):
+        item = schema_pattern(schema[0])
+        return _seq(_lit('['), ws, _opt(_seq(item, _star(_seq(ws, _lit(','), ws, item)))), ws, _lit(']'))
+    if isinstance(schema, tuple):
+        return _seq(_lit('"'), _alt(*[_lit(option) for option in schema]), _lit('"'))
+    nullable = schema.endswith('?')
+    kind = schema.rstrip('?')
+    if kind == 'string':
+        pattern = _seq(_lit('"'), _star(_cls(STRING_CHAR)), _lit('"'))
+    elif kind == 'number':
+        digits = _seq(_cls(DIGIT), _repeat(_cls(DIGIT), 0, 5))
+        pattern = _seq(_opt(_lit('-')), digits, _opt(_seq(_lit('.'), digits)))
+    elif kind == 'boolean':
+        pattern = _alt(_lit('true'), _lit('false'))
+    else:
+        raise Exception(f"Unknown schema type: {schema}")
+    return _alt(pattern, _lit('null')) if nullable else pattern
+
+
+class Grammar:
+    """
+    Character automaton for a pattern. States are frozensets of NFA nodes
+    (determinized lazily), so they can key caches.
+    """
+
+    def __init__(self, pattern):
+        self.edges: List[List[Tuple[Any, int]]] = []
+        self.eps: List[List[int]] = []
+        start = self._node()
+        self.end = self._build(pattern, start)
+        self.start = self._closure({start})
+        self._steps: Dict[frozenset, Dict[str, Optional[frozenset]]] = {}
+        self._distance = self._distances()
+        # Longest shortest-completion from anywhere reachable: the token reserve for closing the object
+        self.max_completion = max(d for d in self._distance if d is not None)
+        self._completions: Dict[frozenset, str] = {}
+
+    def _node(self) -> int:
+        self.edges.append([])
+        self.eps.append([])
+        return len(self.edges) - 1
+
+    def _build(self, pattern, start: int) -> int:
+        kind, body = pattern
+        if kind == 'lit':
+            node = start
+            for char in body:
+                following = self._node()
+                self.edges[node].append((char, following))
+                node = following
+            return node
+        if kind == 'cls':
+            following = self._node()
+            self.edges[start].append((body, following))
+            return following
+        if kind == 'seq':
+            node = start
+            for part in body:
+                node = self._build(part, node)
+            return node
+        if kind == 'alt':
+            end = self._node()
+            for part in body:
+                entry = self._node()
+                self.eps[start].append(entry)
+                self.eps[self._build(part, entry)].append(end)
+            return end
+        if kind == 'star':
+            loop = self._node()
+            self.eps[start].append(loop)
+            self.eps[self._build(body, loop)].append(loop)
+            return loop
+        raise Exception(f"Unknown pattern: {kind}")
+
+    def _closure(self, nodes) -> frozenset:
+        stack, seen = list(nodes), set(nodes)
+        while stack:
+            for following in self.eps[stack.pop()]:
+                if following not in seen:
+                    seen.add(following)
+                    stack.append(following)
+        return frozenset(seen)
+
+    def step(self, state: frozenset, char: str) -> Optional[frozenset]:
+        """State after char, or None if char is not allowed"""
+        steps = self._steps.get(state)
+        if steps is None:
+            steps = self._steps[state] = {}
+        if char in steps:
+            return steps[char]
+        targets = {
+            following for node in state for matcher, following in self.edges[node]
+            if (matcher == char if isinstance(matcher, str) else matcher.matches(char))
+        }
+        result = steps[char] = self._closure(targets) if targets else None
+        return result
+
+    def advance(self, state: Optional[frozenset], text: str) -> Optional[frozenset]:
+        for char in text:
+            if state is None:
+                return None
+            state = self.step(state, char)
+        return state
+
+    def is_complete(self, state: Optional[frozenset]) -> bool:
+        return state is not None and self.end in state
+
+    def in_string(self, state: frozenset) -> bool:
+        return any(matcher is STRING_CHAR for node in state for matcher, _ in self.edges[node])
+
+    def _distances(self) -> List[Optional[int]]:
+        """Characters from each NFA node to the end (0-1 BFS backwards: epsilon edges are free)"""
+        incoming: List[List[Tuple[int, int]]] = [[] for _ in self.edges]
+        for node, edges in enumerate(self.edges):
+            for _, following in edges:
+                incoming[following].append((node, 1))
+        for node, targets in enumerate(self.eps):
+            for following in targets:
+                incoming[following].append((node, 0))
+        distance: List[Optional[int]] = [None] * len(self.edges)
+        distance[self.end] = 0
+        queue = deque([self.end])
+        while queue:
+            node = queue.popleft()
+            for previous, cost in incoming[node]:
+                candidate = distance[node] + cost
+                if distance[previous] is None or candidate < distance[previous]:
+                    distance[previous] = candidate
+                    queue.appendleft(previous) if cost == 0 else queue.append(previous)
+        return distance
+
+    def completion(self, state: frozenset) -> str:
+        """Shortest text that completes the object from state"""
+        if state in self._completions:
+            return self._completions[state]
+        text, current = [], state
+        while not self.is_complete(current):
+            best = None
+            for node in current:
+                for matcher, following in self.edges[node]:
+                    if self._distance[following] is not None and (best is None or self._distance[following] < best[0]):
+                        best = (self._distance[following], matcher if isinstance(matcher, str) else matcher.sample)
+            text.append(best[1])
+            current = self.step(current, best[1])
+        self._completions[state] = ''.join(text)
+        return self._completions[state]
+
+
+class TokenVocabulary:
+    """Text of every generatable token, in a trie for walking against the grammar"""
+
+    def __init__(self, tokenizer):
+        special = set(tokenizer.all_special_ids)
+        prefix = tokenizer.encode("a", add_special_tokens=False)
+        prefix_text = tokenizer.decode(prefix)
+        self.texts: Dict[int, str] = {}
+        self.trie: Dict[str, Any] = {}
+        for token_id in range(len(tokenizer)):
+            if token_id in special:
+                continue
+            # Decoding after a known prefix keeps leading spaces that a lone token would lose
+            text = tokenizer.decode(prefix + [token_id])[len(prefix_text):]
+            if not text or '�' in text:
+                continue  # Partial UTF-8 byte tokens
+            self.texts[token_id] = text
+            node = self.trie
+            for char in text:
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).append(token_id)
+
+
+class StructuredDecoding:
+    """Grammar and vocabulary for one tokenizer, with the per-state token masks they produce"""
+
+    def __init__(self, tokenizer, schema=STRUCTURED_SCHEMA):
+        self.grammar = Grammar(schema_pattern(schema))
+        self.vocab = TokenVocabulary(tokenizer)
+        self.eos_token_id = tokenizer.eos_token_id
+        self._allowed: Dict[frozenset, torch.Tensor] = {}
+        self._closing: Dict[Tuple[frozenset, bool], torch.Tensor] = {}
+        self._quote_first = torch.tensor(sorted(t for t, text in self.vocab.texts.items() if text.startswith('"')))
+
+    def allowed(self, state: frozenset) -> torch.Tensor:
+        """Ids of every token the grammar accepts from state"""
+        ids = self._allowed.get(state)
+        if ids is None:
+            found: List[int] = []
+            stack = [(self.vocab.trie, state)]
+            while stack:
+                node, current = stack.pop()
+                for char, child in node.items():
+                    if char is None:
+                        continue
+                    following = self.grammar.step(current, char)
+                    if following is not None:
+                        found.extend(child.get(None, ()))
+                        stack.append((child, following))
+            ids = self._allowed[state] = torch.tensor(sorted(found), dtype=torch.long)
+        return ids
+
+    def closing(self, state: frozenset, close_string: bool) -> torch.Tensor:
+        """Tokens for wrapping up: a prefix of the shortest completion, or a closing quote for an overlong string"""
+        key = (state, close_string)
+        ids = self._closing.get(key)
+        if ids is None:
+            if close_string:
+                allowed = self.allowed(state)
+                ids = allowed[torch.isin(allowed, self._quote_first)]
+            else:
+                completion = self.grammar.completion(state)
+                ids = torch.tensor([t for t, text in self.vocab.texts.items() if completion.startswith(text)],
+                                   dtype=torch.long)
+            if ids.numel() == 0:
+                ids = self.allowed(state)  # Tokenizer without a fitting token: stay within the grammar
+            self._closing[key] = ids
+        return ids
+
+    def logits_processor(self, max_new_tokens: int) -> "GrammarLogitsProcessor":
+        return GrammarLogitsProcessor(self, max_new_tokens)
+
+
+class GrammarLogitsProcessor(LogitsProcessor):
+    """Per-row grammar state for one generate call; masks every token that would break the JSON"""
+
+    def __init__(self, decoding: StructuredDecoding, max_new_tokens: int):
+        if max_new_tokens <= decoding.grammar.max_completion:
+            raise Exception(f"max_new_tokens must be above {decoding.grammar.max_completion} for JSON output")
+        self.decoding = decoding
+        self.max_new_tokens = max_new_tokens
+        self.prompt_length = None
+        self.seen = 0
+        self.states: List[Optional[frozenset]] = []
+        self.string_chars: List[int] = []
+
+    def update(self, input_ids: torch.LongTensor):
+        """Advance every row by the tokens generated since the last call"""
+        grammar = self.decoding.grammar
+        if self.prompt_length is None:
+            self.prompt_length = self.seen = input_ids.shape[1]
+            self.states = [grammar.start] * input_ids.shape[0]
+            self.string_chars = [0] * input_ids.shape[0]
+            return
+        for row in range(input_ids.shape[0]):
+            for token_id in input_ids[row, self.seen:].tolist():
+                state = self.states[row]
+                if state is None or grammar.is_complete(state):
+                    break  # Finished rows are padded from here on
+                text = self.decoding.vocab.texts.get(token_id)
+                self.states[row] = grammar.advance(state, text) if text is not None else None
+                if text is not None:
+                    self.string_chars[row] = (len(text) - text.rindex('"') - 1 if '"' in text
+                                              else self.string_chars[row] + len(text))
+        self.seen = input_ids.shape[1]
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        self.update(input_ids)
+        grammar = self.decoding.grammar
+        remaining = self.max_new_tokens - (self.seen - self.prompt_length)
+        mask = torch.full_like(scores, float('-inf'))
+        for row, state in enumerate(self.states):
+            if state is None or grammar.is_complete(state):
+                mask[row, self.decoding.eos_token_id] = 0
+                continue
+            if remaining <= grammar.max_completion + 1:
+                allowed = self.decoding.closing(state, False)
+            elif self.string_chars[row] >= MAX_STRING_CHARS and grammar.in_string(state):
+                allowed = self.decoding.closing(state, True)
+            else:
+                allowed = self.decoding.allowed(state)
+            mask[row, allowed.to(scores.device)] = 0
+        return scores + mask
+
+
+class GrammarStoppingCriteria(StoppingCriteria):
+    """Ends each row as soon as its JSON object closes"""
+
+    def __init__(self, processor: GrammarLogitsProcessor):
+        self.processor = processor
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        self.processor.update(input_ids)
+        grammar = self.processor.decoding.grammar
+        return torch.tensor([grammar.is_complete(state) for state in self.processor.states],
+                            dtype=torch.bool, device=input_ids.device)
+
+
+def parse_structured(response: str) -> Optional[Dict[str, Any]]:
+    """The generated object; numbers stay strings exactly as written (2.490, not 2.49)"""
+    try:
+        return json.loads(response, parse_float=str, parse_int=str)
+    except ValueError:
+        return None
+
+
+def structured_dimensions(structured: Dict[str, Any], page: int = 0) -> List[Dict[str, Any]]:
+    """Dimensions of a parsed object, in the extract_dimensions_regex() format"""
+    dimensions = []
+    for dim in structured.get('dimensions', []):
+        if dim['kind'] in KIND_TYPES:
+            dim_type = KIND_TYPES[dim['kind']]
+        elif dim['inspection']:
+            dim_type = 'inspection_feature'
+        elif dim['tolerance'] is not None:
+            dim_type = 'tolerance_dim'
+        else:
+            dim_type = 'decimal_dim'
+        full_match = f"{dim['value']} ±{dim['tolerance']}" if dim['tolerance'] is not None else dim['value']
+        dimensions.append({
+            'type': dim_type,
+            'value': dim['value'],
+            'tolerance': dim['tolerance'],
+            'full_match': full_match,
+            'feature': dim['feature'],
+            'kind': dim['kind'],
+            'inspection': dim['inspection'],
+            'confidence': calculate_confidence(dim_type, full_match),
+            'source': 'llava_json',
+            'page': page
+        })
+    return dimensions
+
+
+def structured_metadata(structured: Dict[str, Any]) -> Dict[str, str]:
+    return {field: structured[field] for field in METADATA_FIELDS if structured.get(field)}
@@ -0,0 +1,74 @@
+# structured_output_test.py - Schema-constrained JSON output, using a tiny random model
+import json
+import os
+import tempfile
+
+from PIL import Image
+
+from tiny_model import build_tiny_model
+from main import ColumbusDrawingAnalyzer
+from structured_output import STRUCTURED_SCHEMA, Grammar, schema_pattern, structured_dimensions
+
+
+def test_grammar():
+    grammar = Grammar(schema_pattern(STRUCTURED_SCHEMA))
+    document = ('{"part_number": "PIS2.500-0120", "revision": "B", "material": null, "weight": null,'
+                ' "components": ["piston"], "dimensions": [{"feature": "bore", "kind": "diameter", '
+                '"value": 2.490, "tolerance": 0.002, "inspection": true}]}')
+    state = grammar.advance(grammar.start, document)
+    assert grammar.is_complete(state)
+    assert not grammar.is_complete(grammar.advance(grammar.start, document[:-1]))
+
+    # Keys are fixed, values are typed
+    assert grammar.advance(grammar.start, '{"revision"') is None
+    assert grammar.advance(grammar.start, '{"part_number": 12') is None
+    assert grammar.advance(grammar.start, document.replace('"diameter"', '"hexagon"')) is None
+
+    # The shortest completion from anywhere closes a valid object
+    for cut in (0, 20, 90, 160, len(document) - 1):
+        state = grammar.advance(grammar.start, document[:cut])
+        completed = document[:cut] + grammar.completion(state)
+        assert grammar.is_complete(grammar.advance(grammar.start, completed))
+        assert len(grammar.completion(state)) <= grammar.max_completion
+        json.loads(completed)
+
+    dims = structured_dimensions(json.loads(document, parse_float=str), page=0)
+    assert dims[0]['type'] == 'diameter_symbol' and dims[0]['full_match'] == "2.490 ±0.002"
+    print("✅ Grammar accepts the schema, rejects everything else and completes from any prefix")
+
+
+def test_structured_generation():
+    with tempfile.TemporaryDirectory() as tmp:
+        model_dir = build_tiny_model(os.path.join(tmp, "model"))
+        path = os.path.join(tmp, "drawing.png")
+        Image.new("RGB", (400, 300), "white").save(path)
+
+        prose = ColumbusDrawingAnalyzer(model_name=model_dir, max_new_tokens=400, text_layer="off")
+        structured = ColumbusDrawingAnalyzer(model_name=model_dir, max_new_tokens=400, text_layer="off", output="json")
+
+        # A random model never stops on its own; the JSON object closes well before the budget
+        assert prose.analyze_columbus_drawing(path)['output_tokens'] == 400
+        result = structured.analyze_columbus_drawing(path)
+        assert result['structured'] is not None and list(result['structured']) == list(STRUCTURED_SCHEMA)
+        assert json.loads(result['llava_response']) is not None
+        assert result['output_tokens'] < 400
+        print(f"✅ JSON output: {result['output_tokens']} tokens instead of 400")
+
+        # Batched rows stop independently and match single-drawing output
+        batch = structured.analyze_batch([path, path])
+        assert [r['llava_response'] for r in batch] == [result['llava_response']] * 2
+
+        # A tight budget still ends in a complete object
+        tight = ColumbusDrawingAnalyzer(model_name=model_dir, max_new_tokens=100, text_layer="off", output="json")
+        result = tight.analyze_columbus_drawing(path)
+        assert result['structured'] is not None and result['output_tokens'] <= 100
+
+        analysis = structured.comprehensive_analysis(path)['analysis_results']
+        assert analysis['performance_metrics']['output_tokens'] < 400
+        assert all(d['source'] == 'llava_json' for d in analysis['extracted_dimensions'])
+        print("✅ Batched and budget-limited JSON output passed")
+
+
+if __name__ == "__main__":
+    test_grammar()
+    test_structured_generation()
@@ -0,0 +1,168 @@
+# text_layer.py - Positioned text extraction for CAD-exported PDF drawings
+"""
+Reads the text layer of digitally authored drawings with PyMuPDF, so
+dimensions and title block fields come straight from the PDF instead of
+from a vision model reading pixels.
+
+- Spans are reassembled into rows by position and reading direction
+  (a callout like "* Ø0.878 ±0.002" is exported as four separate spans,
+  vertical dimensions run bottom to top)
+- GD&T symbol fonts (AIGDT) are mapped back to the symbols they draw
+- Title block values are read from the cell under each label
+
+    python text_layer.py images/PIS2.375-0001REV0.pdf
+"""
+import re
+import sys
+from typing import Dict, List, Set, Tuple
+
+# Glyphs of the AutoCAD GD&T font as they appear in exported PDFs; the
+# code points differ between exports, so both observed encodings are listed
+GDT_SYMBOLS = {'`': '±', 'B': '±', 'n': 'Ø', 'P': 'Ø', 'x': '↧', 'Z': '↧'}
+
+# Below this many characters a page is treated as scanned / raster only
+MIN_TEXT_CHARS = 20
+
+# Title block labels end in a colon, which keeps revision history headers (REV, DATE, ...) out
+TITLE_BLOCK_LABELS = {
+    'part_number': r'^(DRAWING|PART)\s*(NO\.?|NUMBER):$',
+    'description': r'^DESCRIPTION:$',
+    'material': r'^MATERIAL:$',
+    'weight': r'^WEIGHT:$',
+    'revision': r'^(CURRENT\s+)?REV(ISION)?\.?:$',
+    'date': r'^DATE:$',
+    'drawn_by': r'^(DWN|DRAWN)\s+BY:$',
+    'checked_by': r'^(CKD|CHECKED)\s+BY:$',
+}
+
+REVISION_PATTERN = re.compile(r'^([A-Z]{1,2}|\d{1,2})$')
+DATE_PATTERN = re.compile(r'\d{1,2}/\d{1,2}/\d{2,4}')
+
+
+def _span_text(span: Dict) -> str:
+    if 'GDT' in span['font'].upper():
+        return ''.join(GDT_SYMBOLS.get(char, char) for char in span['text'])
+    return span['text']
+
+
+def _project(bbox: Tuple[float, float, float, float], direction: Tuple[int, int]) -> Tuple[float, float, float]:
+    """(start, end) along the reading direction and the centre across it"""
+    dx, dy = direction
+    corners = [(bbox[0], bbox[1]), (bbox[2], bbox[1]), (bbox[0], bbox[3]), (bbox[2], bbox[3])]
+    along = [x * dx + y * dy for x, y in corners]
+    across = [y * dx - x * dy for x, y in corners]
+    return min(along), max(along), sum(across) / 4
+
+
+def extract_rows(pdf_path: str) -> List[List[Dict]]:
+    """
+    Text rows per page, in reading order. Each row is
+    {'text', 'bbox', 'size', 'dir'}; bbox is in PDF points.
+    """
+    try:
+        import fitz  # PyMuPDF
+    except ImportError:
+        raise Exception("PyMuPDF not installed. Install with: pip install PyMuPDF")
+
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for page in doc:
+            lines = []
+            for block in page.get_text('dict')['blocks']:
+                for line in block.get('lines', []):
+                    text = ''.join(_span_text(span) for span in line['spans'])
+                    if not text.strip():
+                        continue
+                    direction = (round(line['dir'][0]), round(line['dir'][1]))
+                    start, end, across = _project(line['bbox'], direction)
+                    lines.append({
+                        'text': text, 'bbox': list(line['bbox']), 'dir': direction,
+                        'size': max(span['size'] for span in line['spans']),
+                        'start': start, 'end': end, 'across': across
+                    })
+
+            # Glue pieces that sit on the same baseline with (almost) no gap between them
+            rows: List[Dict] = []
+            for line in sorted(lines, key=lambda l: l['start']):
+                size = line['size']
+                for row in rows:
+                    if (row['dir'] == line['dir'] and abs(row['across'] - line['across']) <= size / 2
+                            and -size / 2 <= line['start'] - row['end'] <= 0.6 * size):
+                        joiner = ' ' if line['start'] - row['end'] > 0.15 * size else ''
+                        row['text'] += joiner + line['text']
+                        row['end'] = max(row['end'], line['end'])
+                        row['bbox'] = [min(row['bbox'][0], line['bbox'][0]), min(row['bbox'][1], line['bbox'][1]),
+                                       max(row['bbox'][2], line['bbox'][2]), max(row['bbox'][3], line['bbox'][3])]
+                        row['size'] = max(row['size'], size)
+                        break
+                else:
+                    rows.append(dict(line))
+
+            rows.sort(key=lambda r: (r['dir'] != (1, 0), r['dir'], round(r['across']), r['start']))
+            pages.append([
+                {'text': ' '.join(row['text'].split()), 'bbox': [round(v, 1) for v in row['bbox']],
+                 'size': round(row['size'], 1), 'dir': row['dir']}
+                for row in rows
+            ])
+    return pages
+
+
+def has_usable_text(rows: List[Dict]) -> bool:
+    return sum(len(row['text'].replace(' ', '')) for row in rows) >= MIN_TEXT_CHARS
+
+
+def resolve_title_block(rows: List[Dict]) -> Tuple[Dict[str, str], Set[int]]:
+    """
+    Title block fields read from the cell below each label.
+    Returns (fields, indices of the label and value rows used).
+    """
+    fields: Dict[str, str] = {}
+    used: Set[int] = set()
+    labels = {}
+    for index, row in enumerate(rows):
+        for field, pattern in TITLE_BLOCK_LABELS.items():
+            if field not in labels and row['dir'] == (1, 0) and re.match(pattern, row['text'], re.IGNORECASE):
+                labels[field] = index
+
+    label_rows = set(labels.values())
+    used.update(label_rows)
+    for field, label_index in labels.items():
+        label = rows[label_index]
+        x0, y0, x1, y1 = label['bbox']
+        size = label['size']
+        # Value rows start below the label's centre line, within a few label heights
+        below = [
+            (index, row) for index, row in enumerate(rows)
+            if index not in label_rows and row['dir'] == (1, 0)
+            and (row['bbox'][1] + row['bbox'][3]) / 2 > (y0 + y1) / 2 and row['bbox'][1] <= y1 + 3 * size
+        ]
+
+        if field == 'revision':
+            # The revision cell holds the revision date and, once revised, the revision letter
+            cell = [(index, row) for index, row in below if x0 - size <= row['bbox'][0] <= x1 + 2 * size]
+            tokens = [token for _, row in cell for token in row['text'].split()]
+            letters = [token for token in tokens if REVISION_PATTERN.match(token)]
+            if letters:
+                fields[field] = letters[-1]
+            elif any(DATE_PATTERN.fullmatch(token) for token in tokens):
+                fields[field] = '0'  # Dated but unlettered: the initial release
+            used.update(index for index, _ in cell)
+            continue
+
+        aligned = [(index, row) for index, row in below if abs(row['bbox'][0] - x0) <= 2 * size]
+        if aligned:
+            index, row = min(aligned, key=lambda item: item[1]['bbox'][1])
+            fields[field] = row['text']
+            used.add(index)
+    return fields, used
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        for number, page_rows in enumerate(extract_rows(path)):
+            fields, _ = resolve_title_block(page_rows)
+            print(f"📄 {path} page {number}: {len(page_rows)} rows")
+            for key, value in fields.items():
+                print(f"  {key}: {value}")
+            for row in page_rows:
+                print(f"  {row['bbox']} {row['text']}")
@@ -0,0 +1,71 @@
+# text_layer_test.py - Text layer fast path and model fallback, using a tiny random model
+import os
+import tempfile
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from tiny_model import build_tiny_model
+from main import ColumbusDrawingAnalyzer
+
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "images")
+
+
+def test_text_layer():
+    with tempfile.TemporaryDirectory() as tmp:
+        analyzer = ColumbusDrawingAnalyzer(
+            model_name=build_tiny_model(os.path.join(tmp, "model")), max_new_tokens=16, lazy_load=True
+        )
+
+        # CAD export: everything comes from the text layer and the model is never loaded
+        analysis = analyzer.comprehensive_analysis(os.path.join(IMAGES_DIR, "PIS2.500-0120REVB.pdf"))
+        results = analysis['analysis_results']
+        assert results['performance_metrics']['analysis_path'] == "text_layer"
+        assert analyzer.model is None
+        assert results['drawing_metadata']['part_number'] == "PIS2.500-0120"
+        assert results['drawing_metadata']['revision'] == "B"
+        assert results['drawing_metadata']['material'] == "ALUMINUM 2011-T3"
+        assert results['field_sources']['part_number'] == "title_block"
+        assert not results['unresolved_fields']
+        callouts = {d['full_match'] for d in results['extracted_dimensions'] if d['type'] == "tolerance_dim"}
+        assert "0.753 ±0.002" in callouts and "2.490 ±0.002" in callouts
+        assert all(d['source'] == "text_layer" and len(d['bbox']) == 4 for d in results['extracted_dimensions'])
+        print(f"✅ Text layer: {len(results['extracted_dimensions'])} dimensions in "
+              f"{results['performance_metrics']['text_layer_seconds'] * 1000:.0f}ms")
+
+        # Dimensions in the text layer but no title block: the model is asked for the missing fields
+        doc = fitz.open()
+        page = doc.new_page(width=792, height=612)
+        page.insert_text((100, 100), "Ø2.490 ±0.002")
+        page.insert_text((100, 140), "0.125 X 45° Chamfer")
+        doc.save(os.path.join(tmp, "no_title.pdf"))
+        doc.close()
+        analysis = analyzer.comprehensive_analysis(os.path.join(tmp, "no_title.pdf"))
+        results = analysis['analysis_results']
+        assert results['performance_metrics']['analysis_path'] == "text_layer+llava"
+        assert {d['source'] for d in results['extracted_dimensions']} == {"text_layer"}
+        assert set(results['unresolved_fields']) | set(results['drawing_metadata']) >= {"part_number", "material"}
+        assert all(results['field_sources'][key] == "llava" for key in results['drawing_metadata'])
+
+        # Scanned drawing: no text layer at all, so the whole drawing goes to the model
+        Image.new("RGB", (400, 300), "white").save(os.path.join(tmp, "scan.png"))
+        doc = fitz.open()
+        doc.new_page(width=792, height=612).insert_image(fitz.Rect(0, 0, 792, 612), filename=os.path.join(tmp, "scan.png"))
+        doc.save(os.path.join(tmp, "scan.pdf"))
+        doc.close()
+        analysis = analyzer.comprehensive_analysis(os.path.join(tmp, "scan.pdf"))
+        assert analysis['analysis_results']['performance_metrics']['analysis_path'] == "llava"
+        print("✅ Model fallback for unresolved fields and raster-only pages passed")
+
+        # The same routing through the batched path
+        batch = analyzer.comprehensive_analysis_batch([
+            os.path.join(IMAGES_DIR, "PIS2.375-0001REV0.pdf"), os.path.join(tmp, "no_title.pdf"), os.path.join(tmp, "scan.pdf")
+        ])
+        assert [a['analysis_results']['performance_metrics']['analysis_path'] for a in batch] == \
+            ["text_layer", "text_layer+llava", "llava"]
+        assert batch[0]['analysis_results']['drawing_metadata']['revision'] == "0"
+        print("✅ Batched text layer routing passed")
+
+
+if __name__ == "__main__":
+    test_text_layer()
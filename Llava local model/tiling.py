@@ -0,0 +1,136 @@
+# tiling.py - Overlapping tiles and a low-resolution overview of large drawings
+"""
+LLaVA-NeXT fits every image into one of its grid resolutions (at most
+672x672 for the Mistral checkpoint), so a large-format sheet rendered at
+144 DPI loses most of its pixels and small tolerance callouts become
+unreadable. Tiling analyzes the sheet as overlapping tiles that each go
+through the model at (close to) full resolution, plus one downscaled
+overview for the title block and layout.
+
+- plan_tiles() spreads a grid of tiles evenly over the page, with at
+  least the requested overlap, so a callout cut by one tile's edge is
+  whole in its neighbour
+- Blank tiles (no ink at all) are skipped
+- merge_dimensions() de-duplicates what overlapping tiles both saw: the
+  model gives no coordinates, so a dimension's position is the tile it was
+  read from, and two readings with the same type, value and tolerance from
+  overlapping tiles are one dimension. Its region narrows to the overlap.
+
+    tiles = split_drawing(image, tile_size=672, overlap=0.15)
+    merged = merge_dimensions([(tile['region'], dims) for tile, dims in zip(tiles, per_tile_dims)])
+"""
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+Box = Tuple[int, int, int, int]  # left, top, right, bottom in page pixels
+
+DEFAULT_TILE_SIZE = 672  # The largest LLaVA-NeXT (Mistral) grid resolution: tiles are seen at full size
+DEFAULT_OVERLAP = 0.15
+OVERVIEW_EDGE = 672
+# Tiles whose darkest pixel is lighter than this carry no linework or text
+BLANK_THRESHOLD = 200
+
+
+def _spans(length: int, tile: int, overlap: int) -> List[Tuple[int, int]]:
+    """Evenly spaced [start, end) spans of size tile covering length, overlapping by at least overlap"""
+    if length <= tile:
+        return [(0, length)]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    step = (length - tile) / (count - 1)
+    return [(round(index * step), round(index * step) + tile) for index in range(count)]
+
+
+def plan_tiles(width: int, height: int, tile_size: int = DEFAULT_TILE_SIZE, overlap: float = DEFAULT_OVERLAP) -> List[Box]:
+    """Tile boxes covering a width x height page, row by row"""
+    overlap_px = min(tile_size - 1, round(tile_size * overlap))
+    return [
+        (left, top, right, bottom)
+        for top, bottom in _spans(height, tile_size, overlap_px)
+        for left, right in _spans(width, tile_size, overlap_px)
+    ]
+
+
+def needs_tiling(image: Image.Image, tile_size: int) -> bool:
+    """Whether a drawing is larger than one tile along either axis"""
+    return max(image.size) > tile_size
+
+
+def is_blank(image: Image.Image) -> bool:
+    """No ink anywhere: nothing for the model to read"""
+    darkest, _ = image.convert('L').getextrema()
+    return darkest >= BLANK_THRESHOLD
+
+
+def overview(image: Image.Image, edge: int = OVERVIEW_EDGE) -> Image.Image:
+    """The whole drawing scaled to fit edge x edge"""
+    scaled = image.copy()
+    scaled.thumbnail((edge, edge), Image.LANCZOS)
+    return scaled
+
+
+def split_drawing(image: Image.Image, tile_size: int = DEFAULT_TILE_SIZE, overlap: float = DEFAULT_OVERLAP,
+                  overview_edge: int = OVERVIEW_EDGE) -> List[Dict[str, Any]]:
+    """
+    Every non-blank tile, then the overview, as {'kind', 'image', 'region'}.
+    The overview's region is the whole page.
+    """
+    parts = []
+    for box in plan_tiles(image.width, image.height, tile_size, overlap):
+        tile = image.crop(box)
+        if not is_blank(tile):
+            parts.append({'kind': 'tile', 'image': tile, 'region': box})
+    parts.append({'kind': 'overview', 'image': overview(image, overview_edge), 'region': (0, 0) + image.size})
+    return parts
+
+
+def _number(value: Optional[str]) -> Optional[str]:
+    """2.490, 2.49 and 2.4900 compare equal; anything else (1/4, UNF) as written"""
+    if value is None:
+        return None
+    try:
+        return f"{float(value):g}"
+    except ValueError:
+        return value.strip().lower()
+
+
+def dimension_key(dim: Dict[str, Any]) -> Tuple[str, Optional[str], Optional[str]]:
+    if dim.get('value') is None:
+        return dim['type'], dim['full_match'].strip().lower(), None
+    return dim['type'], _number(dim['value']), _number(dim.get('tolerance'))
+
+
+def _intersection(a: Box, b: Box) -> Optional[Box]:
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    return box if box[0] < box[2] and box[1] < box[3] else None
+
+
+def merge_dimensions(parts: Sequence[Tuple[Box, List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+    """
+    One list of dimensions from per-part lists, each with the region it was read from.
+    A reading is the same dimension as an earlier one when the key matches, the
+    regions overlap and it came from another part (repeats within one part are
+    separate callouts). The most confident reading is kept, with 'region' narrowed
+    to where all its readings overlap and 'tiles' listing the parts that saw it.
+    With the overview last (as split_drawing() orders it), positions come from the tiles.
+    """
+    merged: List[Dict[str, Any]] = []
+    by_key: Dict[Tuple, List[Dict[str, Any]]] = {}
+    for index, (region, dims) in enumerate(parts):
+        for dim in dims:
+            candidates = by_key.setdefault(dimension_key(dim), [])
+            match = next((
+                entry for entry in candidates
+                if index not in entry['tiles'] and _intersection(entry['region'], region) is not None
+            ), None)
+            if match is None:
+                entry = {'dim': dim, 'region': tuple(region), 'tiles': [index]}
+                candidates.append(entry)
+                merged.append(entry)
+                continue
+            match['tiles'].append(index)
+            match['region'] = _intersection(match['region'], region)
+            if dim['confidence'] > match['dim']['confidence']:
+                match['dim'] = dim
+    return [dict(entry['dim'], region=list(entry['region']), tiles=entry['tiles']) for entry in merged]
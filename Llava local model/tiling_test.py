@@ -0,0 +1,99 @@
+# tiling_test.py - Tile planning, de-duplication across overlapping tiles and tiled analysis with a tiny random model
+import os
+import tempfile
+
+from PIL import Image, ImageDraw
+
+from tiny_model import build_tiny_model
+from main import ColumbusDrawingAnalyzer
+from tiling import merge_dimensions, plan_tiles, split_drawing
+
+
+def _dim(value: str, tolerance: str = None, confidence: float = 0.9) -> dict:
+    full_match = f"{value} ±{tolerance}" if tolerance else value
+    return {'type': 'tolerance_dim' if tolerance else 'decimal_dim', 'value': value, 'tolerance': tolerance,
+            'full_match': full_match, 'confidence': confidence}
+
+
+def test_plan_tiles():
+    boxes = plan_tiles(2000, 1000, tile_size=672, overlap=0.15)
+    assert len(boxes) == 4 * 2
+    assert all(right - left == 672 and bottom - top == 672 for left, top, right, bottom in boxes)
+    assert boxes[0][:2] == (0, 0) and boxes[-1][2:] == (2000, 1000)
+    # Neighbours share at least the requested overlap
+    assert all(boxes[i][2] - boxes[i + 1][0] >= 100 for i in range(3))
+    assert plan_tiles(600, 400, tile_size=672) == [(0, 0, 600, 400)]
+
+    # Blank tiles are skipped; the overview comes last and covers the page
+    page = Image.new('RGB', (2000, 1000), 'white')
+    ImageDraw.Draw(page).line((50, 50, 400, 50), fill='black', width=3)
+    parts = split_drawing(page, tile_size=672)
+    assert [part['kind'] for part in parts] == ['tile', 'overview']
+    assert parts[-1]['region'] == (0, 0, 2000, 1000) and max(parts[-1]['image'].size) == 672
+    print("✅ Tiles cover the page with overlap, blank tiles skipped")
+
+
+def test_merge_dimensions():
+    left, right, far = (0, 0, 672, 672), (572, 0, 1244, 672), (2000, 0, 2672, 672)
+    overview = (0, 0, 2672, 672)
+    merged = merge_dimensions([
+        (left, [_dim('2.490', '0.002', 0.9), _dim('1.000'), _dim('1.000')]),
+        (right, [_dim('2.49', '0.002', 0.95), _dim('1.000')]),
+        (far, [_dim('2.490', '0.002')]),
+        (overview, [_dim('2.490', '0.002', 0.5), _dim('0.750')])
+    ])
+    toleranced = [d for d in merged if d['type'] == 'tolerance_dim']
+    # Same callout in the overlap of left and right (written differently), plus a separate one far away
+    assert len(toleranced) == 2
+    assert toleranced[0]['tiles'] == [0, 1, 3] and toleranced[0]['region'] == [572, 0, 672, 672]
+    assert toleranced[0]['confidence'] == 0.95 and toleranced[1]['tiles'] == [2]
+    # Two callouts within one tile stay two; one of them was also seen by the neighbour
+    assert [d['tiles'] for d in merged if d['value'] == '1.000'] == [[0, 1], [0]]
+    # Only the overview saw it: kept, positioned on the whole page
+    assert [d['region'] for d in merged if d['value'] == '0.750'] == [list(overview)]
+    print("✅ Overlapping readings merged by value and position")
+
+
+def test_tiled_analysis():
+    with tempfile.TemporaryDirectory() as tmp:
+        model_dir = build_tiny_model(os.path.join(tmp, "model"))
+        path = os.path.join(tmp, "sheet.png")
+        page = Image.new('RGB', (1400, 900), 'white')
+        draw = ImageDraw.Draw(page)
+        draw.rectangle((40, 40, 1360, 860), outline='black', width=4)
+        draw.text((700, 450), "Ø2.490 ±0.002", fill='black')
+        page.save(path)
+        small = os.path.join(tmp, "small.png")
+        page.resize((600, 386)).save(small)
+
+        batched = ColumbusDrawingAnalyzer(model_name=model_dir, max_new_tokens=16, profile="cpu-fp32", text_layer="off",
+                                          tile_size=672, tile_batch=3)
+        result = batched.analyze_columbus_drawing(path)
+        assert len(result['tiles']) == 3 * 2 + 1 and result['tiles'][-1]['kind'] == 'overview'
+        assert result['llava_response'].startswith('[Overview]')
+        assert result['output_tokens'] == sum(tile['output_tokens'] for tile in result['tiles'])
+        analysis = batched.comprehensive_analysis(path)['analysis_results']
+        assert len(analysis['tiles']) == 7
+        assert all('region' in dim and 'tiles' in dim for dim in analysis['extracted_dimensions'])
+        assert 'tile_size' in batched.analysis_settings()
+
+        # Drawings within one tile take the usual path
+        assert 'tiles' not in batched.analyze_columbus_drawing(small)
+        assert [('tiles' in r) for r in batched.analyze_batch([path, small])] == [True, False]
+
+        # Worker processes give the same answers as in-process batches
+        workers = ColumbusDrawingAnalyzer(model_name=model_dir, max_new_tokens=16, profile="cpu-fp32", text_layer="off",
+                                          tile_size=672, tile_workers=2, lazy_load=True)
+        try:
+            parallel = workers.analyze_columbus_drawing(path)
+            assert workers.model is None  # Only the workers loaded the model
+        finally:
+            workers.close()
+        assert parallel['llava_response'] == result['llava_response']
+        print(f"✅ Tiled analysis: {len(result['tiles'])} parts, in-process batches and worker processes agree")
+
+
+if __name__ == "__main__":
+    test_plan_tiles()
+    test_merge_dimensions()
+    test_tiled_analysis()
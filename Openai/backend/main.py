@@ -1,15 +1,31 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import ValidationError
 import os
+import sys
+import json
+import asyncio
+import logging
+import mimetypes
 import shutil
 from datetime import datetime
 import uuid
 
-from models import ChatRequest, ChatResponse, UploadResponse
+from models import ChatRequest, ChatResponse, UploadResponse, JobProgress, KnownFile, BlobCheckRequest, BlobCheckResponse
 from services.gpt_service import GPTService
+from services.rate_limiter import UpstreamError
 from services.storage_service import StorageService
+from services.image_payload import ImagePayload
+from services.job_service import JobService
+from services.worker_pool import WorkerPool
+from services.metrics import METRICS, MetricsMiddleware, span
+
+# Service logs (catalog rebuilds, upload sweeps, job worker errors); uvicorn configures its own loggers
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+# httpx logs every upstream request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 app = FastAPI(title="GPT-5 Wrapper API", version="1.0.0")
 
@@ -26,73 +42,322 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
-# Initialize services
-gpt_service = GPTService()
+# Initialize services; with WORKERS > 1 every server process has its own set, sharing state on disk
+worker_pool = WorkerPool(preload=("services.image_preprocessor", "services.request_planner"))
+gpt_service = GPTService(worker_pool)
 storage_service = StorageService()
+job_service = JobService(gpt_service)
+
+@app.on_event("startup")
+async def startup():
+    await worker_pool.start()
+    await job_service.start()
+    await storage_service.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await storage_service.stop()
+    await job_service.stop()
+    await gpt_service.close()
+    await worker_pool.stop()
 
 @app.get("/api/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "upstream_in_flight": gpt_service.in_flight
+    }
 
 @app.post("/api/upload", response_model=UploadResponse)
 async def upload_files(
-    files: List[UploadFile] = File(...),
-    store_files: bool = Form(False)
+    files: List[UploadFile] = File([]),
+    store_files: bool = Form(False),
+    known_files: Optional[str] = Form(None)
 ):
+    """
+    known_files is a JSON list of {"filename", "content_type", "sha256"} for
+    content the client confirmed via /api/blobs/check; those are linked into
+    the session from the blob store instead of being sent again.
+    """
     try:
         uploaded_files = []
         session_id = str(uuid.uuid4())
 
+        try:
+            known = [KnownFile.model_validate(entry) for entry in json.loads(known_files)] if known_files else []
+        except (ValidationError, ValueError, TypeError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid known_files: {e}")
+        if not files and not known:
+            raise HTTPException(status_code=400, detail="No files provided")
+
         for file in files:
             if not file.content_type.startswith('image/'):
                 raise HTTPException(status_code=400, detail=f"File {file.filename} is not an image")
 
-            # Read file content
-            content = await file.read()
-
-            # Store file if user consents
-            file_path = None
+            # Stream to disk if user consents, otherwise just hash; never hold the whole file
             if store_files:
-                file_path = await storage_service.store_file(file, session_id)
+                stored = await storage_service.store_file(file, session_id)
+            else:
+                stored = await storage_service.hash_file(file)
 
             uploaded_files.append({
                 "filename": file.filename,
                 "content_type": file.content_type,
-                "size": len(content),
+                "size": stored["size"],
                 "stored": store_files,
-                "path": file_path,
-                "content": content  # For immediate processing
+                "path": stored["path"],
+                "content_id": stored["sha256"],
+                "deduplicated": stored.get("deduplicated", False)
+            })
+
+        for entry in known:
+            stored = await storage_service.link_stored_blob(entry.sha256, session_id, entry.filename, entry.content_type)
+            if stored is None:
+                raise HTTPException(status_code=404, detail=f"No stored content with hash {entry.sha256}")
+            uploaded_files.append({
+                "filename": entry.filename,
+                "content_type": entry.content_type,
+                "size": stored["size"],
+                "stored": True,
+                "path": stored["path"],
+                "content_id": entry.sha256,
+                "deduplicated": True
             })
 
         return UploadResponse(
             session_id=session_id,
             files=uploaded_files,
-            stored=store_files
+            stored=store_files or bool(known)
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _parse_chat_request(http_request: Request) -> Tuple[ChatRequest, List[ImagePayload]]:
+    """
+    Accept either a JSON ChatRequest or multipart/form-data carrying the same
+    fields with images as binary `images` parts. In both forms `image_refs`
+    can point at files already stored through /api/upload.
+    """
+    content_type = http_request.headers.get("content-type", "")
+    try:
+        # Reading and validating the JSON body (base64 included), or reading the multipart form
+        with span("parse"):
+            if content_type.startswith("multipart/form-data"):
+                form = await http_request.form()
+                request = ChatRequest(
+                    prompt=form.get("prompt"),
+                    template=form.get("template") or None,
+                    session_id=form.get("session_id") or None,
+                    use_cache=(form.get("use_cache") or "true").lower() == "true",
+                    preprocess=form.get("preprocess") or None,
+                    tiling=form.get("tiling") or None,
+                    image_refs=json.loads(form.get("image_refs") or "[]")
+                )
+                images = []
+                for upload in form.getlist("images"):
+                    if not (upload.content_type or "").startswith("image/"):
+                        raise HTTPException(status_code=400, detail=f"File {upload.filename} is not an image")
+                    # Keep the spooled upload file; it is read only when the payload is encoded
+                    images.append(ImagePayload(upload.filename, upload.content_type, file=upload.file))
+            else:
+                # Validating a large base64 body takes a while; keep it off the event loop
+                request = await asyncio.to_thread(ChatRequest.model_validate_json, await http_request.body())
+                images = [ImagePayload.from_image_data(image) for image in request.images or []]
+    except (ValidationError, ValueError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    for ref in request.image_refs or []:
+        path = await storage_service.find_stored_file(ref.session_id, ref.filename)
+        if path is None:
+            raise HTTPException(status_code=404, detail=f"Stored file {ref.filename} not found in session {ref.session_id}")
+        content_type = mimetypes.guess_type(ref.filename)[0] or "application/octet-stream"
+        images.append(ImagePayload(ref.filename, content_type, path=path))
+
+    return request, images
+
+@app.get("/api/sessions/{session_id}/files")
+async def list_session_files(session_id: str):
+    """Files stored for a session, answered from the upload catalog"""
+    return {"session_id": session_id, "files": await storage_service.get_stored_files(session_id)}
+
+@app.post("/api/blobs/check", response_model=BlobCheckResponse)
+async def check_blobs(request: BlobCheckRequest):
+    """Tell the client which SHA-256 hashes the server already stores, so those uploads can be skipped"""
+    present = [sha256 for sha256 in request.hashes if storage_service.has_blob(sha256)]
+    return BlobCheckResponse(
+        present=present,
+        missing=[sha256 for sha256 in request.hashes if sha256 not in present]
+    )
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat_with_gpt(request: ChatRequest):
+async def chat_with_gpt(http_request: Request):
+    request, images = await _parse_chat_request(http_request)
+
     try:
         # Process the chat request with GPT-5
-        response = await gpt_service.process_chat(
+        result = await gpt_service.process_chat(
             prompt=request.prompt,
-            images=request.images,
-            template=request.template
+            images=images,
+            template=request.template,
+            use_cache=request.use_cache,
+            preprocess=request.preprocess,
+            tiling=request.tiling
         )
 
-        return ChatResponse(
-            response=response,
-            session_id=request.session_id,
-            timestamp=datetime.now().isoformat()
+        with span("serialize"):
+            response = ChatResponse(
+                response=result["response"],
+                session_id=request.session_id,
+                timestamp=datetime.now().isoformat(),
+                cached=result["cached"],
+                preprocessing=result["preprocessing"],
+                plan=result["plan"],
+                usage=result["usage"],
+                tiling=result["tiling"]
+            )
+            return JSONResponse(response.model_dump())
+
+    except UpstreamError as e:
+        # Rate limits that survived retrying become a 503 the client can back off on
+        headers = {"Retry-After": str(int(e.retry_after))} if e.retry_after else None
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return gpt_service.cache.stats()
+
+@app.get("/api/upstream/stats")
+async def upstream_stats():
+    return gpt_service.scheduler.stats()
+
+@app.get("/api/metrics")
+async def metrics():
+    """Request, byte and token counters, per-stage latency histograms and in-flight gauges in Prometheus text format"""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.post("/api/jobs", response_model=JobProgress)
+async def create_job(
+    files: List[UploadFile] = File(...),
+    prompt: str = Form(...),
+    template: Optional[str] = Form(None),
+    use_cache: bool = Form(True),
+    preprocess: Optional[bool] = Form(None),
+    tiling: Optional[bool] = Form(None)
+):
+    """Queue a batch analysis of many drawings; returns immediately with the job id"""
+    for file in files:
+        if not file.content_type.startswith('image/'):
+            raise HTTPException(status_code=400, detail=f"File {file.filename} is not an image")
+
+    try:
+        job_id = job_service.new_job_id()
+        inputs = []
+        for index, file in enumerate(files):
+            filename = os.path.basename(file.filename)
+            destination = os.path.join(job_service.job_dir(job_id), "inputs", f"{index}_{filename}")
+            saved = await storage_service.save_upload(file, destination)
+            inputs.append({
+                "filename": filename,
+                "content_type": file.content_type,
+                "path": saved["path"],
+                "size": saved["size"],
+                "sha256": saved["sha256"]
+            })
+
+        job = await job_service.create_job(
+            job_id, inputs,
+            prompt=prompt,
+            template=template,
+            use_cache=use_cache,
+            preprocess=preprocess,
+            tiling=tiling
         )
+        return job_service.progress(job)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/jobs/{job_id}", response_model=JobProgress)
+async def get_job(job_id: str):
+    job = job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job_service.progress(job)
+
+@app.get("/api/jobs/{job_id}/results")
+async def get_job_results(job_id: str):
+    job = job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JSONResponse(
+        content={"job": job_service.progress(job), "results": await job_service.get_results(job)},
+        headers={"Content-Disposition": f'attachment; filename="job_{job_id}_results.json"'}
+    )
+
+@app.delete("/api/jobs/{job_id}", response_model=JobProgress)
+async def cancel_job(job_id: str):
+    job = job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    await job_service.cancel_job(job)
+    return job_service.progress(job)
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_with_gpt_stream(http_request: Request):
+    """Stream the analysis as server-sent events: `delta` events, then `done` (or `error`)"""
+    request, images = await _parse_chat_request(http_request)
+
+    async def event_stream():
+        try:
+            async for event in gpt_service.stream_chat(
+                prompt=request.prompt,
+                images=images,
+                template=request.template,
+                use_cache=request.use_cache,
+                preprocess=request.preprocess,
+                tiling=request.tiling
+            ):
+                if event["type"] == "delta":
+                    yield _sse_event("delta", {"content": event["content"]})
+                else:
+                    yield _sse_event("done", {
+                        "session_id": request.session_id,
+                        "timestamp": datetime.now().isoformat(),
+                        "usage": event["usage"],
+                        "plan": event["plan"],
+                        "timing": event["timing"],
+                        "cached": event["cached"],
+                        "preprocessing": event["preprocessing"],
+                        "tiling": event["tiling"]
+                    })
+        except Exception as e:
+            # Headers are already sent, so report failures in-band
+            yield _sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Hand over to the uvicorn CLI, which pre-forks WORKERS server processes. Started from
+    # here instead, every spawned process (CPU pool included) would re-run this file first.
+    os.execv(sys.executable, [
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--host", os.getenv("HOST", "0.0.0.0"),
+        "--port", os.getenv("PORT", "8000"),
+        "--workers", os.getenv("WORKERS", "1")
+    ])
\ No newline at end of file
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# How often a DiskCache re-reads its directory to account for entries written by other server processes
+DISK_RESCAN_SECONDS = 60
+# Result of an in-flight computation whose request was cancelled: its followers have to compute again
+_ABANDONED = object()
+
+
+class MemoryCache:
+    """Bounded in-memory LRU cache"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCache:
+    """
+    On-disk JSON cache with a TTL and a total-size cap.
+    Entries older than ttl_seconds are ignored and removed; when the
+    directory grows past max_bytes the least recently written entries go first.
+    Several server processes can share one directory: each keeps its own
+    index, picks up entries the others wrote on a miss, and re-reads the
+    directory periodically so the size cap counts everyone's entries.
+    Calls arrive from worker threads (asyncio.to_thread); the index and
+    byte count are only touched under _lock.
+    """
+
+    def __init__(self, directory: str, ttl_seconds: float = 86400, max_bytes: int = 100 * 1024 * 1024):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+        # key -> (size, mtime), read from disk at startup and on every rescan
+        self._index: Dict[str, Tuple[int, float]] = {}
+        self.total_bytes = 0
+        self._scanned = 0.0
+        self._lock = threading.Lock()
+        self._scan()
+
+    def _scan(self):
+        # Called from __init__ and _evict (under _lock)
+        index = {}
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".json"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, filename))
+                except OSError:
+                    continue  # Removed by another process in the meantime
+                index[filename[:-5]] = (stat.st_size, stat.st_mtime)
+        self._index = index
+        self.total_bytes = sum(size for size, _ in index.values())
+        self._scanned = time.time()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._index.get(key) or self._adopt(key)
+            if entry is not None and time.time() - entry[1] > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+        if entry is None:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self._remove(key)
+            return None
+
+    def set(self, key: str, value: Any):
+        data = json.dumps(value).encode("utf-8")
+        # Write then rename so readers never see a partial entry; unique so concurrent writers never share it
+        tmp_path = f"{self._path(key)}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            if key in self._index:
+                self.total_bytes -= self._index[key][0]
+            self._index[key] = (len(data), time.time())
+            self.total_bytes += len(data)
+            self._evict()
+
+    def _adopt(self, key: str) -> Optional[Tuple[int, float]]:
+        """Index an entry another server process wrote; the caller holds _lock"""
+        try:
+            stat = os.stat(self._path(key))
+        except OSError:
+            return None
+        self._index[key] = (stat.st_size, stat.st_mtime)
+        self.total_bytes += stat.st_size
+        return self._index[key]
+
+    def _evict(self):
+        # The caller holds _lock
+        if self.total_bytes <= self.max_bytes and time.time() - self._scanned < DISK_RESCAN_SECONDS:
+            return
+        self._scan()
+        if self.total_bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self._index.items(), key=lambda item: item[1][1]):
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._remove(key)
+
+    def _remove(self, key: str):
+        # The caller holds _lock
+        size, _ = self._index.pop(key, (0, 0))
+        self.total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class ResponseCache:
+    """
+    Content-addressed cache for model responses.
+    Lookups go memory -> disk -> upstream, and identical requests that
+    arrive while the first one is still running share its upstream call.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+        self.memory = MemoryCache(int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256")))
+
+        cache_dir = os.getenv("RESPONSE_CACHE_DIR")
+        self.disk = DiskCache(
+            cache_dir,
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+            max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+        ) if cache_dir else None
+
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(**parts: Any) -> str:
+        """Hash the request parts (model, prompt, temperature, image hashes, ...) into a cache key"""
+        canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Any):
+        """Best effort: a failed disk write (full, read-only) is logged and the value stays in memory"""
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.set, key, value)
+            except Exception:
+                logger.exception("Could not write response cache entry %s to disk", key)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Return (value, cached). cached is True when no upstream call was
+        made for this request - either a stored hit or a coalesced wait.
+        """
+        if not self.enabled:
+            return await compute(), False
+
+        while True:
+            value = await self.get(key)
+            if value is not None:
+                self.hits += 1
+                return value, True
+
+            # Single-flight: piggyback on an identical request already in progress
+            if key not in self._in_flight:
+                break
+            value = await asyncio.shield(self._in_flight[key])
+            if value is not _ABANDONED:
+                self.coalesced += 1
+                return value, True
+            # The leading request was cancelled (client gone, job item cancelled); the first follower takes over
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await compute()
+            await self.set(key, value)
+            future.set_result(value)
+            return value, False
+        except asyncio.CancelledError:
+            # Only this request is cancelled, not the identical ones waiting on it
+            future.set_result(_ABANDONED)
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure does not log a warning
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def count_lookup(self, hit: bool):
+        """Record a lookup made through get(), for callers that do not use get_or_compute()"""
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+            "disk_bytes": self.disk.total_bytes if self.disk is not None else 0,
+            "in_flight": len(self._in_flight)
+        }
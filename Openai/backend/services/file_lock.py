@@ -0,0 +1,32 @@
+from typing import IO, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def try_lock(path: str) -> Optional[IO]:
+    """
+    Take an exclusive lock on path without waiting, so one of several server
+    processes can own a piece of shared work. Returns the open handle (keep
+    it to hold the lock) or None if another process holds it. The OS drops
+    the lock when the holder exits, crashed or not.
+    """
+    handle = open(path, "a+")
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def release(handle: Optional[IO]):
+    if handle is not None:
+        handle.close()  # Closing the handle drops the lock
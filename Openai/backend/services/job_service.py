@@ -0,0 +1,280 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import IO, Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from services.gpt_service import GPTService
+from services.image_payload import ImagePayload
+from services.file_lock import release, try_lock
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Item states: pending -> running -> done | failed (| cancelled)
+TERMINAL_STATES = ("done", "failed", "cancelled")
+
+
+class JobService:
+    """
+    Batch analysis jobs: many drawings + one prompt/template, processed by a
+    bounded pool of async workers that share the GPTService.
+    Each job lives in jobs/<job_id>/ (job.json, inputs/, results/) so state
+    survives a restart; unfinished items are re-queued on start().
+    With several server processes, the one holding a job's owner.lock runs
+    it; the others answer for it from job.json and leave a cancel.json
+    marker for the owner. A job whose owner died is adopted on next access.
+    """
+
+    def __init__(self, gpt_service: GPTService):
+        self.gpt_service = gpt_service
+        self.jobs_dir = os.getenv("JOBS_DIR", "backend/jobs")
+        self.concurrency = int(os.getenv("JOB_CONCURRENCY", "8"))
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: "asyncio.Queue[tuple]" = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._owned: Dict[str, IO] = {}  # job_id -> owner.lock handle, for unfinished jobs this process runs
+
+    async def start(self):
+        """Load persisted jobs, resume unfinished ones no other server process owns and start the worker pool"""
+        for job in await asyncio.to_thread(self._load_jobs):
+            if self._unfinished(job) and not self._resume(job):
+                continue  # Running in another server process; get_job() reads it from disk
+            self.jobs[job["job_id"]] = job
+
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for handle in self._owned.values():
+            release(handle)
+        self._owned = {}
+
+    @staticmethod
+    def _unfinished(job: Dict[str, Any]) -> bool:
+        return any(item["status"] not in TERMINAL_STATES for item in job["items"])
+
+    def _resume(self, job: Dict[str, Any]) -> bool:
+        """Take ownership of an unfinished job and re-queue its items; False if another process owns it"""
+        handle = try_lock(os.path.join(self.job_dir(job["job_id"]), "owner.lock"))
+        if handle is None:
+            return False
+        self._owned[job["job_id"]] = handle
+        for item in job["items"]:
+            if item["status"] not in TERMINAL_STATES:
+                # Anything that was running when its process stopped starts over
+                item["status"] = "pending"
+                self._queue.put_nowait((job["job_id"], item["index"]))
+        return True
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id)
+
+    def new_job_id(self) -> str:
+        job_id = str(uuid.uuid4())
+        os.makedirs(os.path.join(self.job_dir(job_id), "inputs"), exist_ok=True)
+        os.makedirs(os.path.join(self.job_dir(job_id), "results"), exist_ok=True)
+        return job_id
+
+    async def create_job(
+        self,
+        job_id: str,
+        inputs: List[Dict[str, Any]],
+        prompt: str,
+        template: Optional[str] = None,
+        use_cache: bool = True,
+        preprocess: Optional[bool] = None,
+        tiling: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """
+        Register a job whose input files are already under job_dir(job_id)/inputs.
+        inputs: [{"filename", "content_type", "path", "size", "sha256"}]
+        """
+        now = datetime.now().isoformat()
+        job = {
+            "job_id": job_id,
+            "status": "pending",
+            "created": now,
+            "updated": now,
+            "prompt": prompt,
+            "template": template,
+            "use_cache": use_cache,
+            "preprocess": preprocess,
+            "tiling": tiling,
+            "items": [
+                dict(entry, index=index, status="pending", error=None, started=None, finished=None)
+                for index, entry in enumerate(inputs)
+            ]
+        }
+        self._owned[job_id] = try_lock(os.path.join(self.job_dir(job_id), "owner.lock"))
+        self.jobs[job_id] = job
+        await self._save(job)
+
+        for item in job["items"]:
+            self._queue.put_nowait((job_id, item["index"]))
+        return job
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        try:
+            uuid.UUID(job_id)  # Only ever a directory name this service created
+            with open(os.path.join(self.job_dir(job_id), "job.json"), "r", encoding="utf-8") as f:
+                job = json.load(f)
+        except (ValueError, OSError):
+            return None
+        if self._unfinished(job) and self._resume(job):
+            # Its owner is gone: run the rest here
+            self.jobs[job_id] = job
+        return job
+
+    def progress(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        counts = {state: 0 for state in ("pending", "running") + TERMINAL_STATES}
+        for item in job["items"]:
+            counts[item["status"]] += 1
+        return {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "created": job["created"],
+            "updated": job["updated"],
+            "total": len(job["items"]),
+            "counts": counts,
+            "progress": sum(counts[state] for state in TERMINAL_STATES) / len(job["items"]) if job["items"] else 1.0
+        }
+
+    async def get_results(self, job: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._read_results, job)
+
+    async def cancel_job(self, job: Dict[str, Any]):
+        """Cancel items that have not started; running items finish normally"""
+        for item in job["items"]:
+            if item["status"] == "pending":
+                item["status"] = "cancelled"
+        if job["job_id"] in self.jobs:
+            await self._update_status(job)
+        else:
+            # Owned by another server process, which checks for the marker before each item
+            marker = os.path.join(self.job_dir(job["job_id"]), "cancel.json")
+            await asyncio.to_thread(self._write_json, marker, {"requested": datetime.now().isoformat()})
+
+    async def _worker(self):
+        while True:
+            job_id, index = await self._queue.get()
+            try:
+                job = self.jobs.get(job_id)
+                if job is not None and job["items"][index]["status"] == "pending":
+                    if os.path.exists(os.path.join(self.job_dir(job_id), "cancel.json")):
+                        await self.cancel_job(job)
+                    else:
+                        await self._run_item(job, job["items"][index])
+            except Exception:
+                # Keep the worker alive; the item stays as it was and is retried on restart
+                logger.exception("Job worker error (%s/%s)", job_id, index)
+            finally:
+                self._queue.task_done()
+
+    async def _run_item(self, job: Dict[str, Any], item: Dict[str, Any]):
+        item["status"] = "running"
+        item["started"] = datetime.now().isoformat()
+        await self._update_status(job)
+
+        image = ImagePayload(item["filename"], item["content_type"], path=item["path"])
+        try:
+            result = await self.gpt_service.process_chat(
+                prompt=job["prompt"],
+                images=[image],
+                template=job["template"],
+                use_cache=job["use_cache"],
+                preprocess=job["preprocess"],
+                tiling=job.get("tiling")
+            )
+            record = {
+                "index": item["index"],
+                "filename": item["filename"],
+                "sha256": item.get("sha256"),
+                "status": "done",
+                "response": result["response"],
+                "cached": result["cached"],
+                "preprocessing": result["preprocessing"],
+                "plan": result["plan"],
+                "usage": result["usage"],
+                "tiling": result["tiling"]
+            }
+            item["status"] = "done"
+            item["error"] = None
+        except Exception as e:
+            record = {
+                "index": item["index"],
+                "filename": item["filename"],
+                "sha256": item.get("sha256"),
+                "status": "failed",
+                "error": str(e)
+            }
+            item["status"] = "failed"
+            item["error"] = str(e)
+
+        item["finished"] = datetime.now().isoformat()
+        record["finished"] = item["finished"]
+        result_path = os.path.join(self.job_dir(job["job_id"]), "results", f"{item['index']}.json")
+        await asyncio.to_thread(self._write_json, result_path, record)
+        await self._update_status(job)
+
+    async def _update_status(self, job: Dict[str, Any]):
+        states = [item["status"] for item in job["items"]]
+        if all(state in TERMINAL_STATES for state in states):
+            job["status"] = "cancelled" if "cancelled" in states else "completed"
+        elif any(state != "pending" for state in states):
+            job["status"] = "running"
+        job["updated"] = datetime.now().isoformat()
+        await self._save(job)
+        if not self._unfinished(job):
+            release(self._owned.pop(job["job_id"], None))
+
+    async def _save(self, job: Dict[str, Any]):
+        # One writer per job at a time; the snapshot is taken on the event loop
+        lock = self._locks.setdefault(job["job_id"], asyncio.Lock())
+        async with lock:
+            snapshot = json.loads(json.dumps(job))
+            await asyncio.to_thread(self._write_json, os.path.join(self.job_dir(job["job_id"]), "job.json"), snapshot)
+
+    @staticmethod
+    def _write_json(path: str, data: Any):
+        # Write then rename so a crash never leaves a half-written file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _load_jobs(self) -> List[Dict[str, Any]]:
+        jobs = []
+        for job_id in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, job_id, "job.json")
+            if os.path.isfile(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        jobs.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return jobs
+
+    def _read_results(self, job: Dict[str, Any]) -> List[Dict[str, Any]]:
+        results = []
+        for item in job["items"]:
+            path = os.path.join(self.job_dir(job["job_id"]), "results", f"{item['index']}.json")
+            if os.path.isfile(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    results.append(json.load(f))
+            else:
+                results.append({"index": item["index"], "filename": item["filename"], "status": item["status"]})
+        return results
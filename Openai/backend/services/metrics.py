@@ -0,0 +1,245 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds; wide enough for multi-minute upstream calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], *extra: str) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(pair for pair in extra if pair)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), function: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.function = function  # Read at scrape time instead of being updated
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()  # Storage work updates metrics from worker threads
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self, worker: str = "") -> List[str]:
+        if self.function is not None:
+            return [f"{self.name}{_format_labels((), (), worker)} {float(self.function())}"]
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key, worker)} {value}" for key, value in values]
+
+    def render(self, worker: str = "") -> str:
+        header = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(header + self.samples(worker))
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # Per series: a count per bucket and one above the last bound, then sum and count
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 3)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self, worker: str = "") -> List[str]:
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        lines = []
+        for key, values in series:
+            labels = _format_labels(self.label_names, key, worker)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, worker, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{labels} {values[-2]}")
+            lines.append(f"{self.name}_count{labels} {values[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Counters, gauges and histograms rendered in the Prometheus text format.
+    METRICS_ENABLED=false turns spans and the HTTP middleware into no-ops.
+    Every server process (WORKERS) keeps its own values and a scrape is
+    answered by whichever process accepts it, so each series carries a
+    worker="<pid>" label; sum over it in queries for service-wide totals.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        # Re-registering returns the existing metric, so services can be constructed more than once
+        registered = self._metrics.setdefault(metric.name, metric)
+        if metric.function is not None:
+            registered.function = metric.function  # Callbacks follow the latest service instance
+        return registered
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = (), function: Optional[Callable[[], float]] = None) -> Counter:
+        return self._register(Counter(name, help, labels, function))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = (), function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, help, labels, function))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        # Read at scrape time: the registry is created before uvicorn forks its workers
+        worker = f'worker="{os.getpid()}"'
+        return "\n".join(metric.render(worker) for metric in self._metrics.values()) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+STAGE_SECONDS = METRICS.histogram("columbus_stage_seconds", "Time spent in each request processing stage", ("stage",))
+STAGE_ERRORS = METRICS.counter("columbus_stage_errors_total", "Exceptions raised per stage, by exception type", ("stage", "error"))
+TEMPLATE_SECONDS = METRICS.histogram("columbus_chat_seconds", "Chat processing time per prompt template", ("template",))
+UPSTREAM_TOKENS = METRICS.counter("columbus_upstream_tokens_total", "Tokens reported in upstream usage", ("kind",))
+HTTP_REQUESTS = METRICS.counter("columbus_http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+HTTP_REQUEST_BYTES = METRICS.counter("columbus_http_request_bytes_total", "HTTP request body bytes received", ("route",))
+HTTP_RESPONSE_BYTES = METRICS.counter("columbus_http_response_bytes_total", "HTTP response body bytes sent", ("route",))
+HTTP_SECONDS = METRICS.histogram("columbus_http_request_seconds", "HTTP request latency until the response completes", ("route",))
+HTTP_IN_FLIGHT = METRICS.gauge("columbus_http_requests_in_flight", "HTTP requests being handled")
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a block as one stage; exceptions are counted by type and re-raised"""
+    if not METRICS.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        count_error(stage, e)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage measured outside a span (e.g. queueing before an upstream call)"""
+    if METRICS.enabled:
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def count_error(stage: str, error: BaseException):
+    # Cancellations and client disconnects (GeneratorExit) are not failures
+    if METRICS.enabled and isinstance(error, Exception):
+        STAGE_ERRORS.inc(stage=stage, error=type(error).__name__)
+
+
+def observe_template(template: str, seconds: float):
+    if METRICS.enabled:
+        TEMPLATE_SECONDS.observe(seconds, template=template)
+
+
+def record_usage(prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+    """Upstream token usage as reported in response.usage"""
+    if METRICS.enabled:
+        UPSTREAM_TOKENS.inc(prompt_tokens or 0, kind="prompt")
+        UPSTREAM_TOKENS.inc(completion_tokens or 0, kind="completion")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests, body bytes and latency per route
+    template (not per raw path, which would grow without bound). Streamed
+    responses are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        received = 0
+        sent = 0
+        status = 500  # If the app fails before starting a response
+
+        async def counting_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal sent, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        # The route is only known once routing ran, so the in-flight gauge counts all requests together
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUESTS.inc(method=scope["method"], route=route, status=status)
+            HTTP_REQUEST_BYTES.inc(received, route=route)
+            HTTP_RESPONSE_BYTES.inc(sent, route=route)
+            HTTP_SECONDS.observe(time.perf_counter() - start, route=route)
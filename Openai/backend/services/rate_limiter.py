@@ -0,0 +1,362 @@
+import os
+import re
+import time
+import random
+import asyncio
+from typing import Any, Awaitable, Callable, Mapping, Optional, Tuple
+
+import openai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """An upstream failure with the HTTP status the API should answer with"""
+
+    def __init__(self, message: str, status_code: int = 502, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset durations such as "1s", "6m0s", "20ms" or "1h2m3.5s" into seconds"""
+    if not value:
+        return None
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+def parse_retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            return None  # HTTP-date form; fall back to backoff
+    return None
+
+
+class TokenBucket:
+    """
+    Refills continuously at per_minute / 60 per second and holds up to
+    burst_seconds worth. per_minute <= 0 disables the bucket.
+    Waiters are served in arrival order. share scales the limit, and the
+    limits later read from headers, down to this process's part of it.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10, share: float = 1.0):
+        self.burst_seconds = burst_seconds
+        self.share = share
+        self._set_rate(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _set_rate(self, per_minute: float):
+        per_minute *= self.share
+        self.per_minute = per_minute
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * self.burst_seconds)
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_minute > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        if not self.enabled:
+            return
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def refund(self, amount: float):
+        """Give back over-reserved tokens (or charge extra with a negative amount)"""
+        if self.enabled:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def pause(self, seconds: float):
+        """Hold every waiter back for the given time, e.g. after a 429 with Retry-After"""
+        if self.enabled:
+            self._refill()
+            self.tokens = min(self.tokens, -self.rate * seconds)
+
+    def sync(self, limit: Optional[str], remaining: Optional[str]):
+        """Adopt the upstream's view from x-ratelimit-limit-* / x-ratelimit-remaining-* headers"""
+        try:
+            if limit and float(limit) > 0:
+                self._set_rate(float(limit))
+            if remaining is not None and self.enabled:
+                self._refill()
+                self.tokens = min(self.tokens, float(remaining) * self.share)
+        except ValueError:
+            pass
+
+
+class LatencyModel:
+    """
+    Expected latency of an uncongested call as a fixed overhead plus a cost
+    per output token, fitted by exponentially weighted least squares over
+    recent calls, so a 50-token answer and a 4000-token one are each judged
+    against what their own length should take.
+    """
+
+    def __init__(self, smoothing: float = 0.05):
+        self.smoothing = smoothing
+        self.samples = 0
+        self.max_tokens = 0  # Longest output fitted so far; longer ones are not extrapolated to
+        self._weight = self._tokens = self._latency = self._tokens_sq = self._cross = 0.0
+
+    def add(self, tokens: int, latency: float):
+        keep = 1 - self.smoothing
+        self._weight = keep * self._weight + 1
+        self._tokens = keep * self._tokens + tokens
+        self._latency = keep * self._latency + latency
+        self._tokens_sq = keep * self._tokens_sq + tokens * tokens
+        self._cross = keep * self._cross + tokens * latency
+        self.samples += 1
+        self.max_tokens = max(self.max_tokens, tokens)
+
+    @property
+    def per_token(self) -> float:
+        if not self.samples:
+            return 0.0
+        mean_tokens = self._tokens / self._weight
+        variance = self._tokens_sq / self._weight - mean_tokens ** 2
+        if variance <= 1e-9 * max(1.0, mean_tokens ** 2):
+            return 0.0  # Every call had the same length: only the overhead is known
+        covariance = self._cross / self._weight - mean_tokens * self._latency / self._weight
+        return max(0.0, covariance / variance)
+
+    @property
+    def overhead(self) -> float:
+        if not self.samples:
+            return 0.0
+        return max(0.0, (self._latency - self.per_token * self._tokens) / self._weight)
+
+    def expected(self, tokens: int) -> Optional[float]:
+        """The fitted latency for an output length, None until it is known for that length"""
+        if not self.samples or tokens > self.max_tokens:
+            return None
+        return self.overhead + self.per_token * tokens
+
+
+class AIMDConcurrency:
+    """
+    Latency-driven concurrency limit: grows by roughly one slot per round
+    trip while latency stays near what the LatencyModel expects for the
+    output length, and halves on throttling or when latency climbs past
+    latency_tolerance x that expectation (queueing upstream).
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, latency_tolerance: float = 2.0, decrease_factor: float = 0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.latency = LatencyModel()
+        self.round_trip = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, elapsed: Optional[float] = None, output_tokens: Optional[int] = None, throttled: bool = False):
+        async with self._condition:
+            self.in_flight -= 1
+            if elapsed is not None:
+                self.round_trip = elapsed if not self.round_trip else 0.9 * self.round_trip + 0.1 * elapsed
+            if throttled:
+                self._decrease()
+            elif elapsed is not None and output_tokens is not None:
+                self._observe(elapsed, output_tokens)
+            self._condition.notify_all()
+
+    def _observe(self, elapsed: float, output_tokens: int):
+        expected = self.latency.expected(output_tokens)
+        congested = expected is not None and elapsed > self.latency_tolerance * expected
+        # A slow call still pulls the fit up, capped, so a lasting shift is not treated as congestion forever
+        self.latency.add(output_tokens, min(elapsed, self.latency_tolerance * expected) if congested else elapsed)
+
+        if congested:
+            self._decrease()
+        elif self.in_flight + 1 >= int(self.limit):
+            # Only grow while the limit is what holds requests back
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def _decrease(self):
+        # At most one decrease per round trip, so one burst of slow or throttled responses counts once
+        now = time.monotonic()
+        if now - self._last_decrease < self.round_trip:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+
+
+class UpstreamScheduler:
+    """
+    Admission control for upstream calls: request and token buckets sized
+    from config and corrected from rate-limit headers, an AIMD concurrency
+    limit, and jittered exponential retries that honor Retry-After.
+    """
+
+    def __init__(self):
+        # The limits are per account; each of WORKERS server processes gets an equal share
+        share = 1 / max(1, int(os.getenv("WORKERS", "1")))
+        self.requests = TokenBucket(
+            float(os.getenv("OPENAI_RPM", "500")),
+            burst_seconds=float(os.getenv("OPENAI_BURST_SECONDS", "10")),
+            share=share
+        )
+        self.tokens = TokenBucket(
+            float(os.getenv("OPENAI_TPM", "30000")),
+            burst_seconds=float(os.getenv("OPENAI_BURST_SECONDS", "10")),
+            share=share
+        )
+        max_concurrency = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+        self.concurrency = AIMDConcurrency(
+            initial=int(os.getenv("OPENAI_INITIAL_CONCURRENCY", str(max(1, max_concurrency // 4)))),
+            minimum=1,
+            maximum=max_concurrency,
+            latency_tolerance=float(os.getenv("OPENAI_LATENCY_TOLERANCE", "2.0"))
+        )
+        # Output tokens reserved per call until usage reports the real count; reserving the whole
+        # max_tokens would let a default 30000 TPM bucket admit one call at a time
+        self.output_estimate = int(os.getenv("OPENAI_OUTPUT_TOKEN_ESTIMATE", "1000"))
+        self.max_retries = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+        self.base_delay = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))
+        self.max_delay = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "30"))
+
+        self.retries = 0
+        self.throttled = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self.concurrency.in_flight
+
+    async def execute(self, call: Callable[[], Awaitable[Any]], estimated_tokens: int) -> Tuple[Any, float]:
+        """
+        Run call() (which must return an openai raw response) under the limits,
+        retrying transient failures. Returns (raw, started) where started is
+        when the successful attempt was sent. The concurrency slot is still
+        held - call finish(started, ...) once the response has been consumed.
+        """
+        attempt = 0
+        while True:
+            # Take the slot first so rate tokens are spent when the call is actually sent
+            await self.concurrency.acquire()
+            try:
+                await self.requests.acquire(1)
+                await self.tokens.acquire(estimated_tokens)
+            except BaseException:
+                await self.concurrency.release()
+                raise
+            start_time = time.perf_counter()
+
+            try:
+                raw = await call()
+            except (openai.APIStatusError, openai.APIConnectionError) as e:
+                status = getattr(e, "status_code", None)
+                headers = e.response.headers if getattr(e, "response", None) is not None else None
+                throttled = status == 429
+                self.throttled += int(throttled)
+                # A failed attempt is not charged upstream; the retry reserves again
+                self.tokens.refund(estimated_tokens)
+                self._sync(headers)
+                await self.concurrency.release(time.perf_counter() - start_time, throttled=throttled)
+
+                retryable = status is None or status in RETRYABLE_STATUS_CODES
+                retry_after = parse_retry_after(headers)
+                if throttled and retry_after:
+                    # The whole account is limited, not just this call: hold new admissions back too
+                    self.requests.pause(retry_after)
+                if not retryable or attempt >= self.max_retries:
+                    raise self._to_upstream_error(e, status, retry_after)
+
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+                continue
+            except BaseException:
+                await self.concurrency.release()
+                raise
+
+            self._sync(raw.headers)
+            return raw, start_time
+
+    async def finish(self, started: float, output_tokens: Optional[int]):
+        """Release the slot taken by execute() once the response has been read"""
+        await self.concurrency.release(time.perf_counter() - started, output_tokens)
+
+    def reservation(self, input_tokens: int, max_tokens: int) -> int:
+        """Tokens to reserve for a call: its input plus the output estimate, capped at max_tokens"""
+        return input_tokens + min(max_tokens, self.output_estimate)
+
+    def settle_tokens(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        if actual_tokens is not None:
+            self.tokens.refund(estimated_tokens - actual_tokens)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        # Full jitter spreads retries from many concurrent requests apart
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = retry_after + random.uniform(0, self.base_delay)
+        return min(delay, self.max_delay)
+
+    def _sync(self, headers: Optional[Mapping[str, str]]):
+        if not headers:
+            return
+        self.requests.sync(headers.get("x-ratelimit-limit-requests"), headers.get("x-ratelimit-remaining-requests"))
+        self.tokens.sync(headers.get("x-ratelimit-limit-tokens"), headers.get("x-ratelimit-remaining-tokens"))
+
+    @staticmethod
+    def _to_upstream_error(e: Exception, status: Optional[int], retry_after: Optional[float]) -> UpstreamError:
+        if status in RETRYABLE_STATUS_CODES or status is None:
+            # Still throttled or unavailable after retrying: tell the client to come back later
+            return UpstreamError(f"GPT API unavailable: {e}", 503, retry_after or 30)
+        if status == 400:
+            return UpstreamError(f"GPT API rejected the request: {e}", 400)
+        return UpstreamError(f"GPT API error: {e}", 502)
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+            "latency_overhead": round(self.concurrency.latency.overhead, 3),
+            "latency_per_token": round(self.concurrency.latency.per_token, 6),
+            "requests_per_minute": self.requests.per_minute,
+            "tokens_per_minute": self.tokens.per_minute,
+            "retries": self.retries,
+            "throttled": self.throttled
+        }
@@ -0,0 +1,299 @@
+import os
+import io
+import math
+import json
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from services.cache_service import MemoryCache
+from services.image_payload import ImagePayload
+from services.image_preprocessor import BASE_TOKENS, TILE_SIZE, estimate_image_tokens, model_view_size
+from services.worker_pool import WorkerPool
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it every image is planned at an assumed size
+    Image = None
+
+load_dotenv()
+
+# Low detail: the model sees one 512x512 view for a flat cost
+LOW_DETAIL_EDGE = TILE_SIZE
+LOW_DETAIL_TOKENS = BASE_TOKENS
+# Assumed for images whose size cannot be read: a drawing page rendered at ~200 DPI
+FALLBACK_SIZE = (2048, 1536)
+EXIF_ORIENTATION = 274
+
+DEFAULT_OUTPUT_TOKENS = "technical=2000,analyze=2000,describe=800,default=1500"
+DEFAULT_TEMPERATURES = "technical=0.2,analyze=0.3,describe=0.7,default=0.7"
+
+
+def resize_png(data: bytes, size: Tuple[int, int]) -> bytes:
+    """Upright, resized PNG of an image; runs in a pool worker"""
+    with Image.open(io.BytesIO(data)) as source:
+        resized = ImageOps.exif_transpose(source)
+        if resized.mode not in ("L", "LA", "RGB", "RGBA"):
+            resized = resized.convert("L" if resized.mode == "1" else "RGB")
+        resized = resized.resize(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    resized.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _template_values(value: str, cast) -> Dict[str, Any]:
+    """Parse "technical=2000,describe=800" into {"technical": 2000, "describe": 800}"""
+    values = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, setting = item.split("=", 1)
+            values[name.strip()] = cast(setting.strip())
+    return values
+
+
+class RequestPlanner:
+    """
+    Plans each upstream call before it is made: a detail level and
+    resolution per image, and the output token limit and temperature for
+    the template. High-detail images are snapped down to the largest size
+    that needs fewer 512px tiles, as long as they keep at least
+    PLAN_MIN_SCALE of what the model would have seen. A latency or token
+    budget first cuts the output limit (down to PLAN_MIN_OUTPUT_TOKENS) and
+    only then steps images further down (to PLAN_BUDGET_MIN_SCALE), since
+    small dimension text is the first thing lost at lower resolution.
+    """
+
+    def __init__(self, max_tokens: int = 4000, temperature: float = 0.7):
+        self.available = Image is not None
+        # Opt-in: planned calls use per-template output limits and temperatures instead of the service defaults
+        self.enabled = os.getenv("PLANNING_ENABLED", "false").lower() == "true"
+        # Used for every template when planning is off
+        self.default_max_tokens = max_tokens
+        self.default_temperature = temperature
+
+        self.output_tokens = _template_values(os.getenv("PLAN_OUTPUT_TOKENS", DEFAULT_OUTPUT_TOKENS), int)
+        self.temperatures = _template_values(os.getenv("PLAN_TEMPERATURES", DEFAULT_TEMPERATURES), float)
+        self.low_detail_templates = [name for name in os.getenv("PLAN_LOW_DETAIL_TEMPLATES", "describe").split(",") if name]
+        # Shares of the model's view; above 1 would ask for more than the full view, which no grid offers
+        self.min_scale = min(1.0, float(os.getenv("PLAN_MIN_SCALE", "0.85")))
+        self.budget_min_scale = min(1.0, float(os.getenv("PLAN_BUDGET_MIN_SCALE", "0.6")))
+        self.min_output_tokens = int(os.getenv("PLAN_MIN_OUTPUT_TOKENS", "512"))
+
+        # Per-request budgets; 0 = none
+        self.latency_budget = float(os.getenv("PLAN_LATENCY_BUDGET", "0"))
+        self.token_budget = int(os.getenv("PLAN_TOKEN_BUDGET", "0"))
+        # Latency model for the budget: fixed overhead plus prefill and decode time
+        self.base_seconds = float(os.getenv("PLAN_BASE_SECONDS", "0.5"))
+        self.seconds_per_input_token = float(os.getenv("PLAN_SECONDS_PER_INPUT_TOKEN", "0.0001"))
+        self.seconds_per_output_token = float(os.getenv("PLAN_SECONDS_PER_OUTPUT_TOKEN", "0.015"))
+
+        self.cache = MemoryCache(int(os.getenv("PLAN_CACHE_ENTRIES", "128")))
+
+    @property
+    def settings_key(self) -> str:
+        """Identifies the current settings, so cached responses follow config changes"""
+        if not self.enabled:
+            settings = {"max_tokens": self.default_max_tokens, "temperature": self.default_temperature}
+        else:
+            settings = {
+                "output_tokens": self.output_tokens,
+                "temperatures": self.temperatures,
+                "low_detail_templates": self.low_detail_templates,
+                "min_scale": self.min_scale,
+                "budget_min_scale": self.budget_min_scale,
+                "min_output_tokens": self.min_output_tokens,
+                "latency_budget": self.latency_budget,
+                "token_budget": self.token_budget,
+                "latency_model": [self.base_seconds, self.seconds_per_input_token, self.seconds_per_output_token]
+            }
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def _template_key(self, template: Optional[str]) -> str:
+        return template if template in self.output_tokens else "default"
+
+    async def prepare(
+        self,
+        prompt: str,
+        images: Optional[List[ImagePayload]],
+        template: Optional[str],
+        pool: WorkerPool
+    ) -> Tuple[Dict[str, Any], Optional[List[ImagePayload]]]:
+        """Plan the call and resize the images to the planned resolution"""
+        if self.enabled:
+            sizes = await asyncio.to_thread(lambda: [self.image_size(image) for image in images or []])
+        else:
+            # Nothing to decide: images go out as they are and their token estimate assumes FALLBACK_SIZE
+            sizes = [None] * len(images or [])
+        plan = self.plan(prompt, [image.filename for image in images or []], sizes, template)
+        if images:
+            images = list(await asyncio.gather(*(
+                self._apply(image, image_plan, pool) for image, image_plan in zip(images, plan["images"])
+            )))
+        return plan, images
+
+    def plan(
+        self,
+        prompt: str,
+        filenames: List[str],
+        sizes: List[Optional[Tuple[int, int]]],
+        template: Optional[str]
+    ) -> Dict[str, Any]:
+        template_key = self._template_key(template)
+        text_tokens = len(prompt) // 4
+        if not self.enabled:
+            images = [self._full_detail(filename, size) for filename, size in zip(filenames, sizes)]
+            return self._summary(template_key, images, text_tokens, self.default_max_tokens, self.default_temperature)
+
+        low_detail = template_key in self.low_detail_templates
+        options = [self._options(size, low_detail) for size in sizes]
+        chosen = [0] * len(options)  # Index into each image's options, cheapest acceptable first
+
+        output_limit = self.output_tokens.get(template_key, self.default_max_tokens)
+
+        def input_tokens() -> int:
+            return text_tokens + sum(option[index]["estimated_tokens"] for option, index in zip(options, chosen))
+
+        # Not even the minimum output fits: step the most expensive image down one tile grid at a time
+        while not self._fits(input_tokens(), self.min_output_tokens):
+            steppable = [i for i, option in enumerate(options) if chosen[i] + 1 < len(option)]
+            if not steppable:
+                break
+            i = max(steppable, key=lambda i: options[i][chosen[i]]["estimated_tokens"])
+            chosen[i] += 1
+
+        max_tokens = max(self.min_output_tokens, min(output_limit, self._output_allowance(input_tokens())))
+        images = [dict(option[index], filename=filename) for option, index, filename in zip(options, chosen, filenames)]
+        return self._summary(template_key, images, text_tokens, max_tokens, self.temperatures.get(template_key, self.default_temperature))
+
+    def _fits(self, input_tokens: int, output_tokens: int) -> bool:
+        if self.token_budget and input_tokens + output_tokens > self.token_budget:
+            return False
+        return not self.latency_budget or self._estimated_latency(input_tokens, output_tokens) <= self.latency_budget
+
+    def _output_allowance(self, input_tokens: int) -> int:
+        """Output tokens left in the budgets once the input is paid for"""
+        allowance = math.inf
+        if self.token_budget:
+            allowance = self.token_budget - input_tokens
+        if self.latency_budget:
+            remaining = self.latency_budget - self._estimated_latency(input_tokens, 0)
+            allowance = min(allowance, math.floor(remaining / self.seconds_per_output_token))
+        return allowance
+
+    def _estimated_latency(self, input_tokens: int, output_tokens: int) -> float:
+        return self.base_seconds + input_tokens * self.seconds_per_input_token + output_tokens * self.seconds_per_output_token
+
+    def _summary(
+        self,
+        template_key: str,
+        images: List[Dict[str, Any]],
+        text_tokens: int,
+        max_tokens: int,
+        temperature: float
+    ) -> Dict[str, Any]:
+        input_tokens = text_tokens + sum(image["estimated_tokens"] for image in images)
+        summary = {
+            "enabled": self.enabled,
+            "template": template_key,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "images": images,
+            "estimated_input_tokens": input_tokens
+        }
+        if self.enabled:
+            # The latency model and budgets only shape planned calls
+            summary["estimated_latency"] = round(self._estimated_latency(input_tokens, max_tokens), 3)
+            summary["within_budget"] = self._fits(input_tokens, max_tokens)
+        return summary
+
+    def _full_detail(self, filename: str, size: Optional[Tuple[int, int]]) -> Dict[str, Any]:
+        """The image as sent without planning: original size, no detail hint"""
+        width, height = size or (None, None)
+        return {
+            "filename": filename,
+            "detail": None,
+            "width": width,
+            "height": height,
+            "original_width": width,
+            "original_height": height,
+            "scale": 1.0,
+            "estimated_tokens": estimate_image_tokens(*(size or FALLBACK_SIZE))
+        }
+
+    def _options(self, size: Optional[Tuple[int, int]], low_detail: bool) -> List[Dict[str, Any]]:
+        """Candidate (detail, resolution) choices for one image, the default choice first, then cheaper ones for budgets"""
+        if size is None:
+            return [dict(self._full_detail("", size), detail="high")]
+        width, height = size
+
+        # Anything within one 512px view looks the same at low detail, for a third of a tile's tokens
+        if low_detail or max(width, height) <= LOW_DETAIL_EDGE:
+            scale = min(1.0, LOW_DETAIL_EDGE / max(width, height))
+            return [self._option("low", size, scale, scale, LOW_DETAIL_TOKENS)]
+
+        # Scales are relative to the view the model would have made of the original
+        view_width, view_height = model_view_size(width, height)
+        view_scale = view_width / width
+        grids = {}
+        for columns in range(math.ceil(view_width / TILE_SIZE), 0, -1):
+            for rows in range(math.ceil(view_height / TILE_SIZE), 0, -1):
+                scale = min(1.0, columns * TILE_SIZE / view_width, rows * TILE_SIZE / view_height)
+                if scale < self.budget_min_scale:
+                    continue
+                # Floor so rounding never spills into another tile
+                tokens = estimate_image_tokens(max(1, math.floor(view_width * scale)), max(1, math.floor(view_height * scale)))
+                if tokens not in grids or grids[tokens] < scale:
+                    grids[tokens] = scale
+
+        # Drop grids that cost more than another without keeping more of the image
+        by_cost = []
+        for tokens, scale in sorted(grids.items()):
+            if not by_cost or scale > by_cost[-1][1]:
+                by_cost.append((tokens, scale))
+        # Default: the cheapest grid that still keeps min_scale (the full view if none does); budgets may go further down
+        default = next((index for index, (_, scale) in enumerate(by_cost) if scale >= self.min_scale), len(by_cost) - 1)
+        chosen = [by_cost[default]] + list(reversed(by_cost[:default]))
+        return [self._option("high", size, view_scale * scale, scale, tokens) for tokens, scale in chosen]
+
+    @staticmethod
+    def _option(detail: str, size: Tuple[int, int], size_scale: float, scale: float, tokens: int) -> Dict[str, Any]:
+        width, height = size
+        return {
+            "detail": detail,
+            "width": max(1, math.floor(width * size_scale)) if size_scale < 1 else width,
+            "height": max(1, math.floor(height * size_scale)) if size_scale < 1 else height,
+            "original_width": width,
+            "original_height": height,
+            "scale": round(scale, 3),
+            "estimated_tokens": tokens
+        }
+
+    def image_size(self, image: ImagePayload) -> Optional[Tuple[int, int]]:
+        """Upright size from the image header, without decoding the pixels or copying the file"""
+        if not self.available:
+            return None
+        try:
+            with image.open() as f, Image.open(f) as source:
+                width, height = source.size
+                # A PNG without EXIF in its header would be decoded in full by getexif() looking for it further on
+                has_exif = source.format != "PNG" or "exif" in source.info
+                if has_exif and source.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                    width, height = height, width
+                return width, height
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return None
+
+    async def _apply(self, image: ImagePayload, image_plan: Dict[str, Any], pool: WorkerPool) -> ImagePayload:
+        """A new payload to send: downscaled if the plan shrinks it, with the planned detail hint"""
+        if image_plan["width"] is None or image_plan["width"] >= image_plan["original_width"]:
+            return image.with_detail(image_plan["detail"])
+
+        size = (image_plan["width"], image_plan["height"])
+        key = f"{await asyncio.to_thread(lambda: image.sha256)}:{size[0]}x{size[1]}"
+        data = self.cache.get(key)
+        if data is None:
+            original = await asyncio.to_thread(image.read_bytes)
+            data = await pool.run(resize_png, original, size, input_bytes=len(original))
+            self.cache.set(key, data)
+        return ImagePayload(image.filename, "image/png", data=data, detail=image_plan["detail"])
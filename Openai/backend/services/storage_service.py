@@ -1,75 +1,332 @@
 import os
+import re
+import time
+import uuid
 import shutil
-from typing import Optional
-from datetime import datetime
+import asyncio
+import hashlib
+import logging
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
 from fastapi import UploadFile
+from services.file_catalog import FileCatalog, TIMESTAMP_FORMAT
+from services.file_lock import release, try_lock
+from services.metrics import span
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+SHA256_PATTERN = re.compile(r"[0-9a-f]{64}")
+# Blobs younger than this are never swept, so a blob is not removed between being written and linked
+ORPHAN_GRACE_SECONDS = 600
 
 class StorageService:
+    """
+    Uploads are stored once per content in a blob store (blobs/<aa>/<sha256>);
+    session directories hold hard links named <timestamp>_<filename> (copies
+    on filesystems without hard links). Session files are indexed in a SQLite
+    catalog so listings and lookups never scan the tree, and the catalog's
+    rows for a hash are the blob's references. A background sweeper enforces
+    the retention age and the total-size quota.
+    """
+
     def __init__(self):
         self.upload_dir = "backend/uploads"
+        self.blob_dir = os.getenv("BLOB_DIR", "backend/blobs")
+        self.retention_days = float(os.getenv("UPLOAD_RETENTION_DAYS", "30"))
+        self.max_bytes = int(os.getenv("UPLOAD_MAX_BYTES", str(1024 * 1024 * 1024)))
+        self.sweep_interval = float(os.getenv("UPLOAD_SWEEP_INTERVAL", "3600"))
+        self._sweeper: Optional[asyncio.Task] = None
+        self._sweep_lock = None
         self.ensure_upload_directory()
 
+        self.catalog = FileCatalog(os.getenv("UPLOAD_CATALOG", "backend/catalog.db"))
+        if self.catalog.needs_rebuild:
+            indexed = self.catalog.rebuild(self.upload_dir, self.blob_dir)
+            logger.info("Rebuilt upload catalog: %d files", indexed)
+
     def ensure_upload_directory(self):
-        """Ensure the upload directory exists"""
+        """Ensure the upload and blob directories exist"""
         os.makedirs(self.upload_dir, exist_ok=True)
+        os.makedirs(os.path.join(self.blob_dir, "tmp"), exist_ok=True)
+
+    async def start(self):
+        """Start the background retention sweeper"""
+        if self.sweep_interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        release(self._sweep_lock)
+        self._sweep_lock = None
+        self.catalog.close()
 
-    async def store_file(self, file: UploadFile, session_id: str) -> str:
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.blob_dir, sha256[:2], sha256)
+
+    def has_blob(self, sha256: str) -> bool:
+        return bool(SHA256_PATTERN.fullmatch(sha256)) and os.path.isfile(self.blob_path(sha256))
+
+    async def store_file(self, file: UploadFile, session_id: str) -> Dict[str, Any]:
         """
         Store uploaded file with user consent
-        Returns the file path where the file is stored
+        Streams the upload into the blob store in fixed-size chunks off the
+        event loop, hashing as it goes, and links it into the session.
+        Returns {"path", "size", "sha256", "deduplicated"}.
         """
         try:
-            # Create session directory
-            session_dir = os.path.join(self.upload_dir, session_id)
-            os.makedirs(session_dir, exist_ok=True)
+            with span("storage_store"):
+                tmp_path = os.path.join(self.blob_dir, "tmp", uuid.uuid4().hex)
+                size, sha256 = await asyncio.to_thread(self._copy_and_hash, file.file, tmp_path)
+                deduplicated = await asyncio.to_thread(self._commit_blob, tmp_path, sha256)
+                path = await asyncio.to_thread(self._link_blob, sha256, session_id, file.filename, size, file.content_type)
+                if path is None:
+                    raise FileNotFoundError(f"Blob {sha256} was removed before it was linked")
+                return {"path": path, "size": size, "sha256": sha256, "deduplicated": deduplicated}
 
-            # Generate unique filename with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{timestamp}_{file.filename}"
-            file_path = os.path.join(session_dir, filename)
+        except Exception as e:
+            raise Exception(f"File storage error: {str(e)}")
 
-            # Save file
-            with open(file_path, "wb") as buffer:
-                file.file.seek(0)  # Reset file pointer
-                shutil.copyfileobj(file.file, buffer)
+    async def link_stored_blob(
+        self,
+        sha256: str,
+        session_id: str,
+        filename: str,
+        content_type: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Add a blob the server already holds to a session without re-uploading it.
+        Returns None when there is no blob with that hash.
+        """
+        with span("storage_link"):
+            if not self.has_blob(sha256):
+                return None
+            try:
+                size = os.path.getsize(self.blob_path(sha256))
+            except FileNotFoundError:
+                return None
+            path = await asyncio.to_thread(self._link_blob, sha256, session_id, filename, size, content_type)
+            if path is None:
+                return None
+            return {"path": path, "size": size, "sha256": sha256, "deduplicated": True}
 
-            return file_path
+    def _commit_blob(self, tmp_path: str, sha256: str) -> bool:
+        """Move a freshly hashed upload into the blob store; True if the content was already there"""
+        blob_path = self.blob_path(sha256)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+            os.utime(blob_path)
+            return True
+        os.replace(tmp_path, blob_path)
+        return False
 
-        except Exception as e:
-            raise Exception(f"File storage error: {str(e)}")
+    def _link_blob(self, sha256: str, session_id: str, filename: str, size: int, content_type: Optional[str]) -> Optional[str]:
+        """Add a session reference to a blob; None if the blob is gone (swept since it was looked up)"""
+        blob_path = self.blob_path(sha256)
+        try:
+            # mtime doubles as last use for the size quota, and keeps the sweeper off it from here on
+            os.utime(blob_path)
+        except FileNotFoundError:
+            return None
 
-    def get_stored_files(self, session_id: str) -> list:
-        """Get list of stored files for a session"""
         session_dir = os.path.join(self.upload_dir, session_id)
-        if not os.path.exists(session_dir):
-            return []
-
-        files = []
-        for filename in os.listdir(session_dir):
-            file_path = os.path.join(session_dir, filename)
-            if os.path.isfile(file_path):
-                files.append({
-                    "filename": filename,
-                    "path": file_path,
-                    "size": os.path.getsize(file_path),
-                    "created": datetime.fromtimestamp(os.path.getctime(file_path)).isoformat()
-                })
-
-        return files
+        os.makedirs(session_dir, exist_ok=True)
+
+        # Generate unique filename with timestamp
+        now = datetime.now()
+        filename = os.path.basename(filename)
+        file_path = os.path.join(session_dir, f"{now.strftime(TIMESTAMP_FORMAT)}_{filename}")
+
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+        # Catalog first: a crash before the link leaves an entry without a file, which lookups skip and
+        # the sweeper expires; the other order would leave a reference the sweeper never sees
+        self.catalog.add(file_path, session_id, filename, sha256, size, content_type, now.timestamp())
+        try:
+            try:
+                os.link(blob_path, file_path)
+            except OSError:
+                # No hard links on this filesystem: keep a private copy (not deduplicated)
+                shutil.copyfile(blob_path, file_path)
+        except BaseException:
+            self.catalog.remove_paths([file_path])
+            raise
+        return file_path
+
+    async def save_upload(self, file: UploadFile, destination: str) -> Dict[str, Any]:
+        """Stream an upload to an explicit destination path, returning {"path", "size", "sha256"}"""
+        with span("storage_save"):
+            size, sha256 = await asyncio.to_thread(self._copy_and_hash, file.file, destination)
+        return {"path": destination, "size": size, "sha256": sha256}
+
+    async def hash_file(self, file: UploadFile) -> Dict[str, Any]:
+        """Size and SHA-256 of an upload that is not being stored"""
+        with span("storage_hash"):
+            size, sha256 = await asyncio.to_thread(self._copy_and_hash, file.file, None)
+        return {"path": None, "size": size, "sha256": sha256}
+
+    @staticmethod
+    def _copy_and_hash(source: BinaryIO, destination: Optional[str]) -> Tuple[int, str]:
+        """Copy source to destination (if given) chunk by chunk, returning (size, sha256)"""
+        digest = hashlib.sha256()
+        size = 0
+        source.seek(0)  # Reset file pointer
+        buffer = open(destination, "wb") if destination else None
+        try:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                size += len(chunk)
+                if buffer:
+                    buffer.write(chunk)
+        finally:
+            if buffer:
+                buffer.close()
+        return size, digest.hexdigest()
+
+    async def get_stored_files(self, session_id: str) -> list:
+        """Get list of stored files for a session"""
+        # A catalog query; kept off the event loop
+        return await asyncio.to_thread(self._list_session, session_id)
+
+    def _list_session(self, session_id: str) -> list:
+        return [
+            {
+                "filename": entry["filename"],
+                "path": entry["path"],
+                "size": entry["size"],
+                "content_type": entry["content_type"],
+                "sha256": entry["sha256"],
+                "created": datetime.fromtimestamp(entry["created"]).isoformat()
+            }
+            for entry in self.catalog.list_session(session_id)
+        ]
+
+    async def find_stored_file(self, session_id: str, filename: str) -> Optional[str]:
+        """Resolve a file stored via /api/upload by session id and original filename"""
+        # Reject anything that could step outside the upload directory
+        if os.path.basename(session_id) != session_id or os.path.basename(filename) != filename:
+            return None
+
+        with span("storage_lookup"):
+            return await asyncio.to_thread(self._find_latest, session_id, filename)
+
+    def _find_latest(self, session_id: str, filename: str) -> Optional[str]:
+        # The latest upload of that name wins
+        path = self.catalog.find_latest(session_id, filename)
+        if path is None:
+            return None
+        try:
+            os.utime(path)  # Shared with the blob: marks it recently used
+        except OSError:
+            return None
+        return path
 
     def delete_session_files(self, session_id: str) -> bool:
         """Delete all files for a session"""
         session_dir = os.path.join(self.upload_dir, session_id)
         if os.path.exists(session_dir):
             try:
+                self.catalog.remove_session(session_id)
                 shutil.rmtree(session_dir)
                 return True
             except Exception:
                 return False
         return False
 
-    def cleanup_old_files(self, days_old: int = 30):
-        """Clean up files older than specified days (for future caching implementation)"""
-        # Placeholder for future implementation
-        # This would be used to clean up old stored files periodically
-        pass
\ No newline at end of file
+    def cleanup_old_files(self, days_old: Optional[float] = None) -> Dict[str, int]:
+        """
+        Drop session references older than days_old (default UPLOAD_RETENTION_DAYS),
+        delete blobs nothing references any more, then evict the least recently
+        used blobs - with their references - until the store fits UPLOAD_MAX_BYTES.
+        """
+        days_old = self.retention_days if days_old is None else days_old
+        cutoff = datetime.now() - timedelta(days=days_old)
+        stats = {"references_removed": 0, "blobs_removed": 0, "bytes_freed": 0}
+
+        expired = self.catalog.older_than(cutoff.timestamp())
+        for entry in expired:
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+        self.catalog.remove_paths([entry["path"] for entry in expired])
+        stats["references_removed"] += len(expired)
+
+        for session_id in {entry["session_id"] for entry in expired}:
+            session_dir = os.path.join(self.upload_dir, session_id)
+            if (os.path.isdir(session_dir) and not os.listdir(session_dir)
+                    and time.time() - os.path.getmtime(session_dir) > ORPHAN_GRACE_SECONDS):
+                os.rmdir(session_dir)
+
+        now = time.time()
+        blobs = []
+        total_bytes = 0
+        for root, _, names in os.walk(self.blob_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                if now - stat.st_mtime < ORPHAN_GRACE_SECONDS:
+                    total_bytes += stat.st_size
+                elif os.path.basename(root) == "tmp" or not self._referenced(name, stat):
+                    # Abandoned partial upload or unreferenced blob
+                    self._remove_blob(path, stat.st_size, stats)
+                else:
+                    total_bytes += stat.st_size
+                    blobs.append((stat.st_mtime, path, stat.st_size))
+
+        for _, path, size in sorted(blobs):
+            if total_bytes <= self.max_bytes:
+                break
+            references = self.catalog.find_by_hash(os.path.basename(path))
+            for reference in references:
+                try:
+                    os.remove(reference["path"])
+                except OSError:
+                    pass
+            self.catalog.remove_paths([reference["path"] for reference in references])
+            stats["references_removed"] += len(references)
+            self._remove_blob(path, size, stats)
+            total_bytes -= size
+
+        return stats
+
+    def _referenced(self, sha256: str, stat: os.stat_result) -> bool:
+        """
+        Whether a session still uses a blob: another hard link or a catalog row.
+        The link count alone is not enough, since without hard links session
+        files are copies and every blob has a link count of 1
+        """
+        return stat.st_nlink > 1 or bool(self.catalog.find_by_hash(sha256))
+
+    @staticmethod
+    def _remove_blob(path: str, size: int, stats: Dict[str, int]):
+        try:
+            os.remove(path)
+            stats["blobs_removed"] += 1
+            stats["bytes_freed"] += size
+        except OSError:
+            pass
+
+    async def _sweep_loop(self):
+        while True:
+            # With several server processes only one sweeps; the others take over if it exits
+            if self._sweep_lock is None:
+                self._sweep_lock = try_lock(self.catalog.db_path + ".sweep.lock")
+            if self._sweep_lock is None:
+                await asyncio.sleep(self.sweep_interval)
+                continue
+            try:
+                stats = await asyncio.to_thread(self.cleanup_old_files)
+                if stats["references_removed"] or stats["blobs_removed"]:
+                    logger.info("Upload sweep: %s", stats)
+            except Exception:
+                logger.exception("Upload sweep failed")
+            await asyncio.sleep(self.sweep_interval)
@@ -0,0 +1,94 @@
+import os
+import asyncio
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional, Tuple
+
+from dotenv import load_dotenv
+from services.metrics import METRICS
+
+load_dotenv()
+
+
+def _init_worker(niceness: int):
+    # Below the server processes, so request handling wins the CPU over a backlog of huge images
+    if niceness and hasattr(os, "nice"):
+        os.nice(niceness)
+
+
+def _ready(modules: Tuple[str, ...]) -> int:
+    for module in modules:
+        importlib.import_module(module)
+    return os.getpid()
+
+
+class WorkerPool:
+    """
+    Process pool for CPU-bound image work (decoding, resizing, re-encoding)
+    shared by every request in this server process. Work sent here runs in
+    parallel and outside this process's GIL, so one huge drawing cannot
+    stall the event loop for every other client.
+    CPU_WORKERS=0 runs the same work in threads instead. Workers run at
+    CPU_WORKERS_NICE lower priority than the server. Inputs smaller than
+    CPU_POOL_MIN_BYTES also stay in a thread: shipping them to a worker costs
+    about as much as the work, and they would queue behind huge ones.
+    """
+
+    def __init__(self, preload: Tuple[str, ...] = ()):
+        self.size = int(os.getenv("CPU_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self.niceness = int(os.getenv("CPU_WORKERS_NICE", "10"))
+        self.min_bytes = int(os.getenv("CPU_POOL_MIN_BYTES", str(1024 * 1024)))
+        self.preload = preload
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.in_flight = 0
+
+        METRICS.gauge("columbus_cpu_pool_in_flight", "CPU-bound tasks queued or running in the worker pool",
+                      function=lambda: self.in_flight)
+
+    async def start(self):
+        """
+        Start the worker processes and import the preload modules in each, so
+        the first large uploads do not pay for it
+        """
+        if self.size > 0:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            await asyncio.gather(*(loop.run_in_executor(executor, _ready, self.preload) for _ in range(self.size)))
+
+    async def stop(self):
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, True, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn rather than fork: the server process has threads, which fork does not copy safely
+            self._executor = ProcessPoolExecutor(
+                self.size,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.niceness,)
+            )
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args, input_bytes: Optional[int] = None) -> Any:
+        """
+        fn(*args) in a worker process; fn, its arguments and its result must be
+        picklable. input_bytes is the size of the data fn works on, if known.
+        """
+        self.in_flight += 1
+        try:
+            if self.size <= 0 or (input_bytes is not None and input_bytes < self.min_bytes):
+                return await asyncio.to_thread(fn, *args)
+            executor = self._get_executor()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); the next call starts a fresh pool
+                if self._executor is executor:
+                    self._executor = None
+                raise
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,112 @@
+"""
+Shared fixtures for the backend tests: the local OpenAI stub from
+benchmarks/stub_openai.py, and backend server processes (uvicorn CLI)
+answering from it with all their files in the test's temporary directory.
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks")
+sys.path[:0] = [BACKEND_DIR, BENCHMARKS_DIR]
+
+from stub_openai import StubServer  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Backend:
+    """
+    A backend server process. Relative data paths (uploads, blobs, catalog,
+    jobs) resolve inside workdir, so restart() comes back to the same data.
+    """
+
+    def __init__(self, workdir: str, openai_base_url: str, **env: str):
+        self.workdir = workdir
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = {
+            **os.environ,
+            "OPENAI_BASE_URL": openai_base_url,
+            "OPENAI_API_KEY": "stub",
+            # No client-side rate limits unless a test sets them: the stub does not enforce any
+            "OPENAI_RPM": "0",
+            "OPENAI_TPM": "0",
+            "CPU_WORKERS": "0",
+            "UPLOAD_SWEEP_INTERVAL": "0",
+            **env
+        }
+        self.process: subprocess.Popen = None
+
+    def start(self) -> "Backend":
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR,
+             "--port", str(self.port), "--log-level", "warning"],
+            cwd=self.workdir, env=self.env
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                httpx.get(f"{self.url}/api/health", timeout=1).raise_for_status()
+                return self
+            except httpx.HTTPError:
+                if self.process.poll() is not None:
+                    break
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("Backend did not start")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(30)
+
+    def restart(self) -> "Backend":
+        self.stop()
+        return self.start()
+
+
+@pytest.fixture
+def stub():
+    with StubServer(port=free_port(), latency=0.2) as server:
+        yield server
+
+
+@pytest.fixture
+def stub_server():
+    """Call with StubServer options for a throttling or failing stub: stub_server(rpm=2, window=1)"""
+    servers = []
+
+    def start(latency: float = 0.05, **throttling) -> StubServer:
+        server = StubServer(port=free_port(), latency=latency, **throttling).__enter__()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.__exit__(None, None, None)
+
+
+@pytest.fixture
+def backend(tmp_path, stub):
+    """Call with env overrides to start a backend: backend(JOB_CONCURRENCY="1")"""
+    started = []
+
+    def start(**env: str) -> Backend:
+        server = Backend(str(tmp_path), stub.base_url, **env).start()
+        started.append(server)
+        return server
+
+    yield start
+    for server in started:
+        server.stop()
@@ -6,7 +6,8 @@ export interface UploadedFile {
   size: number;
   stored: boolean;
   path?: string;
-  content?: ArrayBuffer;
+  content_id: string; // SHA-256 of the file content
+  deduplicated?: boolean;
 }
 
 export interface UploadResponse {
@@ -21,17 +22,78 @@ export interface ImageData {
   content_type: string;
 }
 
+export interface ImageRef {
+  session_id: string;
+  filename: string;
+}
+
 export interface ChatRequest {
   prompt: string;
   images?: ImageData[];
+  image_refs?: ImageRef[];
   template?: string;
   session_id?: string;
+  use_cache?: boolean;
+  preprocess?: boolean;
+  tiling?: boolean;
 }
 
 export interface ChatResponse {
   response: string;
   session_id?: string;
   timestamp: string;
+  cached?: boolean;
+  preprocessing?: PreprocessingStats;
+  tiling?: TilingStats;
+}
+
+export interface PreprocessingStats {
+  images: number;
+  cache_hits: number;
+  original_bytes: number;
+  processed_bytes: number;
+  bytes_saved: number;
+  estimated_tokens_before: number;
+  estimated_tokens_after: number;
+  estimated_tokens_saved: number;
+}
+
+export interface TileDimension {
+  drawing: string;
+  value: string;
+  tolerance: string | null;
+  kind: string;
+  feature: string;
+  x: number;
+  y: number;
+  tiles: number[];
+}
+
+export interface TilingStats {
+  drawings: number;
+  tiles: number;
+  unreadable_tiles: number;
+  dimensions: TileDimension[];
+}
+
+export interface ChatStreamDone {
+  session_id?: string;
+  timestamp: string;
+  usage?: { prompt_tokens: number; completion_tokens: number; total_tokens: number };
+  timing: { time_to_first_token?: number; total_time: number };
+  cached: boolean;
+  preprocessing?: PreprocessingStats;
+  tiling?: TilingStats;
+}
+
+export interface JobProgress {
+  job_id: string;
+  status: string;
+  created: string;
+  updated: string;
+  total: number;
+  counts: Record<string, number>;
+  progress: number;
 }
 
 class ApiService {
@@ -45,8 +107,22 @@ class ApiService {
 
   async uploadFiles(files: FileList, storeFiles: boolean = false): Promise<UploadResponse> {
     const formData = new FormData();
+    let toSend = Array.from(files);
+
+    // Skip the transfer for content the server already stores; only the hash is sent
+    if (storeFiles) {
+      const hashes = await Promise.all(toSend.map(file => this.sha256(file)));
+      const { present } = await this.checkBlobs(hashes);
+      const known = toSend
+        .map((file, index) => ({ filename: file.name, content_type: file.type, sha256: hashes[index] }))
+        .filter(entry => present.includes(entry.sha256));
+      toSend = toSend.filter((_, index) => !present.includes(hashes[index]));
+      if (known.length > 0) {
+        formData.append('known_files', JSON.stringify(known));
+      }
+    }
 
-    Array.from(files).forEach(file => {
+    toSend.forEach(file => {
       formData.append('files', file);
     });
     formData.append('store_files', storeFiles.toString());
@@ -64,6 +140,29 @@ class ApiService {
     return await response.json();
   }
 
+  async checkBlobs(hashes: string[]): Promise<{ present: string[]; missing: string[] }> {
+    const response = await fetch(`${API_BASE_URL}/blobs/check`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ hashes }),
+    });
+
+    if (!response.ok) {
+      throw new Error('Blob check failed');
+    }
+
+    return await response.json();
+  }
+
+  private async sha256(file: File): Promise<string> {
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest))
+      .map(byte => byte.toString(16).padStart(2, '0'))
+      .join('');
+  }
+
   async chat(request: ChatRequest): Promise<ChatResponse> {
     const response = await fetch(`${API_BASE_URL}/chat`, {
       method: 'POST',
@@ -81,6 +180,101 @@ class ApiService {
     return await response.json();
   }
 
+  // Streams the analysis over server-sent events; onDelta fires for every chunk of text
+  // Pass files to send them as binary multipart parts instead of base64 JSON
+  async chatStream(
+    request: ChatRequest,
+    onDelta: (content: string) => void,
+    files?: File[]
+  ): Promise<ChatStreamDone> {
+    const response = await fetch(`${API_BASE_URL}/chat/stream`, files ? {
+      method: 'POST',
+      body: this.buildChatFormData(request, files),
+    } : {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(request),
+    });
+
+    if (!response.ok || !response.body) {
+      const error = await response.json();
+      throw new Error(error.detail || 'Chat request failed');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Events are separated by a blank line
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let eventName = 'message';
+        let data = '';
+        for (const line of rawEvent.split('\n')) {
+          if (line.startsWith('event: ')) eventName = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        }
+
+        const payload = JSON.parse(data);
+        if (eventName === 'delta') onDelta(payload.content);
+        else if (eventName === 'done') return payload as ChatStreamDone;
+        else if (eventName === 'error') throw new Error(payload.detail || 'Chat request failed');
+      }
+    }
+
+    throw new Error('Stream ended unexpectedly');
+  }
+
+  buildChatFormData(request: ChatRequest, files: File[]): FormData {
+    const formData = new FormData();
+    formData.append('prompt', request.prompt);
+    if (request.template) formData.append('template', request.template);
+    if (request.session_id) formData.append('session_id', request.session_id);
+    if (request.use_cache !== undefined) formData.append('use_cache', request.use_cache.toString());
+    if (request.preprocess !== undefined) formData.append('preprocess', request.preprocess.toString());
+    if (request.tiling !== undefined) formData.append('tiling', request.tiling.toString());
+    if (request.image_refs?.length) formData.append('image_refs', JSON.stringify(request.image_refs));
+    files.forEach(file => formData.append('images', file));
+    return formData;
+  }
+
+  async createJob(files: File[], prompt: string, template?: string): Promise<JobProgress> {
+    const formData = new FormData();
+    files.forEach(file => formData.append('files', file));
+    formData.append('prompt', prompt);
+    if (template) formData.append('template', template);
+
+    const response = await fetch(`${API_BASE_URL}/jobs`, {
+      method: 'POST',
+      body: formData,
+    });
+
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.detail || 'Job creation failed');
+    }
+
+    return await response.json();
+  }
+
+  async getJob(jobId: string): Promise<JobProgress> {
+    const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`);
+    if (!response.ok) {
+      throw new Error('Job lookup failed');
+    }
+    return await response.json();
+  }
+
   // Helper function to convert File to base64 ImageData
   async fileToImageData(file: File): Promise<ImageData> {
     return new Promise((resolve, reject) => {
@@ -0,0 +1,99 @@
+"""
+/api/chat request parsing against a backend process: JSON with base64
+images, multipart with binary image parts, image_refs resolving to files
+stored through /api/upload, and the 4xx answers for malformed requests.
+"""
+import base64
+import io
+import json
+
+import httpx
+import pytest
+from PIL import Image
+
+PROMPT = "List all dimensions"
+
+
+def _png(width: int = 600) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", (width, 400), 255).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def server(stub_server, backend):
+    """A backend whose stub charges for prompt tokens, so usage shows which images reached the upstream"""
+    charging = stub_server(seconds_per_input_token=1e-9)
+    return backend(OPENAI_BASE_URL=charging.base_url)
+
+
+def _form(**fields) -> list:
+    """Form fields as multipart parts, so a form without images is still multipart/form-data"""
+    return [(name, (None, value)) for name, value in fields.items()]
+
+
+def _prompt_tokens(response: httpx.Response) -> int:
+    assert response.status_code == 200, response.text
+    return response.json()["usage"]["prompt_tokens"]
+
+
+def test_json_and_multipart_send_the_same_images(server):
+    png = _png()
+    text_only = _prompt_tokens(httpx.post(f"{server.url}/api/chat", json={"prompt": PROMPT, "use_cache": False}))
+
+    as_json = httpx.post(f"{server.url}/api/chat", timeout=30, json={
+        "prompt": PROMPT,
+        "use_cache": False,
+        "images": [{"filename": "a.png", "content_type": "image/png", "content": base64.b64encode(png).decode()}]
+    })
+    as_multipart = httpx.post(f"{server.url}/api/chat", timeout=30,
+                              data={"prompt": PROMPT, "use_cache": "false", "session_id": "session-a"},
+                              files=[("images", ("a.png", png, "image/png"))])
+
+    assert _prompt_tokens(as_json) == _prompt_tokens(as_multipart) > text_only
+    assert as_multipart.json()["session_id"] == "session-a"
+
+
+def test_image_refs_resolve_to_stored_uploads(server):
+    png = _png()
+    upload = httpx.post(f"{server.url}/api/upload", data={"store_files": "true"},
+                        files=[("files", ("stored.png", png, "image/png"))], timeout=30).json()
+    ref = {"session_id": upload["session_id"], "filename": "stored.png"}
+
+    inline = _prompt_tokens(httpx.post(f"{server.url}/api/chat", data={"prompt": PROMPT, "use_cache": "false"},
+                                       files=[("images", ("a.png", png, "image/png"))], timeout=30))
+    # Referenced from JSON and from a multipart form alike
+    by_json = httpx.post(f"{server.url}/api/chat", json={"prompt": PROMPT, "use_cache": False, "image_refs": [ref]},
+                         timeout=30)
+    by_form = httpx.post(f"{server.url}/api/chat", timeout=30,
+                         files=_form(prompt=PROMPT, use_cache="false", image_refs=json.dumps([ref])))
+    assert _prompt_tokens(by_json) == _prompt_tokens(by_form) == inline
+
+    missing = httpx.post(f"{server.url}/api/chat", timeout=30,
+                         json={"prompt": PROMPT, "image_refs": [dict(ref, filename="other.png")]})
+    assert missing.status_code == 404
+    escaping = httpx.post(f"{server.url}/api/chat", timeout=30,
+                          json={"prompt": PROMPT, "image_refs": [dict(ref, session_id="../uploads")]})
+    assert escaping.status_code == 404
+
+
+@pytest.mark.parametrize("request_kwargs", [
+    {"content": b"{not json", "headers": {"content-type": "application/json"}},
+    {"json": {"images": []}},
+    {"json": {"prompt": PROMPT, "images": [{"filename": "a.png"}]}},
+    {"json": {"prompt": PROMPT, "image_refs": [{"filename": "a.png"}]}},
+    {"files": _form(template="technical")},
+    {"files": _form(prompt=PROMPT, image_refs="not json")},
+    {"files": _form(prompt=PROMPT, image_refs=json.dumps([{"session_id": "s"}]))},
+], ids=["bad-json", "no-prompt", "image-fields", "ref-fields", "form-no-prompt", "form-refs-json", "form-ref-fields"])
+def test_malformed_requests_are_422(backend, request_kwargs):
+    server = backend()
+    response = httpx.post(f"{server.url}/api/chat", timeout=30, **request_kwargs)
+    assert response.status_code == 422, response.text
+
+
+def test_non_image_parts_are_rejected(backend):
+    server = backend()
+    response = httpx.post(f"{server.url}/api/chat", data={"prompt": PROMPT},
+                          files=[("images", ("notes.txt", b"text", "text/plain"))], timeout=30)
+    assert response.status_code == 400 and "notes.txt" in response.json()["detail"]
@@ -0,0 +1,58 @@
+"""
+/api/chat/stream against the local OpenAI stub: `delta` events carrying
+the answer as it streams, then one `done` event, or an in-band `error`
+event once the response has started and the upstream call fails.
+"""
+import json
+
+import httpx
+
+from stub_openai import STUB_TEXT
+
+PAYLOAD = {"prompt": "List all dimensions", "images": []}
+
+
+def _events(base_url: str, payload: dict) -> list:
+    """(event, data) pairs of one streamed response"""
+    events = []
+    with httpx.stream("POST", f"{base_url}/api/chat/stream", json=payload, timeout=30) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+
+def test_stream_sends_deltas_then_done(backend):
+    server = backend()
+    events = _events(server.url, dict(PAYLOAD, use_cache=False, session_id="session-a"))
+
+    names = [event for event, _ in events]
+    assert names == ["delta"] * (len(names) - 1) + ["done"] and len(names) > 2
+    assert "".join(data["content"] for event, data in events[:-1]) == STUB_TEXT
+    done = events[-1][1]
+    assert done["session_id"] == "session-a" and not done["cached"]
+    assert done["usage"]["completion_tokens"] > 0
+    assert done["timing"]["time_to_first_token"] <= done["timing"]["total_time"]
+
+
+def test_cached_stream_replays_one_delta(backend):
+    server = backend()
+    _events(server.url, PAYLOAD)
+    events = _events(server.url, PAYLOAD)
+    assert [event for event, _ in events] == ["delta", "done"]
+    assert events[0][1]["content"] == STUB_TEXT and events[1][1]["cached"]
+
+
+def test_upstream_failure_is_an_error_event(stub_server, backend):
+    failing = stub_server(error_rate=1.0)
+    server = backend(OPENAI_BASE_URL=failing.base_url, OPENAI_MAX_RETRIES="1", OPENAI_RETRY_BASE_DELAY="0.01")
+
+    events = _events(server.url, dict(PAYLOAD, use_cache=False))
+    assert [event for event, _ in events] == ["error"]
+    assert "503" in events[0][1]["detail"]
+    assert failing.app.state.requests == 2
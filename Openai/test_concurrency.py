@@ -0,0 +1,54 @@
+"""
+Concurrent /api/chat calls against the local OpenAI stub: they must wait
+on the upstream together, not one after another, and /api/health must keep
+answering meanwhile. This holds with the shipped request limit, but not with
+the shipped OPENAI_TPM (30000), whose burst admits only a few calls at once;
+the test lifts that limit as a deployment with a real account limit would.
+"""
+import asyncio
+import time
+
+import httpx
+
+REQUESTS = 20
+PAYLOAD = {"prompt": "List all dimensions", "images": [], "use_cache": False}
+
+
+async def _load(base_url: str):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        start = time.perf_counter()
+        (await client.post("/api/chat", json=PAYLOAD)).raise_for_status()
+        single = time.perf_counter() - start
+
+        health_latencies = []
+        done = asyncio.Event()
+
+        async def probe_health():
+            while not done.is_set():
+                probe = time.perf_counter()
+                (await client.get("/api/health")).raise_for_status()
+                health_latencies.append(time.perf_counter() - probe)
+                await asyncio.sleep(0.05)
+
+        prober = asyncio.create_task(probe_health())
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.post("/api/chat", json=PAYLOAD) for _ in range(REQUESTS)))
+        concurrent = time.perf_counter() - start
+        done.set()
+        await prober
+    return single, concurrent, responses, health_latencies
+
+
+def test_concurrent_chat_takes_about_one_call(stub, backend):
+    stub.app.state.latency = 0.5
+    server = backend(OPENAI_MAX_CONCURRENCY=str(REQUESTS), OPENAI_INITIAL_CONCURRENCY=str(REQUESTS),
+                     OPENAI_RPM="500", OPENAI_TPM="0")
+    requests_before = stub.app.state.requests
+
+    single, concurrent, responses, health_latencies = asyncio.run(_load(server.url))
+
+    assert [response.status_code for response in responses] == [200] * REQUESTS
+    # Every call really went upstream: nothing was answered from the response cache
+    assert stub.app.state.requests - requests_before == REQUESTS + 1
+    assert concurrent < 2 * single, f"{REQUESTS} concurrent calls took {concurrent:.2f}s, one took {single:.2f}s"
+    assert health_latencies and max(health_latencies) < stub.app.state.latency
@@ -0,0 +1,79 @@
+"""DrawingTiler: tile plans, reading structured tile answers and merging overlapping readings"""
+import json
+
+from services.drawing_tiler import DrawingTiler, plan_tiles
+
+LEFT, RIGHT = (0, 0, 768, 768), (653, 0, 1421, 768)
+
+
+def _answer(*dimensions: dict) -> str:
+    return json.dumps({"dimensions": list(dimensions)})
+
+
+def _dim(value: str, x: float, y: float, tolerance: str = "0.002", kind: str = "diameter") -> dict:
+    return {"value": value, "tolerance": tolerance, "kind": kind, "feature": "bore", "x": x, "y": y}
+
+
+def test_plan_tiles_grows_tiles_to_the_limit():
+    boxes = plan_tiles(6800, 4400, 768, 0.15, 16)
+    assert len(boxes) <= 16
+    assert boxes[0][:2] == (0, 0) and boxes[-1][2:] == (6800, 4400)
+    assert plan_tiles(600, 400, 768, 0.15, 16) == [(0, 0, 600, 400)]
+
+
+def test_read_tile_positions_on_the_page():
+    readings = DrawingTiler.read_tile(_answer(_dim("2.490", 0.5, 0.25), _dim("1.0", 1.4, -1, tolerance=None)), RIGHT)
+    assert [(reading["x"], reading["y"]) for reading in readings] == [(1037, 192), (1421, 0)]
+    assert readings[1]["tolerance"] is None
+
+
+def test_read_tile_rejects_answers_off_the_schema():
+    bad_answers = [
+        "not json",
+        json.dumps({"callouts": []}),
+        json.dumps({"dimensions": ["2.490"]}),
+        _answer({"value": "2.490", "x": 0.5, "y": 0.5}),
+        _answer(dict(_dim("2.490", 0.5, 0.5), value=2.49)),
+        _answer(dict(_dim("2.490", 0.5, 0.5), tolerance=0.002)),
+        _answer(dict(_dim("2.490", 0.5, 0.5), x="left")),
+        # One bad dimension among good ones still makes the tile unreadable
+        _answer(_dim("1.0", 0.1, 0.1), {"value": "2.490", "tolerance": None, "x": 0.5, "y": 0.5})
+    ]
+    assert [DrawingTiler.read_tile(answer, LEFT) for answer in bad_answers] == [None] * len(bad_answers)
+
+
+def test_merge_overlapping_readings(monkeypatch):
+    monkeypatch.delenv("TILE_SIZE", raising=False)
+    monkeypatch.delenv("TILE_MERGE_DISTANCE", raising=False)
+    tiler = DrawingTiler()
+    left = tiler.read_tile(_answer(_dim("2.490", 0.92, 0.5), _dim("1.000", 0.1, 0.1, tolerance=None, kind="linear")), LEFT)
+    right = tiler.read_tile(_answer(_dim("2.49", 0.08, 0.51, tolerance="±.002")), RIGHT)
+
+    merged = tiler.merge([(0, LEFT, left), (1, RIGHT, right)])
+    assert [(dim["value"], dim["tiles"]) for dim in merged] == [("2.490", [0, 1]), ("1.000", [0])]
+    # Two equal callouts in one tile stay two
+    assert len(tiler.merge([(0, LEFT, left + left)])) == 4
+
+
+def test_merge_distance_follows_grown_tiles(monkeypatch):
+    monkeypatch.delenv("TILE_SIZE", raising=False)
+    monkeypatch.delenv("TILE_MERGE_DISTANCE", raising=False)
+    tiler = DrawingTiler()
+    # Tiles grown to 1200px for a large drawing: readings 100px apart are one callout, 180px apart two
+    grown_left, grown_right = (0, 0, 1200, 1200), (1020, 0, 2220, 1200)
+    left = tiler.read_tile(_answer(_dim("2.490", 0.95, 0.5)), grown_left)
+    near = tiler.read_tile(_answer(_dim("2.490", 1 / 6, 0.5)), grown_right)
+    far = tiler.read_tile(_answer(_dim("2.490", 0.25, 0.5)), grown_right)
+
+    assert [dim["tiles"] for dim in tiler.merge([(0, grown_left, left), (1, grown_right, near)])] == [[0, 1]]
+    assert len(tiler.merge([(0, grown_left, left), (1, grown_right, far)])) == 2
+
+
+def test_format_dimensions_keeps_asymmetric_tolerances():
+    dims = [dict(_dim("2.490", 10, 20, tolerance=tolerance), drawing="a.png")
+            for tolerance in ("0.002", "±.002", "+0.002/-0.001", "H7", None)]
+    lines = DrawingTiler.format_dimensions(dims).splitlines()[3:]
+    assert [line.split(" (")[0] for line in lines] == [
+        "- 2.490 ±0.002", "- 2.490 ±.002", "- 2.490 +0.002/-0.001", "- 2.490 H7", "- 2.490"
+    ]
+    assert lines[0] == "- 2.490 ±0.002 (diameter) - bore [a.png @ 10,20]"
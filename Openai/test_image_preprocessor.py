@@ -0,0 +1,73 @@
+"""ImagePreprocessor through GPTService.process_chat: what reaches the upstream call, the stats and the cache key"""
+import asyncio
+import base64
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from services.gpt_service import GPTService
+from services.image_payload import ImagePayload
+
+
+def _drawing() -> bytes:
+    """A large RGB scan with wide white margins: cropped and shrunk by the defaults"""
+    image = Image.new("RGB", (3000, 2000), "white")
+    ImageDraw.Draw(image).rectangle((1000, 600, 1600, 1400), outline="black", width=6)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def service(monkeypatch):
+    for name, value in {"CPU_WORKERS": "0", "PREPROCESS_ENABLED": "false", "PLANNING_ENABLED": "false",
+                        "TILING_ENABLED": "false", "OPENAI_API_KEY": "test"}.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv("RESPONSE_CACHE_DIR", raising=False)
+    service = GPTService()
+    service.sent = []
+
+    async def complete(messages, plan, **params):
+        service.sent.append([part["image_url"]["url"] for part in messages[0]["content"] if part["type"] == "image_url"])
+        return "ok", None
+
+    monkeypatch.setattr(service, "_complete", complete)
+    yield service
+    asyncio.run(service.close())
+
+
+def _sent_bytes(data_url: str) -> bytes:
+    return base64.b64decode(data_url.split(",", 1)[1])
+
+
+def test_preprocess_false_sends_the_bytes_untouched(service):
+    original = _drawing()
+    result = asyncio.run(service.process_chat("List all dimensions", [ImagePayload("a.png", "image/png", data=original)],
+                                              preprocess=False))
+    assert result["preprocessing"] is None
+    assert service.sent[0][0].startswith("data:image/png;base64,")
+    assert _sent_bytes(service.sent[0][0]) == original
+
+
+def test_preprocess_true_returns_stats_and_keys_the_cache(service):
+    original = _drawing()
+
+    async def chat(preprocess: bool):
+        return await service.process_chat("List all dimensions", [ImagePayload("a.png", "image/png", data=original)],
+                                          preprocess=preprocess)
+
+    processed = asyncio.run(chat(True))
+    stats = processed["preprocessing"]
+    assert stats["images"] == 1 and stats["cache_hits"] == 0
+    assert stats["original_bytes"] == len(original) > stats["processed_bytes"] == len(_sent_bytes(service.sent[0][0]))
+    assert stats["bytes_saved"] == stats["original_bytes"] - stats["processed_bytes"]
+    assert stats["estimated_tokens_before"] > stats["estimated_tokens_after"]
+    with Image.open(io.BytesIO(_sent_bytes(service.sent[0][0]))) as sent:
+        assert sent.size[0] < sent.size[1] < 2000  # Cropped to the drawing and shrunk
+
+    # The same prompt and image without preprocessing is a different cache entry, with preprocessing the same one
+    assert not asyncio.run(chat(False))["cached"]
+    assert _sent_bytes(service.sent[1][0]) == original
+    assert asyncio.run(chat(True))["cached"] and asyncio.run(chat(False))["cached"]
+    assert len(service.sent) == 2
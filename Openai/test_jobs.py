@@ -0,0 +1,87 @@
+"""
+Batch jobs (/api/jobs) against the local OpenAI stub: a job runs to the
+end, survives its server process being killed halfway, and cancelling it
+stops the items that have not started.
+"""
+import io
+import time
+
+import httpx
+from PIL import Image
+
+
+def _drawings(count: int) -> list:
+    files = []
+    for index in range(count):
+        buffer = io.BytesIO()
+        Image.new("L", (64 + index, 64), 255).save(buffer, "PNG")
+        files.append(("files", (f"drawing_{index}.png", buffer.getvalue(), "image/png")))
+    return files
+
+
+def _create_job(base_url: str, count: int) -> str:
+    response = httpx.post(f"{base_url}/api/jobs", data={"prompt": "List all dimensions", "use_cache": "false"},
+                          files=_drawings(count), timeout=30)
+    response.raise_for_status()
+    return response.json()["job_id"]
+
+
+def _wait(base_url: str, job_id: str, condition, timeout: float = 30) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        progress = httpx.get(f"{base_url}/api/jobs/{job_id}", timeout=5).json()
+        if condition(progress):
+            return progress
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} stuck at {progress}")
+
+
+def _results(base_url: str, job_id: str) -> list:
+    return httpx.get(f"{base_url}/api/jobs/{job_id}/results", timeout=5).json()["results"]
+
+
+def test_job_runs_every_item(backend):
+    server = backend()
+    job_id = _create_job(server.url, 3)
+
+    progress = _wait(server.url, job_id, lambda progress: progress["status"] == "completed")
+    assert progress["counts"]["done"] == 3 and progress["progress"] == 1.0
+    results = _results(server.url, job_id)
+    assert [result["filename"] for result in results] == ["drawing_0.png", "drawing_1.png", "drawing_2.png"]
+    assert all(result["status"] == "done" and result["response"] for result in results)
+
+
+def test_job_survives_a_killed_server(stub, backend):
+    stub.app.state.latency = 0.5
+    server = backend(JOB_CONCURRENCY="1")
+    job_id = _create_job(server.url, 4)
+    _wait(server.url, job_id, lambda progress: progress["counts"]["done"] >= 1)
+
+    # No shutdown hooks: the item in flight stays "running" in job.json
+    server.process.kill()
+    server.process.wait()
+    server.start()
+
+    progress = _wait(server.url, job_id, lambda progress: progress["status"] == "completed")
+    assert progress["counts"]["done"] == 4
+    assert [result["status"] for result in _results(server.url, job_id)] == ["done"] * 4
+
+
+def test_cancel_stops_pending_items(stub, backend):
+    stub.app.state.latency = 0.5
+    server = backend(JOB_CONCURRENCY="1")
+    requests_before = stub.app.state.requests
+    job_id = _create_job(server.url, 5)
+    _wait(server.url, job_id, lambda progress: progress["counts"]["running"] == 1)
+
+    response = httpx.delete(f"{server.url}/api/jobs/{job_id}", timeout=5)
+    response.raise_for_status()
+    assert response.json()["counts"]["cancelled"] == 4
+
+    # The running item finishes; nothing else goes upstream
+    progress = _wait(server.url, job_id, lambda progress: progress["counts"]["running"] == 0)
+    assert progress["status"] == "cancelled"
+    assert progress["counts"]["done"] == 1 and progress["counts"]["cancelled"] == 4
+    time.sleep(stub.app.state.latency)
+    assert stub.app.state.requests - requests_before == 1
+    assert [result["status"] for result in _results(server.url, job_id)] == ["done"] + ["cancelled"] * 4
@@ -0,0 +1,23 @@
+"""Prometheus text rendering: every series is labelled with the server process that owns it"""
+import os
+
+from services.metrics import MetricsRegistry
+
+
+def test_every_series_names_its_worker(monkeypatch):
+    monkeypatch.setenv("METRICS_ENABLED", "true")
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests", ("route",)).inc(route="/api/chat")
+    registry.gauge("in_flight", "In flight", function=lambda: 2)
+    registry.histogram("seconds", "Latency", buckets=(1,)).observe(0.5)
+
+    worker = f'worker="{os.getpid()}"'
+    samples = [line for line in registry.render().splitlines() if line and not line.startswith("#")]
+    assert samples == [
+        f'requests_total{{route="/api/chat",{worker}}} 1',
+        f"in_flight{{{worker}}} 2.0",
+        f'seconds_bucket{{{worker},le="1"}} 1',
+        f'seconds_bucket{{{worker},le="+Inf"}} 1',
+        f"seconds_sum{{{worker}}} 0.5",
+        f"seconds_count{{{worker}}} 1"
+    ]
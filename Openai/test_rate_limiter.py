@@ -0,0 +1,151 @@
+"""
+UpstreamScheduler against the local OpenAI stub (429 with Retry-After,
+503s, x-ratelimit-* headers) and the AIMD concurrency limit's latency model.
+"""
+import asyncio
+import random
+import time
+
+import httpx
+import openai
+import pytest
+
+from services import rate_limiter
+from services.rate_limiter import AIMDConcurrency, UpstreamError, UpstreamScheduler
+
+
+def _scheduler(monkeypatch, **env: str) -> UpstreamScheduler:
+    defaults = {"WORKERS": "1", "OPENAI_RPM": "0", "OPENAI_TPM": "0", "OPENAI_RETRY_BASE_DELAY": "0.05"}
+    for name, value in dict(defaults, **env).items():
+        monkeypatch.setenv(name, value)
+    return UpstreamScheduler()
+
+
+async def _call(client: openai.AsyncOpenAI, scheduler: UpstreamScheduler, estimated_tokens: int = 100):
+    raw, started = await scheduler.execute(
+        lambda: client.chat.completions.with_raw_response.create(
+            model="stub", messages=[{"role": "user", "content": "List all dimensions"}], max_tokens=100
+        ),
+        estimated_tokens
+    )
+    response = raw.parse()
+    await scheduler.finish(started, response.usage.completion_tokens)
+    return response
+
+
+def _run(base_url: str, calls) -> list:
+    async def run():
+        async with openai.AsyncOpenAI(api_key="stub", base_url=base_url, max_retries=0) as client:
+            return await asyncio.gather(*(call(client) for call in calls), return_exceptions=True)
+    return asyncio.run(run())
+
+
+def test_throttled_calls_wait_for_retry_after(monkeypatch, stub_server):
+    stub = stub_server(rpm=2, window=1.0)
+    scheduler = _scheduler(monkeypatch, OPENAI_RPM="6000")
+
+    start = time.perf_counter()
+    results = _run(stub.base_url, [lambda client: _call(client, scheduler)] * 4)
+    elapsed = time.perf_counter() - start
+
+    assert all(result.choices[0].message.content for result in results)
+    # Two calls fit the stub's window; the others were answered 429 and only retried once it reopened
+    assert scheduler.throttled == stub.app.state.throttled >= 1
+    assert scheduler.retries == scheduler.throttled
+    assert elapsed >= 0.9
+
+
+def test_failed_attempts_are_refunded_and_mapped_to_503(monkeypatch, stub_server):
+    stub = stub_server(error_rate=1.0)
+    # 1000 tokens of burst: without refunds the second attempt would wait seconds for its 800
+    scheduler = _scheduler(monkeypatch, OPENAI_TPM="6000", OPENAI_MAX_RETRIES="3")
+
+    start = time.perf_counter()
+    [error] = _run(stub.base_url, [lambda client: _call(client, scheduler, estimated_tokens=800)])
+
+    assert isinstance(error, UpstreamError)
+    assert (error.status_code, error.retry_after) == (503, 30)
+    assert stub.app.state.requests == 4 and scheduler.retries == 3
+    assert time.perf_counter() - start < 2
+    assert scheduler.tokens.tokens > scheduler.tokens.capacity - 50
+
+
+def test_client_errors_are_not_retried(monkeypatch, stub_server):
+    stub = stub_server()
+    scheduler = _scheduler(monkeypatch)
+
+    [error] = _run(stub.base_url.replace("/v1", "/missing"), [lambda client: _call(client, scheduler)])
+    assert isinstance(error, UpstreamError) and error.status_code == 502
+    assert scheduler.retries == 0
+
+    request = httpx.Request("POST", stub.base_url)
+    rejected = openai.BadRequestError("bad image", response=httpx.Response(400, request=request), body=None)
+    assert UpstreamScheduler._to_upstream_error(rejected, 400, None).status_code == 400
+
+
+def test_rate_limit_headers_sync_the_buckets(monkeypatch, stub_server):
+    stub = stub_server(rpm=50, window=60.0)
+    scheduler = _scheduler(monkeypatch, OPENAI_RPM="500")
+
+    _run(stub.base_url, [lambda client: _call(client, scheduler)])
+    assert scheduler.requests.per_minute == 50
+    assert scheduler.requests.tokens <= 49
+
+
+def test_backoff_is_jittered_and_capped(monkeypatch):
+    scheduler = _scheduler(monkeypatch, OPENAI_RETRY_BASE_DELAY="0.5", OPENAI_RETRY_MAX_DELAY="4")
+    random.seed(7)
+
+    for attempt in range(1, 6):
+        delays = [scheduler._backoff(attempt, None) for _ in range(50)]
+        assert all(0 <= delay <= min(4, 0.5 * 2 ** attempt) for delay in delays)
+        assert len(set(delays)) == 50
+    # Retry-After is a floor, plus up to one base delay of jitter
+    assert all(2 <= scheduler._backoff(1, 2) <= 2.5 for _ in range(50))
+    assert scheduler._backoff(1, 60) == 4
+
+
+def test_reservation_caps_the_output_estimate(monkeypatch):
+    scheduler = _scheduler(monkeypatch, OPENAI_OUTPUT_TOKEN_ESTIMATE="1000")
+    assert scheduler.reservation(1200, 4000) == 2200
+    assert scheduler.reservation(100, 300) == 400
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake monotonic clock for the limiter's once-per-round-trip decreases"""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _traffic(concurrency: AIMDConcurrency, clock: list, calls: list):
+    """Release (seconds, output tokens) calls one after another with the limit fully used"""
+    async def run():
+        for elapsed, tokens in calls:
+            clock[0] += elapsed
+            concurrency.in_flight = int(concurrency.limit)
+            await concurrency.release(elapsed, tokens)
+    asyncio.run(run())
+
+
+def test_mixed_answer_lengths_keep_the_limit(clock):
+    concurrency = AIMDConcurrency(initial=8, minimum=1, maximum=32)
+    rng = random.Random(3)
+    # 2s of overhead plus 7ms per token: a 4000-token answer takes 30s, a short tile read 2s
+    calls = [(rng.uniform(0.9, 1.1) * (2 + 0.007 * tokens), tokens)
+             for tokens in rng.choices([50, 200, 1000, 4000], k=200)]
+    _traffic(concurrency, clock, calls)
+    assert concurrency.limit >= 8
+    assert concurrency.latency.overhead == pytest.approx(2, rel=0.25)
+    assert concurrency.latency.per_token == pytest.approx(0.007, rel=0.25)
+
+
+def test_congestion_still_halves_the_limit(clock):
+    concurrency = AIMDConcurrency(initial=8, minimum=1, maximum=32)
+    _traffic(concurrency, clock, [(2 + 0.007 * tokens, tokens) for tokens in [50, 4000] * 20])
+    limit = concurrency.limit
+
+    # Upstream queueing: the same lengths now take three times as long
+    _traffic(concurrency, clock, [(3 * (2 + 0.007 * tokens), tokens) for tokens in [50, 4000] * 3])
+    assert concurrency.limit <= limit / 2
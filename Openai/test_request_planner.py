@@ -0,0 +1,82 @@
+"""RequestPlanner defaults, settings validation and the payloads it hands back"""
+import asyncio
+import io
+import tempfile
+
+from PIL import Image
+
+from services.image_payload import ImagePayload
+from services.request_planner import RequestPlanner
+from services.worker_pool import WorkerPool
+
+
+def _planner(monkeypatch, **env: str) -> RequestPlanner:
+    monkeypatch.delenv("PLANNING_ENABLED", raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return RequestPlanner(max_tokens=4000, temperature=0.7)
+
+
+def _unexpected(what: str):
+    def fail(*args):
+        raise AssertionError(f"{what} unexpectedly")
+    return fail
+
+
+def test_planning_is_opt_in(monkeypatch):
+    plan = _planner(monkeypatch).plan("List all dimensions", ["a.png"], [(6000, 4000)], "describe")
+    assert not plan["enabled"]
+    assert (plan["max_tokens"], plan["temperature"]) == (4000, 0.7)
+    assert plan["images"][0]["detail"] is None and plan["images"][0]["width"] == 6000
+
+    assert "estimated_latency" not in plan and "within_budget" not in plan
+
+    plan = _planner(monkeypatch, PLANNING_ENABLED="true").plan("List all dimensions", ["a.png"], [(6000, 4000)], "describe")
+    assert plan["enabled"] and plan["images"][0]["detail"] == "low" and "estimated_latency" in plan
+
+
+def test_disabled_planning_does_not_read_the_images(monkeypatch):
+    monkeypatch.setenv("CPU_WORKERS", "0")
+    planner = _planner(monkeypatch)
+    monkeypatch.setattr(planner, "image_size", _unexpected("sized an image"))
+    image = ImagePayload("a.png", "image/png", data=b"not read")
+
+    plan, images = asyncio.run(planner.prepare("List all dimensions", [image], "technical", WorkerPool()))
+    assert plan["images"][0]["width"] is None and images[0].detail is None
+
+
+def test_image_size_reads_only_the_header(monkeypatch):
+    planner = _planner(monkeypatch)
+    monkeypatch.setattr(ImagePayload, "read_bytes", _unexpected("copied the image"))
+    rotated = Image.new("RGB", (300, 200), "white")
+    exif = rotated.getexif()
+    exif[0x0112] = 6  # Rotated 90 degrees: upright it is 200 wide
+    buffer = io.BytesIO()
+    rotated.save(buffer, "JPEG", exif=exif)
+
+    with tempfile.NamedTemporaryFile(suffix=".jpg") as stored, tempfile.SpooledTemporaryFile() as spooled:
+        stored.write(buffer.getvalue())
+        stored.flush()
+        spooled.write(buffer.getvalue())
+        assert planner.image_size(ImagePayload("a.jpg", "image/jpeg", path=stored.name)) == (200, 300)
+        assert planner.image_size(ImagePayload("a.jpg", "image/jpeg", file=spooled)) == (200, 300)
+        assert spooled.tell() == 0  # Rewound for whoever reads the upload next
+
+
+def test_min_scale_above_one_keeps_the_full_view(monkeypatch):
+    planner = _planner(monkeypatch, PLANNING_ENABLED="true", PLAN_MIN_SCALE="1.5", PLAN_BUDGET_MIN_SCALE="2")
+    plan = planner.plan("List all dimensions", ["a.png"], [(6000, 4000)], "technical")
+    assert plan["images"][0]["detail"] == "high" and plan["images"][0]["scale"] == 1.0
+
+
+def test_prepare_leaves_the_callers_payload_alone(monkeypatch):
+    monkeypatch.setenv("CPU_WORKERS", "0")
+    planner = _planner(monkeypatch, PLANNING_ENABLED="true")
+    buffer = io.BytesIO()
+    Image.new("L", (300, 200), 255).save(buffer, "PNG")
+    image = ImagePayload("a.png", "image/png", data=buffer.getvalue())
+
+    _, planned = asyncio.run(planner.prepare("List all dimensions", [image], "technical", WorkerPool()))
+    assert planned[0].detail == "low" and planned[0] is not image
+    assert image.detail is None
+    assert planned[0].data_url() == image.data_url()
@@ -0,0 +1,120 @@
+"""
+ResponseCache single-flight (identical requests in flight share one
+computation), best-effort disk writes and DiskCache's byte accounting
+"""
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from services.cache_service import DiskCache, ResponseCache
+
+
+def _cache(monkeypatch, directory: str = None) -> ResponseCache:
+    monkeypatch.setenv("RESPONSE_CACHE_ENABLED", "true")
+    if directory:
+        monkeypatch.setenv("RESPONSE_CACHE_DIR", directory)
+    else:
+        monkeypatch.delenv("RESPONSE_CACHE_DIR", raising=False)
+    return ResponseCache()
+
+
+def test_identical_requests_share_one_computation(monkeypatch):
+    cache = _cache(monkeypatch)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute("key", compute) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert results == [("answer", False)] + [("answer", True)] * 4
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 4
+    assert asyncio.run(cache.get_or_compute("key", compute)) == ("answer", True)
+
+
+def test_cancelled_leader_hands_over_to_a_follower(monkeypatch):
+    cache = _cache(monkeypatch)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return f"answer {len(calls)}"
+
+    async def run():
+        leader = asyncio.create_task(cache.get_or_compute("key", compute))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(cache.get_or_compute("key", compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        return leader, results
+
+    leader, results = asyncio.run(run())
+    assert leader.cancelled()
+    # One follower computed again and the others waited on it
+    assert sorted(results) == [("answer 2", False), ("answer 2", True), ("answer 2", True)]
+    assert len(calls) == 2
+    assert cache.stats()["in_flight"] == 0
+
+
+def test_failure_reaches_every_waiter(monkeypatch):
+    cache = _cache(monkeypatch)
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        raise ValueError("upstream failed")
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute("key", compute) for _ in range(3)), return_exceptions=True)
+
+    assert [str(result) for result in asyncio.run(run())] == ["upstream failed"] * 3
+    assert cache.stats()["in_flight"] == 0
+
+
+def test_failed_disk_write_still_answers(monkeypatch, tmp_path, caplog):
+    cache = _cache(monkeypatch, str(tmp_path))
+
+    def disk_full(key, value):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(cache.disk, "set", disk_full)
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute("key", compute) for _ in range(3)))
+
+    with caplog.at_level("ERROR", logger="services.cache_service"):
+        assert asyncio.run(run()) == [("answer", False), ("answer", True), ("answer", True)]
+    assert "No space left on device" in caplog.text
+    assert cache.memory.get("key") == "answer"
+
+
+def test_disk_cache_counts_bytes_across_threads(tmp_path):
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # Switch threads as often as possible
+    disk = DiskCache(str(tmp_path), max_bytes=10 ** 9)
+
+    def touch(index: int):
+        # A lookup racing the write of the same new key adopts the entry from disk while set() indexes it
+        if index % 2:
+            disk.set(f"key-{index // 2}", "x" * index)
+        else:
+            disk.get(f"key-{index // 2}")
+
+    try:
+        with ThreadPoolExecutor(16) as pool:
+            list(pool.map(touch, range(20000)))
+    finally:
+        sys.setswitchinterval(switch_interval)
+    on_disk = sum(os.path.getsize(os.path.join(tmp_path, name)) for name in os.listdir(tmp_path))
+    assert len(disk) == 10000 and disk.total_bytes == on_disk
@@ -0,0 +1,208 @@
+"""
+StorageService blob store and upload catalog: rebuilding the catalog from
+disk, blobs shared between sessions, and the retention/quota sweeper.
+"""
+import asyncio
+import io
+import os
+import time
+
+import pytest
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+from services import storage_service as storage_module
+from services.storage_service import ORPHAN_GRACE_SECONDS, StorageService
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """StorageService factory; its relative uploads/blobs/catalog paths resolve in tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    for name in ("BLOB_DIR", "UPLOAD_CATALOG", "UPLOAD_RETENTION_DAYS", "UPLOAD_MAX_BYTES"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("UPLOAD_SWEEP_INTERVAL", "0")
+    services = []
+
+    def create(**env: str) -> StorageService:
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        service = StorageService()
+        services.append(service)
+        return service
+
+    yield create
+    for service in services:
+        service.catalog.close()
+
+
+def _upload(data: bytes, filename: str = "drawing.png") -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename=filename, headers=Headers({"content-type": "image/png"}))
+
+
+def _store(service: StorageService, data: bytes, session_id: str, filename: str = "drawing.png") -> dict:
+    return asyncio.run(service.store_file(_upload(data, filename), session_id))
+
+
+def _age(path: str, seconds: float):
+    """Backdate a file's mtime, e.g. past the orphan grace period"""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def _without_created(entries: list) -> list:
+    return sorted((dict(entry, created=None) for entry in entries), key=lambda entry: entry["path"])
+
+
+def test_identical_content_is_stored_once(storage):
+    service = storage()
+    first = _store(service, b"drawing-1", "session-a")
+    second = _store(service, b"drawing-1", "session-b", "copy.png")
+
+    assert not first["deduplicated"] and second["deduplicated"]
+    assert first["sha256"] == second["sha256"]
+    blob = service.blob_path(first["sha256"])
+    # One blob, two session references: its link count is the reference count
+    assert os.stat(blob).st_nlink == 3
+    assert os.path.samefile(first["path"], second["path"])
+    assert [entry["path"] for entry in service.catalog.find_by_hash(first["sha256"])] == [first["path"], second["path"]]
+
+
+def test_catalog_is_rebuilt_from_disk(storage):
+    service = storage()
+    stored = [_store(service, b"drawing-1", "session-a"), _store(service, b"drawing-2", "session-a", "other.png"),
+              _store(service, b"drawing-1", "session-b")]
+    listing = asyncio.run(service.get_stored_files("session-a"))
+    service.catalog.close()
+    os.remove(service.catalog.db_path)
+
+    rebuilt = storage()
+    assert len(rebuilt.catalog) == 3
+    # Rebuilt timestamps come from the file names, to the second, so compare everything else
+    assert _without_created(asyncio.run(rebuilt.get_stored_files("session-a"))) == _without_created(listing)
+    assert asyncio.run(rebuilt.find_stored_file("session-b", "drawing.png")) == stored[2]["path"]
+    assert {entry["sha256"] for entry in rebuilt.catalog.find_by_hash(stored[0]["sha256"])} == {stored[0]["sha256"]}
+
+
+def test_damaged_catalog_is_rebuilt(storage):
+    service = storage()
+    _store(service, b"drawing-1", "session-a")
+    service.catalog.close()
+    with open(service.catalog.db_path, "wb") as f:
+        f.write(b"not a database" * 100)
+
+    assert len(storage().catalog) == 1
+
+
+def test_failed_link_leaves_no_catalog_entry(storage, monkeypatch):
+    service = storage()
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(storage_module.os, "link", fail)
+    monkeypatch.setattr(storage_module.shutil, "copyfile", fail)
+    with pytest.raises(Exception, match="disk full"):
+        _store(service, b"drawing-1", "session-a")
+    assert len(service.catalog) == 0
+
+
+def test_blob_is_deleted_with_its_last_reference(storage):
+    service = storage()
+    first = _store(service, b"drawing-1", "session-a")
+    _store(service, b"drawing-1", "session-b")
+    blob = service.blob_path(first["sha256"])
+    _age(blob, ORPHAN_GRACE_SECONDS + 60)
+
+    assert service.delete_session_files("session-a")
+    assert service.cleanup_old_files()["blobs_removed"] == 0
+    assert os.path.exists(blob) and os.stat(blob).st_nlink == 2
+
+    assert service.delete_session_files("session-b")
+    stats = service.cleanup_old_files()
+    assert stats["blobs_removed"] == 1 and stats["bytes_freed"] == len(b"drawing-1")
+    assert not os.path.exists(blob) and len(service.catalog) == 0
+
+
+def test_copied_references_keep_their_blob(storage, monkeypatch):
+    """Without hard links session files are copies, so every blob has a link count of 1"""
+    def no_links(*args):
+        raise OSError("hard links not supported")
+
+    monkeypatch.setattr(storage_module.os, "link", no_links)
+    service = storage()
+    stored = _store(service, b"drawing-1", "session-a")
+    blob = service.blob_path(stored["sha256"])
+    _age(blob, ORPHAN_GRACE_SECONDS + 60)
+    assert os.stat(blob).st_nlink == 1
+
+    assert service.cleanup_old_files()["blobs_removed"] == 0
+    assert service.has_blob(stored["sha256"]) and _store(service, b"drawing-1", "session-b")["deduplicated"]
+
+    service.delete_session_files("session-a")
+    service.delete_session_files("session-b")
+    _age(blob, ORPHAN_GRACE_SECONDS + 60)
+    assert service.cleanup_old_files()["blobs_removed"] == 1 and not os.path.exists(blob)
+
+
+def test_linking_a_swept_blob_is_an_unknown_hash(storage):
+    service = storage()
+    stored = _store(service, b"drawing-1", "session-a")
+    os.remove(service.blob_path(stored["sha256"]))
+    os.remove(stored["path"])
+
+    assert service._link_blob(stored["sha256"], "session-b", "again.png", 9, "image/png") is None
+    assert asyncio.run(service.link_stored_blob(stored["sha256"], "session-b", "again.png")) is None
+    assert [entry["session_id"] for entry in service.catalog.find_by_hash(stored["sha256"])] == ["session-a"]
+    assert not os.path.exists(os.path.join(service.upload_dir, "session-b"))
+
+
+def test_recent_orphan_blobs_are_kept(storage):
+    """A blob written moments ago may be about to be linked: the grace period protects it"""
+    service = storage()
+    stored = _store(service, b"drawing-1", "session-a")
+    service.delete_session_files("session-a")
+    assert service.cleanup_old_files()["blobs_removed"] == 0
+    assert os.path.exists(service.blob_path(stored["sha256"]))
+
+
+def test_sweep_expires_old_references(storage):
+    service = storage()
+    old = _store(service, b"drawing-old", "session-a")
+    new = _store(service, b"drawing-new", "session-b")
+    with service.catalog._lock, service.catalog._conn:
+        service.catalog._conn.execute("UPDATE files SET created = ? WHERE path = ?", (time.time() - 40 * 86400, old["path"]))
+    _age(service.blob_path(old["sha256"]), ORPHAN_GRACE_SECONDS + 60)
+
+    stats = service.cleanup_old_files(days_old=30)
+    assert stats["references_removed"] == 1 and stats["blobs_removed"] == 1
+    assert not os.path.exists(old["path"]) and not os.path.exists(service.blob_path(old["sha256"]))
+    assert [entry["path"] for entry in asyncio.run(service.get_stored_files("session-b"))] == [new["path"]]
+
+
+def test_sweep_evicts_least_recently_used_over_quota(storage):
+    service = storage(UPLOAD_MAX_BYTES="150")
+    stored = [_store(service, bytes([index]) * 100, f"session-{index}") for index in range(3)]
+    for index, entry in enumerate(stored):
+        _age(service.blob_path(entry["sha256"]), ORPHAN_GRACE_SECONDS + 300 - index)
+
+    stats = service.cleanup_old_files()
+    # Only the most recently used blob fits; the others go with their references
+    assert stats["blobs_removed"] == 2 and stats["references_removed"] == 2
+    assert [os.path.exists(service.blob_path(entry["sha256"])) for entry in stored] == [False, False, True]
+    assert len(service.catalog) == 1
+
+
+def test_sweeper_runs_in_the_background(storage, caplog):
+    service = storage(UPLOAD_SWEEP_INTERVAL="0.05", UPLOAD_RETENTION_DAYS="0")
+    stored = _store(service, b"drawing-1", "session-a")
+
+    async def run():
+        await service.start()
+        await asyncio.sleep(0.3)
+        await service.stop()
+
+    with caplog.at_level("INFO", logger="services.storage_service"):
+        asyncio.run(run())
+    assert not os.path.exists(stored["path"])
+    assert any("Upload sweep" in record.message for record in caplog.records)
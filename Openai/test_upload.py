@@ -0,0 +1,89 @@
+"""
+Upload deduplication against a backend process: identical content is
+stored once, and a client that learns from /api/blobs/check that the server
+already holds a file links it by hash instead of sending it again.
+"""
+import hashlib
+import io
+import json
+import os
+
+import httpx
+from PIL import Image
+
+
+def _png(width: int = 64) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", (width, 64), 255).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def _upload(base_url: str, files: list = (), store: bool = True, known: list = None) -> httpx.Response:
+    data = {"store_files": str(store).lower()}
+    if known is not None:
+        data["known_files"] = json.dumps(known)
+    return httpx.post(f"{base_url}/api/upload", data=data,
+                      files=[("files", (name, content, "image/png")) for name, content in files], timeout=30)
+
+
+def _blobs(workdir: str) -> list:
+    blob_dir = os.path.join(workdir, "backend", "blobs")
+    return [name for root, _, names in os.walk(blob_dir) if os.path.basename(root) != "tmp" for name in names]
+
+
+def test_identical_uploads_share_one_blob(backend):
+    server = backend()
+    png = _png()
+
+    first = _upload(server.url, [("a.png", png)]).json()["files"][0]
+    second = _upload(server.url, [("b.png", png), ("c.png", _png(65))]).json()["files"]
+
+    assert not first["deduplicated"] and second[0]["deduplicated"] and not second[1]["deduplicated"]
+    assert first["content_id"] == second[0]["content_id"] == hashlib.sha256(png).hexdigest()
+    assert sorted(_blobs(server.workdir)) == sorted({first["content_id"], second[1]["content_id"]})
+
+
+def test_unstored_uploads_are_not_kept(backend):
+    server = backend()
+    png = _png()
+    uploaded = _upload(server.url, [("a.png", png)], store=False).json()
+    assert not uploaded["stored"] and uploaded["files"][0]["path"] is None
+
+    check = httpx.post(f"{server.url}/api/blobs/check", json={"hashes": [hashlib.sha256(png).hexdigest()]}).json()
+    assert check["present"] == [] and _blobs(server.workdir) == []
+
+
+def test_known_hash_links_the_stored_blob(backend):
+    server = backend()
+    png = _png()
+    sha256 = hashlib.sha256(png).hexdigest()
+    _upload(server.url, [("a.png", png)])
+
+    check = httpx.post(f"{server.url}/api/blobs/check", json={"hashes": [sha256, "0" * 64]}).json()
+    assert check == {"present": [sha256], "missing": ["0" * 64]}
+
+    # Only the hash goes over the wire; the new session references the existing blob
+    linked = _upload(server.url, known=[{"filename": "again.png", "content_type": "image/png", "sha256": sha256}])
+    linked.raise_for_status()
+    body = linked.json()
+    assert body["stored"] and body["files"][0]["deduplicated"] and body["files"][0]["size"] == len(png)
+    assert os.path.samefile(os.path.join(server.workdir, body["files"][0]["path"]),
+                            os.path.join(server.workdir, "backend", "blobs", sha256[:2], sha256))
+    assert _blobs(server.workdir) == [sha256]
+
+    files = httpx.get(f"{server.url}/api/sessions/{body['session_id']}/files").json()["files"]
+    assert [(entry["filename"], entry["sha256"]) for entry in files] == [("again.png", sha256)]
+
+    # The linked file is usable like any upload
+    chat = httpx.post(f"{server.url}/api/chat", timeout=30, json={
+        "prompt": "List all dimensions",
+        "use_cache": False,
+        "image_refs": [{"session_id": body["session_id"], "filename": "again.png"}]
+    })
+    assert chat.status_code == 200 and chat.json()["response"]
+
+
+def test_unknown_hash_is_rejected(backend):
+    server = backend()
+    response = _upload(server.url, known=[{"filename": "x.png", "content_type": "image/png", "sha256": "f" * 64}])
+    assert response.status_code == 404
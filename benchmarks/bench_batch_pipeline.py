@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+--batch wall-clock time: the sequential loop (rasterize, tokenize,
+generate, extract, write, one drawing after the other) versus the staged
+BatchPipeline, where preparation and writing overlap with inference.
+Prints per-stage busy / idle / blocked time; the closer inference
+utilization gets to 100%, the closer wall time is to pure inference time.
+Uses the images/ PDFs with the text layer off, so every drawing is
+rasterized and goes through the model. Without --model it builds a small
+random checkpoint with tiny_model.py.
+
+    python benchmarks/bench_batch_pipeline.py --prepare-workers 2
+    python benchmarks/bench_batch_pipeline.py --dpi 300 --rounds 3 --threads 4
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+LLAVA_DIR = os.path.join(ROOT, "Llava local model")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Staged --batch pipeline benchmark")
+    parser.add_argument("--model", default=None, help="Checkpoint to load (default: a small random model)")
+    parser.add_argument("--images", default=os.path.join(ROOT, "images"), help="Directory of PDF drawings")
+    parser.add_argument("--rounds", type=int, default=2, help="Passes over the PDFs")
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--profile", default="cpu-fp32")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--prepare-workers", type=int, default=2)
+    parser.add_argument("--write-workers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--hidden-size", type=int, default=512, help="Hidden size of the generated model")
+    parser.add_argument("--layers", type=int, default=4, help="Decoder layers of the generated model")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(LLAVA_DIR))
+    from batch_pipeline import BatchPipeline, print_stage_stats
+    from main import ColumbusDrawingAnalyzer
+
+    pdfs = sorted(glob.glob(os.path.join(args.images, "*.pdf"))) * args.rounds
+    if not pdfs:
+        print(f"no PDFs in {args.images}")
+        return
+
+    root = tempfile.mkdtemp(prefix="llava-pipeline-bench-")
+    try:
+        model = args.model
+        if model is None:
+            from tiny_model import build_tiny_model
+            model = build_tiny_model(os.path.join(root, "model"), hidden_size=args.hidden_size, num_layers=args.layers)
+        analyzer = ColumbusDrawingAnalyzer(model_name=model, max_new_tokens=args.max_new_tokens, profile=args.profile,
+                                           num_threads=args.threads, dpi=args.dpi, text_layer="off")
+        analyzer.comprehensive_analysis(pdfs[0])  # Warm-up
+
+        def write(index: int, analysis):
+            with open(os.path.join(root, f"{index}.json"), "w") as f:
+                json.dump(analysis, f, indent=2, default=str)
+
+        start = time.perf_counter()
+        for index, pdf in enumerate(pdfs):
+            write(index, analyzer.comprehensive_analysis(pdf))
+        sequential = time.perf_counter() - start
+
+        pipeline = BatchPipeline(
+            analyzer, lambda path, index, analysis, error, seconds: write(index, analysis),
+            prepare_workers=args.prepare_workers, write_workers=args.write_workers, queue_size=args.queue_size
+        )
+        stats = pipeline.run([(pdf, index) for index, pdf in enumerate(pdfs)])
+
+        print_stage_stats(stats, pipeline.wall)
+        print(f"\n{len(pdfs)} drawings at {args.dpi} dpi, {args.prepare_workers} prepare / {args.write_workers} write workers")
+        print(f"{'mode':10s} {'seconds':>8s} {'drawings/min':>13s} {'speedup':>8s}")
+        for mode, seconds in (("sequential", sequential), ("pipeline", pipeline.wall)):
+            print(f"{mode:10s} {seconds:8.2f} {len(pdfs) * 60 / seconds:13.1f} {sequential / seconds:7.2f}x")
+        print(f"pure inference {stats['inference'].busy:.2f}s")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Listing and lookup latency with ~100k stored files: the SQLite upload
+catalog versus the directory scans StorageService used before.
+Builds a throwaway upload tree (sessions of hard links into a blob store),
+indexes it with FileCatalog.rebuild() and times each query.
+
+    python benchmarks/bench_catalog.py --sessions 9000 --files-per-session 10 --large-session 10000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+
+def build_tree(root: str, sessions: int, per_session: int, large_session: int, blobs: int) -> tuple:
+    upload_dir = os.path.join(root, "uploads")
+    blob_dir = os.path.join(root, "blobs")
+    blob_paths = []
+    for i in range(blobs):
+        sha256 = f"{i:064x}"
+        path = os.path.join(blob_dir, sha256[:2], sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(os.urandom(64))
+        blob_paths.append(path)
+
+    start = datetime.now() - timedelta(days=60)
+    counter = 0
+    layout = [(f"session-{s:06d}", per_session) for s in range(sessions)] + [("session-large", large_session)]
+    for session_id, count in layout:
+        session_dir = os.path.join(upload_dir, session_id)
+        os.makedirs(session_dir)
+        for i in range(count):
+            stamp = (start + timedelta(seconds=counter * 37)).strftime(TIMESTAMP_FORMAT)
+            os.link(blob_paths[counter % blobs], os.path.join(session_dir, f"{stamp}_drawing_{i}.png"))
+            counter += 1
+    return upload_dir, blob_dir, counter
+
+
+# The directory scans StorageService did before the catalog
+
+def scan_list_session(upload_dir: str, session_id: str) -> list:
+    session_dir = os.path.join(upload_dir, session_id)
+    files = []
+    for filename in os.listdir(session_dir):
+        file_path = os.path.join(session_dir, filename)
+        if os.path.isfile(file_path):
+            files.append({
+                "filename": filename,
+                "path": file_path,
+                "size": os.path.getsize(file_path),
+                "created": datetime.fromtimestamp(os.path.getctime(file_path)).isoformat()
+            })
+    return files
+
+
+def scan_find_latest(upload_dir: str, session_id: str, filename: str) -> str:
+    session_dir = os.path.join(upload_dir, session_id)
+    matches = sorted(name for name in os.listdir(session_dir) if name.endswith(f"_{filename}"))
+    return os.path.join(session_dir, matches[-1]) if matches else None
+
+
+def scan_find_by_hash(upload_dir: str, blob_path: str) -> list:
+    inode = os.stat(blob_path).st_ino
+    return [
+        os.path.join(root, name)
+        for root, _, names in os.walk(upload_dir)
+        for name in names
+        if os.stat(os.path.join(root, name)).st_ino == inode
+    ]
+
+
+def scan_older_than(upload_dir: str, cutoff: datetime) -> list:
+    return [
+        os.path.join(root, name)
+        for root, _, names in os.walk(upload_dir)
+        for name in names
+        if datetime.strptime(name[:15], TIMESTAMP_FORMAT) < cutoff
+    ]
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload catalog vs directory scan benchmark")
+    parser.add_argument("--backend", default=os.path.join(os.path.dirname(__file__), "..", "Openai", "backend"))
+    parser.add_argument("--sessions", type=int, default=9000)
+    parser.add_argument("--files-per-session", type=int, default=10)
+    parser.add_argument("--large-session", type=int, default=10000)
+    parser.add_argument("--blobs", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.backend))
+    from services.file_catalog import FileCatalog
+
+    root = tempfile.mkdtemp(prefix="catalog-bench-")
+    try:
+        start = time.perf_counter()
+        upload_dir, blob_dir, total = build_tree(root, args.sessions, args.files_per_session, args.large_session, args.blobs)
+        print(f"built {total} files in {args.sessions + 1} sessions ({time.perf_counter() - start:.1f}s)")
+
+        catalog = FileCatalog(os.path.join(root, "catalog.db"))
+        start = time.perf_counter()
+        catalog.rebuild(upload_dir, blob_dir)
+        print(f"catalog rebuild from disk: {time.perf_counter() - start:.2f}s\n")
+
+        session = f"session-{args.sessions // 2:06d}"
+        blob = os.path.join(blob_dir, f"{7:064x}"[:2], f"{7:064x}")
+        cutoff = datetime.now() - timedelta(days=59)
+        cases = [
+            ("list small session", lambda: scan_list_session(upload_dir, session), lambda: catalog.list_session(session)),
+            ("list large session", lambda: scan_list_session(upload_dir, "session-large"),
+             lambda: catalog.list_session("session-large")),
+            ("latest by filename", lambda: scan_find_latest(upload_dir, "session-large", "drawing_5000.png"),
+             lambda: catalog.find_latest("session-large", "drawing_5000.png")),
+            ("files by hash", lambda: scan_find_by_hash(upload_dir, blob), lambda: catalog.find_by_hash(f"{7:064x}")),
+            ("files older than", lambda: scan_older_than(upload_dir, cutoff), lambda: catalog.older_than(cutoff.timestamp())),
+        ]
+
+        print(f"{'query':20s} {'directory scan':>15s} {'catalog':>12s} {'speedup':>9s}")
+        for label, scan, indexed in cases:
+            scan_time = timed(scan, args.repeat)
+            index_time = timed(indexed, args.repeat)
+            print(f"{label:20s} {scan_time * 1000:13.2f}ms {index_time * 1000:10.2f}ms {scan_time / index_time:8.1f}x")
+        catalog.close()
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
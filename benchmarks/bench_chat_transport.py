@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Compare /api/chat image transports on a ~20 MB drawing set:
+base64 images inside JSON versus binary multipart parts.
+The backend runs in its own process so its peak RSS (VmHWM) is measured
+in isolation; the upstream is the local stub with zero latency.
+
+    python benchmarks/bench_chat_transport.py --total-mb 20 --files 10
+"""
+import argparse
+import base64
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from stub_openai import StubServer
+
+BACKEND_PORT = 8768
+
+
+def start_backend(backend_dir: str, stub_url: str) -> subprocess.Popen:
+    env = dict(os.environ, OPENAI_BASE_URL=stub_url, OPENAI_API_KEY="stub", RESPONSE_CACHE_ENABLED="false")
+    proc = subprocess.Popen(
+        [sys.executable, "-c", f"import uvicorn, main; uvicorn.run(main.app, port={BACKEND_PORT}, log_level='warning')"],
+        cwd=backend_dir, env=env
+    )
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{BACKEND_PORT}/api/health", timeout=1)
+            return proc
+        except httpx.TransportError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("backend did not start")
+
+
+def peak_rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def send_json(files):
+    payload = {
+        "prompt": "List all dimensions",
+        "use_cache": False,
+        "images": [
+            {"filename": name, "content": base64.b64encode(data).decode("ascii"), "content_type": "image/png"}
+            for name, data in files
+        ]
+    }
+    return httpx.post(f"http://127.0.0.1:{BACKEND_PORT}/api/chat", json=payload, timeout=120)
+
+
+def send_multipart(files):
+    return httpx.post(
+        f"http://127.0.0.1:{BACKEND_PORT}/api/chat",
+        data={"prompt": "List all dimensions", "use_cache": "false"},
+        files=[("images", (name, data, "image/png")) for name, data in files],
+        timeout=120
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON/base64 vs multipart transport benchmark")
+    parser.add_argument("--backend", default=os.path.join(os.path.dirname(__file__), "..", "Openai", "backend"))
+    parser.add_argument("--total-mb", type=float, default=20)
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    per_file = int(args.total_mb * 1024 * 1024 / args.files)
+    files = [(f"drawing_{i}.png", os.urandom(per_file)) for i in range(args.files)]
+
+    with StubServer(port=9003, latency=0.0) as stub:
+        for label, send in [("json/base64", send_json), ("multipart", send_multipart)]:
+            proc = start_backend(os.path.abspath(args.backend), stub.base_url)
+            try:
+                idle_rss = peak_rss_mb(proc.pid)
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    send(files).raise_for_status()
+                    timings.append(time.perf_counter() - start)
+                print(f"{label:12s} request: {min(timings) * 1000:7.1f}ms  "
+                      f"backend peak RSS: {peak_rss_mb(proc.pid):6.1f}MB (idle {idle_rss:.1f}MB)")
+            finally:
+                proc.terminate()
+                proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Concurrency check for the FastAPI backend against the local OpenAI stub.
+N concurrent /api/chat calls should finish in about the time of one, and
+/api/health should keep answering while they are in flight.
+
+    python benchmarks/bench_concurrency.py --requests 50 --latency 1.0
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import threading
+
+import httpx
+import uvicorn
+
+from stub_openai import StubServer
+
+
+def start_backend(backend_dir: str, port: int) -> uvicorn.Server:
+    sys.path.insert(0, backend_dir)
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+async def run(base_url: str, n: int):
+    # Bypass the response cache: identical prompts would otherwise measure cache hits
+    payload = {"prompt": "List all dimensions", "images": [], "use_cache": False}
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        start = time.perf_counter()
+        r = await client.post("/api/chat", json=payload)
+        r.raise_for_status()
+        single = time.perf_counter() - start
+
+        health_latencies = []
+
+        async def probe_health(done: asyncio.Event):
+            while not done.is_set():
+                t = time.perf_counter()
+                await client.get("/api/health")
+                health_latencies.append(time.perf_counter() - t)
+                await asyncio.sleep(0.05)
+
+        done = asyncio.Event()
+        prober = asyncio.create_task(probe_health(done))
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[client.post("/api/chat", json=payload) for _ in range(n)])
+        concurrent = time.perf_counter() - start
+        done.set()
+        await prober
+
+    failed = sum(1 for r in responses if r.status_code != 200)
+    print(f"single request:        {single:.2f}s")
+    print(f"{n} concurrent requests: {concurrent:.2f}s ({concurrent / single:.2f}x single, {failed} failed)")
+    print(f"/api/health during load: max {max(health_latencies) * 1000:.1f}ms over {len(health_latencies)} probes")
+    return concurrent / single
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend concurrency benchmark")
+    parser.add_argument("--backend", default=os.path.join(os.path.dirname(__file__), "..", "Openai", "backend"))
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+    backend_dir = os.path.abspath(args.backend)
+    # The backend keeps uploads, blobs, its catalog and jobs under relative paths: keep them out of the tree
+    os.chdir(tempfile.mkdtemp(prefix="bench-concurrency-"))
+
+    with StubServer(port=9000, latency=args.latency) as stub:
+        os.environ["OPENAI_BASE_URL"] = stub.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+        os.environ.setdefault("OPENAI_MAX_CONCURRENCY", str(args.requests))
+        os.environ.setdefault("OPENAI_INITIAL_CONCURRENCY", str(args.requests))
+        # The stub has no rate limits; the client-side RPM/TPM buckets would otherwise pace the burst
+        os.environ.setdefault("OPENAI_RPM", "0")
+        os.environ.setdefault("OPENAI_TPM", "0")
+        start_backend(backend_dir, port=8765)
+        ratio = asyncio.run(run("http://127.0.0.1:8765", args.requests))
+
+    sys.exit(0 if ratio < 2.0 else 1)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Dimension extraction throughput on large synthetic LLaVA responses: the
+original per-line, per-pattern re.finditer scan versus the single-pass
+DimensionExtractor, whole text and streamed in token-sized chunks.
+Every run checks that both give identical output.
+
+    python benchmarks/bench_dimension_extractor.py --lines 20000
+    python benchmarks/bench_dimension_extractor.py --lines 100000 --rounds 5
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+LLAVA_DIR = os.path.join(os.path.dirname(__file__), "..", "Llava local model")
+
+LINE_TEMPLATES = [
+    "The bore is Ø{d} ±{t} and the relief is R{s}.",
+    "* {d} ±{t} inspection feature on the outer diameter",
+    "Thread: 1/4-20 UNC-2B, depth {d}",
+    "{s} X 45° Chamfer on both ends",
+    "Overall length {d} with a {w} {f} shoulder",
+    "MATERIAL: ALUMINUM 2011-T3",
+    "The drawing shows a hydraulic piston with several machined features.",
+    "",
+]
+
+
+def synthetic_response(lines: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    out = []
+    for _ in range(lines):
+        out.append(rng.choice(LINE_TEMPLATES).format(
+            d=f"{rng.uniform(0.1, 9.9):.3f}", t=f"{rng.choice([0.001, 0.002, 0.005]):.3f}",
+            s=f"{rng.uniform(0.01, 0.5):.2f}", w=rng.randint(1, 9), f=rng.choice(["1/2", "3/4", "1/8"])
+        ))
+    return "\n".join(out)
+
+
+def per_line_scan(text: str, patterns: dict, calculate_confidence) -> list:
+    # What extract_dimensions_regex() did before dimension_extractor.py
+    dimensions = []
+    for line_num, line in enumerate(text.split('\n')):
+        for pattern_name, pattern in patterns.items():
+            for match in re.finditer(pattern, line, re.IGNORECASE):
+                dimensions.append({
+                    'type': pattern_name,
+                    'value': match.group(1) if match.groups() else match.group(0),
+                    'tolerance': match.group(2) if len(match.groups()) > 1 else None,
+                    'full_match': match.group(0),
+                    'line_number': line_num + 1,
+                    'line_text': line.strip(),
+                    'confidence': calculate_confidence(pattern_name, match.group(0))
+                })
+    return dimensions
+
+
+def best_of(rounds: int, fn):
+    best, result = None, None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dimension extraction benchmark")
+    parser.add_argument("--lines", type=int, default=20000, help="Lines of synthetic response text")
+    parser.add_argument("--rounds", type=int, default=3, help="Best of this many runs per method")
+    parser.add_argument("--chunk", type=int, default=4, help="Characters per streamed chunk (about one token)")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(LLAVA_DIR))
+    from dimension_extractor import DIMENSION_PATTERNS, DimensionExtractor, calculate_confidence
+
+    text = synthetic_response(args.lines)
+    chunks = [text[i:i + args.chunk] for i in range(0, len(text), args.chunk)]
+    extractor = DimensionExtractor()
+
+    def streamed():
+        stream = extractor.stream()
+        found = []
+        for chunk in chunks:
+            found += stream.feed(chunk)
+        return found + stream.close()
+
+    rows = []
+    seconds, expected = best_of(args.rounds, lambda: per_line_scan(text, DIMENSION_PATTERNS, calculate_confidence))
+    rows.append(("per-line", seconds))
+    seconds, found = best_of(args.rounds, lambda: [d.as_dict() for d in extractor.extract(text)])
+    assert found == expected, "single-pass output differs"
+    rows.append(("single", seconds))
+    seconds, found = best_of(args.rounds, lambda: extractor.extract(text))
+    rows.append(("records", seconds))
+    seconds, found = best_of(args.rounds, streamed)
+    assert [d.as_dict() for d in found] == expected, "streamed output differs"
+    rows.append(("streamed", seconds))
+
+    megabytes = len(text.encode()) / 1e6
+    print(f"\n{args.lines} lines, {megabytes:.1f} MB, {len(expected)} dimensions (outputs identical)")
+    print(f"{'method':9s} {'seconds':>8s} {'MB/s':>7s} {'dims/s':>10s} {'speedup':>8s}")
+    baseline = rows[0][1]
+    for method, seconds in rows:
+        print(f"{method:9s} {seconds:8.3f} {megabytes / seconds:7.1f} {len(expected) / seconds:10.0f} "
+              f"{baseline / seconds:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
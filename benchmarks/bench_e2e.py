@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmark of both analysis paths over the images/ drawings:
+
+    llava  ColumbusDrawingAnalyzer.comprehensive_analysis on a tiny random
+           LLaVA-NeXT checkpoint (tiny_model.py): the text layer path, and the
+           model path split into prepare / generate / compile
+    api    the FastAPI backend: rasterize each PDF page, POST /api/upload,
+           then POST /api/chat referencing the upload, answered by the
+           OpenAI stub (stub_openai.py) with --latency seconds per call
+
+Each path runs in its own process (both have a main.py, and peak RSS stays
+per path). Per stage it records wall time per item, throughput and peak
+RSS to JSON; compare flags regressions against a saved baseline. Runs on a
+CPU-only box without network.
+
+    python benchmarks/bench_e2e.py run --output bench.json
+    python benchmarks/bench_e2e.py run --output new.json --baseline bench.json
+    python benchmarks/bench_e2e.py compare bench.json new.json --time-tolerance 0.2
+"""
+import argparse
+import glob
+import json
+import mimetypes
+import os
+import platform
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+LLAVA_DIR = os.path.join(BENCH_DIR, "..", "Llava local model")
+BACKEND_DIR = os.path.join(BENCH_DIR, "..", "Openai", "backend")
+IMAGES_DIR = os.path.join(BENCH_DIR, "..", "images")
+RESULT_VERSION = 1
+PATHS = ("llava", "api")
+
+CHAT_PROMPT = "Identify the component and list every dimension with its tolerance."
+
+
+class Recorder:
+    """Per-stage item timings, and the peak RSS sampled while each stage runs"""
+
+    def __init__(self, interval: float = 0.005):
+        self.stages = {}
+        self.active = None
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, args=(interval,), daemon=True)
+        self._sampler.start()
+
+    def rss_mb(self) -> float:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page_size / 2 ** 20
+        except OSError:
+            # Process-wide high-water mark where /proc is missing (KB on Linux, bytes on macOS)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+    def _sample(self, interval: float):
+        while not self._stop.wait(interval):
+            stage = self.active
+            if stage is not None:
+                stage["peak_rss_mb"] = max(stage["peak_rss_mb"], self.rss_mb())
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time one item of a stage"""
+        stage = self.stages.setdefault(name, {"seconds": [], "peak_rss_mb": 0.0})
+        self.active = stage
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage["seconds"].append(time.perf_counter() - start)
+            stage["peak_rss_mb"] = max(stage["peak_rss_mb"], self.rss_mb())  # Items shorter than the interval
+            self.active = None
+
+    def summary(self) -> dict:
+        self._stop.set()
+        summary = {}
+        for name, stage in self.stages.items():
+            seconds = stage["seconds"]
+            summary[name] = {
+                "items": len(seconds),
+                "wall_seconds": sum(seconds),
+                "median_seconds": statistics.median(seconds),
+                "max_seconds": max(seconds),
+                "throughput_per_s": len(seconds) / sum(seconds) if sum(seconds) > 0 else 0.0,
+                "peak_rss_mb": stage["peak_rss_mb"]
+            }
+        return summary
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_llava(drawings: list, args, recorder: Recorder, workdir: str):
+    sys.path.insert(0, os.path.abspath(LLAVA_DIR))
+    from tiny_model import build_tiny_model
+    from main import ColumbusDrawingAnalyzer
+
+    model = build_tiny_model(os.path.join(workdir, "model"), hidden_size=args.hidden_size, num_layers=args.layers)
+    with recorder.stage("llava.model_load"):
+        analyzer = ColumbusDrawingAnalyzer(model_name=model, max_new_tokens=args.max_new_tokens,
+                                           profile="cpu-fp32", text_layer="off")
+    text_layer = ColumbusDrawingAnalyzer(model_name=model, max_new_tokens=args.max_new_tokens,
+                                         profile="cpu-fp32", text_layer="auto", lazy_load=True)
+
+    analyzer.analyze_columbus_drawing(drawings[0])  # Warm-up, builds the prompt prefix cache
+    for path in drawings:
+        # CAD exports resolve from their text layer; the model only runs for what is missing
+        with recorder.stage("llava.text_layer"):
+            text_layer.comprehensive_analysis(path)
+
+        # Model path, stage by stage as the --batch pipeline runs it
+        with recorder.stage("llava.prepare"):
+            text_result, pages = analyzer.plan_analysis(path)
+            prepared = [analyzer.prepare_drawing(path, page=page) for page in pages]
+        with recorder.stage("llava.generate"):
+            llava_results = [analyzer.run_prepared(p) for p in prepared]
+        with recorder.stage("llava.compile"):
+            analyzer.compile_results(path, text_result, llava_results)
+
+
+def bench_api(drawings: list, args, recorder: Recorder, workdir: str):
+    import fitz  # PyMuPDF
+    import httpx
+    import uvicorn
+
+    sys.path.insert(0, BENCH_DIR)
+    from stub_openai import StubServer
+
+    stub = StubServer(port=free_port(), latency=args.latency)
+    stub.__enter__()
+    os.environ.update({
+        "OPENAI_BASE_URL": stub.base_url,
+        "OPENAI_API_KEY": "stub",
+        "RESPONSE_CACHE_ENABLED": "false",  # Every chat call goes upstream
+    })
+    os.chdir(workdir)  # The backend keeps uploads, blobs and its catalog relative to the working directory
+    sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+    from main import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=120) as client:
+            for path in drawings:
+                # The backend takes images, so PDF drawings are rendered first, like the frontend does
+                with recorder.stage("api.rasterize"):
+                    if path.lower().endswith(".pdf"):
+                        with fitz.open(path) as doc:
+                            content = doc[0].get_pixmap(dpi=args.dpi).tobytes("png")
+                        filename, content_type = os.path.splitext(os.path.basename(path))[0] + ".png", "image/png"
+                    else:
+                        with open(path, "rb") as f:
+                            content = f.read()
+                        filename, content_type = os.path.basename(path), mimetypes.guess_type(path)[0]
+
+                with recorder.stage("api.upload"):
+                    r = client.post("/api/upload", files={"files": (filename, content, content_type)},
+                                    data={"store_files": "true"})
+                    r.raise_for_status()
+                    session_id = r.json()["session_id"]
+
+                with recorder.stage("api.chat"):
+                    r = client.post("/api/chat", json={
+                        "prompt": CHAT_PROMPT,
+                        "image_refs": [{"session_id": session_id, "filename": filename}],
+                        "session_id": session_id,
+                        "use_cache": False
+                    })
+                    r.raise_for_status()
+    finally:
+        server.should_exit = True
+        stub.__exit__()
+
+
+def run_path(args):
+    """Child process: one path, its stage summary written to args.json"""
+    drawings = find_drawings(args.images, args.drawings)
+    recorder = Recorder()
+    workdir = tempfile.mkdtemp(prefix=f"bench-e2e-{args.path}-")
+    start = time.perf_counter()
+    try:
+        (bench_llava if args.path == "llava" else bench_api)(drawings, args, recorder, workdir)
+    finally:
+        os.chdir(BENCH_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.json, "w") as f:
+        json.dump({"wall_seconds": time.perf_counter() - start, "drawings": len(drawings),
+                   "stages": recorder.summary()}, f)
+
+
+def find_drawings(directory: str, limit: int) -> list:
+    paths = sorted(p for p in glob.glob(os.path.join(directory, "*"))
+                   if os.path.splitext(p)[1].lower() in (".pdf", ".png", ".jpg", ".jpeg"))
+    if not paths:
+        raise SystemExit(f"No drawings in {directory}")
+    return paths[:limit] if limit else paths
+
+
+def environment() -> dict:
+    info = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def run(args) -> int:
+    result = {
+        "version": RESULT_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "config": {key: getattr(args, key) for key in
+                   ("images", "drawings", "latency", "dpi", "max_new_tokens", "hidden_size", "layers")},
+        "paths": {},
+        "stages": {}
+    }
+    for path in args.paths:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            output = tmp.name
+        command = [sys.executable, os.path.abspath(__file__), "path", path, "--json", output,
+                   "--images", args.images, "--drawings", str(args.drawings), "--latency", str(args.latency),
+                   "--dpi", str(args.dpi), "--max-new-tokens", str(args.max_new_tokens),
+                   "--hidden-size", str(args.hidden_size), "--layers", str(args.layers)]
+        print(f"⏳ Running the {path} path...")
+        env = dict(os.environ, HF_HUB_OFFLINE="1", TRANSFORMERS_OFFLINE="1")
+        completed = subprocess.run(command, env=env, stdout=None if args.verbose else subprocess.DEVNULL)
+        if completed.returncode != 0:
+            print(f"❌ The {path} path failed (exit code {completed.returncode})")
+            return completed.returncode
+        with open(output) as f:
+            measured = json.load(f)
+        os.unlink(output)
+        result["paths"][path] = {"wall_seconds": measured["wall_seconds"], "drawings": measured["drawings"]}
+        result["stages"].update(measured["stages"])
+
+    print_stages(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"💾 Saved to {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            return compare(json.load(f), result, args)
+    return 0
+
+
+def print_stages(result: dict):
+    print(f"\n{'stage':18s} {'items':>5s} {'median':>9s} {'max':>9s} {'per s':>8s} {'peak RSS':>9s}")
+    for name, stage in result["stages"].items():
+        print(f"{name:18s} {stage['items']:5d} {stage['median_seconds'] * 1000:7.1f}ms {stage['max_seconds'] * 1000:7.1f}ms "
+              f"{stage['throughput_per_s']:8.2f} {stage['peak_rss_mb']:7.0f}MB")
+
+
+def compare(baseline: dict, current: dict, args) -> int:
+    """Print every stage against the baseline; returns 1 when any metric regressed past its tolerance"""
+    print(f"\nCompared with the baseline from {baseline.get('created', '?')}")
+    if baseline.get("environment") != current.get("environment"):
+        print("⚠️ Different environment than the baseline; timings may not be comparable")
+    print(f"{'stage':18s} {'metric':10s} {'baseline':>10s} {'current':>10s} {'change':>8s}")
+    regressions = 0
+    for name, stage in current["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            print(f"{name:18s} {'(new)':10s}")
+            continue
+        checks = [
+            # Times below the floor are noise at any relative change
+            ("median", base["median_seconds"], stage["median_seconds"], args.time_tolerance,
+             stage["median_seconds"] - base["median_seconds"] > args.min_seconds, "{:8.3f}s"),
+            ("rss", base["peak_rss_mb"], stage["peak_rss_mb"], args.rss_tolerance, True, "{:7.1f}MB"),
+        ]
+        for metric, old, new, tolerance, significant, fmt in checks:
+            change = (new - old) / old if old else 0.0
+            regressed = significant and change > tolerance
+            regressions += regressed
+            print(f"{name:18s} {metric:10s} {fmt.format(old):>10s} {fmt.format(new):>10s} {change * 100:+7.1f}% "
+                  f"{'❌ REGRESSION' if regressed else ''}".rstrip())
+    for name in baseline["stages"]:
+        if name not in current["stages"]:
+            print(f"{name:18s} {'(missing)':10s}")
+    print(f"\n{'❌' if regressions else '✅'} {regressions} regression(s) "
+          f"(time tolerance {args.time_tolerance:.0%}, RSS tolerance {args.rss_tolerance:.0%})")
+    return 1 if regressions else 0
+
+
+def add_compare_options(parser):
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="Allowed relative slowdown of a stage median")
+    parser.add_argument("--rss-tolerance", type=float, default=0.10, help="Allowed relative growth of a stage peak RSS")
+    parser.add_argument("--min-seconds", type=float, default=0.005,
+                        help="Slowdowns smaller than this are never flagged")
+
+
+def add_run_options(parser):
+    parser.add_argument("--images", default=IMAGES_DIR, help="Directory with the drawings")
+    parser.add_argument("--drawings", type=int, default=0, help="Use only the first N drawings (0 = all)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the OpenAI stub takes per completion")
+    parser.add_argument("--dpi", type=int, default=100, help="Resolution for rendering PDF drawings for upload")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--hidden-size", type=int, default=64, help="Hidden size of the tiny model")
+    parser.add_argument("--layers", type=int, default=2, help="Decoder layers of the tiny model")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the LLaVA and API analysis paths")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Benchmark and optionally compare with a baseline")
+    add_run_options(run_parser)
+    add_compare_options(run_parser)
+    run_parser.add_argument("--paths", nargs="+", default=list(PATHS), choices=PATHS)
+    run_parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    run_parser.add_argument("--baseline", default=None, help="Results JSON to compare against")
+    run_parser.add_argument("--verbose", action="store_true", help="Show the output of the benchmarked code")
+
+    compare_parser = commands.add_parser("compare", help="Compare two saved results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    add_compare_options(compare_parser)
+
+    path_parser = commands.add_parser("path")  # Internal: one path in a child process
+    path_parser.add_argument("path", choices=PATHS)
+    path_parser.add_argument("--json", required=True)
+    add_run_options(path_parser)
+
+    args = parser.parse_args()
+    if args.command == "path":
+        run_path(args)
+    elif args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        sys.exit(compare(baseline, current, args))
+    else:
+        sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Drawings per minute through ColumbusDrawingAnalyzer at different batch
+sizes: batch size 1 is the old one-generate-per-image --batch loop, larger
+sizes go through analyze_batch(). Without --model it builds the tiny random
+checkpoint from tiny_model.py, which shows the batching overhead curve on
+any machine; point --model at the real checkpoint on a GPU for real numbers.
+
+    python benchmarks/bench_llava_batch.py --batch-sizes 1,2,4,8 --drawings 16
+    python benchmarks/bench_llava_batch.py --model llava-hf/llava-v1.6-mistral-7b-hf --images-dir images/
+"""
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+LLAVA_DIR = os.path.join(os.path.dirname(__file__), "..", "Llava local model")
+
+
+def synthetic_drawings(directory: str, count: int) -> list:
+    from PIL import Image, ImageDraw
+
+    paths = []
+    for i in range(count):
+        # Mixed aspect ratios, so batches exercise image and prompt padding
+        image = Image.new("RGB", (800 + 100 * (i % 3), 600 + 150 * (i % 2)), "white")
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((100, 100, 700, 500), outline="black", width=3)
+        draw.text((120, 520), f"Ø2.49{i % 10} ±0.002", fill="black")
+        path = os.path.join(directory, f"drawing_{i:03d}.png")
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def run(analyzer, paths: list, batch_size: int) -> float:
+    start = time.perf_counter()
+    if batch_size == 1:
+        for path in paths:
+            analyzer.analyze_columbus_drawing(path)
+    else:
+        for offset in range(0, len(paths), batch_size):
+            results = analyzer.analyze_batch(paths[offset:offset + batch_size])
+            errors = [r["error"] for r in results if "error" in r]
+            if errors:
+                raise RuntimeError(errors[0])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLaVA batched generate throughput benchmark")
+    parser.add_argument("--model", default=None, help="Checkpoint to load (default: a tiny random model)")
+    parser.add_argument("--images-dir", default=None, help="Use the drawings in this directory instead of synthetic ones")
+    parser.add_argument("--drawings", type=int, default=16)
+    parser.add_argument("--batch-sizes", default="1,2,4,8")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(LLAVA_DIR))
+    from main import ColumbusDrawingAnalyzer
+
+    root = tempfile.mkdtemp(prefix="llava-batch-bench-")
+    try:
+        model = args.model
+        if model is None:
+            from tiny_model import build_tiny_model
+            model = build_tiny_model(os.path.join(root, "model"))
+
+        if args.images_dir:
+            paths = sorted(
+                path for path in glob.glob(os.path.join(args.images_dir, "*"))
+                if path.lower().endswith((".png", ".jpg", ".jpeg", ".pdf", ".tiff", ".bmp"))
+            )[:args.drawings]
+        else:
+            paths = synthetic_drawings(root, args.drawings)
+        if not paths:
+            print("no drawings to process")
+            return
+
+        analyzer = ColumbusDrawingAnalyzer(model_name=model, max_new_tokens=args.max_new_tokens)
+        run(analyzer, paths[:1], 1)  # Warm-up
+
+        batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+        rows = []
+        for batch_size in batch_sizes:
+            try:
+                elapsed = run(analyzer, paths, batch_size)
+            except RuntimeError as e:
+                # Out of memory even after the analyzer's own batch splitting: larger sizes won't fit either
+                rows.append((batch_size, None))
+                print(f"batch size {batch_size}: {e}")
+                break
+            rows.append((batch_size, elapsed))
+
+        print(f"\n{len(paths)} drawings, max_new_tokens={args.max_new_tokens}, device={analyzer.model.device}")
+        print(f"{'batch size':>10s} {'seconds':>9s} {'drawings/min':>13s} {'speedup':>8s}")
+        baseline = rows[0][1]
+        for batch_size, elapsed in rows:
+            if elapsed is None:
+                print(f"{batch_size:10d} {'OOM':>9s}")
+                continue
+            print(f"{batch_size:10d} {elapsed:9.2f} {len(paths) * 60 / elapsed:13.1f} {baseline / elapsed:7.2f}x")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Time to first token with and without the cached prompt prefix
+(ColumbusDrawingAnalyzer prefix_cache). Only the prompt text before
+<image> can be cached, so both prompt layouts are measured: the stock
+COLUMBUS_PROMPT (instructions ahead of the image) and the same text with
+the image first, where only the system message is cacheable. Every run
+checks that cached and uncached responses are identical. Without --model
+it builds a small random checkpoint with tiny_model.py.
+
+    python benchmarks/bench_llava_prefix_cache.py --drawings 5
+    python benchmarks/bench_llava_prefix_cache.py --profile cpu-bf16 --threads 4
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+LLAVA_DIR = os.path.join(os.path.dirname(__file__), "..", "Llava local model")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt prefix KV cache benchmark")
+    parser.add_argument("--model", default=None, help="Checkpoint to load (default: a small random model)")
+    parser.add_argument("--profile", default="cpu-fp32")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--drawings", type=int, default=5, help="Drawings timed per configuration")
+    parser.add_argument("--max-new-tokens", type=int, default=8)
+    parser.add_argument("--hidden-size", type=int, default=512, help="Hidden size of the generated model")
+    parser.add_argument("--layers", type=int, default=4, help="Decoder layers of the generated model")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(LLAVA_DIR))
+    from PIL import Image, ImageDraw
+    from transformers.generation.streamers import BaseStreamer
+    from main import COLUMBUS_PROMPT, ColumbusDrawingAnalyzer
+
+    class FirstTokenStreamer(BaseStreamer):
+        def __init__(self):
+            self.prompt_seen = False
+            self.first_token = None
+
+        def put(self, value):
+            if not self.prompt_seen:
+                self.prompt_seen = True  # generate() pushes the prompt ids first
+            elif self.first_token is None:
+                self.first_token = time.perf_counter()
+
+        def end(self):
+            pass
+
+    root = tempfile.mkdtemp(prefix="llava-prefix-bench-")
+    try:
+        model = args.model
+        if model is None:
+            from tiny_model import build_tiny_model
+            model = build_tiny_model(os.path.join(root, "model"), hidden_size=args.hidden_size, num_layers=args.layers)
+
+        drawings = []
+        for index in range(args.drawings):
+            image = Image.new("RGB", (800 + 40 * index, 600), "white")
+            draw = ImageDraw.Draw(image)
+            draw.rectangle((100, 100, 700, 500), outline="black", width=3)
+            draw.text((120, 520), f"Ø2.{490 + index} ±0.002", fill="black")
+            drawings.append(os.path.join(root, f"drawing{index}.png"))
+            image.save(drawings[-1])
+
+        analyzers = {
+            cached: ColumbusDrawingAnalyzer(model_name=model, max_new_tokens=args.max_new_tokens, profile=args.profile,
+                                            num_threads=args.threads, prefix_cache=cached)
+            for cached in (False, True)
+        }
+        layouts = {
+            "stock": COLUMBUS_PROMPT,
+            "image-first": COLUMBUS_PROMPT.replace("<image>\n", "").replace(
+                "<|im_start|>user\n", "<|im_start|>user\n<image>\n"),
+        }
+
+        rows = []
+        for layout, prompt in layouts.items():
+            ttft = {}
+            responses = {}
+            for cached, analyzer in analyzers.items():
+                analyzer.analyze_columbus_drawing(drawings[0], custom_prompt=prompt)  # Warm-up, builds the prefix KV
+                times, responses[cached] = [], []
+                for path in drawings:
+                    streamer = FirstTokenStreamer()
+                    start = time.perf_counter()
+                    result = analyzer.analyze_columbus_drawing(path, custom_prompt=prompt, streamer=streamer)
+                    times.append(streamer.first_token - start)
+                    responses[cached].append(result['llava_response'])
+                ttft[cached] = statistics.median(times)
+            rows.append((layout, ttft[False], ttft[True], responses[True] == responses[False]))
+
+        print(f"\n{args.drawings} drawings per configuration, {args.profile}, median time to first token")
+        print(f"{'prompt':20s} {'uncached':>9s} {'cached':>9s} {'speedup':>8s} {'identical':>10s}")
+        for layout, uncached, cached, identical in rows:
+            print(f"{layout:20s} {uncached * 1000:7.0f}ms {cached * 1000:7.0f}ms {uncached / cached:7.2f}x "
+                  f"{'yes' if identical else 'NO':>10s}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
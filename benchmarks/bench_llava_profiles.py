@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tokens per second, time to first token and peak RSS for each
+ColumbusDrawingAnalyzer inference profile (--profile in main.py).
+Every profile runs in its own process so peak RSS is not shared between
+them. Without --model it builds a small random checkpoint with
+tiny_model.py; pass --model to measure a real one.
+
+    python benchmarks/bench_llava_profiles.py --threads 4
+    python benchmarks/bench_llava_profiles.py --profiles gpu,cpu-bf16,cpu-int8 --compile
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+LLAVA_DIR = os.path.join(os.path.dirname(__file__), "..", "Llava local model")
+
+
+def measure(args):
+    """Child process: load one profile, warm up, then time a single analysis"""
+    sys.path.insert(0, os.path.abspath(LLAVA_DIR))
+    from PIL import Image, ImageDraw
+    from transformers.generation.streamers import BaseStreamer
+    from main import ColumbusDrawingAnalyzer
+
+    class TimingStreamer(BaseStreamer):
+        def __init__(self):
+            self.prompt_seen = False
+            self.first_token = None
+            self.tokens = 0
+            self.finished = None
+
+        def put(self, value):
+            if not self.prompt_seen:
+                self.prompt_seen = True  # generate() pushes the prompt ids first
+                return
+            if self.first_token is None:
+                self.first_token = time.perf_counter()
+            self.tokens += value.numel()
+
+        def end(self):
+            self.finished = time.perf_counter()
+
+    image_path = os.path.join(args.workdir, "drawing.png")
+    if not os.path.exists(image_path):
+        image = Image.new("RGB", (800, 600), "white")
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((100, 100, 700, 500), outline="black", width=3)
+        draw.text((120, 520), "Ø2.490 ±0.002", fill="black")
+        image.save(image_path)
+
+    start = time.perf_counter()
+    analyzer = ColumbusDrawingAnalyzer(
+        model_name=args.model, max_new_tokens=args.max_new_tokens, profile=args.measure,
+        num_threads=args.threads, interop_threads=args.interop_threads, compile=args.compile
+    )
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analyzer.analyze_columbus_drawing(image_path)  # Warm-up (and torch.compile's first trace)
+    warmup_seconds = time.perf_counter() - start
+
+    streamer = TimingStreamer()
+    start = time.perf_counter()
+    analyzer.analyze_columbus_drawing(image_path, streamer=streamer)
+    decode_seconds = streamer.finished - streamer.first_token
+    result = {
+        "load_seconds": load_seconds,
+        "warmup_seconds": warmup_seconds,
+        "ttft_seconds": streamer.first_token - start,
+        "tokens": streamer.tokens,
+        "tokens_per_second": (streamer.tokens - 1) / decode_seconds if decode_seconds > 0 else 0.0,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # KiB on Linux
+    }
+    print("RESULT " + json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLaVA inference profile benchmark")
+    parser.add_argument("--model", default=None, help="Checkpoint to load (default: a small random model)")
+    parser.add_argument("--profiles", default="gpu,cpu-fp32,cpu-bf16,cpu-int8")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--interop-threads", type=int, default=None)
+    parser.add_argument("--compile", action="store_true", help="Also run every profile with torch.compile")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--hidden-size", type=int, default=512, help="Hidden size of the generated model")
+    parser.add_argument("--layers", type=int, default=4, help="Decoder layers of the generated model")
+    parser.add_argument("--measure", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args)
+        return
+
+    root = tempfile.mkdtemp(prefix="llava-profile-bench-")
+    try:
+        model = args.model
+        if model is None:
+            sys.path.insert(0, os.path.abspath(LLAVA_DIR))
+            from tiny_model import build_tiny_model
+            model = build_tiny_model(os.path.join(root, "model"), hidden_size=args.hidden_size, num_layers=args.layers)
+
+        runs = [(profile, False) for profile in args.profiles.split(",")]
+        if args.compile:
+            runs += [(profile, True) for profile in args.profiles.split(",")]
+
+        rows = []
+        for profile, compiled in runs:
+            command = [sys.executable, __file__, "--measure", profile, "--workdir", root, "--model", model,
+                       "--max-new-tokens", str(args.max_new_tokens)]
+            if args.threads:
+                command += ["--threads", str(args.threads)]
+            if args.interop_threads:
+                command += ["--interop-threads", str(args.interop_threads)]
+            if compiled:
+                command.append("--compile")
+            label = profile + (" +compile" if compiled else "")
+            completed = subprocess.run(command, capture_output=True, text=True)
+            lines = [line for line in completed.stdout.splitlines() if line.startswith("RESULT ")]
+            if completed.returncode != 0 or not lines:
+                error = (completed.stderr.strip().splitlines() or ["no output"])[-1]
+                print(f"{label}: failed - {error}")
+                continue
+            rows.append((label, json.loads(lines[-1][len("RESULT "):])))
+
+        print(f"\nmax_new_tokens={args.max_new_tokens}, threads={args.threads or 'default'}")
+        print(f"{'profile':20s} {'tokens':>7s} {'tok/s':>9s} {'TTFT':>9s} {'peak RSS':>10s} {'load':>7s} {'warm-up':>8s}")
+        for label, r in rows:
+            print(f"{label:20s} {r['tokens']:7d} {r['tokens_per_second']:9.1f} {r['ttft_seconds'] * 1000:7.0f}ms "
+                  f"{r['peak_rss_mb']:8.0f}MB {r['load_seconds']:6.1f}s {r['warmup_seconds']:7.1f}s")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
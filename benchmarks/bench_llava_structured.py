@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Output tokens and latency per drawing for prose and JSON output
+(ColumbusDrawingAnalyzer output="json"). Prose runs until max_new_tokens
+unless the model stops on its own; JSON output stops as soon as the
+object closes. Also reports the cost of masking per generated token, and
+the first drawing separately, since it builds the per-state token masks.
+Without --model it builds a small random checkpoint with tiny_model.py;
+a random model never emits eos, so prose always uses the full budget.
+
+    python benchmarks/bench_llava_structured.py --drawings 3
+    python benchmarks/bench_llava_structured.py --model llava-hf/llava-v1.6-mistral-7b-hf --profile gpu
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+LLAVA_DIR = os.path.join(os.path.dirname(__file__), "..", "Llava local model")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prose vs schema-constrained JSON output benchmark")
+    parser.add_argument("--model", default=None, help="Checkpoint to load (default: a small random model)")
+    parser.add_argument("--profile", default="cpu-fp32")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--drawings", type=int, default=3, help="Drawings timed per output mode")
+    parser.add_argument("--max-new-tokens", type=int, default=1500)
+    parser.add_argument("--hidden-size", type=int, default=128, help="Hidden size of the generated model")
+    parser.add_argument("--layers", type=int, default=2, help="Decoder layers of the generated model")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(LLAVA_DIR))
+    from PIL import Image, ImageDraw
+    from main import ColumbusDrawingAnalyzer
+
+    root = tempfile.mkdtemp(prefix="llava-structured-bench-")
+    try:
+        model = args.model
+        if model is None:
+            from tiny_model import build_tiny_model
+            model = build_tiny_model(os.path.join(root, "model"), hidden_size=args.hidden_size, num_layers=args.layers)
+
+        drawings = []
+        for index in range(args.drawings + 1):
+            image = Image.new("RGB", (800 + 40 * index, 600), "white")
+            draw = ImageDraw.Draw(image)
+            draw.rectangle((100, 100, 700, 500), outline="black", width=3)
+            draw.text((120, 520), f"Ø2.{490 + index} ±0.002", fill="black")
+            drawings.append(os.path.join(root, f"drawing{index}.png"))
+            image.save(drawings[-1])
+
+        rows = []
+        for output in ("prose", "json"):
+            analyzer = ColumbusDrawingAnalyzer(model_name=model, max_new_tokens=args.max_new_tokens, profile=args.profile,
+                                               num_threads=args.threads, text_layer="off", output=output)
+            start = time.perf_counter()
+            analyzer.analyze_columbus_drawing(drawings[0])  # Warm-up; builds the token masks in json mode
+            first = time.perf_counter() - start
+            seconds, tokens, parsed = [], [], 0
+            for path in drawings[1:]:
+                start = time.perf_counter()
+                result = analyzer.analyze_columbus_drawing(path)
+                seconds.append(time.perf_counter() - start)
+                tokens.append(result['output_tokens'])
+                parsed += result['structured'] is not None
+            rows.append((output, first, statistics.median(seconds), statistics.median(tokens),
+                         sum(seconds) / sum(tokens), parsed if output == "json" else None))
+
+        print(f"\n{args.drawings} drawings per mode, {args.profile}, max_new_tokens {args.max_new_tokens}")
+        print(f"{'output':8s} {'first':>8s} {'median':>8s} {'tokens':>7s} {'per token':>10s} {'parsed':>7s}")
+        for output, first, median, tokens, per_token, parsed in rows:
+            print(f"{output:8s} {first:7.2f}s {median:7.2f}s {tokens:7.0f} {per_token * 1000:8.1f}ms "
+                  f"{'-' if parsed is None else f'{parsed}/{args.drawings}':>7s}")
+        prose, structured = rows
+        print(f"\nJSON output: {prose[3] / structured[3]:.1f}x fewer tokens, {prose[2] / structured[2]:.1f}x lower latency")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Overhead of the backend's latency instrumentation (services/metrics.py).
+
+- Cost of one span and of MetricsMiddleware per request, measured directly.
+- /api/chat against the local OpenAI stub with one drawing attached, with
+  metrics switched on and off in alternating blocks.
+
+The run fails when the instrumentation cost per request (spans plus
+middleware) exceeds --budget of the median request time. The A/B
+difference is printed too, but at these request times it is mostly noise.
+
+    python benchmarks/bench_metrics.py --requests 200 --latency 0.0
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from stub_openai import StubServer
+
+IMAGES_DIR = os.path.join(os.path.dirname(__file__), "..", "images")
+
+
+def drawing_png() -> bytes:
+    """First page of a sample drawing, or a blank sheet without PyMuPDF"""
+    try:
+        import fitz  # PyMuPDF
+        path = os.path.join(IMAGES_DIR, sorted(os.listdir(IMAGES_DIR))[0])
+        with fitz.open(path) as doc:
+            return doc[0].get_pixmap(dpi=100).tobytes("png")
+    except Exception:
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new("RGB", (1100, 850), "white").save(buffer, "PNG")
+        return buffer.getvalue()
+
+
+def span_cost(metrics, n: int = 200000) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        with metrics.span("bench"):
+            pass
+    return (time.perf_counter() - start) / n
+
+
+def middleware_cost(metrics, n: int = 50000) -> float:
+    """Seconds MetricsMiddleware adds per request over calling the app directly"""
+    async def app(scope, receive, send):
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def receive():
+        return {"type": "http.request", "body": b"{}", "more_body": False}
+
+    async def send(message):
+        pass
+
+    async def run(handler) -> float:
+        scope = {"type": "http", "method": "POST", "path": "/api/chat"}
+        start = time.perf_counter()
+        for _ in range(n):
+            await handler(dict(scope), receive, send)
+        return (time.perf_counter() - start) / n
+
+    wrapped = metrics.MetricsMiddleware(app)
+    return asyncio.run(run(wrapped)) - asyncio.run(run(app))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metrics instrumentation overhead")
+    parser.add_argument("--backend", default=os.path.join(os.path.dirname(__file__), "..", "Openai", "backend"))
+    parser.add_argument("--requests", type=int, default=200, help="/api/chat calls per setting")
+    parser.add_argument("--block", type=int, default=20, help="Calls per block before switching metrics on/off")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub seconds per completion (0 = worst case)")
+    parser.add_argument("--budget", type=float, default=0.01, help="Allowed overhead as a share of request time")
+    args = parser.parse_args()
+
+    with StubServer(port=9000, latency=args.latency):
+        os.environ["OPENAI_BASE_URL"] = "http://127.0.0.1:9000/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+        os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+        os.chdir(tempfile.mkdtemp(prefix="bench-metrics-"))  # Uploads and catalog stay out of the tree
+        sys.path.insert(0, os.path.abspath(args.backend))
+        from main import app
+        from services import metrics
+
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=8766, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.01)
+
+        payload = {
+            "prompt": "List all dimensions",
+            "template": "technical",
+            "images": [{"filename": "drawing.png", "content_type": "image/png",
+                        "content": base64.b64encode(drawing_png()).decode()}],
+            "use_cache": False
+        }
+        times = {True: [], False: []}
+        with httpx.Client(base_url="http://127.0.0.1:8766", timeout=60) as client:
+            client.post("/api/chat", json=payload).raise_for_status()  # Warm-up
+            for block in range(2 * args.requests // args.block):
+                enabled = block % 2 == 0
+                metrics.METRICS.enabled = enabled
+                for _ in range(args.block):
+                    start = time.perf_counter()
+                    client.post("/api/chat", json=payload).raise_for_status()
+                    times[enabled].append(time.perf_counter() - start)
+            metrics.METRICS.enabled = True
+            exported = client.get("/api/metrics").text
+        server.should_exit = True
+
+    per_span = span_cost(metrics)
+    per_request_middleware = middleware_cost(metrics)
+    spans = sum(1 for line in exported.splitlines()
+                if line.startswith("columbus_stage_seconds_count")) or 1
+    on, off = statistics.median(times[True]), statistics.median(times[False])
+    cost = spans * per_span + per_request_middleware
+
+    print(f"span:                 {per_span * 1e6:.2f}µs")
+    print(f"middleware:           {per_request_middleware * 1e6:.2f}µs per request")
+    print(f"stages per /api/chat: {spans}")
+    print(f"/api/chat median:     {on * 1000:.2f}ms with metrics, {off * 1000:.2f}ms without "
+          f"({(on - off) / off * 100:+.2f}%, mostly noise)")
+    print(f"instrumentation:      {cost * 1e6:.1f}µs per request = {cost / off * 100:.3f}% of request time "
+          f"(budget {args.budget:.0%})")
+    print("\nExported stages:")
+    for line in exported.splitlines():
+        if line.startswith(("columbus_stage_seconds_count", "columbus_chat_seconds_count", "columbus_upstream_tokens_total",
+                            "columbus_http_requests_total")):
+            print(f"  {line}")
+    sys.exit(0 if cost / off < args.budget else 1)
+
+
+if __name__ == "__main__":
+    main()
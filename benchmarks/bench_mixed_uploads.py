@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Load test: latency of small /api/chat requests while other clients send
+huge scanned drawings, for several backend layouts. Each layout is
+CPU_WORKERSxWORKERS, e.g. "0x1" = one server process doing image work in
+threads, "2x2" = two pre-forked server processes with two pool workers
+each. The backend runs under the uvicorn CLI against the local OpenAI
+stub, with preprocessing on and its caches off, so every upload is
+decoded, cropped, resized and re-encoded as if it were a new drawing. Every request opens a new connection, so the
+kernel spreads them across server processes.
+
+    python benchmarks/bench_mixed_uploads.py --layouts 0x1,2x1,2x2 --duration 30
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from PIL import Image, ImageDraw
+
+from stub_openai import StubServer
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..", "Openai", "backend")
+
+
+def drawing(width: int, height: int, noise: float, seed: int) -> bytes:
+    """A drawing-like PNG; noise (0-1) imitates scanner grain, which keeps huge scans huge on disk"""
+    rng = random.Random(seed)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((width // 20, height // 20, width * 19 // 20, height * 19 // 20), outline=0, width=max(2, width // 500))
+    for _ in range(60):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.line((x, y, x + rng.randrange(-width // 4, width // 4), y), fill=0, width=max(1, width // 1000))
+        draw.text((x, y + 4), f"Ø{rng.uniform(0.5, 5):.3f} ±0.002", fill=0)
+    if noise:
+        grain = Image.effect_noise((width, height), 255 * noise)
+        image = Image.blend(image, grain, 0.15)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def client_loop(base_url: str, png: bytes, deadline: float, latencies: list, errors: list):
+    # No keep-alive: each request is a new connection the kernel may hand to any server process
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=httpx.Limits(max_keepalive_connections=0)) as client:
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    "/api/chat",
+                    data={"prompt": "List all dimensions", "template": "technical", "use_cache": "false", "preprocess": "true"},
+                    files=[("images", ("drawing.png", png, "image/png"))]
+                )
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(str(e))
+
+
+async def run_load(base_url: str, small: bytes, huge: bytes, args) -> dict:
+    deadline = time.monotonic() + args.duration
+    small_latencies, huge_latencies, errors = [], [], []
+    await asyncio.gather(
+        *(client_loop(base_url, small, deadline, small_latencies, errors) for _ in range(args.small_clients)),
+        *(client_loop(base_url, huge, deadline, huge_latencies, errors) for _ in range(args.huge_clients))
+    )
+    return {"small": small_latencies, "huge": huge_latencies, "errors": errors}
+
+
+def start_backend(layout: str, port: int, workdir: str) -> subprocess.Popen:
+    cpu_workers, workers = layout.split("x")
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL="http://127.0.0.1:9000/v1",
+        OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "stub"),
+        CPU_WORKERS=cpu_workers,
+        WORKERS=workers,
+        RESPONSE_CACHE_ENABLED="false",
+        # Every upload is sent again and again: without these caches it is processed like a new drawing each time
+        PREPROCESS_CACHE_ENTRIES="0",
+        PLAN_CACHE_ENTRIES="0",
+        OPENAI_RPM="0",
+        OPENAI_TPM="0",
+        JOBS_DIR=os.path.join(workdir, "jobs"),
+        BLOB_DIR=os.path.join(workdir, "blobs"),
+        UPLOAD_CATALOG=os.path.join(workdir, "catalog.db"),
+        UPLOAD_SWEEP_INTERVAL="0"
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", os.path.abspath(BACKEND_DIR),
+         "--port", str(port), "--workers", workers, "--log-level", "warning"],
+        cwd=workdir, env=env
+    )
+    for _ in range(300):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/health", timeout=1).raise_for_status()
+            # Let every server process finish starting its pool
+            time.sleep(2)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Backend ({layout}) did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mixed small/huge upload load test")
+    parser.add_argument("--layouts", default="0x1,2x1,2x2", help="CPU_WORKERSxWORKERS per run")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load per layout")
+    parser.add_argument("--small-clients", type=int, default=3)
+    parser.add_argument("--huge-clients", type=int, default=1)
+    parser.add_argument("--small-size", default="1100x850")
+    parser.add_argument("--huge-size", default="7000x5000", help="A D-size sheet scanned at ~200 DPI")
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub seconds per completion")
+    args = parser.parse_args()
+
+    small = drawing(*map(int, args.small_size.split("x")), noise=0, seed=1)
+    huge = drawing(*map(int, args.huge_size.split("x")), noise=0.3, seed=2)
+    print(f"small upload {len(small) / 1e3:.0f} kB, huge upload {len(huge) / 1e6:.1f} MB, {os.cpu_count()} CPUs")
+
+    rows = []
+    with StubServer(port=9000, latency=args.latency):
+        for index, layout in enumerate(args.layouts.split(",")):
+            workdir = tempfile.mkdtemp(prefix="bench-mixed-")
+            port = 8770 + index
+            backend = start_backend(layout, port, workdir)
+            try:
+                result = asyncio.run(run_load(f"http://127.0.0.1:{port}", small, huge, args))
+            finally:
+                backend.terminate()
+                backend.wait(30)
+                shutil.rmtree(workdir, ignore_errors=True)
+            rows.append((layout, result))
+
+    print(f"\n{args.small_clients} small + {args.huge_clients} huge clients, {args.duration:.0f}s per layout, "
+          f"stub latency {args.latency * 1000:.0f}ms")
+    print(f"{'layout':8s} {'small n':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s} {'huge n':>7s} {'huge mean':>10s} {'errors':>7s}")
+    for layout, result in rows:
+        small_latencies, huge_latencies = result["small"], result["huge"]
+        if not small_latencies:
+            print(f"{layout:8s} no small request completed; errors: {result['errors'][:3]}")
+            continue
+        print(f"{layout:8s} {len(small_latencies):8d} "
+              f"{percentile(small_latencies, 0.50) * 1000:6.0f}ms {percentile(small_latencies, 0.95) * 1000:6.0f}ms "
+              f"{percentile(small_latencies, 0.99) * 1000:6.0f}ms {max(small_latencies) * 1000:6.0f}ms "
+              f"{len(huge_latencies):7d} {statistics.mean(huge_latencies) if huge_latencies else 0:9.2f}s "
+              f"{len(result['errors']):7d}")
+
+
+if __name__ == "__main__":
+    main()
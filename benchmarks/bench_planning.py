@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Cost and latency of /api/chat with and without request planning
+(services/request_planner.py), against the local OpenAI stub charging
+per token: prompt tokens from each image's size and detail hint, and an
+answer of --answer-tokens or max_tokens, whichever is lower.
+
+Drawings are the sample PDFs (letter sheets) plus synthetic ANSI B and C
+sheets, rendered at --dpi. For the technical template the run also checks
+what matters for dimension fields: every image stays at high detail with
+at least PLAN_MIN_SCALE of the model's original view, and no answer is
+cut short by the output limit.
+
+    python benchmarks/bench_planning.py --dpi 200 --answer-tokens 1200
+"""
+import argparse
+import base64
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+from PIL import Image, ImageDraw
+
+from stub_openai import StubServer
+
+IMAGES_DIR = os.path.join(os.path.dirname(__file__), "..", "images")
+# Synthetic sheets, inches
+SHEETS = {"ansi-b": (17, 11), "ansi-c": (22, 17)}
+
+
+def drawings(dpi: int):
+    """(name, png bytes) for every sample drawing and synthetic sheet"""
+    import fitz  # PyMuPDF
+    for filename in sorted(os.listdir(IMAGES_DIR)):
+        with fitz.open(os.path.join(IMAGES_DIR, filename)) as doc:
+            yield filename, doc[0].get_pixmap(dpi=dpi).tobytes("png")
+    for name, (width, height) in SHEETS.items():
+        image = Image.new("L", (width * dpi, height * dpi), 255)
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((dpi // 2, dpi // 2, (width - 0.5) * dpi, (height - 0.5) * dpi), outline=0, width=dpi // 50)
+        for index in range(12):
+            x, y = dpi * (1 + index % 4 * (width - 2) / 4), dpi * (1 + index // 4 * (height - 2) / 3)
+            draw.text((x, y), f"Ø{2 + index * 0.125:.3f} ±0.002", fill=0)
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        yield name, buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request planning benchmark")
+    parser.add_argument("--backend", default=os.path.join(os.path.dirname(__file__), "..", "Openai", "backend"))
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--templates", default="technical,describe")
+    parser.add_argument("--latency", type=float, default=0.3, help="Stub seconds per completion before token costs")
+    parser.add_argument("--seconds-per-input-token", type=float, default=0.0002)
+    parser.add_argument("--seconds-per-output-token", type=float, default=0.002,
+                        help="Stub decode time per token (real models are ~5x slower; kept short so runs stay quick)")
+    parser.add_argument("--answer-tokens", type=int, default=1200, help="Completion length the model would produce unbounded")
+    args = parser.parse_args()
+
+    samples = list(drawings(args.dpi))
+    with StubServer(port=9000, latency=args.latency, seconds_per_input_token=args.seconds_per_input_token,
+                    seconds_per_output_token=args.seconds_per_output_token, answer_tokens=args.answer_tokens):
+        os.environ["OPENAI_BASE_URL"] = "http://127.0.0.1:9000/v1"
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+        os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+        os.environ["PREPROCESS_ENABLED"] = "false"
+        os.chdir(tempfile.mkdtemp(prefix="bench-planning-"))  # Uploads and catalog stay out of the tree
+        sys.path.insert(0, os.path.abspath(args.backend))
+        from main import app, gpt_service
+
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=8767, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.01)
+
+        rows = []
+        failures = []
+        with httpx.Client(base_url="http://127.0.0.1:8767", timeout=300) as client:
+            for template in args.templates.split(","):
+                for planning in (False, True):
+                    gpt_service.planner.enabled = planning
+                    seconds, prompt_tokens, completion_tokens, reserved = [], [], [], []
+                    for name, png in samples:
+                        payload = {
+                            "prompt": "List every dimension with its tolerance",
+                            "template": template,
+                            "images": [{"filename": f"{name}.png", "content_type": "image/png",
+                                        "content": base64.b64encode(png).decode()}],
+                            "use_cache": False
+                        }
+                        start = time.perf_counter()
+                        result = client.post("/api/chat", json=payload)
+                        seconds.append(time.perf_counter() - start)
+                        result.raise_for_status()
+                        result = result.json()
+                        plan, usage = result["plan"], result["usage"]
+                        prompt_tokens.append(usage["prompt_tokens"])
+                        completion_tokens.append(usage["completion_tokens"])
+                        reserved.append(gpt_service.scheduler.reservation(plan["estimated_input_tokens"], plan["max_tokens"]))
+
+                        if planning and template == "technical":
+                            image = plan["images"][0]
+                            if image["detail"] != "high" or image["scale"] < gpt_service.planner.min_scale:
+                                failures.append(f"{name}: {image['detail']} detail at scale {image['scale']}")
+                            if usage["completion_tokens"] >= plan["max_tokens"]:
+                                failures.append(f"{name}: answer cut at {plan['max_tokens']} tokens")
+                    rows.append((template, planning, statistics.mean(seconds), sum(prompt_tokens),
+                                 sum(completion_tokens), sum(reserved)))
+        server.should_exit = True
+
+    print(f"\n{len(samples)} drawings at {args.dpi} DPI, answers up to {args.answer_tokens} tokens")
+    print(f"{'template':10s} {'planning':8s} {'mean':>8s} {'prompt tok':>11s} {'output tok':>11s} {'reserved':>9s}")
+    for template, planning, mean, prompt, completion, reserved in rows:
+        print(f"{template:10s} {'on' if planning else 'off':8s} {mean:7.2f}s {prompt:11d} {completion:11d} {reserved:9d}")
+    for off, on in zip(rows[0::2], rows[1::2]):
+        print(f"{off[0]}: {1 - (on[3] + on[4]) / (off[3] + off[4]):.0%} fewer tokens, "
+              f"{1 - on[2] / off[2]:.0%} lower latency, {1 - on[5] / off[5]:.0%} smaller rate-limit reservation")
+
+    if failures:
+        print("\nDimension detail at risk:")
+        for failure in failures:
+            print(f"  {failure}")
+    else:
+        print("\ntechnical: every drawing kept high detail at >= PLAN_MIN_SCALE and no answer hit the output limit")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
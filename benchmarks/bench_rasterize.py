@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+PDF rasterization time and peak memory: the old per-call fitz.open() +
+PPM round trip versus rasterize.py (direct sample buffer, reused documents,
+process pool, raster cache). Each method runs in its own process over the
+images/ PDFs, so peak RSS is measured in isolation.
+
+    python benchmarks/bench_rasterize.py --dpi 144 --rounds 3
+    python benchmarks/bench_rasterize.py --dpi 300 --workers 4
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+LLAVA_DIR = os.path.join(ROOT, "Llava local model")
+
+
+def old_convert(pdf_path: str, dpi: int):
+    # What _convert_pdf_to_image did before rasterize.py (scaled to the requested DPI)
+    import fitz
+    from PIL import Image
+
+    doc = fitz.open(pdf_path)
+    pix = doc[0].get_pixmap(matrix=fitz.Matrix(dpi / 72, dpi / 72))
+    image = Image.open(io.BytesIO(pix.tobytes("ppm")))
+    image.load()
+    doc.close()
+    return image
+
+
+def measure(method: str, pdfs: list, dpi: int, rounds: int, workers: int, cache_dir: str):
+    sys.path.insert(0, os.path.abspath(LLAVA_DIR))
+    from rasterize import rasterize_files, render_pages
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    pages = 0
+    for _ in range(rounds):
+        if method == "old":
+            for pdf_path in pdfs:
+                image = old_convert(pdf_path, dpi)
+                pages += 1
+        elif method == "direct":
+            for pdf_path in pdfs:
+                image = render_pages(pdf_path, [0], dpi)[0]
+                pages += 1
+        elif method == "pool":
+            pages += sum(len(images) for images in rasterize_files(pdfs, [0], dpi, workers=workers).values())
+        elif method == "cached":
+            for pdf_path in pdfs:
+                image = render_pages(pdf_path, [0], dpi, cache_dir=cache_dir)[0]
+                pages += 1
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("RESULT " + json.dumps({
+        "seconds": elapsed,
+        "pages": pages,
+        "peak_rss_mb": peak / 1024,
+        "peak_growth_mb": (peak - baseline) / 1024,  # KiB on Linux
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF rasterization benchmark")
+    parser.add_argument("--images", default=os.path.join(ROOT, "images"), help="Directory of PDF drawings")
+    parser.add_argument("--dpi", type=int, default=144)
+    parser.add_argument("--rounds", type=int, default=3, help="Passes over the PDFs (re-analysis of the same drawings)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--measure", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--cache-dir", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    pdfs = sorted(glob.glob(os.path.join(args.images, "*.pdf")))
+    if args.measure:
+        measure(args.measure, pdfs, args.dpi, args.rounds, args.workers, args.cache_dir)
+        return
+    if not pdfs:
+        print(f"no PDFs in {args.images}")
+        return
+
+    sys.path.insert(0, os.path.abspath(LLAVA_DIR))
+    from rasterize import warm_cache
+
+    cache_dir = tempfile.mkdtemp(prefix="raster-cache-bench-")
+    try:
+        warm_cache(pdfs, cache_dir, pages=[0], dpi=args.dpi, workers=1)
+        rows = []
+        for method in ("old", "direct", "pool", "cached"):
+            command = [sys.executable, __file__, "--measure", method, "--images", args.images, "--dpi", str(args.dpi),
+                       "--rounds", str(args.rounds), "--workers", str(args.workers), "--cache-dir", cache_dir]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            lines = [line for line in completed.stdout.splitlines() if line.startswith("RESULT ")]
+            if completed.returncode != 0 or not lines:
+                print(f"{method}: failed - {(completed.stderr.strip().splitlines() or ['no output'])[-1]}")
+                continue
+            rows.append((method, json.loads(lines[-1][len("RESULT "):])))
+
+        print(f"\n{len(pdfs)} PDFs x {args.rounds} rounds at {args.dpi} dpi, {args.workers} pool workers")
+        print(f"{'method':8s} {'seconds':>8s} {'ms/page':>8s} {'speedup':>8s} {'peak RSS':>9s} {'growth':>8s}")
+        baseline = rows[0][1]["seconds"] if rows else None
+        for method, r in rows:
+            print(f"{method:8s} {r['seconds']:8.2f} {r['seconds'] * 1000 / r['pages']:8.1f} "
+                  f"{baseline / r['seconds']:7.2f}x {r['peak_rss_mb']:7.0f}MB {r['peak_growth_mb']:6.0f}MB")
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Drive /api/chat against a stub that throttles: a request-per-window limit
+answered with 429 + Retry-After, a share of random 503s, and latency that
+grows once the stub is past its capacity. Runs the backend twice - with
+retries disabled and with the full scheduler - and reports user-visible
+errors, sustained throughput against the stub's limit and upstream 429s.
+
+    python benchmarks/bench_rate_limit.py --requests 200 --rpm 60 --window 10
+"""
+import argparse
+import asyncio
+import collections
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from stub_openai import StubServer
+
+BACKEND_PORT = 8769
+
+
+def start_backend(backend_dir: str, env: dict) -> subprocess.Popen:
+    env = dict(os.environ, OPENAI_API_KEY="stub", RESPONSE_CACHE_ENABLED="false", **env)
+    proc = subprocess.Popen(
+        [sys.executable, "-c", f"import uvicorn, main; uvicorn.run(main.app, port={BACKEND_PORT}, log_level='warning')"],
+        cwd=backend_dir, env=env
+    )
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{BACKEND_PORT}/api/health", timeout=1)
+            return proc
+        except httpx.TransportError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("backend did not start")
+
+
+async def run_load(count: int) -> tuple:
+    statuses = collections.Counter()
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{BACKEND_PORT}", timeout=600) as client:
+        async def one(i):
+            response = await client.post("/api/chat", json={"prompt": f"List all dimensions ({i})", "use_cache": False})
+            statuses[response.status_code] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(count)))
+        elapsed = time.perf_counter() - start
+        stats = (await client.get("/api/upstream/stats")).json()
+    return statuses, elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rate limiting / retry benchmark against a throttling stub")
+    parser.add_argument("--backend", default=os.path.join(os.path.dirname(__file__), "..", "Openai", "backend"))
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rpm", type=int, default=60, help="Stub requests per window (0 = unlimited)")
+    parser.add_argument("--window", type=float, default=10.0, help="Stub rate-limit window in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    limit_rps = args.rpm / args.window if args.rpm else args.capacity / args.latency
+    print(f"stub: {args.rpm} requests / {args.window:g}s ({limit_rps:.1f} req/s), "
+          f"{args.error_rate:.0%} 503s, capacity {args.capacity}, {args.latency}s latency")
+
+    runs = [
+        # Configured limits are deliberately wrong; the real ones are learned from the stub's headers
+        ("no retries", {"OPENAI_MAX_RETRIES": "0", "OPENAI_RPM": "10000", "OPENAI_TPM": "0", "OPENAI_BURST_SECONDS": "1"}),
+        ("scheduler", {"OPENAI_RPM": "10000", "OPENAI_TPM": "0", "OPENAI_BURST_SECONDS": "1"}),
+    ]
+    for label, env in runs:
+        throttling = dict(rpm=args.rpm, window=args.window, error_rate=args.error_rate, capacity=args.capacity)
+        with StubServer(port=9004, latency=args.latency, **throttling) as stub:
+            proc = start_backend(os.path.abspath(args.backend), dict(env, OPENAI_BASE_URL=stub.base_url))
+            try:
+                statuses, elapsed, stats = asyncio.run(run_load(args.requests))
+            finally:
+                proc.terminate()
+                proc.wait()
+
+            ok = statuses.get(200, 0)
+            failed = {code: n for code, n in sorted(statuses.items()) if code != 200}
+            print(f"{label:10s} ok {ok:4d}/{args.requests}  user-visible errors {failed or 0}  "
+                  f"{ok / elapsed:5.2f} req/s ({ok / elapsed / limit_rps:.0%} of limit)  "
+                  f"upstream 429s {stub.app.state.throttled}  retries {stats['retries']}  "
+                  f"final concurrency {stats['concurrency_limit']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Wall time of tiled /api/chat requests on a large drawing against the
+upstream concurrency the backend may use. With tiling on, the drawing is
+split into overlapping tiles that are each read in their own upstream call
+next to the overview call; those calls run in parallel up to
+OPENAI_MAX_CONCURRENCY, so wall time should fall with the limit until it
+covers every tile. The stub charges per token like the real API, and each
+limit gets a fresh backend process (the scheduler reads its limits at start).
+
+    python benchmarks/bench_tiling.py --limits 1,2,4,8,16 --sheet 34x22 --dpi 200
+"""
+import argparse
+import io
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from PIL import Image, ImageDraw
+
+from stub_openai import StubServer
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), "..", "Openai", "backend")
+
+
+def sheet(width_in: float, height_in: float, dpi: int) -> bytes:
+    """A drawing sheet with a border and a grid of small tolerance callouts"""
+    width, height = int(width_in * dpi), int(height_in * dpi)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((dpi // 2, dpi // 2, width - dpi // 2, height - dpi // 2), outline=0, width=max(2, dpi // 50))
+    for row in range(6):
+        for column in range(8):
+            x, y = dpi + column * (width - 2 * dpi) // 8, dpi + row * (height - 2 * dpi) // 6
+            draw.line((x, y, x + dpi, y), fill=0, width=2)
+            draw.text((x, y + 6), f"Ø{1 + (row * 8 + column) * 0.125:.3f} ±0.002", fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def start_backend(limit: int, port: int, workdir: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL="http://127.0.0.1:9000/v1",
+        OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "stub"),
+        OPENAI_MAX_CONCURRENCY=str(limit),
+        OPENAI_INITIAL_CONCURRENCY=str(limit),
+        OPENAI_RPM="0",
+        OPENAI_TPM="0",
+        RESPONSE_CACHE_ENABLED="false",
+        TILING_ENABLED="false",
+        JOBS_DIR=os.path.join(workdir, "jobs"),
+        BLOB_DIR=os.path.join(workdir, "blobs"),
+        UPLOAD_CATALOG=os.path.join(workdir, "catalog.db"),
+        UPLOAD_SWEEP_INTERVAL="0"
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", os.path.abspath(BACKEND_DIR),
+         "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env
+    )
+    for _ in range(300):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/health", timeout=1).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"Backend (limit {limit}) did not start")
+
+
+def timed_requests(base_url: str, png: bytes, tiling: bool, repeats: int) -> tuple:
+    """Wall times of repeats sequential requests, and the last response body"""
+    times, body = [], None
+    with httpx.Client(base_url=base_url, timeout=600) as client:
+        for _ in range(repeats + 1):  # The first request warms up the CPU pool and connections
+            start = time.perf_counter()
+            response = client.post(
+                "/api/chat",
+                data={"prompt": "List all dimensions", "template": "technical", "use_cache": "false",
+                      "tiling": str(tiling).lower()},
+                files=[("images", ("sheet.png", png, "image/png"))]
+            )
+            response.raise_for_status()
+            times.append(time.perf_counter() - start)
+            body = response.json()
+    return times[1:], body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiled drawing analysis against upstream concurrency")
+    parser.add_argument("--limits", default="1,2,4,8,16", help="OPENAI_MAX_CONCURRENCY per run")
+    parser.add_argument("--sheet", default="34x22", help="Sheet size in inches (ANSI D)")
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.3, help="Stub seconds per completion before token costs")
+    parser.add_argument("--seconds-per-input-token", type=float, default=0.0002)
+    parser.add_argument("--seconds-per-output-token", type=float, default=0.002)
+    parser.add_argument("--answer-tokens", type=int, default=300)
+    args = parser.parse_args()
+
+    png = sheet(*map(float, args.sheet.split("x")), dpi=args.dpi)
+    print(f"{args.sheet} in sheet at {args.dpi} DPI: {len(png) / 1e3:.0f} kB, {os.cpu_count()} CPUs")
+
+    rows = []
+    with StubServer(port=9000, latency=args.latency, seconds_per_input_token=args.seconds_per_input_token,
+                    seconds_per_output_token=args.seconds_per_output_token, answer_tokens=args.answer_tokens):
+        for index, limit in enumerate(int(value) for value in args.limits.split(",")):
+            workdir = tempfile.mkdtemp(prefix="bench-tiling-")
+            port = 8790 + index
+            backend = start_backend(limit, port, workdir)
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                if index == 0:
+                    untiled, _ = timed_requests(base_url, png, False, args.repeats)
+                tiled, body = timed_requests(base_url, png, True, args.repeats)
+            finally:
+                backend.terminate()
+                backend.wait(30)
+                shutil.rmtree(workdir, ignore_errors=True)
+            rows.append((limit, tiled, body))
+
+    print(f"\nuntiled (one call on the downscaled sheet): {statistics.mean(untiled):.2f}s")
+    print(f"{'limit':>6s} {'tiles':>6s} {'dims':>6s} {'tokens':>8s} {'mean':>8s} {'min':>8s} {'speedup':>8s}")
+    serial = statistics.mean(rows[0][1])
+    for limit, tiled, body in rows:
+        tiling = body["tiling"]
+        print(f"{limit:6d} {tiling['tiles']:6d} {len(tiling['dimensions']):6d} {body['usage']['total_tokens']:8d} "
+              f"{statistics.mean(tiled):7.2f}s {min(tiled):7.2f}s {serial / statistics.mean(tiled):7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stub server for offline benchmarks.
+Answers POST /v1/chat/completions after a configurable delay; with
+"stream": true the delay is the time to first token and the text follows
+as SSE chunks.
+
+Throttling can be injected for rate-limit tests: --rpm enforces a sliding
+window and answers 429 with Retry-After and x-ratelimit-* headers,
+--error-rate fails a fraction of calls with 503, and --capacity makes
+latency grow once more calls are in flight than the stub can serve.
+
+With --seconds-per-input-token / --seconds-per-output-token the stub
+charges for tokens like the real API: prompt tokens are counted from the
+text and from each image's size and detail hint, the answer runs to
+--answer-tokens or max_tokens, whichever is lower, and usage reports both.
+
+Requests with a json_schema response_format (tiled drawing reads) get
+STUB_TILE_JSON, a structured answer with one callout in the tile centre.
+"""
+import argparse
+import asyncio
+import base64
+import collections
+import io
+import json
+import math
+import random
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_TEXT = (
+    "Component: Piston\n"
+    "Dimensions found:\n"
+    "- Ø2.490 ±0.002 - main piston diameter\n"
+    "- 1.000 ±0.005 - overall length\n"
+    "- 3/4-16 UNF-2A - rod thread\n"
+)
+STUB_TILE_JSON = json.dumps({"dimensions": [
+    {"value": "2.490", "tolerance": "0.002", "kind": "diameter", "feature": "main piston diameter", "x": 0.5, "y": 0.5}
+]})
+
+
+def image_tokens(image_url: dict) -> int:
+    """OpenAI vision pricing: 85 tokens at low detail, else 85 + 170 per 512px tile of the fitted image"""
+    if image_url.get("detail") == "low":
+        return 85
+    try:
+        from PIL import Image
+        data = base64.b64decode(image_url["url"].split(",", 1)[1])
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+    except Exception:
+        width, height = 2048, 1536
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    return 85 + 170 * math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+
+
+def token_usage(body: dict, answer_tokens: int) -> dict:
+    prompt_tokens = 0
+    for message in body.get("messages", []):
+        content = message.get("content")
+        for part in content if isinstance(content, list) else [{"type": "text", "text": content or ""}]:
+            prompt_tokens += len(part["text"]) // 4 if part["type"] == "text" else image_tokens(part["image_url"])
+    completion_tokens = min(answer_tokens, body.get("max_tokens") or answer_tokens)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def create_app(
+    latency: float = 0.5,
+    rpm: int = 0,
+    error_rate: float = 0.0,
+    capacity: int = 0,
+    window: float = 60.0,
+    seconds_per_input_token: float = 0.0,
+    seconds_per_output_token: float = 0.0,
+    answer_tokens: int = 1000
+) -> FastAPI:
+    app = FastAPI(title="OpenAI stub")
+    app.state.latency = latency
+    app.state.requests = 0
+    app.state.throttled = 0
+    app.state.errors = 0
+    app.state.in_flight = 0
+    app.state.usage = []  # Usage of every completion answered, when charging for tokens
+    accepted = collections.deque()
+
+    def rate_limit_headers() -> dict:
+        return {
+            "x-ratelimit-limit-requests": str(int(rpm * 60 / window)),
+            "x-ratelimit-remaining-requests": str(max(0, rpm - len(accepted)))
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        headers = {}
+
+        if rpm:
+            now = time.monotonic()
+            while accepted and now - accepted[0] >= window:
+                accepted.popleft()
+            if len(accepted) >= rpm:
+                app.state.throttled += 1
+                retry_after = window - (now - accepted[0])
+                return JSONResponse(
+                    {"error": {"message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded"}},
+                    status_code=429,
+                    headers=dict(rate_limit_headers(), **{"retry-after-ms": str(int(retry_after * 1000))})
+                )
+            accepted.append(now)
+            headers = rate_limit_headers()
+
+        if error_rate and random.random() < error_rate:
+            app.state.errors += 1
+            return JSONResponse({"error": {"message": "The server is overloaded", "type": "server_error"}}, status_code=503)
+
+        usage = {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150}
+        delay = app.state.latency
+        if seconds_per_input_token or seconds_per_output_token:
+            usage = token_usage(body, answer_tokens)
+            app.state.usage.append(usage)
+            delay += usage["prompt_tokens"] * seconds_per_input_token + usage["completion_tokens"] * seconds_per_output_token
+
+        app.state.in_flight += 1
+        try:
+            # Past capacity the stub queues internally, so latency grows with load
+            overload = app.state.in_flight / capacity if capacity else 1.0
+            await asyncio.sleep(delay * max(1.0, overload))
+        finally:
+            app.state.in_flight -= 1
+
+        if body.get("stream"):
+            return StreamingResponse(_stream_chunks(body, usage), media_type="text/event-stream", headers=headers)
+        structured = (body.get("response_format") or {}).get("type") == "json_schema"
+        answer = STUB_TILE_JSON if structured else STUB_TEXT
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": answer},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        }, headers=headers)
+
+    return app
+
+
+async def _stream_chunks(body: dict, usage: dict):
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+    def chunk(choices, usage=None):
+        return "data: " + json.dumps({
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": choices,
+            "usage": usage
+        }) + "\n\n"
+
+    for line in STUB_TEXT.splitlines(keepends=True):
+        yield chunk([{"index": 0, "delta": {"content": line}, "finish_reason": None}])
+        await asyncio.sleep(0.01)
+    yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+    if body.get("stream_options", {}).get("include_usage"):
+        yield chunk([], usage)
+    yield "data: [DONE]\n\n"
+
+
+class StubServer:
+    """Runs the stub in a background thread: `with StubServer(port=9000) as stub: ...`"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9000, latency: float = 0.5, **throttling):
+        self.app = create_app(latency, **throttling)
+        self.base_url = f"http://{host}:{port}/v1"
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host=host, port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per completion")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests allowed per window (0 = unlimited)")
+    parser.add_argument("--window", type=float, default=60.0, help="Rate-limit window in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with 503")
+    parser.add_argument("--capacity", type=int, default=0, help="Concurrent calls served at full speed (0 = unlimited)")
+    parser.add_argument("--seconds-per-input-token", type=float, default=0.0, help="Added latency per prompt token")
+    parser.add_argument("--seconds-per-output-token", type=float, default=0.0, help="Added latency per completion token")
+    parser.add_argument("--answer-tokens", type=int, default=1000, help="Completion length when max_tokens allows it")
+    args = parser.parse_args()
+    app = create_app(args.latency, rpm=args.rpm, error_rate=args.error_rate, capacity=args.capacity, window=args.window,
+                     seconds_per_input_token=args.seconds_per_input_token,
+                     seconds_per_output_token=args.seconds_per_output_token, answer_tokens=args.answer_tokens)
+    uvicorn.run(app, host=args.host, port=args.port)